@@ -59,7 +59,7 @@ class ConfigLoader:
             file_config = configparser.ConfigParser()
             file_config.read(self.conf_file_path)
 
-            # Load parameters and cast them to int if necessary
+            # Load parameters and cast them to int or bool if necessary
             if file_config:
                 for sec in file_config.sections():
                     for k, v in file_config.items(sec):
@@ -71,6 +71,12 @@ class ConfigLoader:
                                 except ValueError:
                                     err_msg = "{} is not an integer ({}).".format(k, v)
                                     raise ValueError(err_msg)
+                            elif self.conf_fields[k_upper]["type"] == bool:
+                                try:
+                                    self.conf_fields[k_upper]["value"] = file_config.getboolean(sec, k)
+                                except ValueError:
+                                    err_msg = "{} is not a boolean ({}).".format(k, v)
+                                    raise ValueError(err_msg)
                             else:
                                 self.conf_fields[k_upper]["value"] = v
 
@@ -15,10 +15,14 @@ DEFAULT_CONF = {
     "BTC_RPC_PASSWORD": {"value": "passwd", "type": str},
     "BTC_RPC_CONNECT": {"value": "127.0.0.1", "type": str},
     "BTC_RPC_PORT": {"value": MAINNET_RPC_PORT, "type": int},
+    "BTC_RPC_POOL_SIZE": {"value": 8, "type": int},
+    "BTC_RPC_TIMEOUT": {"value": 30, "type": int},
     "BTC_NETWORK": {"value": "mainnet", "type": str},
     "BTC_FEED_PROTOCOL": {"value": "tcp", "type": str},
     "BTC_FEED_CONNECT": {"value": "localhost", "type": str},
     "BTC_FEED_PORT": {"value": 28332, "type": int},
+    "BTC_FEED_RAWBLOCK": {"value": False, "type": bool},
+    "BTC_FEED_RAWTX": {"value": False, "type": bool},
     "DAEMON": {"value": False, "type": bool},
     "MAX_APPOINTMENTS": {"value": 1000000, "type": int},
     "SUBSCRIPTION_SLOTS": {"value": 100, "type": int},
@@ -26,12 +30,24 @@ DEFAULT_CONF = {
     "EXPIRY_DELTA": {"value": 6, "type": int},
     "MIN_TO_SELF_DELAY": {"value": 20, "type": int},
     "LOCATOR_CACHE_SIZE": {"value": 6, "type": int},
+    "LOCATOR_INDEX_BLOCKS": {"value": 0, "type": int},
+    "BREACH_VALIDATION_WORKERS": {"value": 4, "type": int},
+    "BREACH_MEMPOOL_PREFLIGHT": {"value": False, "type": bool},
+    "MAX_DECRYPTS_PER_LOCATOR": {"value": 10, "type": int},
+    "MEMPOOL_BROADCAST": {"value": False, "type": bool},
+    "CARRIER_BROADCAST_WORKERS": {"value": 4, "type": int},
+    "RECEIPT_LEDGER_SIZE": {"value": 100000, "type": int},
+    "CONFIRMATIONS_BEFORE_RETRY": {"value": 6, "type": int},
+    "MEMPOOL_CHECK_INTERVAL": {"value": 60, "type": int},
+    "DB_GROUP_COMMIT_MS": {"value": 2, "type": int},
+    "DB_SYNC_WRITES": {"value": False, "type": bool},
     "OVERWRITE_KEY": {"value": False, "type": bool},
     "WSGI": {"value": "gunicorn", "type": str},
     "LOG_FILE": {"value": "teos.log", "type": str, "path": True},
     "TEOS_SECRET_KEY": {"value": "teos_sk.der", "type": str, "path": True},
     "APPOINTMENTS_DB_PATH": {"value": "appointments", "type": str, "path": True},
     "USERS_DB_PATH": {"value": "users", "type": str, "path": True},
+    "LOCATOR_INDEX_DB_PATH": {"value": "locator_index", "type": str, "path": True},
     "INTERNAL_API_HOST": {"value": "localhost", "type": str},
     "INTERNAL_API_PORT": {"value": 50051, "type": int},
     "INTERNAL_API_WORKERS": {"value": 10, "type": int},
@@ -1,7 +1,10 @@
 import json
 import plyvel
+from threading import local
+from contextlib import contextmanager
 
 from teos.logger import get_logger
+from teos.group_commit import GroupCommitter
 from common.db_manager import DBManager
 
 WATCHER_PREFIX = "w"
@@ -9,6 +12,12 @@ WATCHER_LAST_BLOCK_KEY = "bw"
 RESPONDER_PREFIX = "r"
 RESPONDER_LAST_BLOCK_KEY = "br"
 TRIGGERED_APPOINTMENTS_PREFIX = "ta"
+HEADERS_PREFIX = "h"
+HEADER_INDEX_TIP_KEY = "bh"
+LOCATOR_CACHE_PREFIX = "lc"
+BROADCAST_INTENT_PREFIX = "bi"
+CARRIER_RECEIPT_PREFIX = "cr"
+DEFERRED_BREACH_PREFIX = "db"
 
 
 class AppointmentsDBM(DBManager):
@@ -16,27 +25,40 @@ class AppointmentsDBM(DBManager):
     The :class:`AppointmentsDBM` is in charge of interacting with the appointments database (``LevelDB``).
     Keys and values are stored as bytes in the database but processed as strings by the manager.
 
-    The database is split in six prefixes:
+    The database is split in eleven prefixes:
 
         - ``WATCHER_PREFIX``, defined as ``b'w``, is used to store :obj:`Watcher <teos.watcher.Watcher>` appointments.
         - ``RESPONDER_PREFIX``, defines as ``b'r``, is used to store :obj:`Responder <teos.responder.Responder>` trackers.
         - ``WATCHER_LAST_BLOCK_KEY``, defined as ``b'bw``, is used to store the last block hash known by the :obj:`Watcher <teos.watcher.Watcher>`.
         - ``RESPONDER_LAST_BLOCK_KEY``, defined as ``b'br``, is used to store the last block hash known by the :obj:`Responder <teos.responder.Responder>`.
         - ``TRIGGERED_APPOINTMENTS_PREFIX``, defined as ``b'ta``, is used to stored triggered appointments (appointments that have been handed to the :obj:`Responder <teos.responder.Responder>`.)
+        - ``HEADERS_PREFIX``, defined as ``b'h``, is used to store the headers of the :obj:`HeaderIndex <teos.header_index.HeaderIndex>`.
+        - ``HEADER_INDEX_TIP_KEY``, defined as ``b'bh``, is used to store the tip of the :obj:`HeaderIndex <teos.header_index.HeaderIndex>`.
+        - ``LOCATOR_CACHE_PREFIX``, defined as ``b'lc``, is used to checkpoint the blocks of the :obj:`LocatorCache <teos.watcher.LocatorCache>`.
+        - ``BROADCAST_INTENT_PREFIX``, defined as ``b'bi``, is used to store the penalties queued for broadcast by the :obj:`Responder <teos.responder.Responder>` that have not been tracked yet.
+        - ``CARRIER_RECEIPT_PREFIX``, defined as ``b'cr``, is used to persist the :obj:`ReceiptLedger <teos.carrier.ReceiptLedger>` of the :obj:`Carrier <teos.carrier.Carrier>`.
+        - ``DEFERRED_BREACH_PREFIX``, defined as ``b'db``, is used to store the breaches deferred by the :obj:`Watcher <teos.watcher.Watcher>` that have not been checked yet.
 
     Args:
         db_path (:obj:`str`): the path (relative or absolute) to the system folder containing the database. A fresh
             database will be created if the specified path does not contain one.
+        commit_interval (:obj:`float`): the time (in seconds) concurrent writes are gathered for before being committed
+            together. Optional (writes are committed straightaway by default).
+        sync_writes (:obj:`bool`): whether group commits are flushed to disk before being acknowledged. Optional.
    
     Attributes:
         logger (:obj:`Logger <teos.logger.Logger>`): the logger for this component.
+        group_commit (:obj:`GroupCommitter <teos.group_commit.GroupCommitter>`): the committer used by the writes
+            done when accepting appointments, so writes from concurrent requests are committed in a single batch.
+        block_batches (:obj:`threading.local`): the block batch opened by each thread (if any). See
+            :meth:`block_batch`.
 
     Raises:
         :obj:`ValueError`: If the provided ``db_path`` is not a string.
         :obj:`plyvel.Error`: If the db is currently unavailable (being used by another process).
     """  # noqa: E501
 
-    def __init__(self, db_path):
+    def __init__(self, db_path, commit_interval=0, sync_writes=False):
         if not isinstance(db_path, str):
             raise ValueError("db_path must be a valid path/name")
 
@@ -51,6 +73,79 @@ class AppointmentsDBM(DBManager):
 
             raise e
 
+        self.group_commit = GroupCommitter(self.db, commit_interval, sync_writes)
+        self.block_batches = local()
+
+    def close(self):
+        """Commits the pending writes and closes the database."""
+        self.group_commit.stop()
+        super().close()
+
+    @contextmanager
+    def block_batch(self):
+        """
+        Gathers all the writes the calling thread does to the :obj:`Watcher <teos.watcher.Watcher>` and
+        :obj:`Responder <teos.responder.Responder>` data (appointments, trackers, triggered flags, locator cache
+        checkpoints, deferred breaches and last known blocks) within the context, and commits them as a single
+        ``WriteBatch`` on exit.
+
+        This is used to process blocks atomically: the effects of a block are committed alongside its last known block
+        marker, or not at all (if an exception is raised within the context). Writes that need to be durable
+        straightaway (like storing the broadcast intents of the Responder) are not deferred. Nested contexts join the
+        outer one.
+        """
+
+        if getattr(self.block_batches, "batch", None) is not None:
+            yield
+            return
+
+        batch = self.db.write_batch(transaction=True, sync=self.group_commit.sync)
+        self.block_batches.batch = batch
+        try:
+            yield
+        finally:
+            self.block_batches.batch = None
+
+        try:
+            batch.write()
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    @contextmanager
+    def get_write_batch(self):
+        """
+        Gets a ``WriteBatch`` to write to. That is the block batch of the calling thread, if it has one open (see
+        :meth:`block_batch`), or a new batch that is written once the context exits otherwise.
+        """
+
+        batch = getattr(self.block_batches, "batch", None)
+        if batch is not None:
+            yield batch
+        else:
+            with self.db.write_batch() as b:
+                yield b
+
+    def _commit(self, puts=None, deletes=None):
+        """
+        Commits some writes through ``group_commit``, unless the calling thread has a block batch open, in which case
+        they are added to it.
+
+        Args:
+            puts (:obj:`list`): a list of ``(key, value)`` pairs (as bytes) to be stored. Optional.
+            deletes (:obj:`list`): a list of keys (as bytes) to be deleted. Optional.
+        """
+
+        batch = getattr(self.block_batches, "batch", None)
+        if batch is None:
+            self.group_commit.write(puts, deletes)
+        else:
+            for key, value in puts or []:
+                batch.put(key, value)
+            for key in deletes or []:
+                batch.delete(key)
+
     def load_appointments_db(self, prefix):
         """
         Loads all data from the appointments database given a prefix. Two prefixes are defined: ``WATCHER_PREFIX`` and
@@ -189,6 +284,33 @@ class AppointmentsDBM(DBManager):
 
         return self.load_appointments_db(prefix=RESPONDER_PREFIX)
 
+    def batch_load_responder_trackers(self, uuids):
+        """
+        Loads a collection of trackers from the database. All the trackers are read from the same snapshot of the
+        database, so the result is consistent even if the trackers are being updated concurrently.
+
+        Args:
+            uuids (:obj:`list`): a list of tracker identifiers to be loaded.
+
+        Returns:
+            :obj:`dict`: A dictionary (``uuid:tracker_data``) with the data of every requested tracker. Trackers that
+            cannot be found (or loaded) map to :obj:`None`.
+        """
+
+        trackers = {}
+
+        with self.db.snapshot() as snapshot:
+            for uuid in uuids:
+                data = snapshot.get((RESPONDER_PREFIX + uuid).encode("utf-8"))
+
+                try:
+                    trackers[uuid] = json.loads(data)
+                except (TypeError, json.decoder.JSONDecodeError) as e:
+                    self.logger.error(str(e))
+                    trackers[uuid] = None
+
+        return trackers
+
     def store_watcher_appointment(self, uuid, appointment):
         """
         Stores an appointment in the database using the ``WATCHER_PREFIX`` prefix.
@@ -203,7 +325,7 @@ class AppointmentsDBM(DBManager):
 
         try:
             self.logger.info("Adding appointment to Watchers's db", uuid=uuid)
-            self.create_entry(uuid, json.dumps(appointment), prefix=WATCHER_PREFIX)
+            self._commit(puts=[((WATCHER_PREFIX + uuid).encode("utf-8"), json.dumps(appointment).encode("utf-8"))])
             return True
 
         except json.JSONDecodeError:
@@ -234,7 +356,8 @@ class AppointmentsDBM(DBManager):
 
         try:
             self.logger.info("Adding tracker to Responder's db", uuid=uuid)
-            self.create_entry(uuid, json.dumps(tracker), prefix=RESPONDER_PREFIX)
+            with self.get_write_batch() as b:
+                b.put((RESPONDER_PREFIX + uuid).encode("utf-8"), json.dumps(tracker).encode("utf-8"))
             return True
 
         except json.JSONDecodeError:
@@ -262,7 +385,7 @@ class AppointmentsDBM(DBManager):
 
         try:
             self.logger.info("Deleting appointment from Watcher's db", uuid=uuid)
-            self.delete_entry(uuid, prefix=WATCHER_PREFIX)
+            self._commit(deletes=[(WATCHER_PREFIX + uuid).encode("utf-8")])
             return True
 
         except TypeError:
@@ -282,7 +405,7 @@ class AppointmentsDBM(DBManager):
         """
 
         try:
-            with self.db.write_batch() as b:
+            with self.get_write_batch() as b:
                 for uuid in uuids:
                     self.logger.info("Deleting appointment from Watcher's db", uuid=uuid)
                     b.delete((WATCHER_PREFIX + uuid).encode("utf-8"))
@@ -304,7 +427,8 @@ class AppointmentsDBM(DBManager):
 
         try:
             self.logger.info("Deleting tracker from Responder's db", uuid=uuid)
-            self.delete_entry(uuid, prefix=RESPONDER_PREFIX)
+            with self.get_write_batch() as b:
+                b.delete((RESPONDER_PREFIX + uuid).encode("utf-8"))
             return True
 
         except TypeError:
@@ -324,7 +448,7 @@ class AppointmentsDBM(DBManager):
         """
 
         try:
-            with self.db.write_batch() as b:
+            with self.get_write_batch() as b:
                 for uuid in uuids:
                     self.logger.info("Deleting appointment from Responder's db", uuid=uuid)
                     b.delete((RESPONDER_PREFIX + uuid).encode("utf-8"))
@@ -366,7 +490,11 @@ class AppointmentsDBM(DBManager):
         """
 
         try:
-            self.create_entry(WATCHER_LAST_BLOCK_KEY, block_hash)
+            if not isinstance(block_hash, str):
+                raise TypeError("Block hash must be str")
+
+            with self.get_write_batch() as b:
+                b.put(WATCHER_LAST_BLOCK_KEY.encode("utf-8"), block_hash.encode("utf-8"))
             return True
 
         except (TypeError, json.JSONDecodeError) as e:
@@ -389,7 +517,11 @@ class AppointmentsDBM(DBManager):
         """
 
         try:
-            self.create_entry(RESPONDER_LAST_BLOCK_KEY, block_hash)
+            if not isinstance(block_hash, str):
+                raise TypeError("Block hash must be str")
+
+            with self.get_write_batch() as b:
+                b.put(RESPONDER_LAST_BLOCK_KEY.encode("utf-8"), block_hash.encode("utf-8"))
             return True
 
         except (TypeError, json.JSONDecodeError) as e:
@@ -410,7 +542,37 @@ class AppointmentsDBM(DBManager):
 
         try:
             self.logger.info("Flagging appointment as triggered", uuid=uuid)
-            self.db.put((TRIGGERED_APPOINTMENTS_PREFIX + uuid).encode("utf-8"), "".encode("utf-8"))
+            self._commit(puts=[((TRIGGERED_APPOINTMENTS_PREFIX + uuid).encode("utf-8"), b"")])
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    def store_triggered_appointment(self, uuid, appointment):
+        """
+        Stores an appointment and flags it as triggered, atomically.
+
+        Args:
+            uuid (:obj:`str`): the identifier of the appointment to be stored.
+            appointment (:obj:`dict`): an appointment encoded as a dictionary.
+
+        Returns:
+            :obj:`bool`: True if the appointment was stored in the db. False otherwise.
+        """
+
+        try:
+            self.logger.info("Adding triggered appointment to Watchers's db", uuid=uuid)
+            self._commit(
+                puts=[
+                    ((WATCHER_PREFIX + uuid).encode("utf-8"), json.dumps(appointment).encode("utf-8")),
+                    ((TRIGGERED_APPOINTMENTS_PREFIX + uuid).encode("utf-8"), b""),
+                ]
+            )
+            return True
+
+        except TypeError:
+            self.logger.info("Couldn't add appointment to db.", uuid=uuid, appointment=appointment)
+            return False
+
         except RuntimeError as e:
             self.logger.error(str(e))
             raise e
@@ -424,7 +586,7 @@ class AppointmentsDBM(DBManager):
         """
 
         try:
-            with self.db.write_batch() as b:
+            with self.get_write_batch() as b:
                 for uuid in uuids:
                     self.logger.info("Flagging appointment as triggered", uuid=uuid)
                     b.put((TRIGGERED_APPOINTMENTS_PREFIX + uuid).encode("utf-8"), b"")
@@ -462,7 +624,8 @@ class AppointmentsDBM(DBManager):
 
         try:
             self.logger.info("Removing triggered flag from appointment appointment", uuid=uuid)
-            self.delete_entry(uuid, prefix=TRIGGERED_APPOINTMENTS_PREFIX)
+            with self.get_write_batch() as b:
+                b.delete((TRIGGERED_APPOINTMENTS_PREFIX + uuid).encode("utf-8"))
             return True
 
         except TypeError:
@@ -482,7 +645,7 @@ class AppointmentsDBM(DBManager):
         """
 
         try:
-            with self.db.write_batch() as b:
+            with self.get_write_batch() as b:
                 for uuid in uuids:
                     self.logger.info("Removing triggered flag from appointment appointment", uuid=uuid)
                     b.delete((TRIGGERED_APPOINTMENTS_PREFIX + uuid).encode("utf-8"))
@@ -490,3 +653,274 @@ class AppointmentsDBM(DBManager):
         except RuntimeError as e:
             self.logger.error(str(e))
             raise e
+
+    def load_headers(self):
+        """
+        Loads all the headers of the :obj:`HeaderIndex <teos.header_index.HeaderIndex>` from the database.
+
+        Returns:
+            :obj:`dict`: A dictionary of ``block_hash:[height, prev_block_hash]``.
+
+            Returns an empty dictionary if no data is found.
+        """
+
+        return self.load_appointments_db(prefix=HEADERS_PREFIX)
+
+    def store_headers(self, headers):
+        """
+        Stores multiple headers of the :obj:`HeaderIndex <teos.header_index.HeaderIndex>` in the database.
+
+        Args:
+            headers (:obj:`dict`): a dictionary of ``block_hash:[height, prev_block_hash]``.
+        """
+
+        try:
+            with self.db.write_batch() as b:
+                for block_hash, header in headers.items():
+                    b.put((HEADERS_PREFIX + block_hash).encode("utf-8"), json.dumps(header).encode("utf-8"))
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    def batch_delete_headers(self, block_hashes):
+        """
+        Deletes multiple headers of the :obj:`HeaderIndex <teos.header_index.HeaderIndex>` from the database.
+
+        Args:
+            block_hashes (:obj:`list`): a list of the hashes of the headers to be deleted.
+        """
+
+        try:
+            with self.db.write_batch() as b:
+                for block_hash in block_hashes:
+                    b.delete((HEADERS_PREFIX + block_hash).encode("utf-8"))
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    def load_header_index_tip(self):
+        """
+        Loads the tip of the :obj:`HeaderIndex <teos.header_index.HeaderIndex>` from the database.
+
+        Returns:
+            :obj:`str` or :obj:`None`: A 32-byte hex-encoded string representing the tip hash if found.
+
+            Returns :obj:`None` otherwise.
+        """
+
+        return self.get_last_known_block(HEADER_INDEX_TIP_KEY)
+
+    def store_header_index_tip(self, block_hash):
+        """
+        Stores the tip of the :obj:`HeaderIndex <teos.header_index.HeaderIndex>`.
+
+        Args:
+            block_hash (:obj:`str`): the block hash to be stored (32-byte hex-encoded)
+
+        Returns:
+            :obj:`bool`: True if the block hash was stored in the db. False otherwise.
+        """
+
+        try:
+            self.create_entry(HEADER_INDEX_TIP_KEY, block_hash)
+            return True
+
+        except TypeError as e:
+            self.logger.error(str(e))
+            return False
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    def load_locator_cache_blocks(self):
+        """
+        Loads the checkpointed blocks of the :obj:`LocatorCache <teos.watcher.LocatorCache>` from the database.
+
+        Returns:
+            :obj:`dict`: A dictionary of ``block_hash:block_data``, where ``block_data`` contains the
+            ``prev_block_hash`` and the ``locator_txid_map`` of the block.
+
+            Returns an empty dictionary if no data is found.
+        """
+
+        return self.load_appointments_db(prefix=LOCATOR_CACHE_PREFIX)
+
+    def store_locator_cache_blocks(self, blocks):
+        """
+        Checkpoints multiple blocks of the :obj:`LocatorCache <teos.watcher.LocatorCache>` to the database.
+
+        Args:
+            blocks (:obj:`dict`): a dictionary of ``block_hash:block_data``, where ``block_data`` contains the
+                ``prev_block_hash`` and the ``locator_txid_map`` of the block.
+        """
+
+        try:
+            with self.get_write_batch() as b:
+                for block_hash, block_data in blocks.items():
+                    b.put((LOCATOR_CACHE_PREFIX + block_hash).encode("utf-8"), json.dumps(block_data).encode("utf-8"))
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    def batch_delete_locator_cache_blocks(self, block_hashes):
+        """
+        Deletes multiple checkpointed blocks of the :obj:`LocatorCache <teos.watcher.LocatorCache>` from the database.
+
+        Args:
+            block_hashes (:obj:`list`): a list of the hashes of the blocks to be deleted.
+        """
+
+        try:
+            with self.get_write_batch() as b:
+                for block_hash in block_hashes:
+                    b.delete((LOCATOR_CACHE_PREFIX + block_hash).encode("utf-8"))
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    def load_broadcast_intents(self):
+        """
+        Loads all the pending broadcast intents from the database (all entries with the ``BROADCAST_INTENT_PREFIX``
+        prefix).
+
+        Returns:
+            :obj:`dict`: A dictionary of ``uuid:intent``, where ``intent`` contains the data needed to handle the breach
+            again. An empty dictionary if there are none.
+        """
+
+        return self.load_appointments_db(prefix=BROADCAST_INTENT_PREFIX)
+
+    def store_broadcast_intent(self, uuid, intent):
+        """
+        Stores a broadcast intent in the database using the ``BROADCAST_INTENT_PREFIX`` prefix.
+
+        Args:
+            uuid (:obj:`str`): the identifier of the appointment the penalty belongs to.
+            intent (:obj:`dict`): the data needed to handle the breach (the arguments of
+                :meth:`Responder.handle_breach <teos.responder.Responder.handle_breach>`).
+        """
+
+        try:
+            self.create_entry(uuid, json.dumps(intent), prefix=BROADCAST_INTENT_PREFIX)
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    def delete_broadcast_intent(self, uuid):
+        """
+        Deletes a broadcast intent from the database. The deletion joins the block batch of the calling thread, if
+        any, so it is committed alongside the tracker created for the breach (see :meth:`block_batch`).
+
+        Args:
+           uuid (:obj:`str`): the identifier of the appointment the penalty belongs to.
+        """
+
+        try:
+            with self.get_write_batch() as b:
+                b.delete((BROADCAST_INTENT_PREFIX + uuid).encode("utf-8"))
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    def load_carrier_receipts(self):
+        """
+        Loads the receipts of the :obj:`ReceiptLedger <teos.carrier.ReceiptLedger>` from the database.
+
+        Returns:
+            :obj:`dict`: A dictionary of ``txid:receipt_data``, where ``receipt_data`` contains the
+            :obj:`Receipt <teos.carrier.Receipt>` (as a dictionary) and the height at which it was issued.
+
+            Returns an empty dictionary if no data is found.
+        """
+
+        return self.load_appointments_db(prefix=CARRIER_RECEIPT_PREFIX)
+
+    def store_carrier_receipt(self, txid, receipt_data):
+        """
+        Stores a receipt of the :obj:`ReceiptLedger <teos.carrier.ReceiptLedger>` in the database.
+
+        Args:
+            txid (:obj:`str`): the id of the transaction the receipt belongs to.
+            receipt_data (:obj:`dict`): the :obj:`Receipt <teos.carrier.Receipt>` (as a dictionary) and the height at
+                which it was issued.
+        """
+
+        try:
+            self.create_entry(txid, json.dumps(receipt_data), prefix=CARRIER_RECEIPT_PREFIX)
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    def batch_delete_carrier_receipts(self, txids):
+        """
+        Deletes multiple receipts of the :obj:`ReceiptLedger <teos.carrier.ReceiptLedger>` from the database.
+
+        Args:
+            txids (:obj:`list`): a list of the ids of the transactions whose receipts will be deleted.
+        """
+
+        try:
+            with self.db.write_batch() as b:
+                for txid in txids:
+                    b.delete((CARRIER_RECEIPT_PREFIX + txid).encode("utf-8"))
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    def load_deferred_breaches(self):
+        """
+        Loads all the breaches deferred by the :obj:`Watcher <teos.watcher.Watcher>` from the database (all entries
+        with the ``DEFERRED_BREACH_PREFIX`` prefix).
+
+        Returns:
+            :obj:`dict`: A dictionary of ``group_id:group``, where ``group`` contains the ``locator``, the
+            ``dispute_txid`` and the ``uuids`` of the deferred appointments. An empty dictionary if there are none.
+        """
+
+        return self.load_appointments_db(prefix=DEFERRED_BREACH_PREFIX)
+
+    def store_deferred_breaches(self, groups):
+        """
+        Stores multiple groups of deferred breaches in the database using the ``DEFERRED_BREACH_PREFIX`` prefix. The
+        writes join the block batch of the calling thread, if any (see :meth:`block_batch`).
+
+        Args:
+            groups (:obj:`dict`): a dictionary of ``group_id:group``, where ``group`` contains the ``locator``, the
+                ``dispute_txid`` and the ``uuids`` of the deferred appointments.
+        """
+
+        try:
+            with self.get_write_batch() as b:
+                for group_id, group in groups.items():
+                    b.put((DEFERRED_BREACH_PREFIX + group_id).encode("utf-8"), json.dumps(group).encode("utf-8"))
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    def batch_delete_deferred_breaches(self, group_ids):
+        """
+        Deletes multiple groups of deferred breaches from the database. The deletions join the block batch of the
+        calling thread, if any (see :meth:`block_batch`).
+
+        Args:
+            group_ids (:obj:`list`): a list of the ids of the groups to be deleted.
+        """
+
+        try:
+            with self.get_write_batch() as b:
+                for group_id in group_ids:
+                    b.delete((DEFERRED_BREACH_PREFIX + group_id).encode("utf-8"))
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
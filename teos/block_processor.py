@@ -1,7 +1,15 @@
+from threading import Lock
+from collections import deque
+from types import MappingProxyType
+
 from teos.logger import get_logger
+from common.tools import compute_locator
 from common.exceptions import BasicException
 
-from teos.tools import bitcoin_cli
+from teos.tools import bitcoin_cli_batch
+from teos.header_index import HeaderIndex
+from teos.constants import MEDIAN_TIME_SPAN
+from teos.utils.rpc_pool import RPCConnectionPool
 from teos.utils.auth_proxy import JSONRPCException
 
 
@@ -9,6 +17,177 @@ class InvalidTransactionFormat(BasicException):
     """Raised when a transaction is not properly formatted."""
 
 
+class Block:
+    """
+    An immutable view of a block, as needed by the tower components. It is built once per block by the
+    :obj:`ChainMonitor <teos.chain_monitor.ChainMonitor>` and shared by all its subscribers, so the block is only
+    fetched, decoded and hashed into locators once.
+
+    Args:
+        block_hash (:obj:`str`): the hash of the block.
+        height (:obj:`int`): the height of the block.
+        prev_block_hash (:obj:`str`): the hash of the parent block.
+        txids (:obj:`list`): the ids of the transactions included in the block.
+        time (:obj:`int`): the block timestamp (as set in the header). Optional.
+        median_time (:obj:`int`): the median time past of the block (median of the last 11 block timestamps).
+            Optional, since it cannot be computed from the block alone.
+
+    Attributes:
+        hash (:obj:`str`): The hash of the block.
+        height (:obj:`int`): The height of the block.
+        prev_block_hash (:obj:`str`): The hash of the parent block.
+        txids (:obj:`tuple`): The ids of the transactions included in the block.
+        time (:obj:`int` or :obj:`None`): The block timestamp, if known.
+        median_time (:obj:`int` or :obj:`None`): The median time past of the block, if known.
+        locator_txid_map (:obj:`MappingProxyType`): A read-only ``locator:txid`` map for all the transactions in the
+            block.
+    """
+
+    __slots__ = ("_hash", "_height", "_prev_block_hash", "_txids", "_time", "_median_time", "_locator_txid_map")
+
+    def __init__(self, block_hash, height, prev_block_hash, txids, time=None, median_time=None):
+        object.__setattr__(self, "_hash", block_hash)
+        object.__setattr__(self, "_height", height)
+        object.__setattr__(self, "_prev_block_hash", prev_block_hash)
+        object.__setattr__(self, "_txids", tuple(txids))
+        object.__setattr__(self, "_time", time)
+        object.__setattr__(self, "_median_time", median_time)
+        object.__setattr__(
+            self, "_locator_txid_map", MappingProxyType({compute_locator(txid): txid for txid in self._txids})
+        )
+
+    def __setattr__(self, key, value):
+        raise AttributeError("Block objects are immutable")
+
+    def __repr__(self):
+        return f"Block(hash={self._hash}, height={self._height})"
+
+    @property
+    def hash(self):
+        return self._hash
+
+    @property
+    def height(self):
+        return self._height
+
+    @property
+    def prev_block_hash(self):
+        return self._prev_block_hash
+
+    @property
+    def txids(self):
+        return self._txids
+
+    @property
+    def time(self):
+        return self._time
+
+    @property
+    def median_time(self):
+        return self._median_time
+
+    @property
+    def locator_txid_map(self):
+        return self._locator_txid_map
+
+    @classmethod
+    def from_dict(cls, block_data):
+        """
+        Builds a :obj:`Block` from the dictionary returned by ``bitcoind``'s ``getblock``.
+
+        Args:
+            block_data (:obj:`dict`): the block data as returned by ``getblock`` (``hash``, ``height``,
+                ``previousblockhash``, ``tx``, ``time`` and ``mediantime``).
+
+        Returns:
+            :obj:`Block`: The block built from the given data.
+        """
+
+        return cls(
+            block_data.get("hash"),
+            block_data.get("height"),
+            block_data.get("previousblockhash"),
+            block_data.get("tx", []),
+            block_data.get("time"),
+            block_data.get("mediantime"),
+        )
+
+
+class ChainTip:
+    """
+    A thread-safe cache of the best chain tip: its hash, height and median time past. It is updated by the
+    :obj:`ChainMonitor <teos.chain_monitor.ChainMonitor>` every time a new block is notified, so the components serving
+    user requests can check the tip without querying ``bitcoind``.
+
+    The median time past is taken from the block if known (blocks fetched via ``getblock``). Otherwise, it is computed
+    from the timestamps of the last ``MEDIAN_TIME_SPAN`` blocks, as long as they have been seen on top of each other.
+
+    Attributes:
+        recent_times (:obj:`deque`): The timestamps of the last ``MEDIAN_TIME_SPAN`` blocks of the chain ending at the
+            tip.
+        lock (:obj:`Lock`): A lock to make sure the tip data is always read and updated at once.
+    """
+
+    def __init__(self):
+        self._hash = None
+        self._height = None
+        self._median_time = None
+        self.recent_times = deque(maxlen=MEDIAN_TIME_SPAN)
+        self.lock = Lock()
+
+    @property
+    def hash(self):
+        return self._hash
+
+    @property
+    def height(self):
+        return self._height
+
+    @property
+    def median_time(self):
+        return self._median_time
+
+    def get(self):
+        """
+        Returns the tip data.
+
+        Returns:
+            :obj:`tuple`: A tuple ``(hash, height, median_time)``. All the items are :obj:`None` if the tip has not
+            been set yet, and ``median_time`` may be :obj:`None` if it is unknown.
+        """
+
+        with self.lock:
+            return self._hash, self._height, self._median_time
+
+    def update(self, block):
+        """
+        Sets a new best tip.
+
+        Args:
+            block (:obj:`Block`): the new best block.
+        """
+
+        with self.lock:
+            # The time window is only kept for blocks on top of each other (it is restarted on reorgs)
+            if block.prev_block_hash != self._hash:
+                self.recent_times.clear()
+            if block.time is not None:
+                self.recent_times.append(block.time)
+            else:
+                self.recent_times.clear()
+
+            if block.median_time is not None:
+                median_time = block.median_time
+            elif len(self.recent_times) == MEDIAN_TIME_SPAN:
+                median_time = sorted(self.recent_times)[MEDIAN_TIME_SPAN // 2]
+            else:
+                median_time = None
+
+            self._hash = block.hash
+            self._height = block.height
+            self._median_time = median_time
+
+
 class BlockProcessor:
     """
     The :class:`BlockProcessor` contains methods related to the blockchain. Most of its methods require communication
@@ -18,15 +197,26 @@ class BlockProcessor:
         btc_connect_params (:obj:`dict`): a dictionary with the parameters to connect to bitcoind
             (``rpc user, rpc password, host and port``).
         bitcoind_reachable (:obj:`threading.Event`): signals whether bitcoind is reachable or not.
+        header_index (:obj:`HeaderIndex <teos.header_index.HeaderIndex>`): the index of block headers used to answer
+            chain queries locally. Optional, an in-memory (non-persistent) index is used if not set.
 
     Attributes:
         logger (:obj:`Logger <teos.logger.Logger>`): the logger for this component.
+        rpc (:obj:`RPCConnectionPool <teos.utils.rpc_pool.RPCConnectionPool>`): the pool of connections used to query
+            ``bitcoind``.
+        tip (:obj:`ChainTip`): the cached best chain tip. Kept up to date by the
+            :obj:`ChainMonitor <teos.chain_monitor.ChainMonitor>`.
+        header_index (:obj:`HeaderIndex <teos.header_index.HeaderIndex>`): the index of the headers of the best chain
+            (and recent forks). Kept up to date by the :obj:`ChainMonitor <teos.chain_monitor.ChainMonitor>`.
     """
 
-    def __init__(self, btc_connect_params, bitcoind_reachable):
+    def __init__(self, btc_connect_params, bitcoind_reachable, header_index=None):
         self.logger = get_logger(component=BlockProcessor.__name__)
         self.btc_connect_params = btc_connect_params
         self.bitcoind_reachable = bitcoind_reachable
+        self.rpc = RPCConnectionPool(btc_connect_params)
+        self.tip = ChainTip()
+        self.header_index = header_index if header_index is not None else HeaderIndex()
 
     def _blocking_query(self, method):
         """
@@ -80,7 +270,7 @@ class BlockProcessor:
             return self._blocking_query(lambda: self.get_block(block_hash))
 
         try:
-            block = bitcoin_cli(self.btc_connect_params).getblock(block_hash)
+            block = self.rpc.getblock(block_hash)
 
         except JSONRPCException as e:
             block = None
@@ -88,6 +278,163 @@ class BlockProcessor:
 
         return block
 
+    def get_blocks(self, block_hashes, blocking=False):
+        """
+        Gets a collection of blocks given their hashes. All the blocks are requested to ``bitcoind`` using ``json-rpc``
+        batches, instead of one request per block.
+
+        Args:
+            block_hashes (:obj:`list`): the block hashes to be queried.
+            blocking (:obj:`bool`): whether the call should be blocking (wait for bitcoind to be available) or not.
+
+        Returns:
+            :obj:`list`: A list with the data of the requested blocks, in the same order as ``block_hashes``. Blocks
+            that cannot be found are returned as :obj:`None`.
+
+        Raises:
+            :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
+        """
+
+        if blocking:
+            return self._blocking_query(lambda: self.get_blocks(block_hashes))
+
+        blocks = []
+        for block_hash, (block, error) in zip(
+            block_hashes, bitcoin_cli_batch(self.rpc, "getblock", [[h] for h in block_hashes])
+        ):
+            if error is not None:
+                self.logger.error("Couldn't get block from bitcoind", block_hash=block_hash, error=error)
+            blocks.append(block)
+
+        return blocks
+
+    def get_block_hashes(self, heights, blocking=False):
+        """
+        Gets the hashes of the blocks at the given heights in the best chain. All the hashes are requested to
+        ``bitcoind`` using ``json-rpc`` batches, instead of one request per height.
+
+        Args:
+            heights (:obj:`list`): the heights to be queried.
+            blocking (:obj:`bool`): whether the call should be blocking (wait for bitcoind to be available) or not.
+
+        Returns:
+            :obj:`list`: A list with the requested block hashes, in the same order as ``heights``. Heights that are
+            out of range are returned as :obj:`None`.
+
+        Raises:
+            :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
+        """
+
+        if blocking:
+            return self._blocking_query(lambda: self.get_block_hashes(heights))
+
+        block_hashes = []
+        for height, (block_hash, error) in zip(
+            heights, bitcoin_cli_batch(self.rpc, "getblockhash", [[h] for h in heights])
+        ):
+            if error is not None:
+                self.logger.error("Couldn't get block hash", height=height, error=error)
+            block_hashes.append(block_hash)
+
+        return block_hashes
+
+    def get_block_headers(self, block_hashes, blocking=False):
+        """
+        Gets a collection of block headers given their hashes. All the headers are requested to ``bitcoind`` using
+        ``json-rpc`` batches, instead of one request per header.
+
+        Args:
+            block_hashes (:obj:`list`): the block hashes to be queried.
+            blocking (:obj:`bool`): whether the call should be blocking (wait for bitcoind to be available) or not.
+
+        Returns:
+            :obj:`list`: A list with the requested headers (as returned by ``getblockheader``), in the same order as
+            ``block_hashes``. Headers that cannot be found are returned as :obj:`None`.
+
+        Raises:
+            :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
+        """
+
+        if blocking:
+            return self._blocking_query(lambda: self.get_block_headers(block_hashes))
+
+        headers = []
+        for block_hash, (header, error) in zip(
+            block_hashes, bitcoin_cli_batch(self.rpc, "getblockheader", [[h] for h in block_hashes])
+        ):
+            if error is not None:
+                self.logger.error("Couldn't get block header from bitcoind", block_hash=block_hash, error=error)
+            headers.append(header)
+
+        return headers
+
+    def get_block_heights(self, block_hashes, blocking=False):
+        """
+        Gets the heights of a collection of blocks. The header index is used for the indexed blocks, and the headers of
+        the rest are requested to ``bitcoind`` using ``json-rpc`` batches.
+
+        Args:
+            block_hashes (:obj:`list`): the block hashes to be queried.
+            blocking (:obj:`bool`): whether the call should be blocking (wait for bitcoind to be available) or not.
+
+        Returns:
+            :obj:`dict`: A ``block_hash:height`` map. The heights of the blocks that cannot be found are :obj:`None`.
+
+        Raises:
+            :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
+        """
+
+        heights = {block_hash: self.header_index.get_height(block_hash) for block_hash in block_hashes}
+
+        unindexed = [block_hash for block_hash, height in heights.items() if height is None]
+        if unindexed:
+            for block_hash, header in zip(unindexed, self.get_block_headers(unindexed, blocking)):
+                heights[block_hash] = header.get("height") if header is not None else None
+
+        return heights
+
+    def get_parsed_block(self, block_hash, blocking=False):
+        """
+        Gets a block given a block hash and builds a :obj:`Block` out of it.
+
+        Args:
+            block_hash (:obj:`str`): the block hash to be queried.
+            blocking (:obj:`bool`): whether the call should be blocking (wait for bitcoind to be available) or not.
+
+        Returns:
+            :obj:`Block` or :obj:`None`: The requested block if found. :obj:`None` otherwise.
+
+        Raises:
+            :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
+        """
+
+        block = self.get_block(block_hash, blocking)
+
+        return Block.from_dict(block) if block is not None else None
+
+    def resolve_block(self, block, blocking=False):
+        """
+        Returns a :obj:`Block` given either a :obj:`Block` or a block hash.
+
+        Subscribers of the :obj:`ChainMonitor <teos.chain_monitor.ChainMonitor>` normally receive :obj:`Block` objects,
+        but block hashes are still pushed to their queues during bootstrap (when catching up with missed blocks).
+
+        Args:
+            block (:obj:`Block` or :obj:`str`): the block, or its hash.
+            blocking (:obj:`bool`): whether the call should be blocking (wait for bitcoind to be available) or not.
+
+        Returns:
+            :obj:`Block` or :obj:`None`: The block, or :obj:`None` if a hash was given and the block cannot be found.
+
+        Raises:
+            :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
+        """
+
+        if isinstance(block, Block):
+            return block
+
+        return self.get_parsed_block(block, blocking)
+
     def get_best_block_hash(self, blocking=False):
         """
         Gets the hash of the current best chain tip.
@@ -108,7 +455,7 @@ class BlockProcessor:
             return self._blocking_query(lambda: self.get_best_block_hash())
 
         try:
-            block_hash = bitcoin_cli(self.btc_connect_params).getbestblockhash()
+            block_hash = self.rpc.getbestblockhash()
 
         except JSONRPCException as e:
             block_hash = None
@@ -136,7 +483,7 @@ class BlockProcessor:
             return self._blocking_query(lambda: self.get_block_count())
 
         try:
-            block_count = bitcoin_cli(self.btc_connect_params).getblockcount()
+            block_count = self.rpc.getblockcount()
 
         except JSONRPCException as e:
             block_count = None
@@ -144,6 +491,79 @@ class BlockProcessor:
 
         return block_count
 
+    def update_tip(self, block, blocking=False):
+        """
+        Sets a new best chain tip, updating both the cached tip and the header index.
+
+        If the parent of the block is not indexed (e.g. the tower has been offline for a while) the missing headers are
+        fetched from ``bitcoind``, up to the size of the index. Their hashes are fetched by height and then their
+        headers, both using ``json-rpc`` batches, so back-filling takes a couple of round trips instead of one per
+        block. The gap down to the index tip is fetched at once, and further blocks are only fetched (doubling the
+        number of blocks on every round) if the missing blocks fork out of the index deeper than that.
+
+        Args:
+            block (:obj:`Block`): the new best block.
+            blocking (:obj:`bool`): whether the call should be blocking (wait for bitcoind to be available) or not.
+
+        Raises:
+            :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
+        """
+
+        headers = [(block.hash, block.height, block.prev_block_hash)]
+        index_tip_height = self.header_index.tip_height
+
+        if index_tip_height is not None:
+            max_size = self.header_index.max_size
+            prev_block_hash = block.prev_block_hash
+            height = block.height - 1
+            n_blocks = max(height - index_tip_height, 1)
+
+            while prev_block_hash not in self.header_index and len(headers) < max_size and height >= 0:
+                low_height = max(height - min(n_blocks, max_size - len(headers)) + 1, 0)
+                block_hashes = self.get_block_hashes(list(range(height, low_height - 1, -1)), blocking)
+                fetched = {
+                    header.get("hash"): header
+                    for header in self.get_block_headers([h for h in block_hashes if h is not None], blocking)
+                    if header is not None
+                }
+
+                # Headers are linked using their previous block hash, so they are consistent even if bitcoind's best
+                # chain changes while they are being fetched
+                while prev_block_hash in fetched and prev_block_hash not in self.header_index:
+                    header = fetched[prev_block_hash]
+                    headers.append((prev_block_hash, header.get("height"), header.get("previousblockhash")))
+                    prev_block_hash = header.get("previousblockhash")
+
+                if headers[-1][1] != low_height:
+                    # Either the index has been reached or the headers did not link (they will be connected as is)
+                    break
+
+                height = low_height - 1
+                n_blocks *= 2
+
+        self.header_index.connect(headers[::-1])
+        self.tip.update(block)
+
+    def get_tip_height(self, blocking=False):
+        """
+        Gets the height of the best chain tip. The cached tip is used if set, so ``bitcoind`` is only queried if no
+        block has been notified yet.
+
+        Args:
+            blocking (:obj:`bool`): whether the call should be blocking (wait for bitcoind to be available) or not. Only
+                relevant if the tip is not cached.
+
+        Returns:
+            :obj:`int` or :obj:`None`: The height of the best chain tip if it can be computed.
+
+        Raises:
+            :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
+        """
+
+        height = self.tip.height
+
+        return height if height is not None else self.get_block_count(blocking)
+
     def decode_raw_transaction(self, raw_tx, blocking=False):
         """
         Deserializes a given raw transaction (hex encoded) and builds a dictionary representing it with all the
@@ -165,7 +585,7 @@ class BlockProcessor:
             return self._blocking_query(lambda: self.decode_raw_transaction(raw_tx))
 
         try:
-            tx = bitcoin_cli(self.btc_connect_params).decoderawtransaction(raw_tx)
+            tx = self.rpc.decoderawtransaction(raw_tx)
 
         except JSONRPCException as e:
             msg = "Cannot build transaction from decoded data"
@@ -174,9 +594,38 @@ class BlockProcessor:
 
         return tx
 
+    def test_mempool_accept(self, raw_tx, blocking=False):
+        """
+        Checks whether a given raw transaction would be accepted by ``bitcoind``'s mempool, without broadcasting it.
+
+        Args:
+            raw_tx (:obj:`str`): the hex representation of the transaction.
+            blocking (:obj:`bool`): whether the call should be blocking (wait for bitcoind to be available) or not.
+
+        Returns:
+            :obj:`dict` or :obj:`None`: The result of ``testmempoolaccept`` for the transaction (``txid``, ``allowed``
+            and ``reject-reason`` if not allowed). :obj:`None` if the transaction cannot be checked.
+
+        Raises:
+            :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
+        """
+
+        if blocking:
+            return self._blocking_query(lambda: self.test_mempool_accept(raw_tx))
+
+        try:
+            result = self.rpc.testmempoolaccept([raw_tx])[0]
+
+        except JSONRPCException as e:
+            result = None
+            self.logger.error("Couldn't test the transaction against the mempool", error=e.error)
+
+        return result
+
     def get_distance_to_tip(self, target_block_hash, blocking=False):
         """
-        Compute the distance between a given block hash and the best chain tip.
+        Compute the distance between a given block hash and the best chain tip. The header index is used if the block is
+        indexed, and ``bitcoind`` is queried otherwise.
 
         Args:
             target_block_hash (:obj:`str`): the hash of the target block (the one to compute the distance form the tip).
@@ -192,7 +641,9 @@ class BlockProcessor:
             :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
         """
 
-        distance = None
+        distance = self.header_index.get_distance_to_tip(target_block_hash)
+        if distance is not None:
+            return distance
 
         chain_tip = self.get_best_block_hash(blocking)
         chain_tip_height = self.get_block(chain_tip, blocking).get("height")
@@ -210,7 +661,10 @@ class BlockProcessor:
         """
         Gets the blocks between the current best chain tip and a given block hash (``last_know_block_hash``).
 
-        This method is used to fetch all the missed information when recovering from a crash.
+        This method is used to fetch all the missed information when recovering from a crash. If the last known block
+        is indexed (and in the best chain) the missed blocks are taken from the header index. Otherwise, if the last
+        known block is still in the best chain, the missed hashes are fetched by height in a single batch, and if not,
+        the chain is walked back from the tip one block at a time.
 
         Args:
             last_know_block_hash (:obj:`str`): the hash of the last known block.
@@ -224,9 +678,26 @@ class BlockProcessor:
             :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
         """
 
+        missed_blocks = self.header_index.get_best_chain_after(last_know_block_hash)
+        if missed_blocks is not None:
+            return missed_blocks
+
         current_block_hash = self.get_best_block_hash(blocking)
-        missed_blocks = []
+        if current_block_hash is None or current_block_hash == last_know_block_hash:
+            return []
+
+        tip = self.get_block(current_block_hash, blocking)
+        last_known_block = self.get_block(last_know_block_hash, blocking)
+
+        if tip is not None and last_known_block is not None and last_known_block.get("confirmations") != -1:
+            heights = list(range(last_known_block.get("height") + 1, tip.get("height") + 1))
+            missed_blocks = self.get_block_hashes(heights, blocking)
 
+            # If the tip has changed in the meantime (e.g. a reorg) we fall back to walking the chain
+            if missed_blocks and missed_blocks[-1] == current_block_hash and None not in missed_blocks:
+                return missed_blocks
+
+        missed_blocks = []
         while current_block_hash != last_know_block_hash and current_block_hash is not None:
             missed_blocks.append(current_block_hash)
 
@@ -240,7 +711,8 @@ class BlockProcessor:
         Checks whether a given block is on the best chain or not. Blocks are identified by block_hash.
 
         A block that is not in the best chain will either not exists (block = None) or have a confirmation count of
-        -1 (implying that the block was forked out or the chain never grew from that one).
+        -1 (implying that the block was forked out or the chain never grew from that one). Indexed blocks are checked
+        against the header index instead.
 
         Args:
             block_hash(:obj:`str`): the hash of the block to be checked.
@@ -254,6 +726,10 @@ class BlockProcessor:
             :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
         """
 
+        in_best_chain = self.header_index.is_in_best_chain(block_hash)
+        if in_best_chain is not None:
+            return in_best_chain
+
         block = self.get_block(block_hash, blocking)
 
         if block is None:
@@ -282,14 +758,36 @@ class BlockProcessor:
             ``last_common_ancestor``.
 
         Raises:
+            :obj:`KeyError`: if any of the blocks cannot be found in the blockchain.
             :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
         """
 
-        target_block_hash = last_known_block_hash
         dropped_txs = []
 
-        while not self.is_block_in_best_chain(target_block_hash, blocking):
+        # If the fork point is indexed only the forked out blocks need to be fetched (to get their transactions)
+        fork_point = self.header_index.find_fork_point(last_known_block_hash)
+        if fork_point is not None:
+            last_common_ancestor, forked_blocks = fork_point
+
+            for block in self.get_blocks(forked_blocks, blocking) if forked_blocks else []:
+                if block is None:
+                    raise KeyError("Block not found")
+                dropped_txs.extend(block.get("tx"))
+
+            return last_common_ancestor, dropped_txs
+
+        target_block_hash = last_known_block_hash
+
+        # Every block is only fetched once, since its confirmation count already tells whether it is in the best chain
+        while True:
             block = self.get_block(target_block_hash, blocking)
+
+            if block is None:
+                raise KeyError("Block not found")
+
+            if block.get("confirmations") != -1:
+                break
+
             dropped_txs.extend(block.get("tx"))
             target_block_hash = block.get("previousblockhash")
 
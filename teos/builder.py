@@ -33,11 +33,7 @@ class Builder:
             ext_appointment = ExtendedAppointment.from_dict(data)
             appointments[uuid] = ext_appointment.get_summary()
 
-            if ext_appointment.locator in locator_uuid_map:
-                locator_uuid_map[ext_appointment.locator].append(uuid)
-
-            else:
-                locator_uuid_map[ext_appointment.locator] = [uuid]
+            locator_uuid_map.setdefault(ext_appointment.locator, {})[uuid] = None
 
         return appointments, locator_uuid_map
 
@@ -68,11 +64,7 @@ class Builder:
             tracker = TransactionTracker.from_dict(data)
             trackers[uuid] = tracker.get_summary()
 
-            if tracker.penalty_txid in tx_tracker_map:
-                tx_tracker_map[tracker.penalty_txid].append(uuid)
-
-            else:
-                tx_tracker_map[tracker.penalty_txid] = [uuid]
+            tx_tracker_map.setdefault(tracker.penalty_txid, set()).add(uuid)
 
         return trackers, tx_tracker_map
 
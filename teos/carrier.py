@@ -1,5 +1,11 @@
+from threading import Lock
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
 from teos.logger import get_logger
-from teos.tools import bitcoin_cli
+from teos.constants import RECEIPT_LEDGER_SIZE, RECEIPT_LEDGER_BLOCKS
+from teos.tools import bitcoin_cli_batch
+from teos.utils.rpc_pool import RPCConnectionPool
 import teos.utils.rpc_errors as rpc_errors
 from teos.utils.auth_proxy import JSONRPCException
 from common.errors import UNKNOWN_JSON_RPC_EXCEPTION, RPC_TX_REORGED_AFTER_BROADCAST
@@ -30,6 +36,168 @@ class Receipt:
         self.confirmations = confirmations
         self.reason = reason
 
+    @classmethod
+    def from_dict(cls, receipt_data):
+        """
+        Builds a :obj:`Receipt` from a dictionary. Useful to load data from the database.
+
+        Args:
+            receipt_data (:obj:`dict`): a dictionary with the ``delivered``, ``confirmations`` and ``reason`` fields.
+
+        Returns:
+            :obj:`Receipt`: The receipt built from the given data.
+        """
+
+        return cls(receipt_data.get("delivered"), receipt_data.get("confirmations", 0), receipt_data.get("reason"))
+
+    def to_dict(self):
+        """Encodes the :obj:`Receipt` as a dictionary."""
+
+        return {"delivered": self.delivered, "confirmations": self.confirmations, "reason": self.reason}
+
+
+class ReceiptLedger:
+    """
+    The :class:`ReceiptLedger` keeps the receipts issued by the :obj:`Carrier` so the same transaction is not sent over
+    and over.
+
+    Receipts are indexed by the height at which they were issued, and dropped once they are older than ``blocks``
+    blocks, so transactions can be sent again if needed (e.g. to rebroadcast them). The ledger is also bounded in size:
+    if it holds more than ``max_receipts`` receipts, the least recently used ones are evicted. If a ``db_manager`` is
+    provided, the ledger is persisted so the receipts survive a restart.
+
+    Args:
+        max_receipts (:obj:`int`): the maximum number of receipts held by the ledger.
+        blocks (:obj:`int`): the number of blocks a receipt is kept for.
+        db_manager (:obj:`AppointmentsDBM <teos.appointments_dbm.AppointmentsDBM>`): an optional instance of the
+            appointment database manager to persist the ledger.
+
+    Attributes:
+        receipts (:obj:`OrderedDict`): A ``txid:(height, Receipt)`` map, sorted from least to most recently used.
+        heights (:obj:`dict`): A ``height:set(txid)`` map of the receipts issued at every height.
+        height (:obj:`int`): The current height. New receipts are issued at this height.
+        lock (:obj:`Lock`): A lock to protect the ledger from concurrent access.
+    """
+
+    def __init__(self, max_receipts, blocks=RECEIPT_LEDGER_BLOCKS, db_manager=None):
+        self.max_receipts = max_receipts
+        self.blocks = blocks
+        self.db_manager = db_manager
+        self.receipts = OrderedDict()
+        self.heights = dict()
+        self.height = 0
+        self.lock = Lock()
+
+        if db_manager is not None:
+            for txid, receipt_data in sorted(db_manager.load_carrier_receipts().items(), key=lambda x: x[1]["height"]):
+                self._add(txid, Receipt.from_dict(receipt_data["receipt"]), receipt_data["height"])
+                self.height = max(self.height, receipt_data["height"])
+
+    def __len__(self):
+        with self.lock:
+            return len(self.receipts)
+
+    def __contains__(self, txid):
+        with self.lock:
+            return txid in self.receipts
+
+    def _add(self, txid, receipt, height):
+        self._remove(txid)
+        self.receipts[txid] = (height, receipt)
+        self.heights.setdefault(height, set()).add(txid)
+
+    def _remove(self, txid):
+        if txid in self.receipts:
+            height, _ = self.receipts.pop(txid)
+            self.heights[height].discard(txid)
+            if not self.heights[height]:
+                del self.heights[height]
+
+    def add(self, txid, receipt):
+        """
+        Adds a receipt to the ledger, at the current height. The least recently used receipts are evicted if the ledger
+        goes over ``max_receipts``.
+
+        Args:
+            txid (:obj:`str`): the id of the transaction the receipt belongs to.
+            receipt (:obj:`Receipt`): the receipt to be added.
+        """
+
+        with self.lock:
+            self._add(txid, receipt, self.height)
+
+            evicted = []
+            while len(self.receipts) > self.max_receipts:
+                evicted_txid = next(iter(self.receipts))
+                self._remove(evicted_txid)
+                evicted.append(evicted_txid)
+
+            if self.db_manager is not None:
+                self.db_manager.store_carrier_receipt(txid, {"height": self.height, "receipt": receipt.to_dict()})
+                if evicted:
+                    self.db_manager.batch_delete_carrier_receipts(evicted)
+
+    def get(self, txid):
+        """
+        Gets the receipt of a transaction from the ledger.
+
+        Args:
+            txid (:obj:`str`): the id of the transaction.
+
+        Returns:
+            :obj:`Receipt` or :obj:`None`: The receipt of the transaction if found. None otherwise.
+        """
+
+        with self.lock:
+            if txid not in self.receipts:
+                return None
+
+            self.receipts.move_to_end(txid)
+            return self.receipts[txid][1]
+
+    def get_status(self, txid):
+        """
+        Gets the status of a transaction, as seen by the :obj:`Carrier` the last time it was sent.
+
+        Args:
+            txid (:obj:`str`): the id of the transaction.
+
+        Returns:
+            :obj:`dict` or :obj:`None`: A dictionary with the receipt data and the ``height`` at which it was issued if
+            the transaction is in the ledger. None otherwise.
+        """
+
+        with self.lock:
+            if txid not in self.receipts:
+                return None
+
+            height, receipt = self.receipts[txid]
+            status = receipt.to_dict()
+            status["height"] = height
+
+            return status
+
+    def update_height(self, height):
+        """
+        Sets the current height of the ledger and drops the receipts that are older than ``blocks`` blocks.
+
+        Args:
+            height (:obj:`int`): the new height.
+        """
+
+        with self.lock:
+            self.height = height
+            min_height = height - self.blocks + 1
+
+            pruned = []
+            for old_height in [h for h in self.heights if h < min_height]:
+                for txid in self.heights.pop(old_height):
+                    del self.receipts[txid]
+                    pruned.append(txid)
+
+            if pruned and self.db_manager is not None:
+                self.db_manager.batch_delete_carrier_receipts(pruned)
+
 
 class Carrier:
     """
@@ -37,106 +205,288 @@ class Carrier:
     objects to report about the sending outcome.
 
     All methods of the ``Carrier`` are blocking, meaning they will wait for bitcoind to come back online if a method is called
-    while it cannot be reached.
+    while it cannot be reached. The only exception is :meth:`broadcast`, which queues the transaction to be pushed by a
+    pool of workers and returns straightaway, so callers do not need to wait for ``bitcoind`` while holding their locks.
 
     Args:
         btc_connect_params (:obj:`dict`): a dictionary with the parameters to connect to bitcoind
             (``rpc user, rpc password, host and port``).
         bitcoind_reachable (:obj:`threading.Event`): signals whether bitcoind is reachable or not.
+        broadcast_workers (:obj:`int`): the maximum number of transactions being pushed to ``bitcoind`` at the same
+            time by :meth:`broadcast`.
+        receipt_ledger (:obj:`ReceiptLedger`): the ledger used to keep the issued receipts. An in-memory ledger of
+            ``RECEIPT_LEDGER_SIZE`` receipts is used if not provided.
 
     Attributes:
         logger (:obj:`Logger <teos.logger.Logger>`): The logger for this component.
-        issued_receipts (:obj:`dict`): A dictionary of issued receipts to prevent resending the same transaction over
-            and over. It should periodically be reset to prevent it from growing unbounded.
+        rpc (:obj:`RPCConnectionPool <teos.utils.rpc_pool.RPCConnectionPool>`): The pool of connections used to reach
+            ``bitcoind``.
+        issued_receipts (:obj:`ReceiptLedger`): A ledger of issued receipts to prevent resending the same transaction
+            over and over.
+        broadcast_pool (:obj:`ThreadPoolExecutor`): The pool of workers pushing the queued transactions.
+        inflight (:obj:`dict`): A ``txid:Future`` map of the transactions queued for broadcast that have not been pushed
+            yet, so the same transaction is only pushed once even if it is queued several times.
+        inflight_lock (:obj:`Lock`): A lock to protect ``inflight`` from concurrent access.
 
     """
 
-    def __init__(self, btc_connect_params, bitcoind_reachable):
+    def __init__(self, btc_connect_params, bitcoind_reachable, broadcast_workers=1, receipt_ledger=None):
         self.logger = get_logger(component=Carrier.__name__)
         self.btc_connect_params = btc_connect_params
         self.bitcoind_reachable = bitcoind_reachable
-        self.issued_receipts = {}
+        self.rpc = RPCConnectionPool(btc_connect_params)
+        self.issued_receipts = receipt_ledger if receipt_ledger is not None else ReceiptLedger(RECEIPT_LEDGER_SIZE)
+        self.broadcast_pool = ThreadPoolExecutor(max_workers=broadcast_workers, thread_name_prefix="carrier_broadcast")
+        self.inflight = {}
+        self.inflight_lock = Lock()
+
+    def broadcast(self, rawtx, txid, callback=None):
+        """
+        Queues a raw transaction to be sent to the Bitcoin network by the broadcast workers.
+
+        Args:
+            rawtx (:obj:`str`): a (potentially) signed raw transaction ready to be broadcast.
+            txid  (:obj:`str`): the transaction id corresponding to ``rawtx``.
+            callback (:obj:`function`): an optional function to be called with the :obj:`Receipt` once the transaction
+                has been pushed. It is run by the broadcast worker before the returned future is resolved.
+
+        Returns:
+            :obj:`Future`: A future that resolves to the :obj:`Receipt` of the broadcast.
+        """
+
+        with self.inflight_lock:
+            sent = self.inflight.get(txid)
+            if sent is None:
+                self.logger.info("Queueing transaction for broadcast", txid=txid)
+                sent = self.broadcast_pool.submit(self.send_transaction, rawtx, txid)
+                self.inflight[txid] = sent
+                sent.add_done_callback(lambda _: self._remove_inflight(txid))
+
+        result = Future()
+
+        def deliver(sent_future):
+            try:
+                receipt = sent_future.result()
+                if callback is not None:
+                    callback(receipt)
+                result.set_result(receipt)
+
+            except Exception as e:
+                self.logger.error("Transaction broadcast failed", txid=txid, error=str(e))
+                result.set_exception(e)
+
+        sent.add_done_callback(deliver)
+
+        return result
+
+    def _remove_inflight(self, txid):
+        with self.inflight_lock:
+            self.inflight.pop(txid, None)
+
+    def get_receipt_status(self, txid):
+        """
+        Gets the status of a transaction sent by the :obj:`Carrier` (see :meth:`ReceiptLedger.get_status`).
+
+        Args:
+            txid (:obj:`str`): the id of the transaction.
+
+        Returns:
+            :obj:`dict` or :obj:`None`: The status of the transaction if a receipt was issued for it. None otherwise.
+        """
+
+        return self.issued_receipts.get_status(txid)
+
+    def shutdown(self):
+        """Waits for the queued transactions to be pushed and stops the broadcast workers."""
+
+        self.broadcast_pool.shutdown(wait=True)
 
     # NOTCOVERED
-    def send_transaction(self, rawtx, txid):
+    def send_transaction(self, rawtx, txid, cache_receipt=True):
         """
         Tries to send a given raw transaction to the Bitcoin network using ``bitcoind``.
 
         Args:
             rawtx (:obj:`str`): a (potentially) signed raw transaction ready to be broadcast.
             txid  (:obj:`str`): the transaction id corresponding to ``rawtx``.
+            cache_receipt (:obj:`bool`): whether the receipt should be stored in ``issued_receipts``. Early broadcasts
+                (e.g. of breaches seen in the mempool) should not be cached, so they do not affect later attempts.
 
         Returns:
             :obj:`Receipt`: A receipt reporting whether the transaction was successfully delivered or not and why.
         """
 
-        if txid in self.issued_receipts:
+        receipt = self.issued_receipts.get(txid)
+        if receipt is not None:
             self.logger.info("Transaction already sent", txid=txid)
-            receipt = self.issued_receipts[txid]
 
             return receipt
 
-        try:
-            self.bitcoind_reachable.wait()
+        # Retried until bitcoind can be reached
+        receipt = None
+        while receipt is None:
+            try:
+                self.bitcoind_reachable.wait()
 
-            self.logger.info("Pushing transaction to the network", txid=txid, rawtx=rawtx)
-            bitcoin_cli(self.btc_connect_params).sendrawtransaction(rawtx)
+                self.logger.info("Pushing transaction to the network", txid=txid, rawtx=rawtx)
+                self.rpc.sendrawtransaction(rawtx)
 
-            receipt = Receipt(delivered=True)
+                receipt = Receipt(delivered=True)
 
-        except JSONRPCException as e:
-            errno = e.error.get("code")
-            # Since we're pushing a raw transaction to the network we can face several rejections
-            if errno == rpc_errors.RPC_VERIFY_REJECTED:
-                # DISCUSS: 37-transaction-rejection
-                receipt = Receipt(delivered=False, reason=rpc_errors.RPC_VERIFY_REJECTED)
-                self.logger.error("Transaction couldn't be broadcast", error=e.error)
-
-            elif errno == rpc_errors.RPC_VERIFY_ERROR:
-                # DISCUSS: 37-transaction-rejection
-                receipt = Receipt(delivered=False, reason=rpc_errors.RPC_VERIFY_ERROR)
-                self.logger.error("Transaction couldn't be broadcast", error=e.error)
-
-            elif errno == rpc_errors.RPC_VERIFY_ALREADY_IN_CHAIN:
-                self.logger.info("Transaction is already in the blockchain. Getting confirmation count", txid=txid)
-
-                # If the transaction is already in the chain, we get the number of confirmations and watch the tracker
-                # until the end of the appointment
-                tx_info = self.get_transaction(txid)
-
-                if tx_info is not None:
-                    confirmations = int(tx_info.get("confirmations"))
-                    receipt = Receipt(
-                        delivered=True, confirmations=confirmations, reason=rpc_errors.RPC_VERIFY_ALREADY_IN_CHAIN
-                    )
+            except JSONRPCException as e:
+                receipt = self._get_error_receipt(txid, e.error, "Carrier.send_transaction")
 
-                else:
-                    # There's a really unlikely edge case where a transaction can be reorged between receiving the
-                    # notification and querying the data. Notice that this implies the tx being also kicked off the
-                    # mempool, which again is really unlikely.
-                    receipt = Receipt(delivered=False, reason=RPC_TX_REORGED_AFTER_BROADCAST)
-
-            elif errno == rpc_errors.RPC_DESERIALIZATION_ERROR:
-                # Adding this here just for completeness. We should never end up here. The Carrier only sends txs
-                # handed by the Responder, who receives them from the Watcher, who checks that the tx can be properly
-                # deserialized
-                self.logger.info("Transaction cannot be deserialized", txid=txid)
-                receipt = Receipt(delivered=False, reason=rpc_errors.RPC_DESERIALIZATION_ERROR)
+                if receipt is None:
+                    # If the transaction is already in the chain, we get the number of confirmations and watch the
+                    # tracker until the end of the appointment
+                    receipt = self._get_in_chain_receipt(self.get_transaction(txid))
+
+            except ConnectionRefusedError:
+                self.logger.error("Cannot connect to bitcoind. Waiting for it to come back online")
+                self.bitcoind_reachable.clear()
+
+        if cache_receipt:
+            self.issued_receipts.add(txid, receipt)
+
+        return receipt
+
+    def send_transactions(self, txs, cache_receipt=True):
+        """
+        Tries to send a collection of raw transactions to the Bitcoin network using ``bitcoind``. All the transactions
+        are pushed using ``json-rpc`` batches, instead of one request per transaction, and the confirmations of the
+        ones that were already in the blockchain are queried in a single batch too.
+
+        Args:
+            txs (:obj:`dict`): a ``txid:rawtx`` map with the (potentially) signed raw transactions to be broadcast.
+            cache_receipt (:obj:`bool`): whether the receipts should be stored in ``issued_receipts``.
 
+        Returns:
+            :obj:`dict`: A ``txid:Receipt`` map reporting whether each transaction was successfully delivered or not and
+            why.
+        """
+
+        receipts = {}
+        pending = {}
+
+        for txid, rawtx in txs.items():
+            receipt = self.issued_receipts.get(txid)
+            if receipt is not None:
+                self.logger.info("Transaction already sent", txid=txid)
+                receipts[txid] = receipt
             else:
-                # If something else happens (unlikely but possible) log it so we can treat it in future releases
-                self.logger.error("JSONRPCException", method="Carrier.send_transaction", error=e.error)
-                receipt = Receipt(delivered=False, reason=UNKNOWN_JSON_RPC_EXCEPTION)
+                pending[txid] = rawtx
+
+        sent = list(pending)
+        in_chain = []
+
+        # Retried until bitcoind can be reached
+        while pending:
+            try:
+                self.bitcoind_reachable.wait()
+
+                self.logger.info("Pushing transactions to the network", n_txs=len(pending))
+                responses = bitcoin_cli_batch(self.rpc, "sendrawtransaction", [[rawtx] for rawtx in pending.values()])
+
+                for txid, (_, error) in zip(pending, responses):
+                    if error is None:
+                        receipts[txid] = Receipt(delivered=True)
+                    else:
+                        receipt = self._get_error_receipt(txid, error, "Carrier.send_transactions")
+                        if receipt is not None:
+                            receipts[txid] = receipt
+                        else:
+                            in_chain.append(txid)
+
+            except JSONRPCException as e:
+                # The batch itself has been rejected, so none of the transactions made it to bitcoind
+                self.logger.error("JSONRPCException", method="Carrier.send_transactions", error=e.error)
+                for txid in pending:
+                    receipts[txid] = Receipt(delivered=False, reason=UNKNOWN_JSON_RPC_EXCEPTION)
+
+            except ConnectionRefusedError:
+                self.logger.error("Cannot connect to bitcoind. Waiting for it to come back online")
+                self.bitcoind_reachable.clear()
+                continue
+
+            pending = {}
+
+        if in_chain:
+            txs_info = self.get_transactions(in_chain)
+            for txid in in_chain:
+                receipts[txid] = self._get_in_chain_receipt(txs_info.get(txid))
+
+        if cache_receipt:
+            for txid in sent:
+                self.issued_receipts.add(txid, receipts[txid])
+
+        return {txid: receipts[txid] for txid in txs}
+
+    def _get_error_receipt(self, txid, error, method):
+        """
+        Builds the :obj:`Receipt` of a transaction that has been rejected by ``bitcoind`` when sent.
 
-        except ConnectionRefusedError:
-            self.logger.error(f"Cannot connect to bitcoind. Waiting for it to come back online")
-            self.bitcoind_reachable.clear()
-            receipt = self.send_transaction(rawtx, txid)
+        Args:
+            txid (:obj:`str`): the id of the rejected transaction.
+            error (:obj:`dict`): the ``json-rpc`` error returned by ``bitcoind``.
+            method (:obj:`str`): the name of the method that sent the transaction (for logging).
 
-        self.issued_receipts[txid] = receipt
+        Returns:
+            :obj:`Receipt` or :obj:`None`: A receipt reporting why the transaction was not delivered, or :obj:`None` if
+            the transaction was rejected because it is already in the blockchain (so its confirmations can be queried).
+        """
+
+        errno = error.get("code")
+        # Since we're pushing a raw transaction to the network we can face several rejections
+        if errno == rpc_errors.RPC_VERIFY_REJECTED:
+            # DISCUSS: 37-transaction-rejection
+            receipt = Receipt(delivered=False, reason=rpc_errors.RPC_VERIFY_REJECTED)
+            self.logger.error("Transaction couldn't be broadcast", error=error)
+
+        elif errno == rpc_errors.RPC_VERIFY_ERROR:
+            # DISCUSS: 37-transaction-rejection
+            receipt = Receipt(delivered=False, reason=rpc_errors.RPC_VERIFY_ERROR)
+            self.logger.error("Transaction couldn't be broadcast", error=error)
+
+        elif errno == rpc_errors.RPC_VERIFY_ALREADY_IN_CHAIN:
+            self.logger.info("Transaction is already in the blockchain. Getting confirmation count", txid=txid)
+            receipt = None
+
+        elif errno == rpc_errors.RPC_DESERIALIZATION_ERROR:
+            # Adding this here just for completeness. We should never end up here. The Carrier only sends
+            # txs handed by the Responder, who receives them from the Watcher, who checks that the tx can be
+            # properly deserialized
+            self.logger.info("Transaction cannot be deserialized", txid=txid)
+            receipt = Receipt(delivered=False, reason=rpc_errors.RPC_DESERIALIZATION_ERROR)
+
+        else:
+            # If something else happens (unlikely but possible) log it so we can treat it in future releases
+            self.logger.error("JSONRPCException", method=method, error=error)
+            receipt = Receipt(delivered=False, reason=UNKNOWN_JSON_RPC_EXCEPTION)
 
         return receipt
 
+    @staticmethod
+    def _get_in_chain_receipt(tx_info):
+        """
+        Builds the :obj:`Receipt` of a transaction that was already in the blockchain when sent.
+
+        Args:
+            tx_info (:obj:`dict` or :obj:`None`): the transaction data as returned by ``bitcoind``.
+
+        Returns:
+            :obj:`Receipt`: A receipt with the confirmation count of the transaction.
+        """
+
+        if tx_info is not None:
+            confirmations = int(tx_info.get("confirmations"))
+            return Receipt(delivered=True, confirmations=confirmations, reason=rpc_errors.RPC_VERIFY_ALREADY_IN_CHAIN)
+
+        else:
+            # There's a really unlikely edge case where a transaction can be reorged between receiving the
+            # notification and querying the data. Notice that this implies the tx being also kicked off the
+            # mempool, which again is really unlikely.
+            return Receipt(delivered=False, reason=RPC_TX_REORGED_AFTER_BROADCAST)
+
     def get_transaction(self, txid):
         """
         Queries transaction data to ``bitcoind`` given a transaction id.
@@ -152,7 +502,7 @@ class Carrier:
         self.bitcoind_reachable.wait()
 
         try:
-            tx_info = bitcoin_cli(self.btc_connect_params).getrawtransaction(txid, 1)
+            tx_info = self.rpc.getrawtransaction(txid, 1)
 
         except JSONRPCException as e:
             # While it's quite unlikely, the transaction that was already in the blockchain could have been
@@ -173,3 +523,87 @@ class Carrier:
             tx_info = self.get_transaction(txid)
 
         return tx_info
+
+    def get_transactions(self, txids):
+        """
+        Queries transaction data to ``bitcoind`` given a collection of transaction ids. All the transactions are
+        requested using ``json-rpc`` batches, instead of one request per transaction.
+
+        Args:
+            txids (:obj:`list`): a list of 32-byte hex-formatted strings representing the transaction ids.
+
+        Returns:
+            :obj:`dict`: A dictionary (``txid:tx_info``) with the transaction data of every requested transaction.
+            Transactions that cannot be found on the chain (or the mempool) map to :obj:`None`.
+        """
+
+        self.bitcoind_reachable.wait()
+
+        # Duplicates are only requested once
+        txids = list(dict.fromkeys(txids))
+
+        try:
+            responses = bitcoin_cli_batch(self.rpc, "getrawtransaction", [[txid, 1] for txid in txids])
+
+        except JSONRPCException as e:
+            self.logger.error("JSONRPCException", method="Carrier.get_transactions", error=e.error)
+            return {txid: None for txid in txids}
+
+        except ConnectionRefusedError:
+            self.logger.error("Cannot connect to bitcoind. Waiting for it to come back online")
+            self.bitcoind_reachable.clear()
+            return self.get_transactions(txids)
+
+        txs_info = {}
+        for txid, (tx_info, error) in zip(txids, responses):
+            if error is not None:
+                if error.get("code") == rpc_errors.RPC_INVALID_ADDRESS_OR_KEY:
+                    self.logger.info("Transaction not found in mempool nor blockchain", txid=txid)
+                else:
+                    self.logger.error("JSONRPCException", method="Carrier.get_transactions", error=error)
+
+            txs_info[txid] = tx_info
+
+        return txs_info
+
+    def get_mempool_entries(self, txids):
+        """
+        Queries the mempool entries of a collection of transactions to ``bitcoind``. All the entries are requested using
+        ``json-rpc`` batches, instead of one request per transaction.
+
+        Args:
+            txids (:obj:`list`): a list of 32-byte hex-formatted strings representing the transaction ids.
+
+        Returns:
+            :obj:`dict`: A dictionary (``txid:entry``) with the mempool entry of the requested transactions.
+            Transactions that are not in the mempool map to :obj:`None`. Transactions that cannot be checked (e.g. due
+            to an unexpected error) are not included.
+        """
+
+        self.bitcoind_reachable.wait()
+
+        # Duplicates are only requested once
+        txids = list(dict.fromkeys(txids))
+
+        try:
+            responses = bitcoin_cli_batch(self.rpc, "getmempoolentry", [[txid] for txid in txids])
+
+        except JSONRPCException as e:
+            self.logger.error("JSONRPCException", method="Carrier.get_mempool_entries", error=e.error)
+            return {}
+
+        except ConnectionRefusedError:
+            self.logger.error("Cannot connect to bitcoind. Waiting for it to come back online")
+            self.bitcoind_reachable.clear()
+            return self.get_mempool_entries(txids)
+
+        entries = {}
+        for txid, (entry, error) in zip(txids, responses):
+            if error is None:
+                entries[txid] = entry
+            elif error.get("code") == rpc_errors.RPC_INVALID_ADDRESS_OR_KEY:
+                entries[txid] = None
+            else:
+                self.logger.error("JSONRPCException", method="Carrier.get_mempool_entries", error=error)
+
+        return entries
@@ -4,6 +4,7 @@ import zmq
 from threading import Thread, Event, Condition
 
 from teos.logger import get_logger
+from teos.utils.deserializer import ByteReader, deserialize_block, deserialize_transaction, DeserializationError
 
 
 class ChainMonitorStatus(Enum):
@@ -16,11 +17,18 @@ class ChainMonitorStatus(Enum):
 class ChainMonitor:
     """
     The :obj:`ChainMonitor` is in charge of monitoring the blockchain (via ``bitcoind``) to detect new blocks on top
-    of the best chain. If a new best block is spotted, the chain monitor will notify the given queues.
+    of the best chain. If a new best block is spotted, the chain monitor will fetch it and notify the given queues.
 
     The :obj:`ChainMonitor` monitors the chain using two methods: ``zmq`` and ``polling``. Blocks are only notified
     once per queue and the notification is triggered by the method that detects the block faster.
 
+    If ``BTC_FEED_RAWBLOCK`` is set, the ``zmq`` feed subscribes to ``rawblock`` instead of ``hashblock`` and blocks
+    are deserialized locally (hash, height, previous hash and txids), so no RPC call is needed to process them. Blocks
+    whose height cannot be decoded fall back to being fetched from ``bitcoind``.
+
+    If ``BTC_FEED_RAWTX`` is set, the ``zmq`` feed also subscribes to ``rawtx``, and the ids of the transactions that
+    reach ``bitcoind``'s mempool are sent to the ``mempool_queues`` (only while active). Duplicates are not filtered.
+
     The :obj:`ChainMonitor` lifecycle goes through 4 states: idle, listening, active and terminated.
     When a :obj:`ChainMonitor` instance is created, it is not yet monitoring the chain and the ``status`` attribute
     is set to ``ChainMonitorStatus.IDLE``.
@@ -37,10 +45,11 @@ class ChainMonitor:
 
     Args:
         receiving_queues (:obj:`list`): a list of :obj:`Queue` objects that will be notified when the chain_monitor is
-            active and it received new blocks hashes.
+            active and it received new blocks (as :obj:`Block <teos.block_processor.Block>` objects).
         block_processor (:obj:`BlockProcessor <teos.block_processor.BlockProcessor>`): a :obj:`BlockProcessor` instance.
         bitcoind_feed_params (:obj:`dict`): a dict with the feed (ZMQ) connection parameters.
-
+        mempool_queues (:obj:`list`): a list of :obj:`Queue` objects that will be notified about the ids of the
+            transactions that reach the mempool (only if ``BTC_FEED_RAWTX`` is set).
 
     Attributes:
         logger (:obj:`Logger <teos.logger.Logger>`): The logger for this component.
@@ -49,16 +58,19 @@ class ChainMonitor:
         lock (:obj:`Condition`): A lock used to protect concurrent access to the queues by the zmq and polling threads.
         bitcoind_reachable (:obj:`threading.Event`): signals whether bitcoind is reachable or not.
         zmqSubSocket (:obj:`socket`): A socket to connect to ``bitcoind`` via ``zmq``.
+        rawblock (:obj:`bool`): Whether the ``zmq`` feed delivers full raw blocks (``rawblock``) or only their hashes
+            (``hashblock``).
+        rawtx (:obj:`bool`): Whether the ``zmq`` feed also delivers the transactions that reach the mempool.
         polling_delta (:obj:`int`): Time between polls (in seconds).
         max_block_window_size (:obj:`int`): Max size of ``last_tips``.
-        queue (:obj:`Queue`): A queue where blocks are stored before they are processed.
+        queue (:obj:`Queue`): A queue where blocks (or block hashes) are stored before they are processed.
         status (:obj:`ChainMonitorStatus`): The current status of the monitor, either ``ChainMonitorStatus.IDLE``,
             ``ChainMonitorStatus.LISTENING``, ``ChainMonitorStatus.ACTIVE`` or ``ChainMonitorStatus.TERMINATED``.
     """
 
     END_MESSAGE = "END"
 
-    def __init__(self, receiving_queues, block_processor, bitcoind_feed_params):
+    def __init__(self, receiving_queues, block_processor, bitcoind_feed_params, mempool_queues=None):
         self.logger = get_logger(component=ChainMonitor.__name__)
         self.last_tips = []
 
@@ -67,10 +79,14 @@ class ChainMonitor:
         self.bitcoind_reachable = block_processor.bitcoind_reachable
         self.polling_retries = 0
 
+        self.rawblock = bitcoind_feed_params.get("BTC_FEED_RAWBLOCK", False)
         self.zmqContext = zmq.Context()
         self.zmqSubSocket = self.zmqContext.socket(zmq.SUB)
         self.zmqSubSocket.setsockopt(zmq.RCVHWM, 0)
-        self.zmqSubSocket.setsockopt_string(zmq.SUBSCRIBE, "hashblock")
+        self.zmqSubSocket.setsockopt_string(zmq.SUBSCRIBE, "rawblock" if self.rawblock else "hashblock")
+        self.rawtx = bitcoind_feed_params.get("BTC_FEED_RAWTX", False)
+        if self.rawtx:
+            self.zmqSubSocket.setsockopt_string(zmq.SUBSCRIBE, "rawtx")
         self.zmqSubSocket.connect(
             "%s://%s:%s"
             % (
@@ -81,6 +97,7 @@ class ChainMonitor:
         )
 
         self.receiving_queues = receiving_queues
+        self.mempool_queues = mempool_queues if mempool_queues is not None else []
 
         self.polling_delta = 60
         self.max_block_window_size = 10
@@ -88,7 +105,7 @@ class ChainMonitor:
         self.queue = Queue()
         self.status = ChainMonitorStatus.IDLE
 
-    def enqueue(self, block_hash):
+    def enqueue(self, block_hash, block=None):
         """
         Adds a new block hash to the internal queue of the  :obj:`ChainMonitor` and the internal state. The state contains
         the list of ``last_tips`` to prevent notifying about old blocks. ``last_tips`` is bounded to
@@ -96,6 +113,8 @@ class ChainMonitor:
 
         Args:
             block_hash (:obj:`str`): the new best tip.
+            block (:obj:`Block <teos.block_processor.Block>`): the already deserialized block, if available. If so, it
+                is queued instead of the hash so it does not need to be fetched from ``bitcoind``.
 
         Returns:
             :obj:`bool`: True if the state was successfully updated, False otherwise.
@@ -103,7 +122,7 @@ class ChainMonitor:
 
         if block_hash not in self.last_tips:
             with self.lock:
-                self.queue.put(block_hash)
+                self.queue.put(block if block is not None else block_hash)
                 self.last_tips.append(block_hash)
 
                 if len(self.last_tips) > self.max_block_window_size:
@@ -152,7 +171,8 @@ class ChainMonitor:
         """
         Monitors ``bitcoind`` via zmq. Once the method is fired, it keeps monitoring as long as the ``status``
         attribute is not ``ChainMonitorStatus.TERMINATED``. If a new best tip is found, it is added to the internal
-        queue.
+        queue (as a :obj:`Block <teos.block_processor.Block>` if it was received as a raw block). Mempool transactions
+        are sent straight to the ``mempool_queues``.
         """
 
         while self.status != ChainMonitorStatus.TERMINATED:
@@ -167,16 +187,59 @@ class ChainMonitor:
                     self.logger.info("New block received via zmq", block_hash=block_hash)
                     self.enqueue(block_hash)
 
+            elif topic == b"rawblock":
+                try:
+                    block = deserialize_block(body)
+                except DeserializationError as e:
+                    self.logger.error("Cannot deserialize raw block received via zmq", error=str(e))
+                    continue
+
+                if block.hash not in self.last_tips:
+                    self.logger.info("New raw block received via zmq", block_hash=block.hash)
+                    # Blocks without a decodable height are fetched via RPC instead
+                    self.enqueue(block.hash, block if block.height is not None else None)
+
+            elif topic == b"rawtx":
+                # Mempool transactions are only relevant once the subscribers are processing blocks
+                if self.status != ChainMonitorStatus.ACTIVE:
+                    continue
+
+                try:
+                    txid = deserialize_transaction(ByteReader(body)).get("txid")
+                except DeserializationError as e:
+                    self.logger.error("Cannot deserialize raw transaction received via zmq", error=str(e))
+                    continue
+
+                for mempool_queue in self.mempool_queues:
+                    mempool_queue.put(txid)
+
     def notify_subscribers(self):
         """
         Once the method is fired, it keeps getting the elements added to the internal queue and notifies the receiving
         queues about them. It terminates whenever the internal state is set to ``ChainMonitorStatus.TERMINATED``.
+
+        Every block is fetched from ``bitcoind`` only once (or not at all if it was received as a raw block), and the
+        same :obj:`Block <teos.block_processor.Block>` object is sent to all the receiving queues. The cached chain tip
+        and the header index of the :obj:`BlockProcessor <teos.block_processor.BlockProcessor>` are also updated with
+        every block. Since the receiving queues are unbounded, the next block is fetched while the subscribers are still
+        processing the previous ones.
         """
 
         while self.status != ChainMonitorStatus.TERMINATED:
             message = self.queue.get()
             # A special ChainMonitor.END_MESSAGE is added to the queue after the status is set to TERMINATED
-            # In all the other cases, message is a block_hash
+            # In all the other cases, message is a block_hash or an already deserialized Block
+            if message != ChainMonitor.END_MESSAGE:
+                block = self.block_processor.resolve_block(message, blocking=True)
+
+                if block is None:
+                    self.logger.error("Block cannot be fetched. Skipping", block_hash=message)
+                    continue
+
+                # The cached tip is updated before notifying, so it is never behind what the subscribers have seen
+                self.block_processor.update_tip(block, blocking=True)
+                message = block
+
             with self.lock:
                 for rec_queue in self.receiving_queues:
                     rec_queue.put(message)
@@ -184,8 +247,9 @@ class ChainMonitor:
     def monitor_chain(self):
         """
         Changes the ``status`` of the :obj:`ChainMonitor` from idle to listening. It initializes the ``last_tips`` list
-        to terminate the current best tip (by querying the :obj:`BlockProcessor <teos.block_processor.BlockProcessor>`)
-        and creates two threads, one per each monitoring approach (``zmq`` and ``polling``).
+        and the cached chain tip to the current best tip (by querying the
+        :obj:`BlockProcessor <teos.block_processor.BlockProcessor>`) and creates two threads, one per each monitoring
+        approach (``zmq`` and ``polling``).
 
         Raises:
             :obj:`RuntimeError`: if the ``status`` was not ``ChainMonitorStatus.IDLE`` when the method was called.
@@ -198,7 +262,14 @@ class ChainMonitor:
 
         try:
             # Since the ChainMonitor is still bootstrapping we cannot use blocking queries
-            self.last_tips.append(self.block_processor.get_best_block_hash(blocking=False))
+            best_block_hash = self.block_processor.get_best_block_hash(blocking=False)
+            self.last_tips.append(best_block_hash)
+
+            # The cached tip is set so requests can be served without querying bitcoind from the start
+            best_block = self.block_processor.get_parsed_block(best_block_hash, blocking=False)
+            if best_block is not None:
+                self.block_processor.update_tip(best_block)
+
             Thread(target=self.monitor_chain_polling, daemon=True).start()
             Thread(target=self.monitor_chain_zmq, daemon=True).start()
         except ConnectionRefusedError:
@@ -28,12 +28,12 @@ class Cleaner:
         # Delete the appointment
         appointments.pop(uuid)
 
-        # If there was only one appointment that matches the locator we can delete the whole list
+        # If there was only one appointment that matches the locator we can delete the whole map
         if len(locator_uuid_map[locator]) == 1:
             locator_uuid_map.pop(locator)
         else:
-            # Otherwise we just delete the appointment that matches locator:appointment_pos
-            locator_uuid_map[locator].remove(uuid)
+            # Otherwise we just delete the uuid of the appointment
+            locator_uuid_map[locator].pop(uuid, None)
 
     @staticmethod
     def delete_appointment_from_db(uuid, db_manager):
@@ -145,7 +145,7 @@ class Cleaner:
                 Cleaner.logger.info("No more trackers for penalty transaction", penalty_txid=penalty_txid)
 
             else:
-                tx_tracker_map[penalty_txid].remove(uuid)
+                tx_tracker_map[penalty_txid].discard(uuid)
 
         # Delete appointment from the db (from watcher's and responder's db) and remove flag
         db_manager.batch_delete_responder_trackers(completed_trackers)
@@ -165,20 +165,21 @@ class Cleaner:
             database.
         """
 
-        user_ids = []
+        deleted_appointments = {}
         # Remove appointments from memory
         for uuid, user_id in appointment_to_delete.items():
             if user_id in registered_users and uuid in registered_users[user_id].appointments:
                 # Remove the appointment from the appointment list and update the available slots
                 freed_slots = registered_users[user_id].appointments.pop(uuid)
                 registered_users[user_id].available_slots += freed_slots
+                deleted_appointments.setdefault(user_id, []).append(uuid)
 
-                if user_id not in user_ids:
-                    user_ids.append(user_id)
-
-        # Store the updated users in the DB
-        for user_id in user_ids:
-            user_db.store_user(user_id, registered_users[user_id].to_dict())
+        # Update the users in the DB (only the deleted appointments are written, and all the users at once)
+        if deleted_appointments:
+            user_db.batch_update_users(
+                {user_id: registered_users[user_id].to_dict() for user_id in deleted_appointments},
+                deleted_appointments,
+            )
 
     @staticmethod
     def delete_outdated_users(outdated_users, registered_users, user_db):
@@ -195,4 +196,5 @@ class Cleaner:
 
         for user_id in outdated_users:
             registered_users.pop(user_id)
-            user_db.delete_user(user_id)
+
+        user_db.batch_delete_users(outdated_users)
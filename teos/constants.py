@@ -2,3 +2,14 @@ import logging.handlers
 
 SHUTDOWN_GRACE_TIME = 10  # Grace time in seconds to complete any pending call when stopping one of the services of TEOS
 OUTDATED_USERS_CACHE_SIZE_BLOCKS = 10  # Size of the users cache, in blocks
+RPC_BATCH_SIZE = 500  # Max number of calls sent to bitcoind in a single json-rpc batch request
+MEDIAN_TIME_SPAN = 11  # Number of blocks used to compute the median time past of a block
+HEADER_INDEX_SIZE = 2016  # Number of blocks (under the tip) kept in the header index
+LOCATOR_INDEX_SEGMENT_SIZE = 144  # Number of blocks covered by each prefilter of the locator index
+LOCATOR_INDEX_TXS_PER_BLOCK = 3000  # Expected transactions per block, used to size the prefilters of the locator index
+LOCATOR_INDEX_FALSE_POSITIVE_RATE = 0.01  # Target rate of lookups for unknown locators that reach the locator index db
+MEMPOOL_CACHE_SIZE = 100000  # Number of mempool transactions tracked by the Watcher to ignore duplicate announcements
+RECEIPT_LEDGER_SIZE = 100000  # Default number of receipts kept by the Carrier
+RECEIPT_LEDGER_BLOCKS = 1  # Number of blocks a receipt is kept for by the Carrier (a tx can be pushed again afterwards)
+WATCHER_LOCATOR_LOCKS = 256  # Number of locks used by the Watcher to serialize appointments to the same locator
+GATEKEEPER_USER_LOCKS = 256  # Number of locks used by the Gatekeeper to serialize the updates of the same user
@@ -1,3 +1,4 @@
+from common.cryptographer import hash_160
 from common.appointment import Appointment
 
 
@@ -31,12 +32,14 @@ class ExtendedAppointment(Appointment):
 
     def get_summary(self):
         """
-        Returns the summary of an appointment, consisting on the ``locator``, and the ``user_id``.
+        Returns the summary of an appointment, consisting on the ``locator``, the ``user_id`` and the ``blob_hash``
+        (the ``RIPEMD-160`` of the ``encrypted_blob``), so appointments with the same data can be told apart without
+        loading them from the database.
 
         Returns:
             :obj:`dict`: The appointment summary.
         """
-        return {"locator": self.locator, "user_id": self.user_id}
+        return {"locator": self.locator, "user_id": self.user_id, "blob_hash": hash_160(self.encrypted_blob)}
 
     @classmethod
     def from_dict(cls, appointment_data):
@@ -1,11 +1,12 @@
 from math import ceil
 from queue import Queue
-from threading import Thread
+from contextlib import contextmanager, ExitStack
+from threading import Thread, Lock
 from readerwriterlock import rwlock
 
 from teos.cleaner import Cleaner
 from teos.chain_monitor import ChainMonitor
-from teos.constants import OUTDATED_USERS_CACHE_SIZE_BLOCKS
+from teos.constants import OUTDATED_USERS_CACHE_SIZE_BLOCKS, GATEKEEPER_USER_LOCKS
 
 from common.tools import is_compressed_pk, is_u4int
 from common.cryptographer import Cryptographer
@@ -88,10 +89,18 @@ class Gatekeeper:
         user_db (:obj:`UsersDBM <teos.user_dbm.UsersDBM>`): A user database manager instance to interact with the
             database.
         registered_users (:obj:`dict`): A map of ``user_pk:user_info``.
+        outdated_users_index (:obj:`dict`): An index of the users by the height their subscription gets outdated at.
+            Keys are block heights, values are (insertion ordered) dicts with the user ids as keys. Kept up to date on
+            registration, renewal and deletion, so the users outdated at a given height can be found without going
+            through all the registered users.
         outdated_users_cache (:obj:`dict`): A cache of outdated user ids to allow the Watcher and Responder to query
-            deleted data. Keys are bock heights, values are lists of user ids. Has a maximum size of
+            deleted data (e.g. on reorgs). Keys are bock heights, values are lists of user ids. Has a maximum size of
             ``OUTDATED_USERS_CACHE_SIZE_BLOCKS``.
         rw_lock (:obj:`RWLockWrite <rwlock.RWLockWrite>`): A lock object to manage access to the Gatekeeper on updates.
+            The write lock is only taken to add or remove users (and to update ``outdated_users_cache``). Updates of
+            the data of a given user are guarded by the user lock.
+        user_locks (:obj:`list`): A list of ``GATEKEEPER_USER_LOCKS`` locks used to serialize the updates of the same
+            user (see :meth:`get_user_lock`). User locks are always acquired before ``rw_lock``.
     """
 
     def __init__(self, user_db, block_processor, subscription_slots, subscription_duration, expiry_delta):
@@ -104,8 +113,13 @@ class Gatekeeper:
         self.registered_users = {
             user_id: UserInfo.from_dict(user_data) for user_id, user_data in user_db.load_all_users().items()
         }
+        self.outdated_users_index = {}
+        for user_id, user_info in self.registered_users.items():
+            self.outdated_users_index.setdefault(self.get_outdated_height(user_info), {})[user_id] = None
+
         self.outdated_users_cache = {}
         self.rw_lock = rwlock.RWLockWrite()
+        self.user_locks = [Lock() for _ in range(GATEKEEPER_USER_LOCKS)]
 
         # Starts a child thread to take care of expiring subscriptions
         Thread(target=self.manage_subscription_expiry, daemon=True).start()
@@ -127,6 +141,41 @@ class Gatekeeper:
         with self.rw_lock.gen_rlock():
             return self.registered_users.get(user_id)
 
+    def get_outdated_height(self, user_info):
+        """Returns the height a user subscription gets outdated at (``expiry_delta`` blocks after expiring)."""
+        return user_info.subscription_expiry + self.expiry_delta
+
+    def get_user_lock(self, user_id):
+        """
+        Gets the lock that guards the data of a given user. Locks are shared by several users (striped), so the number
+        of locks is bounded.
+
+        Args:
+            user_id(:obj:`str`): the public key that identifies the user (33-bytes hex str).
+
+        Returns:
+            :obj:`Lock`: The lock for the given user.
+        """
+
+        return self.user_locks[int(user_id[-8:], 16) % len(self.user_locks)]
+
+    @contextmanager
+    def lock_users(self, user_ids):
+        """
+        Acquires the locks of a collection of users. Locks are taken in a fixed order (by stripe), so bulk operations
+        cannot deadlock with each other.
+
+        Args:
+            user_ids (:obj:`iterable`): the ids of the users to be locked.
+        """
+
+        stripes = sorted({int(user_id[-8:], 16) % len(self.user_locks) for user_id in user_ids})
+
+        with ExitStack() as stack:
+            for stripe in stripes:
+                stack.enter_context(self.user_locks[stripe])
+            yield
+
     def manage_subscription_expiry(self):
         """
         Manages the subscription expiry of the registered users. Subscriptions are not deleted straightaway for two
@@ -138,15 +187,26 @@ class Gatekeeper:
         """
 
         while True:
-            block_hash = self.block_queue.get()
+            message = self.block_queue.get()
             # When the ChainMonitor is stopped, a final ChainMonitor.END_MESSAGE message is sent
-            if block_hash == ChainMonitor.END_MESSAGE:
+            if message == ChainMonitor.END_MESSAGE:
                 break
 
             # Expired user deletion is delayed. Users are deleted when their subscription is outdated, not expired.
-            block_height = self.block_processor.get_block(block_hash, blocking=True).get("height")
+            block_height = self.block_processor.resolve_block(message, blocking=True).height
             self.update_outdated_users_cache(block_height)
-            Cleaner.delete_outdated_users(self.get_outdated_user_ids(block_height), self.registered_users, self.user_db)
+            outdated_user_ids = self.get_outdated_user_ids(block_height)
+
+            with self.lock_users(outdated_user_ids), self.rw_lock.gen_wlock():
+                # Users may have renewed their subscription (or already been deleted on a reorg) since they were fetched
+                outdated_index = self.outdated_users_index.get(block_height, {})
+                outdated_user_ids = [user_id for user_id in outdated_user_ids if user_id in outdated_index]
+                Cleaner.delete_outdated_users(outdated_user_ids, self.registered_users, self.user_db)
+
+                for user_id in outdated_user_ids:
+                    outdated_index.pop(user_id)
+                if not outdated_index:
+                    self.outdated_users_index.pop(block_height, None)
 
     def add_update_user(self, user_id):
         """
@@ -167,33 +227,41 @@ class Gatekeeper:
         if not is_compressed_pk(user_id):
             raise InvalidParameter("Provided public key does not match expected format (33-byte hex string)")
 
-        with self.rw_lock.gen_wlock():
-            block_count = self.block_processor.get_block_count()
-            if user_id not in self.registered_users:
-                self.registered_users[user_id] = UserInfo(
-                    self.subscription_slots, block_count + self.subscription_duration,
-                )
+        # The tip is read before acquiring the lock (it is cached, but may need to be fetched during bootstrap)
+        block_count = self.block_processor.get_tip_height()
+
+        with self.get_user_lock(user_id):
+            with self.rw_lock.gen_rlock():
+                user_info = self.registered_users.get(user_id)
+
+            if user_info is None:
+                # Only adding a new user (or moving it within the index) requires exclusive access to the registry
+                user_info = UserInfo(self.subscription_slots, block_count + self.subscription_duration)
+                with self.rw_lock.gen_wlock():
+                    self.registered_users[user_id] = user_info
+                    self.outdated_users_index.setdefault(self.get_outdated_height(user_info), {})[user_id] = None
             else:
                 # FIXME: For now new calls to register add subscription_slots to the current count and reset the expiry
                 #  time
-                if not is_u4int(self.registered_users[user_id].available_slots + self.subscription_slots):
+                if not is_u4int(user_info.available_slots + self.subscription_slots):
                     raise InvalidParameter("Maximum slots reached for the subscription")
 
-                self.registered_users[user_id].available_slots += self.subscription_slots
-                self.registered_users[user_id].subscription_expiry = block_count + self.subscription_duration
+                old_outdated_height = self.get_outdated_height(user_info)
+                user_info.available_slots += self.subscription_slots
+                user_info.subscription_expiry = block_count + self.subscription_duration
+
+                if self.get_outdated_height(user_info) != old_outdated_height:
+                    with self.rw_lock.gen_wlock():
+                        self.outdated_users_index[old_outdated_height].pop(user_id)
+                        if not self.outdated_users_index[old_outdated_height]:
+                            self.outdated_users_index.pop(old_outdated_height)
+                        self.outdated_users_index.setdefault(self.get_outdated_height(user_info), {})[user_id] = None
 
-            self.user_db.store_user(user_id, self.registered_users[user_id].to_dict())
-            receipt = create_registration_receipt(
-                user_id,
-                self.registered_users[user_id].available_slots,
-                self.registered_users[user_id].subscription_expiry,
-            )
+            # Only the user header changes here, the appointments are left untouched
+            self.user_db.update_user(user_id, user_info.to_dict())
+            receipt = create_registration_receipt(user_id, user_info.available_slots, user_info.subscription_expiry)
 
-            return (
-                self.registered_users[user_id].available_slots,
-                self.registered_users[user_id].subscription_expiry,
-                receipt,
-            )
+            return user_info.available_slots, user_info.subscription_expiry, receipt
 
     def authenticate_user(self, message, signature):
         """
@@ -245,10 +313,14 @@ class Gatekeeper:
             :obj:`NotEnoughSlots`: if the user does not have enough slots to fill.
         """
 
-        with self.rw_lock.gen_wlock():
+        # Only the user being updated is locked, so appointments from different users do not contend
+        with self.get_user_lock(user_id):
+            with self.rw_lock.gen_rlock():
+                user_info = self.registered_users[user_id]
+
             # For updates the difference between the existing appointment and the update is computed.
-            if uuid in self.registered_users[user_id].appointments:
-                used_slots = self.registered_users[user_id].appointments[uuid]
+            if uuid in user_info.appointments:
+                used_slots = user_info.appointments[uuid]
 
             else:
                 # For regular appointments 1 slot is reserved per ENCRYPTED_BLOB_MAX_SIZE_HEX block.
@@ -256,17 +328,17 @@ class Gatekeeper:
 
             required_slots = ceil(len(ext_appointment.encrypted_blob) / ENCRYPTED_BLOB_MAX_SIZE_HEX)
 
-            if required_slots - used_slots <= self.registered_users.get(user_id).available_slots:
+            if required_slots - used_slots <= user_info.available_slots:
                 # Filling / freeing slots depending on whether this is an update or not, and if it is bigger or smaller
                 # than the old appointment.
-                self.registered_users.get(user_id).appointments[uuid] = required_slots
-                self.registered_users.get(user_id).available_slots -= required_slots - used_slots
-                self.user_db.store_user(user_id, self.registered_users[user_id].to_dict())
+                user_info.appointments[uuid] = required_slots
+                user_info.available_slots -= required_slots - used_slots
+                self.user_db.update_user(user_id, user_info.to_dict(), appointments={uuid: required_slots})
 
             else:
                 raise NotEnoughSlots()
 
-            return self.registered_users.get(user_id).available_slots
+            return user_info.available_slots
 
     def has_subscription_expired(self, user_id):
         """
@@ -287,7 +359,7 @@ class Gatekeeper:
             if user_id not in self.registered_users:
                 raise AuthenticationFailure()
             expiry = self.registered_users[user_id].subscription_expiry
-            return self.block_processor.get_block_count() >= expiry, expiry
+            return self.block_processor.get_tip_height() >= expiry, expiry
 
     def get_outdated_users(self, block_height):
         """
@@ -307,12 +379,11 @@ class Gatekeeper:
             # Try to get the data from the cache
             outdated_users = self.outdated_users_cache.get(block_height)
 
-            # Get the data from registered_users otherwise
+            # Get the data from the index otherwise
             if not outdated_users:
                 outdated_users = {
-                    user_id: list(user_info.appointments.keys())
-                    for user_id, user_info in self.registered_users.items()
-                    if block_height == user_info.subscription_expiry + self.expiry_delta
+                    user_id: list(self.registered_users[user_id].appointments.keys())
+                    for user_id in self.outdated_users_index.get(block_height, {})
                 }
 
             return outdated_users
@@ -376,5 +447,7 @@ class Gatekeeper:
         Args:
             appointments (:obj:`dict`): A collection of appointments to be deleted.
         """
-        with self.rw_lock.gen_wlock():
+
+        # Users are not added or removed here, so only the affected users need to be locked
+        with self.lock_users(set(appointments.values())):
             Cleaner.delete_gatekeeper_appointments(appointments, self.registered_users, self.user_db)
@@ -0,0 +1,119 @@
+from threading import Thread, Condition, Event
+from concurrent.futures import Future
+
+
+class GroupCommitter:
+    """
+    The :class:`GroupCommitter` gathers the writes to a database coming from concurrent requests, and commits them
+    using a single ``WriteBatch``, so the cost of a commit (specially of synchronous ones) is shared by all of them.
+
+    Writes are queued using :meth:`submit`, which returns a :obj:`Future` that is resolved once the writes have been
+    committed. Writes are committed in the same order they were submitted, and writes submitted together are committed
+    atomically.
+
+    Args:
+        db (:obj:`plyvel.DB`): the database the writes are committed to.
+        commit_interval (:obj:`float`): the time (in seconds) the committer waits for more writes to arrive before
+            committing a batch. If zero, batches are committed straightaway (writes submitted while a batch is being
+            committed are still grouped).
+        sync (:obj:`bool`): whether batches are committed synchronously (flushed to disk before the futures are
+            resolved) or not.
+
+    Attributes:
+        pending (:obj:`list`): the submitted writes not yet committed, as ``(puts, deletes, future)`` tuples.
+        stopped (:obj:`Event`): set when the committer is stopped. No writes are accepted afterwards.
+    """
+
+    def __init__(self, db, commit_interval=0, sync=False):
+        self.db = db
+        self.commit_interval = commit_interval
+        self.sync = sync
+        self.pending = []
+        self.stopped = Event()
+        self.condition = Condition()
+
+        self.committer_thread = Thread(target=self.do_commit, daemon=True)
+        self.committer_thread.start()
+
+    def submit(self, puts=None, deletes=None):
+        """
+        Queues a collection of writes to be committed in the next batch.
+
+        Args:
+            puts (:obj:`list`): a list of ``(key, value)`` pairs (as bytes) to be stored. Optional.
+            deletes (:obj:`list`): a list of keys (as bytes) to be deleted. Optional.
+
+        Returns:
+            :obj:`Future`: A future resolved to ``True`` once the writes have been committed (or to the exception raised
+            by the database if they could not be).
+
+        Raises:
+            :obj:`RuntimeError`: if the committer has been stopped.
+        """
+
+        future = Future()
+
+        with self.condition:
+            if self.stopped.is_set():
+                raise RuntimeError("Cannot submit writes to a stopped committer")
+
+            self.pending.append((puts or [], deletes or [], future))
+            self.condition.notify()
+
+        return future
+
+    def write(self, puts=None, deletes=None):
+        """
+        Queues a collection of writes and waits until they are committed.
+
+        Args:
+            puts (:obj:`list`): a list of ``(key, value)`` pairs (as bytes) to be stored. Optional.
+            deletes (:obj:`list`): a list of keys (as bytes) to be deleted. Optional.
+
+        Raises:
+            :obj:`RuntimeError`: if the committer has been stopped or the database is closed.
+        """
+
+        self.submit(puts, deletes).result()
+
+    def do_commit(self):
+        """Commits the pending writes in batches until the committer is stopped."""
+
+        while True:
+            with self.condition:
+                while not self.pending and not self.stopped.is_set():
+                    self.condition.wait()
+
+                if not self.pending:
+                    return
+
+            # Give some time to other requests to join the batch (unless the committer is being stopped)
+            if self.commit_interval:
+                self.stopped.wait(self.commit_interval)
+
+            with self.condition:
+                batch, self.pending = self.pending, []
+
+            try:
+                with self.db.write_batch(transaction=True, sync=self.sync) as b:
+                    for puts, deletes, _ in batch:
+                        for key, value in puts:
+                            b.put(key, value)
+                        for key in deletes:
+                            b.delete(key)
+
+                for _, _, future in batch:
+                    future.set_result(True)
+
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+
+    def stop(self):
+        """Stops the committer once all the pending writes have been committed."""
+
+        with self.condition:
+            self.stopped.set()
+            self.condition.notify()
+
+        self.committer_thread.join()
@@ -0,0 +1,257 @@
+from threading import Lock
+
+from teos.logger import get_logger
+from teos.constants import HEADER_INDEX_SIZE
+
+
+class HeaderIndex:
+    """
+    The :class:`HeaderIndex` is an in-memory index of the block headers of the best chain (and recent forks), so
+    questions about the shape of the chain (distance to the tip, whether a block has been reorged out, fork points,
+    ...) can be answered locally instead of walking the chain by querying ``bitcoind``.
+
+    Only the data needed to link blocks is kept (``height`` and ``prev_block_hash``), and only for the last
+    ``max_size`` blocks under the tip. Headers are connected on top of each other, so the index has no gaps. If a
+    header that does not connect to the index is given, the index is restarted from it.
+
+    The index can optionally be backed by a database, so it survives restarts.
+
+    Args:
+        max_size (:obj:`int`): the number of blocks (under the tip) kept in the index.
+        db_manager (:obj:`AppointmentsDBM <teos.appointments_dbm.AppointmentsDBM>`): an optional database manager to
+            persist the index. If set, the index is loaded from it on creation.
+
+    Attributes:
+        logger (:obj:`Logger <teos.logger.Logger>`): The logger for this component.
+        headers (:obj:`dict`): A ``block_hash:(height, prev_block_hash)`` map of all the indexed headers.
+        heights (:obj:`dict`): A ``height:block_hashes`` map of all the indexed headers (``block_hashes`` being a
+            :obj:`set`), so headers can be pruned by height. Since headers are connected on top of each other, the
+            indexed heights are always contiguous.
+        best_chain (:obj:`dict`): A ``height:block_hash`` map of the indexed blocks in the best chain.
+        tip (:obj:`str`): The hash of the best chain tip (:obj:`None` if the index is empty).
+        lock (:obj:`Lock`): A lock to protect the index from concurrent access.
+    """
+
+    def __init__(self, max_size=HEADER_INDEX_SIZE, db_manager=None):
+        self.logger = get_logger(component=HeaderIndex.__name__)
+        self.max_size = max_size
+        self.db_manager = db_manager
+        self.headers = {}
+        self.heights = {}
+        self.best_chain = {}
+        self.tip = None
+        self.lock = Lock()
+
+        if db_manager is not None:
+            tip = db_manager.load_header_index_tip()
+            headers = db_manager.load_headers()
+
+            if tip in headers:
+                for block_hash, (height, prev_block_hash) in headers.items():
+                    self._add_header(block_hash, height, prev_block_hash)
+                self.tip = tip
+                self._update_best_chain()
+            elif headers:
+                # The tip was not stored, so the data cannot be trusted
+                self.logger.info("Header index tip not found. Starting from scratch")
+                db_manager.batch_delete_headers(list(headers.keys()))
+
+    def __len__(self):
+        with self.lock:
+            return len(self.headers)
+
+    def __contains__(self, block_hash):
+        with self.lock:
+            return block_hash in self.headers
+
+    @property
+    def tip_height(self):
+        """The height of the best chain tip (:obj:`None` if the index is empty)."""
+        with self.lock:
+            return self.headers[self.tip][0] if self.tip is not None else None
+
+    def get_height(self, block_hash):
+        """Returns the height of a given block if it is indexed, :obj:`None` otherwise."""
+        with self.lock:
+            header = self.headers.get(block_hash)
+            return header[0] if header else None
+
+    def _add_header(self, block_hash, height, prev_block_hash):
+        """Adds a header to ``headers`` and ``heights``. Must be called holding the lock (or on init)."""
+
+        self.headers[block_hash] = (height, prev_block_hash)
+        self.heights.setdefault(height, set()).add(block_hash)
+
+    def _update_best_chain(self):
+        """
+        Updates ``best_chain`` after a tip change. The chain is walked back from the tip only until it meets the old
+        best chain, and the heights of the old best chain are contiguous, so only the heights that change are visited.
+        This is ``O(depth of the change)``. Must be called holding the lock.
+        """
+
+        tip_height = self.headers[self.tip][0]
+
+        # Blocks over the tip are no longer part of the best chain (the new tip may be lower than the old one)
+        height = tip_height + 1
+        while height in self.best_chain:
+            del self.best_chain[height]
+            height += 1
+
+        block_hash = self.tip
+        lowest_height = tip_height
+        while block_hash in self.headers:
+            height, prev_block_hash = self.headers[block_hash]
+            if self.best_chain.get(height) == block_hash:
+                return
+
+            self.best_chain[height] = block_hash
+            lowest_height = height
+            block_hash = prev_block_hash
+
+        # If the walk left the index before meeting the old best chain, whatever is under it is not linked to the tip
+        height = lowest_height - 1
+        while height in self.best_chain:
+            del self.best_chain[height]
+            height -= 1
+
+    def _prune(self):
+        """
+        Removes the headers that are ``max_size`` or more blocks under the tip. Must be called holding the lock.
+
+        Everything under the previous minimum height was pruned already, so only the heights right under the new one
+        are visited (normally just one).
+
+        Returns:
+            :obj:`list`: The hashes of the removed headers.
+        """
+
+        pruned = []
+        height = self.headers[self.tip][0] - self.max_size
+
+        while height in self.heights:
+            for block_hash in self.heights.pop(height):
+                del self.headers[block_hash]
+                pruned.append(block_hash)
+            self.best_chain.pop(height, None)
+            height -= 1
+
+        return pruned
+
+    def connect(self, headers):
+        """
+        Adds a list of headers to the index. The last header of the list becomes the new best tip.
+
+        Args:
+            headers (:obj:`list`): a list of ``(block_hash, height, prev_block_hash)`` tuples, sorted by height (each
+                one building on top of the previous). The first one should build on top of an indexed header.
+                Otherwise, the index is restarted.
+        """
+
+        if not headers:
+            return
+
+        with self.lock:
+            pruned = []
+            if self.headers and headers[0][2] not in self.headers and headers[0][0] not in self.headers:
+                self.logger.info("Header does not connect to the index. Restarting it", block_hash=headers[0][0])
+                pruned = list(self.headers.keys())
+                self.headers = {}
+                self.heights = {}
+                self.best_chain = {}
+
+            new_headers = {}
+            for block_hash, height, prev_block_hash in headers:
+                if block_hash not in self.headers:
+                    self._add_header(block_hash, height, prev_block_hash)
+                    new_headers[block_hash] = [height, prev_block_hash]
+
+            self.tip = headers[-1][0]
+            self._update_best_chain()
+            pruned.extend(self._prune())
+
+            if self.db_manager is not None:
+                self.db_manager.store_headers({k: v for k, v in new_headers.items() if k in self.headers})
+                self.db_manager.batch_delete_headers([k for k in pruned if k not in self.headers])
+                self.db_manager.store_header_index_tip(self.tip)
+
+    def is_in_best_chain(self, block_hash):
+        """
+        Checks whether a given block is in the best chain.
+
+        Args:
+            block_hash (:obj:`str`): the hash of the block to check.
+
+        Returns:
+            :obj:`bool` or :obj:`None`: Whether the block is in the best chain or not. :obj:`None` if it cannot be told
+            using the index (e.g. the block is not indexed).
+        """
+
+        with self.lock:
+            header = self.headers.get(block_hash)
+            if header is None or header[0] not in self.best_chain:
+                return None
+
+            return self.best_chain.get(header[0]) == block_hash
+
+    def get_distance_to_tip(self, block_hash):
+        """
+        Computes the height distance between a given block and the best chain tip.
+
+        Args:
+            block_hash (:obj:`str`): the hash of the block.
+
+        Returns:
+            :obj:`int` or :obj:`None`: The distance to the tip if the block is indexed. :obj:`None` otherwise.
+        """
+
+        with self.lock:
+            header = self.headers.get(block_hash)
+            if header is None:
+                return None
+
+            return self.headers[self.tip][0] - header[0]
+
+    def find_fork_point(self, block_hash):
+        """
+        Finds the last block in the best chain that is an ancestor of a given block.
+
+        Args:
+            block_hash (:obj:`str`): the hash of the block.
+
+        Returns:
+            :obj:`tuple` or :obj:`None`: A tuple (:obj:`str`, :obj:`list`) with the hash of the last common ancestor and
+            the list of hashes of the forked out blocks (from ``block_hash`` down to the ancestor, excluded).
+            :obj:`None` if the fork point cannot be found in the index.
+        """
+
+        forked_blocks = []
+
+        with self.lock:
+            while block_hash in self.headers:
+                height, prev_block_hash = self.headers[block_hash]
+                if self.best_chain.get(height) == block_hash:
+                    return block_hash, forked_blocks
+
+                forked_blocks.append(block_hash)
+                block_hash = prev_block_hash
+
+        return None
+
+    def get_best_chain_after(self, block_hash):
+        """
+        Gets the hashes of the best chain blocks built on top of a given block.
+
+        Args:
+            block_hash (:obj:`str`): the hash of the block. It must be part of the best chain.
+
+        Returns:
+            :obj:`list` or :obj:`None`: The hashes of the blocks from the child of ``block_hash`` to the tip (both
+            included). :obj:`None` if the block is not indexed or it is not in the best chain.
+        """
+
+        with self.lock:
+            header = self.headers.get(block_hash)
+            if header is None or self.best_chain.get(header[0]) != block_hash:
+                return None
+
+            return [self.best_chain[height] for height in range(header[0] + 1, self.headers[self.tip][0] + 1)]
@@ -15,6 +15,12 @@ def show_usage():
         "\n\t--btcrpcport \t\tbitcoind rpcport. Defaults to '8332'."
         "\n\t--btcfeedconnect \tbitcoind zmq hostname (for blocks). Defaults to 'localhost'."
         "\n\t--btcfeedport \t\tbitcoind zmq port (for blocks). Defaults to '28332'."
+        "\n\t--btcfeedrawblock \tSubscribe to bitcoind zmq rawblock (instead of hashblock) and parse blocks locally."
+        "\n\t                  \tbitcoind must be run with -zmqpubrawblock."
+        "\n\t--btcfeedrawtx \t\tAlso subscribe to bitcoind zmq rawtx to detect breaches in the mempool."
+        "\n\t               \t\tbitcoind must be run with -zmqpubrawtx (on the same port as the block feed)."
+        "\n\t--mempoolbroadcast \tBroadcast penalties as soon as a breach is seen in the mempool."
+        "\n\t                   \tNeeds --btcfeedrawtx."
         "\n\t--datadir \t\tSpecify data directory. Defaults to '~\\.teos'."
         "\n\t--wsgi \t\t\tThe WSGI server used to run the API. Either 'gunicorn' or 'waitress'. Defaults to 'gunicorn'."
         "\n\t       \t\t\tNotice 'gunicorn' does not work on Windows, so Windows users must use 'waitress'."
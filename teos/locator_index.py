@@ -0,0 +1,248 @@
+import plyvel
+from math import ceil, log
+from threading import Lock
+
+from teos.logger import get_logger
+from common.db_manager import DBManager
+from teos.constants import (
+    LOCATOR_INDEX_SEGMENT_SIZE,
+    LOCATOR_INDEX_TXS_PER_BLOCK,
+    LOCATOR_INDEX_FALSE_POSITIVE_RATE,
+)
+
+LOCATOR_PREFIX = b"l"
+BLOCK_PREFIX = b"b"
+
+LOCATOR_SIZE = 16  # In bytes
+HEIGHT_SIZE = 4  # In bytes
+
+
+class LocatorFilter:
+    """
+    A bloom filter of locators. Since locators are derived from transaction ids, their bytes are already uniformly
+    distributed, so the bit positions are taken straight from them (``PROBES`` 32-bit chunks) instead of hashing.
+
+    Args:
+        size (:obj:`int`): the number of bits of the filter. Must be a power of two (see :meth:`get_size`).
+
+    Attributes:
+        bits (:obj:`bytearray`): The filter bits.
+    """
+
+    PROBES = LOCATOR_SIZE // 4
+
+    def __init__(self, size):
+        if size <= 0 or size & (size - 1):
+            raise ValueError("The filter size must be a power of two")
+
+        self.mask = size - 1
+        self.bits = bytearray(size // 8 or 1)
+
+    @classmethod
+    def get_size(cls, capacity, false_positive_rate):
+        """
+        Computes the size of a filter holding ``capacity`` locators with a given false positive rate (at most). The
+        size is rounded up to the next power of two.
+
+        Args:
+            capacity (:obj:`int`): the number of locators to be added to the filter.
+            false_positive_rate (:obj:`float`): the target false positive rate (between 0 and 1).
+
+        Returns:
+            :obj:`int`: The number of bits of the filter.
+        """
+
+        # A bloom filter of m bits with k probes holding n items has a false positive rate of (1 - e^(-kn/m))^k
+        bits = -cls.PROBES * capacity / log(1 - false_positive_rate ** (1 / cls.PROBES))
+
+        # Positions are 32-bit long, so filters cannot be bigger than that
+        return 1 << min(max(ceil(log(bits, 2)), 3), 32)
+
+    def _positions(self, locator):
+        return [int.from_bytes(locator[i : i + 4], "big") & self.mask for i in range(0, LOCATOR_SIZE, 4)]  # noqa: E203
+
+    def add(self, locator):
+        """Adds a locator (as :obj:`bytes`) to the filter."""
+
+        for position in self._positions(locator):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, locator):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(locator))
+
+
+class LocatorIndex(DBManager):
+    """
+    The :class:`LocatorIndex` is an on-disk ``locator:txid`` index (``LevelDB``) covering the last ``window`` blocks,
+    so appointments whose dispute transaction is too old to be in the
+    :obj:`LocatorCache <teos.watcher.LocatorCache>` can still be matched.
+
+    The index is built incrementally from the blocks processed by the :obj:`Watcher <teos.watcher.Watcher>` and pruned
+    by height. Lookups go through an in-memory prefilter first (a bloom filter per segment of
+    ``LOCATOR_INDEX_SEGMENT_SIZE`` blocks), so the database is only hit for locators that are likely to be indexed.
+    Every lookup checks all the segments, so the prefilters are sized for a false positive rate of
+    ``LOCATOR_INDEX_FALSE_POSITIVE_RATE`` over the whole window (assuming ``LOCATOR_INDEX_TXS_PER_BLOCK`` transactions
+    per block). That is, roughly that share of the lookups for unknown locators still reach the database, and bigger
+    windows need bigger prefilters. Whole segments are dropped as the window moves forward.
+
+    Data is stored in binary form to keep the index compact:
+
+        - ``LOCATOR_PREFIX``, defined as ``b'l``, maps ``locator`` (16 bytes) to ``txid`` (32 bytes).
+        - ``BLOCK_PREFIX``, defined as ``b'b``, maps ``height`` (4 bytes, big endian) to the block hash (32 bytes)
+          followed by the locators of the block (16 bytes each). Used for pruning and reorgs.
+
+    Args:
+        db_path (:obj:`str`): the path (relative or absolute) to the system folder containing the database. A fresh
+            database will be created if the specified path does not contain one.
+        window (:obj:`int`): the number of blocks covered by the index.
+
+    Attributes:
+        logger (:obj:`Logger <teos.logger.Logger>`): The logger for this component.
+        filters (:obj:`dict`): A ``segment:LocatorFilter`` map with the prefilters of the indexed segments.
+        filter_size (:obj:`int`): The number of bits of each prefilter.
+        tip_height (:obj:`int`): The height of the last indexed block.
+        lock (:obj:`Lock`): A lock to protect the filters from concurrent access.
+
+    Raises:
+        :obj:`ValueError`: If the provided ``db_path`` is not a string.
+        :obj:`plyvel.Error`: If the db is currently unavailable (being used by another process).
+    """
+
+    def __init__(self, db_path, window):
+        self.logger = get_logger(component=LocatorIndex.__name__)
+
+        if not isinstance(db_path, str):
+            raise ValueError("db_path must be a valid path/name")
+
+        try:
+            super().__init__(db_path)
+
+        except plyvel.Error as e:
+            if "LOCK: Resource temporarily unavailable" in str(e):
+                self.logger.info("The db is already being used by another process (LOCK)")
+
+            raise e
+
+        self.window = window
+        self.filters = {}
+
+        # The window may partially cover a segment at each end
+        segments = window // LOCATOR_INDEX_SEGMENT_SIZE + 2
+        self.filter_size = LocatorFilter.get_size(
+            LOCATOR_INDEX_SEGMENT_SIZE * LOCATOR_INDEX_TXS_PER_BLOCK, LOCATOR_INDEX_FALSE_POSITIVE_RATE / segments
+        )
+        self.tip_height = None
+        self.lock = Lock()
+
+        # The prefilters are not persisted, they are rebuilt from the indexed blocks
+        for key, value in self.db.iterator(prefix=BLOCK_PREFIX):
+            height = int.from_bytes(key[len(BLOCK_PREFIX) :], "big")  # noqa: E203
+            self._add_to_filter(height, value[32:])
+            self.tip_height = height
+
+        self.logger.info(
+            "Locator index loaded",
+            tip_height=self.tip_height,
+            segments=len(self.filters),
+            filter_size_bytes=self.filter_size // 8,
+        )
+
+    @staticmethod
+    def _block_key(height):
+        return BLOCK_PREFIX + height.to_bytes(HEIGHT_SIZE, "big")
+
+    def _add_to_filter(self, height, locators):
+        """Adds the locators of a block (as concatenated :obj:`bytes`) to the prefilter of its segment."""
+
+        segment = height // LOCATOR_INDEX_SEGMENT_SIZE
+        if segment not in self.filters:
+            self.filters[segment] = LocatorFilter(self.filter_size)
+
+        locator_filter = self.filters[segment]
+        for i in range(0, len(locators), LOCATOR_SIZE):
+            locator_filter.add(locators[i : i + LOCATOR_SIZE])  # noqa: E203
+
+    def _delete_blocks(self, batch, start_height, stop_height=None):
+        """
+        Adds the deletion of the indexed blocks within ``[start_height, stop_height)`` (and their locators) to a write
+        batch.
+
+        Returns:
+            :obj:`int`: The number of deleted blocks.
+        """
+
+        # Block keys have a fixed length, so the range can be bounded by the largest possible height
+        stop = self._block_key(stop_height) if stop_height is not None else BLOCK_PREFIX + b"\xff" * (HEIGHT_SIZE + 1)
+        deleted = 0
+
+        for key, value in self.db.iterator(start=self._block_key(start_height), stop=stop):
+            locators = value[32:]
+            for i in range(0, len(locators), LOCATOR_SIZE):
+                batch.delete(LOCATOR_PREFIX + locators[i : i + LOCATOR_SIZE])  # noqa: E203
+            batch.delete(key)
+            deleted += 1
+
+        return deleted
+
+    def add_block(self, block):
+        """
+        Adds the locators of a block to the index and prunes the blocks that fall out of the window.
+
+        If a block at the same height (or above) was already indexed, it is considered reorged out and removed first.
+        Notice that the prefilters cannot forget reorged out locators, but that only means they will be looked up in
+        the database (where they will not be found).
+
+        Args:
+            block (:obj:`Block <teos.block_processor.Block>`): the block to be indexed.
+        """
+
+        if block.height is None:
+            return
+
+        with self.db.write_batch() as batch:
+            disconnected = self._delete_blocks(batch, block.height)
+            if disconnected:
+                self.logger.info("Removing reorged out blocks from the index", height=block.height, blocks=disconnected)
+
+            locators = b""
+            for locator, txid in block.locator_txid_map.items():
+                locator = bytes.fromhex(locator)
+                batch.put(LOCATOR_PREFIX + locator, bytes.fromhex(txid))
+                locators += locator
+
+            batch.put(self._block_key(block.height), bytes.fromhex(block.hash) + locators)
+
+            min_height = block.height - self.window + 1
+            if min_height > 0:
+                self._delete_blocks(batch, 0, min_height)
+
+        with self.lock:
+            self._add_to_filter(block.height, locators)
+            self.tip_height = block.height
+
+            # Segments are only dropped once all their blocks are out of the window
+            for segment in [s for s in self.filters if (s + 1) * LOCATOR_INDEX_SEGMENT_SIZE <= min_height]:
+                del self.filters[segment]
+
+    def get_txid(self, locator):
+        """
+        Gets a txid from the index.
+
+        Args:
+            locator (:obj:`str`): the locator to lookup in the index.
+
+        Returns:
+            :obj:`str` or :obj:`None`: The txid linked to the given locator if found. None otherwise.
+        """
+
+        locator = bytes.fromhex(locator)
+
+        with self.lock:
+            maybe_indexed = any(locator in locator_filter for locator_filter in self.filters.values())
+
+        if not maybe_indexed:
+            return None
+
+        txid = self.db.get(LOCATOR_PREFIX + locator)
+
+        return txid.hex() if txid is not None else None
@@ -1,5 +1,5 @@
 from queue import Queue
-from threading import Thread
+from threading import Thread, Event, Lock
 from readerwriterlock import rwlock
 
 from teos.cleaner import Cleaner
@@ -98,6 +98,47 @@ class TransactionTracker:
         return {"locator": self.locator, "user_id": self.user_id, "penalty_txid": self.penalty_txid}
 
 
+class BreachBroadcast:
+    """
+    A :class:`BreachBroadcast` is the outcome of a penalty queued for broadcast by
+    :meth:`Responder.handle_breach_async`.
+
+    The receipt of the broadcast is handled (the tracker is created, if delivered, and the broadcast intent deleted) by
+    the first thread calling :meth:`result`, instead of by the :obj:`Carrier <teos.carrier.Carrier>` workers. That way
+    the writes are done by the thread processing the breach, and join its block batch, if any.
+
+    Args:
+        future (:obj:`Future`): the future returned by :meth:`Carrier.broadcast <teos.carrier.Carrier.broadcast>`.
+        on_receipt (:obj:`function`): the function handling the :obj:`Receipt <teos.carrier.Receipt>`.
+
+    Attributes:
+        handled (:obj:`bool`): Whether the receipt has already been handled.
+    """
+
+    def __init__(self, future, on_receipt):
+        self.future = future
+        self.on_receipt = on_receipt
+        self.handled = False
+        self.lock = Lock()
+
+    def result(self):
+        """
+        Waits for the penalty to be broadcast and handles the receipt (only the first time it is called).
+
+        Returns:
+            :obj:`Receipt <teos.carrier.Receipt>`: The receipt of the broadcast.
+        """
+
+        receipt = self.future.result()
+
+        with self.lock:
+            if not self.handled:
+                self.on_receipt(receipt)
+                self.handled = True
+
+        return receipt
+
+
 class Responder:
     """
     The :class:`Responder` is in charge of ensuring that channel breaches are dealt with. It does so handling
@@ -110,18 +151,31 @@ class Responder:
         carrier (:obj:`Carrier <teos.carrier.Carrier>`): a carrier instance to send transactions to bitcoind.
         block_processor (:obj:`BlockProcessor <teos.block_processor.BlockProcessor>`): a block processor instance to
             get data from bitcoind.
+        confirmations_before_retry (:obj:`int`): the number of confirmations a ``penalty_tx`` can miss before being
+            rebroadcast.
+        mempool_check_interval (:obj:`int`): how often (in seconds) the presence of the unconfirmed ``penalty_txs`` in
+            ``bitcoind``'s mempool is checked, so the evicted (or replaced) ones can be rebroadcast straightaway. Zero
+            disables the check, so penalties are only rebroadcast after missing ``confirmations_before_retry`` blocks.
 
     Attributes:
         logger (:obj:`Logger <teos.logger.Logger>`): The logger for this component.
         trackers (:obj:`dict`): A dictionary containing the minimum information about the :obj:`TransactionTracker`
             required by the :obj:`Responder` (``penalty_txid``, ``locator`` and ``user_id``). Each entry is identified
             by a ``uuid``.
-        tx_tracker_map (:obj:`dict`): A ``penalty_txid:uuid`` map used to allow the :obj:`Responder` to deal with
+        tx_tracker_map (:obj:`dict`): A ``penalty_txid:set(uuid)`` map used to allow the :obj:`Responder` to deal with
             several trackers triggered by the same ``penalty_txid``.
-        unconfirmed_txs (:obj:`list`): A list that keeps track of all unconfirmed ``penalty_txs``.
-        missed_confirmations (:obj:`dict`): A dictionary that keeps count of how many confirmations each ``penalty_tx``
-            has missed. Used to trigger rebroadcast if needed.
-        block_queue (:obj:`Queue`): A queue used by the :obj:`Responder` to receive block hashes from ``bitcoind``. It
+        unconfirmed_txs (:obj:`set`): A set that keeps track of all unconfirmed ``penalty_txs``.
+        unconfirmed_since (:obj:`dict`): A ``penalty_txid:height`` map with the height at which each unconfirmed
+            ``penalty_tx`` was (re)broadcast. The confirmations missed by a transaction are derived from it.
+        rebroadcast_index (:obj:`dict`): A ``height:set(penalty_txid)`` map with the unconfirmed ``penalty_txs`` that
+            will have missed ``confirmations_before_retry`` confirmations at every height. Used to trigger rebroadcast
+            if needed.
+        inclusion_heights (:obj:`dict`): A ``penalty_txid:height`` map with the height of the block each confirmed
+            ``penalty_tx`` was included in. Used to compute confirmations without querying ``bitcoind``.
+        inclusion_index (:obj:`dict`): A ``height:set(penalty_txid)`` map, the reverse of ``inclusion_heights``.
+        unlocated_penalties (:obj:`set`): The confirmed ``penalty_txs`` whose inclusion height is unknown (e.g. loaded
+            from the database, after a reorg or already on chain when broadcast). They are looked up in ``bitcoind``.
+        block_queue (:obj:`Queue`): A queue used by the :obj:`Responder` to receive blocks from ``bitcoind``. It
             is populated by the :obj:`ChainMonitor <teos.chain_monitor.ChainMonitor>`.
         db_manager (:obj:`AppointmentsDBM <teos.appointments_dbm.AppointmentsDBM>`): An instance of the appointment
                 database manager to interact with the database.
@@ -131,22 +185,41 @@ class Responder:
         block_processor (:obj:`BlockProcessor <teos.block_processor.BlockProcessor>`): A block processor instance to
             get data from bitcoind.
         last_known_block (:obj:`str`): The last block known by the :obj:`Responder`.
+        last_known_height (:obj:`int`): The height of the last block known by the :obj:`Responder` (:obj:`None` until
+            the first block is received).
         rw_lock (:obj:`RWLockWrite <rwlock.RWLockWrite>`): A lock object to manage access to the Responder on updates.
+        mempool_check_stop (:obj:`Event`): An event used to stop the mempool checks once the :obj:`Responder` stops.
     """
 
-    def __init__(self, db_manager, gatekeeper, carrier, block_processor):
+    def __init__(
+        self,
+        db_manager,
+        gatekeeper,
+        carrier,
+        block_processor,
+        confirmations_before_retry=CONFIRMATIONS_BEFORE_RETRY,
+        mempool_check_interval=0,
+    ):
         self.logger = get_logger(component=Responder.__name__)
         self.trackers = dict()
         self.tx_tracker_map = dict()
-        self.unconfirmed_txs = []
-        self.missed_confirmations = dict()
+        self.unconfirmed_txs = set()
+        self.unconfirmed_since = dict()
+        self.rebroadcast_index = dict()
+        self.inclusion_heights = dict()
+        self.inclusion_index = dict()
+        self.unlocated_penalties = set()
         self.block_queue = Queue()
         self.db_manager = db_manager
         self.gatekeeper = gatekeeper
         self.carrier = carrier
         self.block_processor = block_processor
         self.last_known_block = db_manager.load_last_block_hash_responder()
+        self.last_known_height = None
+        self.confirmations_before_retry = confirmations_before_retry
+        self.mempool_check_interval = mempool_check_interval
         self.rw_lock = rwlock.RWLockWrite()
+        self.mempool_check_stop = Event()
 
     @property
     def n_responder_trackers(self):
@@ -225,19 +298,90 @@ class Responder:
             into the blockchain.
         """
 
-        receipt = self.carrier.send_transaction(penalty_rawtx, penalty_txid)
+        return self.handle_breach_async(
+            uuid, locator, dispute_txid, penalty_txid, penalty_rawtx, user_id, block_hash
+        ).result()
 
-        if receipt.delivered:
-            self.add_tracker(uuid, locator, dispute_txid, penalty_txid, penalty_rawtx, user_id, receipt.confirmations)
+    def handle_breach_async(self, uuid, locator, dispute_txid, penalty_txid, penalty_rawtx, user_id, block_hash):
+        """
+        Same as :meth:`handle_breach`, but the ``penalty_tx`` is queued in the :obj:`Carrier <teos.carrier.Carrier>`
+        instead of being pushed straightaway, so the caller does not have to wait for ``bitcoind``.
 
-        else:
-            # TODO: Add the missing reasons (e.g. RPC_VERIFY_REJECTED)
-            # TODO: Use self.on_sync(block_hash) to check whether or not we failed because we are out of sync
-            self.logger.warning(
-                "Tracker cannot be created", reason=receipt.reason, uuid=uuid, on_sync=self.on_sync(block_hash)
+        A broadcast intent is stored in the database before queueing the transaction, and deleted once the outcome has
+        been handled, so penalties that were queued but not tracked when the tower went down can be handled again on
+        restart (see :meth:`replay_broadcast_intents`).
+
+        The outcome is handled by the thread waiting for it (see :obj:`BreachBroadcast`), so callers must always call
+        ``result`` on the returned object.
+
+        Args:
+            uuid (:obj:`str`): a unique identifier for the appointment.
+            locator (:obj:`str`): the appointment locator provided by the user (16-byte hex-encoded).
+            dispute_txid (:obj:`str`): the id of the transaction that created the channel breach.
+            penalty_txid (:obj:`str`): the id of the decrypted transaction included in the appointment.
+            penalty_rawtx (:obj:`str`): the raw transaction to be broadcast in response of the breach.
+            user_id(:obj:`str`): the public key that identifies the user (33-bytes hex str).
+            block_hash (:obj:`str`): the block hash at which the breach was seen (used to see if we are on sync).
+
+        Returns:
+            :obj:`BreachBroadcast`: The pending broadcast. Its ``result`` is the :obj:`Receipt <teos.carrier.Receipt>`
+            of the broadcast, returned once the tracker has been created (if delivered).
+        """
+
+        intent = {
+            "locator": locator,
+            "dispute_txid": dispute_txid,
+            "penalty_txid": penalty_txid,
+            "penalty_rawtx": penalty_rawtx,
+            "user_id": user_id,
+            "block_hash": block_hash,
+        }
+        self.db_manager.store_broadcast_intent(uuid, intent)
+
+        def on_receipt(receipt):
+            if receipt.delivered:
+                self.add_tracker(
+                    uuid, locator, dispute_txid, penalty_txid, penalty_rawtx, user_id, receipt.confirmations
+                )
+
+            else:
+                # TODO: Add the missing reasons (e.g. RPC_VERIFY_REJECTED)
+                # TODO: Use self.on_sync(block_hash) to check whether or not we failed because we are out of sync
+                self.logger.warning(
+                    "Tracker cannot be created", reason=receipt.reason, uuid=uuid, on_sync=self.on_sync(block_hash)
+                )
+
+            self.db_manager.delete_broadcast_intent(uuid)
+
+        return BreachBroadcast(self.carrier.broadcast(penalty_rawtx, penalty_txid), on_receipt)
+
+    def replay_broadcast_intents(self):
+        """
+        Handles the breaches whose penalties were queued for broadcast but never tracked (e.g. because the tower went
+        down while they were being pushed). Appointments whose penalty is delivered are flagged as triggered, like the
+        :obj:`Watcher <teos.watcher.Watcher>` does.
+        """
+
+        intents = self.db_manager.load_broadcast_intents()
+
+        for uuid, intent in intents.items():
+            if uuid in self.trackers:
+                self.db_manager.delete_broadcast_intent(uuid)
+                continue
+
+            self.logger.info("Replaying broadcast intent", uuid=uuid, penalty_txid=intent.get("penalty_txid"))
+            receipt = self.handle_breach(
+                uuid,
+                intent.get("locator"),
+                intent.get("dispute_txid"),
+                intent.get("penalty_txid"),
+                intent.get("penalty_rawtx"),
+                intent.get("user_id"),
+                intent.get("block_hash"),
             )
 
-        return receipt
+            if receipt.delivered:
+                self.db_manager.create_triggered_appointment_flag(uuid)
 
     def add_tracker(self, uuid, locator, dispute_txid, penalty_txid, penalty_rawtx, user_id, confirmations=0):
         """
@@ -262,16 +406,17 @@ class Responder:
             # We only store the penalty_txid, locator and user_id in memory. The rest is dumped into the db.
             self.trackers[uuid] = tracker.get_summary()
 
-            if penalty_txid in self.tx_tracker_map:
-                self.tx_tracker_map[penalty_txid].append(uuid)
-
-            else:
-                self.tx_tracker_map[penalty_txid] = [uuid]
+            # The same breach can be handled twice if a broadcast intent is replayed, so this is a set
+            self.tx_tracker_map.setdefault(penalty_txid, set()).add(uuid)
 
-            # In the case we receive two trackers with the same penalty txid we only add it to the unconfirmed txs list
-            # once
+            # In the case we receive two trackers with the same penalty txid we only add it to the unconfirmed txs once
             if penalty_txid not in self.unconfirmed_txs and confirmations == 0:
-                self.unconfirmed_txs.append(penalty_txid)
+                self.add_unconfirmed_tx(penalty_txid, self.last_known_height)
+
+            # Penalties that are already on chain are located using the block that included them (see
+            # get_completed_trackers), since the confirmation count may not refer to the cached tip
+            elif confirmations > 0:
+                self.unlocated_penalties.add(penalty_txid)
 
             self.db_manager.store_responder_tracker(uuid, tracker.to_dict())
 
@@ -290,102 +435,284 @@ class Responder:
             self.last_known_block = self.block_processor.get_best_block_hash(blocking=True)
             self.db_manager.store_last_block_hash_responder(self.last_known_block)
 
+        # The inclusion height of the penalties loaded from the database is unknown, so they are looked up once
+        with self.rw_lock.gen_wlock():
+            self.reset_inclusion_heights()
+
+        # Penalties that were being broadcast when the tower went down
+        self.replay_broadcast_intents()
+
+        if self.mempool_check_interval > 0:
+            mempool_thread = Thread(target=self.do_watch_mempool, daemon=True)
+            mempool_thread.start()
+
         while True:
-            block_hash = self.block_queue.get()
+            message = self.block_queue.get()
 
             # When the ChainMonitor is stopped, a final ChainMonitor.END_MESSAGE is sent
-            if block_hash == ChainMonitor.END_MESSAGE:
+            if message == ChainMonitor.END_MESSAGE:
                 break
 
-            block = self.block_processor.get_block(block_hash, blocking=True)
+            # Blocks are normally received already parsed from the ChainMonitor (only hashes are received on bootstrap)
+            block = self.block_processor.resolve_block(message, blocking=True)
+            block_hash = message if isinstance(message, str) else block.hash
             self.logger.info(
-                "New block received", block_hash=block_hash, prev_block_hash=block.get("previousblockhash")
+                "New block received",
+                block_hash=block_hash,
+                prev_block_hash=block.prev_block_hash if block is not None else None,
             )
 
-            if len(self.trackers) > 0 and block is not None:
-                txids = block.get("tx")
+            if block is not None:
+                # Blocks are normally received along with their height, otherwise it is derived from the previous one
+                if block.height is not None:
+                    self.last_known_height = block.height
+                elif self.last_known_height is not None:
+                    self.last_known_height += 1
+                else:
+                    self.last_known_height = self.block_processor.get_tip_height()
+
+            # All the block writes are committed in a single batch alongside the last known block, so a block is either
+            # fully processed or not at all
+            with self.db_manager.block_batch():
+                if len(self.trackers) > 0 and block is not None:
+                    txids = block.txids
+                    height = self.last_known_height
+
+                    if self.last_known_block == block.prev_block_hash:
+                        with self.rw_lock.gen_wlock():
+                            completed_trackers = self.get_completed_trackers(height)
+                            outdated_trackers = self.get_outdated_trackers(block.height)
+                            outdated_penalties = {self.trackers[uuid].get("penalty_txid") for uuid in outdated_trackers}
+                            trackers_to_delete_gatekeeper = {
+                                uuid: self.trackers[uuid].get("user_id") for uuid in completed_trackers
+                            }
+
+                            self.check_confirmations(txids, height)
+
+                            Cleaner.delete_trackers(
+                                completed_trackers, block.height, self.trackers, self.tx_tracker_map, self.db_manager
+                            )
+                            Cleaner.delete_trackers(
+                                outdated_trackers,
+                                block.height,
+                                self.trackers,
+                                self.tx_tracker_map,
+                                self.db_manager,
+                                outdated=True,
+                            )
+                            # Outdated penalties are not waited for anymore (unless other trackers share them)
+                            for penalty_txid in outdated_penalties:
+                                if penalty_txid not in self.tx_tracker_map:
+                                    self.remove_unconfirmed_tx(penalty_txid)
 
-                if self.last_known_block == block.get("previousblockhash"):
-                    with self.rw_lock.gen_wlock():
-                        completed_trackers = self.get_completed_trackers()
-                        outdated_trackers = self.get_outdated_trackers(block.get("height"))
-                        trackers_to_delete_gatekeeper = {
-                            uuid: self.trackers[uuid].get("user_id") for uuid in completed_trackers
-                        }
+                            # Remove completed trackers from the Gatekeeper
+                            self.gatekeeper.delete_appointments(trackers_to_delete_gatekeeper)
 
-                        self.check_confirmations(txids)
+                            rebroadcast_trackers = self.get_rebroadcast_trackers(
+                                self.get_txs_to_rebroadcast(height), height
+                            )
 
-                        Cleaner.delete_trackers(
-                            completed_trackers, block.get("height"), self.trackers, self.tx_tracker_map, self.db_manager
-                        )
-                        Cleaner.delete_trackers(
-                            outdated_trackers,
-                            block.get("height"),
-                            self.trackers,
-                            self.tx_tracker_map,
-                            self.db_manager,
-                            outdated=True,
+                        # Penalties are pushed without holding the lock, so trackers can still be queried meanwhile
+                        self.push_penalties(rebroadcast_trackers)
+
+                    # NOTCOVERED
+                    else:
+                        self.logger.warning(
+                            "Reorg found",
+                            local_prev_block_hash=self.last_known_block,
+                            remote_prev_block_hash=block.prev_block_hash,
                         )
-                        # Remove completed trackers from the Gatekeeper
-                        self.gatekeeper.delete_appointments(trackers_to_delete_gatekeeper)
 
-                        self.rebroadcast(self.get_txs_to_rebroadcast())
+                        # ToDo: #24-properly-handle-reorgs
+                        self.handle_reorgs(block_hash)
 
-                # NOTCOVERED
-                else:
-                    self.logger.warning(
-                        "Reorg found",
-                        local_prev_block_hash=self.last_known_block,
-                        remote_prev_block_hash=block.get("previousblockhash"),
-                    )
+                    if len(self.trackers) == 0:
+                        self.logger.info("No more pending trackers")
 
-                    # ToDo: #24-properly-handle-reorgs
-                    self.handle_reorgs(block_hash)
+                # Drop the receipts that were issued in previous blocks
+                if block is not None and block.height is not None:
+                    self.carrier.issued_receipts.update_height(block.height)
 
-                # Clear the receipts issued in this block
-                self.carrier.issued_receipts = {}
+                # Register the last processed block for the responder
+                self.db_manager.store_last_block_hash_responder(block_hash)
+            self.last_known_block = block.hash if block is not None else block_hash
+            self.block_queue.task_done()
 
-                if len(self.trackers) == 0:
-                    self.logger.info("No more pending trackers")
+        self.mempool_check_stop.set()
 
-            # Register the last processed block for the responder
-            self.db_manager.store_last_block_hash_responder(block_hash)
-            self.last_known_block = block.get("hash")
-            self.block_queue.task_done()
+    def do_watch_mempool(self):
+        """
+        Periodically checks that the unconfirmed ``penalty_txs`` are still in ``bitcoind``'s mempool (see
+        :meth:`check_mempool`) until the :obj:`Responder` is stopped.
+        """
+
+        while not self.mempool_check_stop.wait(self.mempool_check_interval):
+            self.check_mempool()
+
+    def check_mempool(self):
+        """
+        Checks whether the unconfirmed ``penalty_txs`` are still in ``bitcoind``'s mempool, and rebroadcasts the ones
+        that have been evicted (or replaced) instead of waiting for them to miss ``confirmations_before_retry`` blocks.
+
+        All the penalties are checked using a single batch of requests. Penalties whose status cannot be checked are
+        left for the next round. Penalties missing from the mempool may have been mined in a block that has not been
+        processed by the :obj:`Responder` yet, so only the ones that ``bitcoind`` cannot find at all are rebroadcast.
+
+        The write lock is only held to update the unconfirmed transactions. The trackers are loaded and the penalties
+        are pushed without holding it, so trackers can still be queried meanwhile.
+
+        Returns:
+            :obj:`list`: A list of ``(penalty_txid, Receipt)`` tuples for the rebroadcast trackers (see
+            :meth:`rebroadcast`).
+        """
+
+        with self.rw_lock.gen_rlock():
+            unconfirmed_txs = list(self.unconfirmed_txs)
+
+        if not unconfirmed_txs:
+            return []
+
+        mempool_entries = self.carrier.get_mempool_entries(unconfirmed_txs)
+        missing_txs = [txid for txid, entry in mempool_entries.items() if entry is None]
+
+        if not missing_txs:
+            return []
+
+        # Mined penalties are confirmed once their block is processed
+        known_txs = self.carrier.get_transactions(missing_txs)
+        evicted_txs = [txid for txid in missing_txs if known_txs.get(txid) is None]
 
-    def check_confirmations(self, txs):
+        if not evicted_txs:
+            return []
+
+        with self.rw_lock.gen_wlock():
+            # Some of the transactions may have been confirmed (or completed) in the meantime
+            evicted_txs = [txid for txid in evicted_txs if txid in self.unconfirmed_txs]
+            rebroadcast_trackers = self.get_rebroadcast_trackers(evicted_txs, self.last_known_height)
+
+        if evicted_txs:
+            self.logger.warning("Penalty transactions missing from the mempool. Rebroadcasting", txids=evicted_txs)
+
+        return self.push_penalties(rebroadcast_trackers)
+
+    def check_confirmations(self, txs, height=None):
         """
-        Checks if any of the monitored ``penalty_txs`` has received it's first confirmation or keeps missing them.
+        Checks if any of the monitored ``penalty_txs`` has received it's first confirmation.
 
-        This method manages ``unconfirmed_txs`` and ``missed_confirmations``.
+        This method manages ``unconfirmed_txs``, and records the height at which the monitored ``penalty_txs`` are
+        included in a block (see ``inclusion_heights``). The transactions that keep missing confirmations do not need
+        to be updated, since the missed confirmations are derived from the height (see ``unconfirmed_since``), so the
+        cost of this method only depends on the size of the block.
 
         Args:
             txs (:obj:`list`): A list of confirmed tx ids (the list of transactions included in the last received
                 block).
+            height (:obj:`int`): the height of the last received block. If unknown, the confirmed ``penalty_txs`` will
+                be looked up in ``bitcoind`` when needed.
         """
 
         # If a new confirmed tx matches a tx we are watching, then we remove it from the unconfirmed txs map
         for tx in txs:
-            if tx in self.tx_tracker_map and tx in self.unconfirmed_txs:
-                self.unconfirmed_txs.remove(tx)
+            if tx in self.tx_tracker_map:
+                if height is not None:
+                    self.set_inclusion_height(tx, height)
+                else:
+                    self.unlocated_penalties.add(tx)
 
-                self.logger.info("Confirmation received for transaction", tx=tx)
+                if tx in self.unconfirmed_txs:
+                    self.remove_unconfirmed_tx(tx)
 
-        # We also add a missing confirmation to all those txs waiting to be confirmed that have not been confirmed in
-        # the current block
-        for tx in self.unconfirmed_txs:
-            if tx in self.missed_confirmations:
-                self.missed_confirmations[tx] += 1
-            else:
-                self.missed_confirmations[tx] = 1
+                    self.logger.info("Confirmation received for transaction", tx=tx)
 
-            self.logger.info(
-                "Transaction missed a confirmation", tx=tx, missed_confirmations=self.missed_confirmations[tx]
-            )
+    def add_unconfirmed_tx(self, penalty_txid, height=None):
+        """
+        Adds a ``penalty_tx`` to the unconfirmed transactions, or resets its missed confirmations if it was already
+        there.
 
-    def get_txs_to_rebroadcast(self):
+        Args:
+            penalty_txid (:obj:`str`): the id of the penalty transaction.
+            height (:obj:`int`): the height at which the transaction was (re)broadcast. The height of the tip is used
+                if unknown.
         """
-        Gets the transactions to be rebroadcast based on their ``missed_confirmation`` count.
+
+        if height is None:
+            height = self.block_processor.get_tip_height()
+
+        self.remove_unconfirmed_tx(penalty_txid)
+        self.unconfirmed_txs.add(penalty_txid)
+        self.unconfirmed_since[penalty_txid] = height
+        self.rebroadcast_index.setdefault(height + self.confirmations_before_retry, set()).add(penalty_txid)
+
+    def remove_unconfirmed_tx(self, penalty_txid):
+        """Removes a ``penalty_tx`` from the unconfirmed transactions (if found)."""
+
+        self.unconfirmed_txs.discard(penalty_txid)
+        height = self.unconfirmed_since.pop(penalty_txid, None)
+
+        if height is not None:
+            retry_height = height + self.confirmations_before_retry
+            self.rebroadcast_index[retry_height].discard(penalty_txid)
+            if not self.rebroadcast_index[retry_height]:
+                del self.rebroadcast_index[retry_height]
+
+    def get_missed_confirmations(self, penalty_txid, height):
+        """
+        Gets the number of confirmations an unconfirmed ``penalty_tx`` has missed at a given height.
+
+        Args:
+            penalty_txid (:obj:`str`): the id of the penalty transaction.
+            height (:obj:`int`): the height of the last received block.
+
+        Returns:
+            :obj:`int` or :obj:`None`: The number of missed confirmations, or :obj:`None` if the transaction is not
+            unconfirmed.
+        """
+
+        since = self.unconfirmed_since.get(penalty_txid)
+
+        return height - since if since is not None else None
+
+    def set_inclusion_height(self, penalty_txid, height):
+        """
+        Records the height of the block a ``penalty_tx`` was included in.
+
+        Args:
+            penalty_txid (:obj:`str`): the id of the penalty transaction.
+            height (:obj:`int`): the height of the block that included the transaction.
+        """
+
+        self.remove_inclusion_height(penalty_txid)
+        self.inclusion_heights[penalty_txid] = height
+        self.inclusion_index.setdefault(height, set()).add(penalty_txid)
+
+    def remove_inclusion_height(self, penalty_txid):
+        """Forgets the inclusion height of a ``penalty_tx`` (if known)."""
+
+        height = self.inclusion_heights.pop(penalty_txid, None)
+        if height is not None:
+            self.inclusion_index[height].discard(penalty_txid)
+            if not self.inclusion_index[height]:
+                del self.inclusion_index[height]
+
+        self.unlocated_penalties.discard(penalty_txid)
+
+    def reset_inclusion_heights(self):
+        """
+        Forgets the inclusion height of all the confirmed ``penalty_txs``, so they are looked up in ``bitcoind`` the
+        next time the completed trackers are checked. Used on bootstrap and after reorgs.
+        """
+
+        self.inclusion_heights = dict()
+        self.inclusion_index = dict()
+        self.unlocated_penalties = {txid for txid in self.tx_tracker_map if txid not in self.unconfirmed_txs}
+
+    def get_txs_to_rebroadcast(self, height):
+        """
+        Gets the transactions to be rebroadcast based on their missed confirmations. Only the heights at which some
+        transaction reaches ``confirmations_before_retry`` are checked (see ``rebroadcast_index``).
+
+        Args:
+            height (:obj:`int`): the height of the last received block.
 
         Returns:
             :obj:`list`: A list with all the ids of the transaction that have to be rebroadcast.
@@ -393,42 +720,68 @@ class Responder:
 
         txs_to_rebroadcast = []
 
-        for tx, missed_conf in self.missed_confirmations.items():
-            if missed_conf >= CONFIRMATIONS_BEFORE_RETRY:
-                # If a transactions has missed too many confirmations we add it to the rebroadcast list
-                txs_to_rebroadcast.append(tx)
+        # If a transactions has missed too many confirmations we add it to the rebroadcast list
+        for retry_height in [h for h in self.rebroadcast_index if h <= height]:
+            txs_to_rebroadcast.extend(self.rebroadcast_index[retry_height])
 
         return txs_to_rebroadcast
 
-    def get_completed_trackers(self):
+    def get_completed_trackers(self, height):
         """
         Gets the trackers that has already been fulfilled based on a given height (the justice transaction is
         irrevocably resolved).
 
+        Confirmations are computed from the height at which each ``penalty_tx`` was included in a block, so only the
+        penalties whose inclusion height is unknown (``unlocated_penalties``) are queried to ``bitcoind``. Their
+        inclusion height is the height of the block that included them (``blockhash``), instead of being derived from
+        their confirmation count, since ``bitcoind`` may be ahead of the last received block.
+
+        Args:
+            height (:obj:`int`): the height of the last received block. The height of the tip is used if unknown.
+
         Returns:
             :obj:`list`: A list of completed trackers uuids.
         """
 
         completed_trackers = []
-        # FIXME: This is here for duplicated penalties, we should be able to get rid of it once we prevent duplicates in
-        #        the responder.
-        checked_txs = {}
-
-        # Avoiding dictionary changed size during iteration
-        for uuid in list(self.trackers.keys()):
-            penalty_txid = self.trackers[uuid].get("penalty_txid")
-            if penalty_txid not in self.unconfirmed_txs:
-                if penalty_txid not in checked_txs:
-                    tx = self.carrier.get_transaction(penalty_txid)
-                else:
-                    tx = checked_txs.get(penalty_txid)
+        if height is None:
+            height = self.block_processor.get_tip_height()
+
+        if self.unlocated_penalties:
+            # All the unlocated penalties are queried at once
+            unlocated_penalties = [txid for txid in self.unlocated_penalties if txid in self.tx_tracker_map]
+            self.unlocated_penalties = set(unlocated_penalties)
+            checked_txs = self.carrier.get_transactions(unlocated_penalties)
+            block_heights = self.block_processor.get_block_heights(
+                list({tx.get("blockhash") for tx in checked_txs.values() if tx is not None and tx.get("blockhash")})
+            )
 
-                if tx is not None:
-                    confirmations = tx.get("confirmations")
-                    checked_txs[penalty_txid] = tx
+            for txid in unlocated_penalties:
+                tx = checked_txs.get(txid)
 
-                    if confirmations is not None and confirmations >= IRREVOCABLY_RESOLVED:
-                        completed_trackers.append(uuid)
+                # Transactions that cannot be found (or whose block cannot be) are checked again in the next block
+                if tx is not None:
+                    block_hash = tx.get("blockhash")
+
+                    if block_hash is not None:
+                        if block_heights.get(block_hash) is not None:
+                            self.set_inclusion_height(txid, block_heights.get(block_hash))
+
+                    # The penalty is back in the mempool (e.g. after a reorg)
+                    else:
+                        self.unlocated_penalties.discard(txid)
+                        if txid not in self.unconfirmed_txs:
+                            self.add_unconfirmed_tx(txid, height)
+
+        # Only the blocks that are deep enough need to be checked
+        max_inclusion_height = height - IRREVOCABLY_RESOLVED + 1
+        for inclusion_height in [h for h in self.inclusion_index if h <= max_inclusion_height]:
+            for txid in list(self.inclusion_index[inclusion_height]):
+                if txid in self.tx_tracker_map:
+                    completed_trackers.extend(self.tx_tracker_map[txid])
+                else:
+                    # The trackers are already gone
+                    self.remove_inclusion_height(txid)
 
         return completed_trackers
 
@@ -454,7 +807,7 @@ class Responder:
 
         return outdated_trackers
 
-    def rebroadcast(self, txs_to_rebroadcast):
+    def rebroadcast(self, txs_to_rebroadcast, height=None):
         """
         Rebroadcasts a ``penalty_tx`` that has missed too many confirmations. In the current approach this will loop
         until the tracker expires if the penalty transactions keeps getting rejected due to fees.
@@ -464,6 +817,8 @@ class Responder:
 
         Args:
             txs_to_rebroadcast (:obj:`list`): a list of transactions to be rebroadcast.
+            height (:obj:`int`): the height of the last received block. The missed confirmations of the rebroadcast
+                transactions are counted from it.
 
         Returns:
             :obj:`list`: A list of :obj:`Receipts <teos.carrier.Receipt>` with information about whether or not every
@@ -473,25 +828,82 @@ class Responder:
         # DISCUSS: #22-discuss-confirmations-before-retry
         # ToDo: #23-define-behaviour-approaching-end
 
-        receipts = []
+        return self.push_penalties(self.get_rebroadcast_trackers(txs_to_rebroadcast, height))
+
+    def get_rebroadcast_trackers(self, txs_to_rebroadcast, height=None):
+        """
+        Resets the missed confirmations of some ``penalty_txs`` that are about to be rebroadcast, and gets the trackers
+        they belong to. Must be called holding the write lock.
+
+        Args:
+            txs_to_rebroadcast (:obj:`list`): a list of transactions to be rebroadcast.
+            height (:obj:`int`): the height of the last received block. The missed confirmations of the rebroadcast
+                transactions are counted from it.
+
+        Returns:
+            :obj:`dict`: A ``uuid:penalty_txid`` map with the trackers of the transactions to be rebroadcast. Penalties
+            whose trackers are gone are dropped.
+        """
+
+        rebroadcast_trackers = {}
 
         for txid in txs_to_rebroadcast:
-            self.missed_confirmations[txid] = 0
+            # The trackers may be gone already (e.g. outdated)
+            if txid not in self.tx_tracker_map:
+                self.remove_unconfirmed_tx(txid)
+                continue
 
-            # FIXME: This would potentially grab multiple instances of the same transaction and try to send them.
-            #   should we do it only once?
-            for uuid in self.tx_tracker_map[txid]:
-                tracker = TransactionTracker.from_dict(self.db_manager.load_responder_tracker(uuid))
-                self.logger.warning(
-                    "Transaction has missed many confirmations. Rebroadcasting", penalty_txid=tracker.penalty_txid
-                )
+            self.add_unconfirmed_tx(txid, height)
+            rebroadcast_trackers.update({uuid: txid for uuid in self.tx_tracker_map[txid]})
+
+        return rebroadcast_trackers
+
+    def push_penalties(self, rebroadcast_trackers):
+        """
+        Pushes the penalties of some trackers to the network (see :meth:`get_rebroadcast_trackers`). Only reads from the
+        database, so it does not need the lock.
+
+        Args:
+            rebroadcast_trackers (:obj:`dict`): a ``uuid:penalty_txid`` map with the trackers to be rebroadcast.
+
+        Returns:
+            :obj:`list`: A list of ``(penalty_txid, Receipt)`` tuples, one per tracker.
+        """
 
-                receipt = self.carrier.send_transaction(tracker.penalty_rawtx, tracker.penalty_txid)
-                receipts.append((txid, receipt))
+        if not rebroadcast_trackers:
+            return []
 
-                if not receipt.delivered:
-                    # FIXME: Can this actually happen?
-                    self.logger.warning("Transaction failed", penalty_txid=tracker.penalty_txid)
+        rebroadcast_trackers = dict(rebroadcast_trackers)
+
+        # All the trackers are loaded at once, and the penalties are sent in a single batch. Penalties shared by several
+        # trackers are only sent once
+        trackers_data = self.db_manager.batch_load_responder_trackers(list(rebroadcast_trackers))
+        penalties = {}
+
+        for uuid, tracker_data in trackers_data.items():
+            # The tracker may have been completed since the lock was released
+            if tracker_data is None:
+                self.logger.info("Tracker not found in the database. Skipping", uuid=uuid)
+                rebroadcast_trackers.pop(uuid)
+                continue
+
+            tracker = TransactionTracker.from_dict(tracker_data)
+            self.logger.warning(
+                "Transaction has missed many confirmations. Rebroadcasting", penalty_txid=tracker.penalty_txid
+            )
+            penalties[tracker.penalty_txid] = tracker.penalty_rawtx
+
+        penalty_receipts = self.carrier.send_transactions(penalties) if penalties else {}
+
+        # Receipts are reported per tracker
+        receipts = []
+        for uuid, txid in rebroadcast_trackers.items():
+            receipt = penalty_receipts[txid]
+            receipts.append((txid, receipt))
+
+            if not receipt.delivered:
+                # FIXME: Can this actually happen?
+                self.logger.warning("Transaction failed", penalty_txid=txid, uuid=uuid)
 
         return receipts
 
@@ -506,23 +918,41 @@ class Responder:
 
         """
 
-        # Avoiding dictionary changed size during iteration
-        for uuid in list(self.trackers.keys()):
-            tracker = TransactionTracker.from_dict(self.db_manager.load_responder_tracker(uuid))
+        # The penalties may have been reorged out (or mined at a different height), so their inclusion height can only
+        # be trusted once they are looked up again
+        with self.rw_lock.gen_wlock():
+            self.reset_inclusion_heights()
+
+        # All the trackers are loaded at once (avoiding dictionary changed size during iteration)
+        trackers = {}
+        for uuid, tracker_data in self.db_manager.batch_load_responder_trackers(list(self.trackers.keys())).items():
+            if tracker_data is not None:
+                trackers[uuid] = TransactionTracker.from_dict(tracker_data)
+            else:
+                self.logger.error("Tracker cannot be loaded from the database", uuid=uuid)
+
+        # The dispute and penalty transactions of all the trackers are queried in batches
+        dispute_txs = self.carrier.get_transactions([tracker.dispute_txid for tracker in trackers.values()])
+        penalty_txs = self.carrier.get_transactions(
+            [tracker.penalty_txid for tracker in trackers.values() if dispute_txs.get(tracker.dispute_txid) is not None]
+        )
+
+        banished_trackers = {}
 
+        for uuid, tracker in trackers.items():
             # First we check if the dispute transaction is known (exists either in mempool or blockchain)
-            dispute_tx = self.carrier.get_transaction(tracker.dispute_txid)
+            dispute_tx = dispute_txs.get(tracker.dispute_txid)
 
             if dispute_tx is not None:
                 # If the dispute is there, we check the penalty
-                penalty_tx = self.carrier.get_transaction(tracker.penalty_txid)
+                penalty_tx = penalty_txs.get(tracker.penalty_txid)
 
                 if penalty_tx is not None:
                     with self.rw_lock.gen_wlock():
                         # If the penalty exists we need to check is it's on the blockchain or not so we can update the
                         # unconfirmed transactions list accordingly.
-                        if penalty_tx.get("confirmations") is None:
-                            self.unconfirmed_txs.append(tracker.penalty_txid)
+                        if penalty_tx.get("confirmations") is None and tracker.penalty_txid not in self.unconfirmed_txs:
+                            self.add_unconfirmed_tx(tracker.penalty_txid, self.last_known_height)
 
                             self.logger.info(
                                 "Penalty transaction back in mempool. Updating unconfirmed transactions",
@@ -531,19 +961,10 @@ class Responder:
 
                 else:
                     # If the penalty transaction is missing, we need to reset the tracker.
-                    self.handle_breach(
-                        tracker.locator,
-                        uuid,
-                        tracker.dispute_txid,
-                        tracker.penalty_txid,
-                        tracker.penalty_rawtx,
-                        tracker.user_id,
-                        block_hash,
-                    )
-
                     self.logger.warning(
                         "Penalty transaction banished. Resetting the tracker", penalty_tx=tracker.penalty_txid
                     )
+                    banished_trackers[uuid] = tracker
 
             else:
                 # ToDo: #24-properly-handle-reorgs
@@ -551,3 +972,31 @@ class Responder:
                 #        reorg manager
                 self.logger.warning("Dispute and penalty transaction missing. Calling the reorg manager")
                 self.logger.error("Reorg manager not yet implemented")
+
+        if banished_trackers:
+            # The banished penalties are sent again in a single batch, and the trackers reset depending on the outcome.
+            # The trackers are already in the database, so there is no need to record a broadcast intent
+            receipts = self.carrier.send_transactions(
+                {tracker.penalty_txid: tracker.penalty_rawtx for tracker in banished_trackers.values()}
+            )
+
+            # Whether the Responder is on sync is only checked once (and only if some tracker cannot be reset)
+            on_sync = None
+
+            for uuid, tracker in banished_trackers.items():
+                receipt = receipts[tracker.penalty_txid]
+
+                if receipt.delivered:
+                    self.add_tracker(
+                        uuid,
+                        tracker.locator,
+                        tracker.dispute_txid,
+                        tracker.penalty_txid,
+                        tracker.penalty_rawtx,
+                        tracker.user_id,
+                        receipt.confirmations,
+                    )
+
+                else:
+                    on_sync = self.on_sync(block_hash) if on_sync is None else on_sync
+                    self.logger.warning("Tracker cannot be reset", reason=receipt.reason, uuid=uuid, on_sync=on_sync)
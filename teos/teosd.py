@@ -18,13 +18,15 @@ from teos.logger import setup_logging, get_logger, serve as serve_logging
 from teos.help import show_usage
 from teos.watcher import Watcher
 from teos.builder import Builder
-from teos.carrier import Carrier
+from teos.carrier import Carrier, ReceiptLedger
 from teos.users_dbm import UsersDBM
 from teos.responder import Responder
 from teos.gatekeeper import Gatekeeper
 from teos.internal_api import InternalAPI
 from teos.chain_monitor import ChainMonitor
 from teos.block_processor import BlockProcessor
+from teos.header_index import HeaderIndex
+from teos.locator_index import LocatorIndex
 from teos.appointments_dbm import AppointmentsDBM
 from teos import DATA_DIR, DEFAULT_CONF, CONF_FILE_NAME
 from teos.tools import can_connect_to_bitcoind, in_correct_network, get_default_rpc_port
@@ -119,18 +121,44 @@ class TeosDaemon:
             bitcoind_reachable.set()
 
         self.logger.info("tower_id = {}".format(Cryptographer.get_compressed_pk(sk.public_key)))
-        self.block_processor = BlockProcessor(bitcoind_connect_params, bitcoind_reachable)
-        carrier = Carrier(bitcoind_connect_params, bitcoind_reachable)
+        # Writes from concurrent requests are gathered for DB_GROUP_COMMIT_MS and committed together
+        commit_interval = self.config.get("DB_GROUP_COMMIT_MS") / 1000
+        self.db_manager = AppointmentsDBM(
+            self.config.get("APPOINTMENTS_DB_PATH"), commit_interval, self.config.get("DB_SYNC_WRITES")
+        )
+        self.block_processor = BlockProcessor(
+            bitcoind_connect_params, bitcoind_reachable, HeaderIndex(db_manager=self.db_manager)
+        )
+        carrier = Carrier(
+            bitcoind_connect_params,
+            bitcoind_reachable,
+            self.config.get("CARRIER_BROADCAST_WORKERS"),
+            ReceiptLedger(self.config.get("RECEIPT_LEDGER_SIZE"), db_manager=self.db_manager),
+        )
 
         gatekeeper = Gatekeeper(
-            UsersDBM(self.config.get("USERS_DB_PATH")),
+            UsersDBM(self.config.get("USERS_DB_PATH"), commit_interval, self.config.get("DB_SYNC_WRITES")),
             self.block_processor,
             self.config.get("SUBSCRIPTION_SLOTS"),
             self.config.get("SUBSCRIPTION_DURATION"),
             self.config.get("EXPIRY_DELTA"),
         )
-        self.db_manager = AppointmentsDBM(self.config.get("APPOINTMENTS_DB_PATH"))
-        responder = Responder(self.db_manager, gatekeeper, carrier, self.block_processor)
+        responder = Responder(
+            self.db_manager,
+            gatekeeper,
+            carrier,
+            self.block_processor,
+            self.config.get("CONFIRMATIONS_BEFORE_RETRY"),
+            self.config.get("MEMPOOL_CHECK_INTERVAL"),
+        )
+
+        # The deep locator index is optional (disabled if LOCATOR_INDEX_BLOCKS is 0)
+        self.locator_index = None
+        if self.config.get("LOCATOR_INDEX_BLOCKS") > 0:
+            self.locator_index = LocatorIndex(
+                self.config.get("LOCATOR_INDEX_DB_PATH"), self.config.get("LOCATOR_INDEX_BLOCKS")
+            )
+
         self.watcher = Watcher(
             self.db_manager,
             gatekeeper,
@@ -139,6 +167,11 @@ class TeosDaemon:
             sk,
             self.config.get("MAX_APPOINTMENTS"),
             self.config.get("LOCATOR_CACHE_SIZE"),
+            self.locator_index,
+            self.config.get("BREACH_VALIDATION_WORKERS"),
+            self.config.get("BREACH_MEMPOOL_PREFLIGHT"),
+            self.config.get("MAX_DECRYPTS_PER_LOCATOR"),
+            self.config.get("MEMPOOL_BROADCAST"),
         )
 
         self.watcher_thread = None
@@ -149,6 +182,7 @@ class TeosDaemon:
             [self.watcher.block_queue, responder.block_queue, gatekeeper.block_queue],
             self.block_processor,
             bitcoind_feed_params,
+            [self.watcher.mempool_queue],
         )
 
         # Set up the internal API
@@ -344,10 +378,23 @@ class TeosDaemon:
         self.watcher_thread.join()
         self.responder_thread.join()
 
+        # wait for the queued penalties to be pushed
+        carrier = self.watcher.responder.carrier
+        carrier.shutdown()
+
+        self.logger.info("Closing connections with bitcoind")
+        self.logger.debug("BlockProcessor rpc pool stats", **self.block_processor.rpc.stats())
+        self.logger.debug("Carrier rpc pool stats", **carrier.rpc.stats())
+        self.block_processor.rpc.close()
+        carrier.rpc.close()
+
         self.logger.info("Closing connection with appointments db")
         self.db_manager.close()
         self.logger.info("Closing connection with users db")
         self.watcher.gatekeeper.user_db.close()
+        if self.locator_index is not None:
+            self.logger.info("Closing connection with locator index db")
+            self.locator_index.close()
 
         self.logger.info("Shutting down TEOS")
         self.stop_log_event.set()
@@ -435,6 +482,9 @@ def run():
                 "btcrpcport=",
                 "btcfeedconnect=",
                 "btcfeedport=",
+                "btcfeedrawblock",
+                "btcfeedrawtx",
+                "mempoolbroadcast",
                 "datadir=",
                 "wsgi=",
                 "daemon",
@@ -484,6 +534,12 @@ def run():
                     command_line_conf["BTC_FEED_PORT"] = int(arg)
                 except ValueError:
                     exit(f"btcfeedport must be an integer, '{arg}' received")
+            if opt in ["--btcfeedrawblock"]:
+                command_line_conf["BTC_FEED_RAWBLOCK"] = True
+            if opt in ["--btcfeedrawtx"]:
+                command_line_conf["BTC_FEED_RAWTX"] = True
+            if opt in ["--mempoolbroadcast"]:
+                command_line_conf["MEMPOOL_BROADCAST"] = True
             if opt in ["--datadir"]:
                 data_dir = os.path.expanduser(arg)
             if opt in ["--wsgi"]:
@@ -1,6 +1,7 @@
 from socket import timeout
 from http.client import HTTPException
 
+from teos.constants import RPC_BATCH_SIZE
 from teos.utils.auth_proxy import AuthServiceProxy, JSONRPCException
 
 from common.constants import MAINNET_RPC_PORT, TESTNET_RPC_PORT, REGTEST_RPC_PORT
@@ -35,6 +36,55 @@ def bitcoin_cli(btc_connect_params):
     )
 
 
+def bitcoin_cli_batch(rpc, method, params_list, batch_size=RPC_BATCH_SIZE):
+    """
+    Calls the same ``json-rpc`` method once per item in ``params_list`` using ``json-rpc`` batch requests, so many
+    calls can be sent to ``bitcoind`` in a single round trip.
+
+    Args:
+        rpc (:obj:`RPCConnectionPool <teos.utils.rpc_pool.RPCConnectionPool>`): the client used to reach ``bitcoind``.
+            Any object implementing ``batch`` (like an :obj:`AuthServiceProxy <teos.utils.auth_proxy.AuthServiceProxy>`)
+            can be used.
+        method (:obj:`str`): the name of the ``json-rpc`` method to be called (e.g. ``getblock``).
+        params_list (:obj:`list`): a list with the parameters (as a :obj:`list`) of every call.
+        batch_size (:obj:`int`): the maximum number of calls sent in a single request.
+
+    Returns:
+        :obj:`list`: A list of ``(result, error)`` tuples, in the same order as ``params_list``. ``error`` is
+        :obj:`None` if the call succeeded, and ``result`` is :obj:`None` if it did not.
+
+    Raises:
+        :obj:`JSONRPCException`: if the batch request itself is rejected by ``bitcoind``.
+        :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
+    """
+
+    results = []
+
+    for i in range(0, len(params_list), batch_size):
+        # Ids only need to be unique within the batch
+        requests = [
+            {"version": "1.1", "method": method, "params": params, "id": request_id}
+            for request_id, params in enumerate(params_list[i : i + batch_size])  # noqa: E203
+        ]
+        responses = rpc.batch(requests)
+
+        # A malformed batch gets a single error response instead of a list of them
+        if not isinstance(responses, list):
+            raise JSONRPCException(responses.get("error"))
+
+        # Responses are not guaranteed to be in the same order as the requests
+        responses = {response.get("id"): response for response in responses}
+        for request in requests:
+            response = responses.get(request.get("id"))
+
+            if response is None:
+                results.append((None, {"code": -342, "message": "missing JSON-RPC response"}))
+            else:
+                results.append((response.get("result"), response.get("error")))
+
+    return results
+
+
 # NOTCOVERED
 def can_connect_to_bitcoind(btc_connect_params):
     """
@@ -2,18 +2,36 @@ import json
 import plyvel
 
 from teos.logger import get_logger
+from teos.group_commit import GroupCommitter
 from common.db_manager import DBManager
 from common.tools import is_compressed_pk
 
+USER_PREFIX = "u"
+USER_APPOINTMENT_PREFIX = "a"
+USER_ID_LEN_HEX = 66
+
 
 class UsersDBM(DBManager):
     """
     The :class:`UsersDBM` is in charge of interacting with the users database (``LevelDB``).
     Keys and values are stored as bytes in the database but processed as strings by the manager.
 
+    Every user is stored as a header record plus one record per appointment, so updating the appointments of a user
+    does not require rewriting the rest of them:
+
+        - ``USER_PREFIX``, defined as ``b'u``, is used to store the user headers (``available_slots`` and
+          ``subscription_expiry``), keyed by ``user_id``.
+        - ``USER_APPOINTMENT_PREFIX``, defined as ``b'a``, is used to store the slots taken by every user appointment,
+          keyed by ``user_id | uuid``.
+
+    Databases using the old layout (a single record per user, keyed by ``user_id``) are migrated on load.
+
     Args:
         db_path (:obj:`str`): the path (relative or absolute) to the system folder containing the database. A fresh
             database will be created if the specified path does not contain one.
+        commit_interval (:obj:`float`): the time (in seconds) concurrent writes are gathered for before being committed
+            together. Optional (writes are committed straightaway by default).
+        sync_writes (:obj:`bool`): whether group commits are flushed to disk before being acknowledged. Optional.
 
     Raises:
         :obj:`ValueError`: If the provided ``db_path`` is not a string.
@@ -21,9 +39,11 @@ class UsersDBM(DBManager):
 
     Attributes:
         logger (:obj:`Logger <teos.logger.Logger>`): The logger for this component.
+        group_commit (:obj:`GroupCommitter <teos.group_commit.GroupCommitter>`): the committer used to write the user
+            records, so writes from concurrent requests are committed in a single batch.
     """
 
-    def __init__(self, db_path):
+    def __init__(self, db_path, commit_interval=0, sync_writes=False):
         self.logger = get_logger(component=UsersDBM.__name__)
 
         if not isinstance(db_path, str):
@@ -38,9 +58,83 @@ class UsersDBM(DBManager):
 
             raise e
 
+        self.migrate_users()
+        self.group_commit = GroupCommitter(self.db, commit_interval, sync_writes)
+
+    def close(self):
+        """Commits the pending writes and closes the database."""
+        self.group_commit.stop()
+        super().close()
+
+    def migrate_users(self):
+        """
+        Migrates the users stored using the old layout (a single record with all the user data, keyed by ``user_id``)
+        to the header + appointments layout. Each user is migrated atomically, so the migration can be safely
+        interrupted and resumed.
+
+        Returns:
+            :obj:`int`: The number of migrated users.
+        """
+
+        migrated_users = 0
+
+        # Old records are keyed by the bare user_id, so they all start by a compressed pk prefix (02 or 03)
+        for pk_prefix in [b"02", b"03"]:
+            for k, v in self.db.iterator(prefix=pk_prefix):
+                user_id = k.decode("utf-8")
+                user_data = json.loads(v)
+
+                puts, deletes = self._get_user_writes(user_id, user_data, user_data.get("appointments", {}))
+                with self.db.write_batch(transaction=True) as b:
+                    for key, value in puts:
+                        b.put(key, value)
+                    b.delete(k)
+
+                migrated_users += 1
+
+        if migrated_users:
+            self.logger.info("Migrated users to the new db layout", n_users=migrated_users)
+
+        return migrated_users
+
+    @staticmethod
+    def _get_user_writes(user_id, user_data, appointments=None, deleted_appointments=None):
+        """
+        Gets the writes needed to store a user header, and to store / delete some of its appointments.
+
+        Args:
+            user_id (:obj:`str`): a 33-byte hex-encoded string identifying the user.
+            user_data (:obj:`dict`): the user associated data, as a dictionary. Only the header fields are stored.
+            appointments (:obj:`dict`): a collection of ``uuid:slots`` appointments to be stored. Optional.
+            deleted_appointments (:obj:`iterable`): a collection of appointment uuids to be deleted. Optional.
+
+        Returns:
+            :obj:`tuple`: A tuple ``(puts, deletes)`` with the ``(key, value)`` pairs to be stored and the keys to be
+            deleted (as bytes).
+
+        Raises:
+            :obj:`KeyError`: if the user data is missing any of the header fields.
+            :obj:`TypeError`: if the user data cannot be serialized.
+        """
+
+        header = {
+            "available_slots": user_data["available_slots"],
+            "subscription_expiry": user_data["subscription_expiry"],
+        }
+        puts = [((USER_PREFIX + user_id).encode("utf-8"), json.dumps(header).encode("utf-8"))]
+        puts.extend(
+            ((USER_APPOINTMENT_PREFIX + user_id + uuid).encode("utf-8"), json.dumps(slots).encode("utf-8"))
+            for uuid, slots in (appointments or {}).items()
+        )
+        deletes = [(USER_APPOINTMENT_PREFIX + user_id + uuid).encode("utf-8") for uuid in deleted_appointments or []]
+
+        return puts, deletes
+
     def store_user(self, user_id, user_data):
         """
-        Stores a user record to the database. ``user_pk`` is used as identifier.
+        Stores a user record to the database, replacing the existing one (if any). ``user_pk`` is used as identifier.
+
+        This rewrites all the user appointments. Use :meth:`update_user` for incremental updates.
 
         Args:
             user_id (:obj:`str`): a 33-byte hex-encoded string identifying the user.
@@ -50,29 +144,102 @@ class UsersDBM(DBManager):
             :obj:`bool`: True if the user was stored in the database, False otherwise.
         """
 
-        if is_compressed_pk(user_id):
-            try:
-                self.logger.info("Adding user to Gatekeeper's db", user_id=user_id)
-                self.create_entry(user_id, json.dumps(user_data))
-                return True
+        if not is_compressed_pk(user_id):
+            self.logger.info("Couldn't add user to db. Wrong pk format", user_id=user_id, user_data=user_data)
+            return False
+
+        if not isinstance(user_data, dict):
+            self.logger.info("Couldn't add user to db. Wrong user data format", user_id=user_id, user_data=user_data)
+            return False
 
-            except json.JSONDecodeError:
-                self.logger.info(
-                    "Couldn't add user to db. Wrong user data format", user_id=user_id, user_data=user_data
-                )
-                return False
+        try:
+            self.logger.info("Adding user to Gatekeeper's db", user_id=user_id)
+            appointments = user_data.get("appointments", {})
+            stale_appointments = [uuid for uuid in self.load_user_appointments(user_id) if uuid not in appointments]
 
-            except TypeError:
-                self.logger.info("Couldn't add user to db", user_id=user_id, user_data=user_data)
-                return False
+            self.group_commit.write(*self._get_user_writes(user_id, user_data, appointments, stale_appointments))
+            return True
 
-            except RuntimeError as e:
-                self.logger.error(str(e))
-                raise e
-        else:
-            self.logger.info("Couldn't add user to db. Wrong pk format", user_id=user_id, user_data=user_data)
+        except (KeyError, TypeError, AttributeError):
+            self.logger.info("Couldn't add user to db", user_id=user_id, user_data=user_data)
             return False
 
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    def update_user(self, user_id, user_data, appointments=None, deleted_appointments=None):
+        """
+        Updates a user record in the database. The user header is rewritten, but only the given appointments are
+        stored / deleted, so the cost of the update does not depend on the number of appointments of the user.
+
+        Args:
+            user_id (:obj:`str`): a 33-byte hex-encoded string identifying the user.
+            user_data (:obj:`dict`): the user associated data, as a dictionary. Only the header fields are stored.
+            appointments (:obj:`dict`): a collection of ``uuid:slots`` new (or updated) appointments. Optional.
+            deleted_appointments (:obj:`iterable`): a collection of appointment uuids to be deleted. Optional.
+
+        Returns:
+            :obj:`bool`: True if the user was updated in the database, False otherwise.
+        """
+
+        if not is_compressed_pk(user_id):
+            self.logger.info("Couldn't update user in db. Wrong pk format", user_id=user_id)
+            return False
+
+        try:
+            self.group_commit.write(*self._get_user_writes(user_id, user_data, appointments, deleted_appointments))
+            return True
+
+        except (KeyError, TypeError):
+            self.logger.info("Couldn't update user in db", user_id=user_id, user_data=user_data)
+            return False
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    def batch_update_users(self, users, deleted_appointments):
+        """
+        Updates multiple users at once, deleting some of their appointments. All the updates are committed together.
+
+        Args:
+            users (:obj:`dict`): a ``user_id:user_data`` dictionary of the users to be updated.
+            deleted_appointments (:obj:`dict`): a ``user_id:uuids`` dictionary of the appointments to be deleted.
+        """
+
+        puts, deletes = [], []
+        for user_id, user_data in users.items():
+            user_puts, user_deletes = self._get_user_writes(
+                user_id, user_data, deleted_appointments=deleted_appointments.get(user_id)
+            )
+            puts.extend(user_puts)
+            deletes.extend(user_deletes)
+
+        try:
+            self.group_commit.write(puts, deletes)
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
+    def load_user_appointments(self, user_id):
+        """
+        Loads the appointments of a user from the database.
+
+        Args:
+            user_id (:obj:`str`): a 33-byte hex-encoded string identifying the user.
+
+        Returns:
+            :obj:`dict`: A dictionary of ``uuid:slots`` with the appointments of the user.
+        """
+
+        key_prefix = USER_APPOINTMENT_PREFIX + user_id
+        return {
+            k.decode("utf-8")[len(key_prefix) :]: json.loads(v)  # noqa: E203
+            for k, v in self.db.iterator(prefix=key_prefix.encode("utf-8"))
+        }
+
     def load_user(self, user_id):
         """
         Loads a user record from the database using the ``user_pk`` as identifier.
@@ -88,8 +255,8 @@ class UsersDBM(DBManager):
         """
 
         try:
-            data = self.load_entry(user_id)
-            data = json.loads(data)
+            data = json.loads(self.load_entry(user_id, prefix=USER_PREFIX))
+            data["appointments"] = self.load_user_appointments(user_id)
         except (TypeError, json.decoder.JSONDecodeError) as e:
             self.logger.error(str(e))
             data = None
@@ -113,7 +280,11 @@ class UsersDBM(DBManager):
 
         try:
             self.logger.info("Deleting user from Gatekeeper's db", uuid=user_id)
-            self.delete_entry(user_id)
+            appointments_prefix = (USER_APPOINTMENT_PREFIX + user_id).encode("utf-8")
+            deletes = [(USER_PREFIX + user_id).encode("utf-8")]
+            deletes.extend(self.db.iterator(prefix=appointments_prefix, include_value=False))
+
+            self.group_commit.write(deletes=deletes)
             return True
 
         except TypeError:
@@ -124,6 +295,29 @@ class UsersDBM(DBManager):
             self.logger.error(str(e))
             raise e
 
+    def batch_delete_users(self, user_ids):
+        """
+        Deletes multiple users (alongside their appointments) at once.
+
+        Args:
+           user_ids (:obj:`list`): a list of 33-byte hex-encoded strings identifying the users to be deleted.
+        """
+
+        deletes = []
+        for user_id in user_ids:
+            self.logger.info("Deleting user from Gatekeeper's db", uuid=user_id)
+            deletes.append((USER_PREFIX + user_id).encode("utf-8"))
+            deletes.extend(
+                self.db.iterator(prefix=(USER_APPOINTMENT_PREFIX + user_id).encode("utf-8"), include_value=False)
+            )
+
+        try:
+            self.group_commit.write(deletes=deletes)
+
+        except RuntimeError as e:
+            self.logger.error(str(e))
+            raise e
+
     def load_all_users(self):
         """
         Loads all user records from the database.
@@ -137,10 +331,19 @@ class UsersDBM(DBManager):
         data = {}
 
         try:
-            for k, v in self.db.iterator():
-                # Get uuid and appointment_data from the db
-                user_id = k.decode("utf-8")
-                data[user_id] = json.loads(v)
+            with self.db.snapshot() as snapshot:
+                for k, v in snapshot.iterator(prefix=USER_PREFIX.encode("utf-8")):
+                    user_id = k.decode("utf-8")[len(USER_PREFIX) :]  # noqa: E203
+                    data[user_id] = json.loads(v)
+                    data[user_id]["appointments"] = {}
+
+                # Appointments are sorted by user, so a single scan is enough to rebuild all of them
+                for k, v in snapshot.iterator(prefix=USER_APPOINTMENT_PREFIX.encode("utf-8")):
+                    key = k.decode("utf-8")[len(USER_APPOINTMENT_PREFIX) :]  # noqa: E203
+                    user_id, uuid = key[:USER_ID_LEN_HEX], key[USER_ID_LEN_HEX:]  # noqa: E203
+                    if user_id in data:
+                        data[user_id]["appointments"][uuid] = json.loads(v)
+
         except RuntimeError as e:
             self.logger.error(str(e))
             raise e
@@ -0,0 +1,320 @@
+from struct import unpack_from
+
+from common.cryptographer import sha256d
+from common.exceptions import BasicException
+
+from teos.block_processor import Block
+
+HEADER_SIZE = 80
+OP_0 = 0x00
+OP_1 = 0x51
+OP_16 = 0x60
+SEGWIT_MARKER = 0x00
+SEGWIT_FLAG = 0x01
+MAX_MONEY = 21000000 * 10 ** 8
+
+
+class DeserializationError(BasicException):
+    """Raised when some serialized data (e.g. a block or a transaction) cannot be deserialized."""
+
+
+class ByteReader:
+    """
+    Sequential reader over a bytes-like object. Every read is bounds checked, so truncated data raises a
+    :obj:`DeserializationError` instead of silently returning fewer bytes.
+
+    Args:
+        data (:obj:`bytes`): the data to be read.
+
+    Attributes:
+        offset (:obj:`int`): The position of the next byte to be read.
+    """
+
+    def __init__(self, data):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def remaining(self):
+        """Returns the number of bytes that are left to be read."""
+
+        return len(self.data) - self.offset
+
+    def read(self, n):
+        """
+        Reads ``n`` bytes from the data.
+
+        Args:
+            n (:obj:`int`): the number of bytes to be read.
+
+        Returns:
+            :obj:`bytes`: The read bytes.
+
+        Raises:
+            :obj:`DeserializationError`: if there are not enough bytes left.
+        """
+
+        if n < 0 or self.offset + n > len(self.data):
+            raise DeserializationError("Unexpected end of data", offset=self.offset, requested=n)
+
+        chunk = self.data[self.offset : self.offset + n].tobytes()  # noqa: E203
+        self.offset += n
+
+        return chunk
+
+    def _unpack(self, fmt, size):
+        if self.offset + size > len(self.data):
+            raise DeserializationError("Unexpected end of data", offset=self.offset, requested=size)
+
+        value = unpack_from(fmt, self.data, self.offset)[0]
+        self.offset += size
+
+        return value
+
+    def peek_byte(self):
+        if self.offset >= len(self.data):
+            raise DeserializationError("Unexpected end of data", offset=self.offset, requested=1)
+
+        return self.data[self.offset]
+
+    def read_uint8(self):
+        return self._unpack("<B", 1)
+
+    def read_uint32(self):
+        return self._unpack("<I", 4)
+
+    def read_int32(self):
+        return self._unpack("<i", 4)
+
+    def read_int64(self):
+        return self._unpack("<q", 8)
+
+    def read_varint(self):
+        """
+        Reads a Bitcoin ``CompactSize`` unsigned integer.
+
+        Returns:
+            :obj:`int`: The decoded integer.
+        """
+
+        prefix = self.read_uint8()
+
+        if prefix < 0xFD:
+            return prefix
+        elif prefix == 0xFD:
+            return self._unpack("<H", 2)
+        elif prefix == 0xFE:
+            return self._unpack("<I", 4)
+        else:
+            return self._unpack("<Q", 8)
+
+    def read_var_bytes(self):
+        """Reads a ``CompactSize`` length followed by that many bytes."""
+
+        return self.read(self.read_varint())
+
+
+def deserialize_transaction(reader):
+    """
+    Deserializes a transaction (either legacy or segwit) from the current position of ``reader``.
+
+    The transaction id is computed locally as the double sha256 of the non-witness serialization of the transaction,
+    so it matches the ``txid`` reported by ``bitcoind`` for both legacy and segwit transactions.
+
+    Args:
+        reader (:obj:`ByteReader`): the reader the transaction will be read from.
+
+    Returns:
+        :obj:`dict`: The transaction data, following the field names used by ``bitcoind``'s ``decoderawtransaction``
+        (``txid``, ``version``, ``vin``, ``vout`` and ``locktime``). Scripts and witness items are returned as hex
+        strings, and output values in satoshis.
+
+    Raises:
+        :obj:`DeserializationError`: if the transaction cannot be deserialized.
+    """
+
+    start = reader.offset
+    version = reader.read_int32()
+
+    # A segwit transaction has a 0x00 marker where a legacy one would have the input count
+    segwit = False
+    if reader.peek_byte() == SEGWIT_MARKER:
+        reader.read_uint8()
+        if reader.read_uint8() != SEGWIT_FLAG:
+            raise DeserializationError("Wrong segwit flag", offset=reader.offset - 1)
+        segwit = True
+
+    io_start = reader.offset
+    vin = []
+    for _ in range(reader.read_varint()):
+        prev_txid = reader.read(32)[::-1].hex()
+        prev_vout = reader.read_uint32()
+        script_sig = reader.read_var_bytes().hex()
+        sequence = reader.read_uint32()
+        vin.append({"txid": prev_txid, "vout": prev_vout, "scriptSig": script_sig, "sequence": sequence})
+
+    vout = []
+    for n in range(reader.read_varint()):
+        value = reader.read_int64()
+        script_pubkey = reader.read_var_bytes().hex()
+        vout.append({"value": value, "n": n, "scriptPubKey": script_pubkey})
+    io_end = reader.offset
+
+    if segwit:
+        for txin in vin:
+            txin["txinwitness"] = [reader.read_var_bytes().hex() for _ in range(reader.read_varint())]
+
+    locktime = reader.read_uint32()
+
+    if segwit:
+        # The txid commits to the transaction without the marker, flag and witness
+        stripped = reader.data[start : start + 4].tobytes() + reader.data[io_start:io_end].tobytes()  # noqa: E203
+        stripped += reader.data[reader.offset - 4 : reader.offset].tobytes()  # noqa: E203
+    else:
+        stripped = reader.data[start : reader.offset].tobytes()  # noqa: E203
+
+    return {
+        "txid": sha256d(stripped)[::-1].hex(),
+        "version": version,
+        "vin": vin,
+        "vout": vout,
+        "locktime": locktime,
+    }
+
+
+def decode_raw_transaction(raw_tx):
+    """
+    Decodes a standalone raw transaction (hex encoded), checking it is well formed the way ``bitcoind``'s
+    ``decoderawtransaction`` would: the whole data must be consumed, the transaction must have inputs and outputs, the
+    output values must be in range and segwit transactions cannot have an empty witness.
+
+    Args:
+        raw_tx (:obj:`str`): the hex representation of the transaction.
+
+    Returns:
+        :obj:`dict`: The transaction data, as returned by :func:`deserialize_transaction`.
+
+    Raises:
+        :obj:`DeserializationError`: if the transaction cannot be deserialized or it is not well formed.
+    """
+
+    try:
+        reader = ByteReader(bytes.fromhex(raw_tx))
+    except (TypeError, ValueError):
+        raise DeserializationError("Wrong transaction encoding")
+
+    tx = deserialize_transaction(reader)
+
+    if reader.remaining():
+        raise DeserializationError("Unexpected data after the transaction", txid=tx.get("txid"))
+
+    if not tx.get("vin") or not tx.get("vout"):
+        raise DeserializationError("Transaction has no inputs or no outputs", txid=tx.get("txid"))
+
+    values = [txout.get("value") for txout in tx.get("vout")]
+    if any(value < 0 or value > MAX_MONEY for value in values) or sum(values) > MAX_MONEY:
+        raise DeserializationError("Output value out of range", txid=tx.get("txid"))
+
+    witnesses = [txin.get("txinwitness") for txin in tx.get("vin") if "txinwitness" in txin]
+    if witnesses and not any(witnesses):
+        raise DeserializationError("Superfluous witness record", txid=tx.get("txid"))
+
+    return tx
+
+
+def decode_coinbase_height(script_sig):
+    """
+    Decodes the block height from a coinbase ``scriptSig`` (BIP34).
+
+    Args:
+        script_sig (:obj:`bytes`): the ``scriptSig`` of the coinbase transaction.
+
+    Returns:
+        :obj:`int` or :obj:`None`: The height encoded in the script, or :obj:`None` if it does not start with a valid
+        height push.
+    """
+
+    if not script_sig:
+        return None
+
+    opcode = script_sig[0]
+    if opcode == OP_0:
+        return 0
+    if OP_1 <= opcode <= OP_16:
+        return opcode - OP_1 + 1
+    if 1 <= opcode <= 8 and len(script_sig) > opcode:
+        height_bytes = script_sig[1 : 1 + opcode]  # noqa: E203
+        # Negative numbers are not valid heights
+        if height_bytes[-1] & 0x80:
+            return None
+        return int.from_bytes(height_bytes, "little")
+
+    return None
+
+
+def compute_merkle_root(txids):
+    """
+    Computes the merkle root of a list of transaction ids.
+
+    Args:
+        txids (:obj:`list`): the transaction ids, in internal byte order (:obj:`bytes`).
+
+    Returns:
+        :obj:`bytes`: The merkle root, in internal byte order.
+    """
+
+    level = list(txids)
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [sha256d(level[i] + level[i + 1]) for i in range(0, len(level), 2)]
+
+    return level[0]
+
+
+def deserialize_block(raw_block):
+    """
+    Deserializes a raw block (as sent by ``bitcoind`` via ``zmq`` ``rawblock``) into a
+    :obj:`Block <teos.block_processor.Block>`.
+
+    The block hash, the previous block hash, the timestamp and the transaction ids are computed locally, and the height
+    is taken from the coinbase transaction (BIP34). The merkle root in the header is checked against the computed
+    transaction ids.
+
+    Args:
+        raw_block (:obj:`bytes`): the serialized block.
+
+    Returns:
+        :obj:`Block <teos.block_processor.Block>`: The deserialized block. Its height will be :obj:`None` if it cannot
+        be decoded from the coinbase transaction.
+
+    Raises:
+        :obj:`DeserializationError`: if the block cannot be deserialized or it is not consistent.
+    """
+
+    reader = ByteReader(raw_block)
+    header = reader.read(HEADER_SIZE)
+    block_hash = sha256d(header)[::-1].hex()
+    prev_block_hash = header[4:36][::-1].hex()
+    merkle_root = header[36:68]
+    time = int.from_bytes(header[68:72], "little")
+
+    tx_count = reader.read_varint()
+    if tx_count == 0:
+        raise DeserializationError("Block has no transactions", block_hash=block_hash)
+
+    txs = [deserialize_transaction(reader) for _ in range(tx_count)]
+
+    if reader.remaining():
+        raise DeserializationError("Unexpected data after the last transaction", block_hash=block_hash)
+
+    txids = [tx.get("txid") for tx in txs]
+    if compute_merkle_root([bytes.fromhex(txid)[::-1] for txid in txids]) != merkle_root:
+        raise DeserializationError("Merkle root mismatch", block_hash=block_hash)
+
+    coinbase_inputs = txs[0].get("vin")
+    if len(coinbase_inputs) != 1:
+        raise DeserializationError("Wrong coinbase transaction", block_hash=block_hash)
+
+    height = decode_coinbase_height(bytes.fromhex(coinbase_inputs[0].get("scriptSig")))
+
+    return Block(block_hash, height, prev_block_hash, txids, time=time)
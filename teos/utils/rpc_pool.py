@@ -0,0 +1,262 @@
+import http.client
+from functools import partial
+from collections import deque
+from threading import Lock, BoundedSemaphore
+
+from teos.utils.auth_proxy import AuthServiceProxy, JSONRPCException, HTTP_TIMEOUT
+
+DEFAULT_POOL_SIZE = 8
+
+# JSON-RPC error code set by AuthServiceProxy when bitcoind does not answer in time
+RPC_TIMEOUT_ERROR = -344
+
+# Errors signaling that bitcoind dropped a kept-alive connection (e.g. because it was idle for too long). The call can
+# be retried over a fresh connection
+RESET_ERRORS = (ConnectionResetError, BrokenPipeError, http.client.HTTPException)
+
+
+class PooledConnection:
+    """
+    A persistent (keep-alive) ``http`` connection to ``bitcoind``, along with the proxies used to send ``json-rpc``
+    calls through it. Proxies are built once per method, so the url parsing and the authentication header are not
+    computed on every call.
+
+    Args:
+        service_url (:obj:`str`): the url of the ``json-rpc`` interface of ``bitcoind`` (including the credentials).
+        host (:obj:`str`): the host ``bitcoind`` is listening at.
+        port (:obj:`int`): the port ``bitcoind`` is listening at.
+        timeout (:obj:`int`): the default timeout of the connection (in seconds).
+
+    Attributes:
+        http_conn (:obj:`http.client.HTTPConnection`): The underlying ``http`` connection.
+        proxy (:obj:`AuthServiceProxy <teos.utils.auth_proxy.AuthServiceProxy>`): The proxy that uses ``http_conn``.
+    """
+
+    def __init__(self, service_url, host, port, timeout):
+        self.http_conn = http.client.HTTPConnection(host, port, timeout=timeout)
+        self.proxy = AuthServiceProxy(service_url, connection=self.http_conn)
+        self.methods = {}
+
+    def method(self, name):
+        """Returns the proxy used to call the ``json-rpc`` method ``name``."""
+
+        if name not in self.methods:
+            self.methods[name] = getattr(self.proxy, name)
+
+        return self.methods[name]
+
+    def set_timeout(self, timeout):
+        """Sets the timeout (in seconds) of the connection for the following calls."""
+
+        self.http_conn.timeout = timeout
+        if self.http_conn.sock is not None:
+            self.http_conn.sock.settimeout(timeout)
+
+    def close(self):
+        """Closes the ``http`` connection. It will be reopened if the connection is used again."""
+
+        self.http_conn.close()
+
+
+class RPCConnectionPool:
+    """
+    The :class:`RPCConnectionPool` is a thread-safe pool of persistent ``http`` connections to ``bitcoind``'s
+    ``json-rpc`` interface, so the tower does not open a new connection for every call.
+
+    The pool is bounded: if all the connections are in use, callers wait until one is released. Connections that
+    are dropped by ``bitcoind`` are reopened and the call is retried once, while connections that end up in an unknown
+    state (e.g. a call timed out while waiting for the response) are discarded.
+
+    Methods can be called directly on the pool as if it was an
+    :obj:`AuthServiceProxy <teos.utils.auth_proxy.AuthServiceProxy>` (e.g. ``pool.getblock(block_hash)``).
+
+    Args:
+        btc_connect_params (:obj:`dict`): a dictionary with the parameters to connect to bitcoind
+            (``rpc user, rpc password, host and port``). ``BTC_RPC_POOL_SIZE`` and ``BTC_RPC_TIMEOUT`` can be used to
+            set the size of the pool and the default call timeout (in seconds).
+
+    Attributes:
+        host (:obj:`str`): The host ``bitcoind`` is listening at.
+        port (:obj:`int`): The port ``bitcoind`` is listening at.
+        max_size (:obj:`int`): The maximum number of open connections.
+        timeout (:obj:`int`): The default timeout of the calls (in seconds).
+    """
+
+    def __init__(self, btc_connect_params):
+        self.host = btc_connect_params.get("BTC_RPC_CONNECT")
+        self.port = btc_connect_params.get("BTC_RPC_PORT")
+        self.service_url = "http://%s:%s@%s:%d" % (
+            btc_connect_params.get("BTC_RPC_USER"),
+            btc_connect_params.get("BTC_RPC_PASSWORD"),
+            self.host,
+            self.port,
+        )
+        self.max_size = btc_connect_params.get("BTC_RPC_POOL_SIZE", DEFAULT_POOL_SIZE)
+        self.timeout = btc_connect_params.get("BTC_RPC_TIMEOUT", HTTP_TIMEOUT)
+
+        # Idle connections are reused LIFO, so the most recently used (the one most likely to still be alive) goes first
+        self.idle_connections = deque()
+        self.slots = BoundedSemaphore(self.max_size)
+        self.lock = Lock()
+        self._stats = {"calls": 0, "created": 0, "reused": 0, "reconnects": 0, "timeouts": 0, "discarded": 0}
+        self.in_use = 0
+
+    def __getattr__(self, name):
+        if name.startswith("__") and name.endswith("__"):
+            raise AttributeError(name)
+
+        return partial(self.call, name)
+
+    def acquire(self):
+        """
+        Gets a connection from the pool, creating a new one if there is no idle connection. Blocks if all the
+        connections are in use.
+
+        Returns:
+            :obj:`PooledConnection`: A connection to ``bitcoind``. It must be handed back using ``release``.
+        """
+
+        self.slots.acquire()
+
+        with self.lock:
+            self.in_use += 1
+            self._stats["calls"] += 1
+
+            if self.idle_connections:
+                self._stats["reused"] += 1
+                return self.idle_connections.pop()
+
+            self._stats["created"] += 1
+
+        return PooledConnection(self.service_url, self.host, self.port, self.timeout)
+
+    def release(self, connection, reusable=True):
+        """
+        Hands a connection back to the pool.
+
+        Args:
+            connection (:obj:`PooledConnection`): the connection to be released.
+            reusable (:obj:`bool`): whether the connection can be reused or it has to be closed.
+        """
+
+        with self.lock:
+            self.in_use -= 1
+
+            if reusable:
+                self.idle_connections.append(connection)
+            else:
+                self._stats["discarded"] += 1
+
+        if not reusable:
+            connection.close()
+
+        self.slots.release()
+
+    def _run(self, command, timeout=None):
+        """
+        Runs a command using a pooled connection, dealing with resets and timeouts.
+
+        Args:
+            command (:obj:`function`): the command to run. It receives a :obj:`PooledConnection` as parameter.
+            timeout (:obj:`int`): the timeout of the call (in seconds). The default pool timeout is used if None.
+
+        Returns:
+            :obj:`Object`: The return of the command.
+
+        Raises:
+            :obj:`JSONRPCException`: if ``bitcoind`` returns an error or the call times out.
+            :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
+        """
+
+        connection = self.acquire()
+        reusable = False
+
+        try:
+            connection.set_timeout(timeout or self.timeout)
+
+            try:
+                result = command(connection)
+            except RESET_ERRORS:
+                with self.lock:
+                    self._stats["reconnects"] += 1
+
+                # The connection will be reopened on the next request
+                connection.close()
+                result = command(connection)
+
+            reusable = True
+            return result
+
+        except JSONRPCException as e:
+            if e.error.get("code") == RPC_TIMEOUT_ERROR:
+                # The response may still arrive, so the connection cannot be used for other calls
+                with self.lock:
+                    self._stats["timeouts"] += 1
+            else:
+                reusable = True
+            raise
+
+        finally:
+            self.release(connection, reusable)
+
+    def call(self, method, *args, timeout=None):
+        """
+        Calls a ``json-rpc`` method.
+
+        Args:
+            method (:obj:`str`): the name of the method (e.g. ``getblock``).
+            args: the parameters of the call.
+            timeout (:obj:`int`): the timeout of the call (in seconds). The default pool timeout is used if None.
+
+        Returns:
+            :obj:`Object`: The result of the call.
+
+        Raises:
+            :obj:`JSONRPCException`: if ``bitcoind`` returns an error or the call times out.
+            :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
+        """
+
+        return self._run(lambda connection: connection.method(method)(*args), timeout)
+
+    def batch(self, rpc_call_list, timeout=None):
+        """
+        Sends a ``json-rpc`` batch request.
+
+        Args:
+            rpc_call_list (:obj:`list`): the list of ``json-rpc`` requests.
+            timeout (:obj:`int`): the timeout of the call (in seconds). The default pool timeout is used if None.
+
+        Returns:
+            :obj:`list`: The ``json-rpc`` responses.
+
+        Raises:
+            :obj:`JSONRPCException`: if the batch request fails or times out.
+            :obj:`ConnectionRefusedError`: if bitcoind cannot be reached.
+        """
+
+        return self._run(lambda connection: connection.proxy.batch(rpc_call_list), timeout)
+
+    def stats(self):
+        """
+        Returns the pool statistics.
+
+        Returns:
+            :obj:`dict`: A dictionary with the number of ``calls``, the number of connections ``created``,
+            ``reused``, ``reconnects``, ``timeouts`` and ``discarded``, and the current ``in_use`` and ``idle``
+            connections (along with the pool ``max_size``).
+        """
+
+        with self.lock:
+            return dict(
+                self._stats, in_use=self.in_use, idle=len(self.idle_connections), max_size=self.max_size,
+            )
+
+    def close(self):
+        """Closes all the idle connections."""
+
+        with self.lock:
+            idle_connections = list(self.idle_connections)
+            self.idle_connections.clear()
+
+        for connection in idle_connections:
+            connection.close()
@@ -1,5 +1,6 @@
 from queue import Queue
-from threading import Thread
+from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor
 from collections import OrderedDict
 from readerwriterlock import rwlock
 
@@ -12,9 +13,14 @@ from common.cryptographer import Cryptographer, hash_160
 
 from teos.cleaner import Cleaner
 from teos.chain_monitor import ChainMonitor
+from teos.constants import MEMPOOL_CACHE_SIZE, WATCHER_LOCATOR_LOCKS
 from teos.gatekeeper import SubscriptionExpired
 from teos.extended_appointment import ExtendedAppointment
 from teos.block_processor import InvalidTransactionFormat
+from teos.utils.deserializer import decode_raw_transaction, DeserializationError
+
+# testmempoolaccept rejections that do not mean the penalty transaction is invalid
+MEMPOOL_ALREADY_KNOWN = ["txn-already-in-mempool", "txn-already-known"]
 
 
 class AppointmentLimitReached(BasicException):
@@ -37,8 +43,13 @@ class LocatorCache:
     against it. The data is indexed by locator and it's mainly built during the normal :obj:`Watcher` operation so no
     extra steps are normally needed.
 
+    If a database manager is given, the cache is checkpointed to the database on every change, so it can be reloaded
+    on restart instead of being fetched from ``bitcoind``.
+
     Args:
         blocks_in_cache (:obj:`int`): the numbers of blocks to keep in the cache.
+        db_manager (:obj:`AppointmentsDBM <teos.appointments_dbm.AppointmentsDBM>`): an optional database manager used
+            to persist the cache.
 
     Attributes:
         logger (:obj:`Logger <teos.logger.Logger>`): The logger for this component.
@@ -51,17 +62,40 @@ class LocatorCache:
         rw_lock (:obj:`RWLockWrite <rwlock.RWLockWrite>`): A lock object to manage access to the cache on updates.
     """
 
-    def __init__(self, blocks_in_cache):
+    def __init__(self, blocks_in_cache, db_manager=None):
         self.logger = get_logger(component=LocatorCache.__name__)
         self.cache = dict()
         self.blocks = OrderedDict()
         self.cache_size = blocks_in_cache
+        self.db_manager = db_manager
         self.rw_lock = rwlock.RWLockWrite()
 
+    def persist(self, new_blocks=None, removed_blocks=None):
+        """
+        Checkpoints the changes of the cache to the database (if the cache is backed by one).
+
+        Args:
+            new_blocks (:obj:`dict`): the blocks added to the cache
+                (``block_hash:{prev_block_hash, locator_txid_map}``).
+            removed_blocks (:obj:`list`): the hashes of the blocks removed from the cache.
+        """
+
+        if self.db_manager is None:
+            return
+
+        if new_blocks:
+            self.db_manager.store_locator_cache_blocks(new_blocks)
+        if removed_blocks:
+            self.db_manager.batch_delete_locator_cache_blocks(removed_blocks)
+
     def init(self, last_known_block, block_processor):
         """
         Sets the initial state of the locator cache.
 
+        If the cache is backed by a database, the checkpointed blocks are reloaded from it and only the missing ones are
+        fetched from ``bitcoind``. Since blocks are linked by their hashes, walking back from ``last_known_block`` only
+        picks the checkpointed blocks that are part of the chain the :obj:`Watcher` is at. The rest are dropped.
+
         Args:
             last_known_block (:obj:`str`): the last known block by the :obj:`Watcher`.
             block_processor (:obj:`BlockProcessor <teos.block_processor.BlockProcessor>`): a block processor instance.
@@ -69,6 +103,9 @@ class LocatorCache:
 
         # This is needed as a separate method from __init__ since it has to be initialized right before start watching.
         # Not doing so implies store temporary variables in the Watcher and initialising the cache as None.
+        checkpointed_blocks = self.db_manager.load_locator_cache_blocks() if self.db_manager is not None else {}
+        fetched_blocks = {}
+
         target_block_hash = last_known_block
         for _ in range(self.cache_size):
             # In some setups, like regtest, it could be the case that there are no enough previous blocks.
@@ -76,16 +113,32 @@ class LocatorCache:
             if not target_block_hash:
                 break
 
-            target_block = block_processor.get_block(target_block_hash, blocking=True)
-            if not target_block:
-                break
+            if target_block_hash in checkpointed_blocks:
+                block_data = checkpointed_blocks.pop(target_block_hash)
+            else:
+                target_block = block_processor.get_block(target_block_hash, blocking=True)
+                if not target_block:
+                    break
 
-            locator_txid_map = {compute_locator(txid): txid for txid in target_block.get("tx")}
+                block_data = {
+                    "prev_block_hash": target_block.get("previousblockhash"),
+                    "locator_txid_map": {compute_locator(txid): txid for txid in target_block.get("tx")},
+                }
+                fetched_blocks[target_block_hash] = block_data
+
+            locator_txid_map = block_data.get("locator_txid_map")
             self.cache.update(locator_txid_map)
             self.blocks[target_block_hash] = list(locator_txid_map.keys())
-            target_block_hash = target_block.get("previousblockhash")
+            target_block_hash = block_data.get("prev_block_hash")
 
         self.blocks = OrderedDict(reversed((list(self.blocks.items()))))
+        self.persist(fetched_blocks, list(checkpointed_blocks.keys()))
+        self.logger.info(
+            "Locator cache initialized",
+            blocks=len(self.blocks),
+            fetched=len(fetched_blocks),
+            dropped=len(checkpointed_blocks),
+        )
 
     def get_txid(self, locator):
         """
@@ -101,7 +154,7 @@ class LocatorCache:
         with self.rw_lock.gen_rlock():
             return self.cache.get(locator)
 
-    def update(self, block_hash, locator_txid_map):
+    def update(self, block_hash, locator_txid_map, prev_block_hash=None):
         """
         Updates the cache with data from a new block. Removes the oldest block if the cache is full after the addition.
 
@@ -109,6 +162,7 @@ class LocatorCache:
             block_hash (:obj:`str`): the hash of the new block.
             locator_txid_map (:obj:`dict`): the dictionary of locators (locator:txid) derived from a list of transaction
                 ids.
+            prev_block_hash (:obj:`str`): the hash of the parent block. Used to link the checkpointed blocks.
         """
 
         with self.rw_lock.gen_wlock():
@@ -116,6 +170,8 @@ class LocatorCache:
             self.blocks[block_hash] = list(locator_txid_map.keys())
             self.logger.debug("Block added to cache", block_hash=block_hash)
 
+        self.persist({block_hash: {"prev_block_hash": prev_block_hash, "locator_txid_map": dict(locator_txid_map)}})
+
         if self.is_full():
             self.remove_oldest_block()
 
@@ -132,35 +188,129 @@ class LocatorCache:
             for locator in locators:
                 del self.cache[locator]
 
+        self.persist(removed_blocks=[block_hash])
         self.logger.debug("Block removed from cache", block_hash=block_hash)
 
     def fix(self, last_known_block, block_processor):
         """
-        Fixes the cache after a reorg has been detected by feeding the most recent ``cache_size`` blocks to it.
+        Fixes the cache after a reorg has been detected, so it covers the chain ending at ``last_known_block``.
+
+        Only the blocks that are not already in the cache are fetched: the new chain is walked back from
+        ``last_known_block`` until a cached block (the fork point) is found. Then, the blocks on top of the fork point
+        are disconnected and the new ones are connected. If no fork point is found within ``cache_size`` blocks, the
+        whole cache is replaced.
+
+        Notice that if the new chain is shorter than the old one, the cache will hold less than ``cache_size`` blocks
+        until new blocks are added to it.
 
         Args:
             last_known_block (:obj:`str`): the last known block hash after the reorg.
             block_processor (:obj:`BlockProcessor <teos.block_processor.BlockProcessor>`): a block processor instance.
-        """
 
-        tmp_cache = LocatorCache(self.cache_size)
+        Returns:
+            :obj:`int`: The depth of the reorg (the number of blocks disconnected from the cache).
+        """
 
-        # We assume there are no reorgs back to genesis. If so, this would raise some log warnings. And the cache will
-        # be filled with less than cache_size blocks.
+        # The cache is only modified by the Watcher's thread, so it can be read without acquiring the lock here
+        new_blocks = []
         target_block_hash = last_known_block
-        for _ in range(tmp_cache.cache_size):
+        while target_block_hash not in self.blocks and len(new_blocks) < self.cache_size:
             target_block = block_processor.get_block(target_block_hash, blocking=True)
-            if target_block:
-                # Compute the locator:txid pair for every transaction in the block and update both the cache and
-                # the block mapping.
-                locator_txid_map = {compute_locator(txid): txid for txid in target_block.get("tx")}
-                tmp_cache.cache.update(locator_txid_map)
-                tmp_cache.blocks[target_block_hash] = list(locator_txid_map.keys())
-                target_block_hash = target_block.get("previousblockhash")
+            if not target_block:
+                break
+
+            locator_txid_map = {compute_locator(txid): txid for txid in target_block.get("tx")}
+            new_blocks.append((target_block_hash, target_block.get("previousblockhash"), locator_txid_map))
+            target_block_hash = target_block.get("previousblockhash")
+
+        fork_point = target_block_hash if target_block_hash in self.blocks else None
+        disconnected_blocks = []
 
         with self.rw_lock.gen_wlock():
-            self.blocks = OrderedDict(reversed((list(tmp_cache.blocks.items()))))
-            self.cache = tmp_cache.cache
+            while self.blocks and next(reversed(self.blocks)) != fork_point:
+                block_hash, locators = self.blocks.popitem(last=True)
+                for locator in locators:
+                    self.cache.pop(locator, None)
+                disconnected_blocks.append(block_hash)
+
+            for block_hash, _, locator_txid_map in reversed(new_blocks):
+                self.cache.update(locator_txid_map)
+                self.blocks[block_hash] = list(locator_txid_map.keys())
+
+        self.persist(
+            {
+                block_hash: {"prev_block_hash": prev_block_hash, "locator_txid_map": locator_txid_map}
+                for block_hash, prev_block_hash, locator_txid_map in new_blocks
+            },
+            disconnected_blocks,
+        )
+        reorg_depth = len(disconnected_blocks)
+
+        while self.is_full():
+            self.remove_oldest_block()
+
+        self.logger.debug(
+            "Cache fixed after reorg", fork_point=fork_point, disconnected=reorg_depth, connected=len(new_blocks)
+        )
+
+        return reorg_depth
+
+
+class MempoolCache:
+    """
+    The :obj:`MempoolCache` keeps track of the last ``cache_size`` transactions seen in ``bitcoind``'s mempool, so
+    duplicate announcements can be ignored, along with the breaches that they triggered (if any).
+
+    Args:
+        cache_size (:obj:`int`): the number of transactions to keep in the cache.
+
+    Attributes:
+        cache_size (:obj:`int`): The number of transactions to keep in the cache.
+        txs (:obj:`OrderedDict`): A ``txid:breaches`` map of the seen transactions, sorted by arrival time. ``breaches``
+            is a ``(uuid, blob_hash):(penalty_txid, penalty_rawtx)`` map (``None`` for invalid breaches), or ``None``
+            if the transaction did not trigger any appointment. Results are keyed by blob so they are not reused if the
+            appointment is updated afterwards.
+        lock (:obj:`Lock`): A lock to protect the cache from concurrent access.
+    """
+
+    def __init__(self, cache_size):
+        self.cache_size = cache_size
+        self.txs = OrderedDict()
+        self.lock = Lock()
+
+    def add(self, txid):
+        """
+        Adds a transaction to the cache. The oldest transaction is removed if the cache is full after the addition.
+
+        Args:
+            txid (:obj:`str`): the id of the transaction.
+
+        Returns:
+            :obj:`bool`: True if the transaction was added, False if it was already in the cache.
+        """
+
+        with self.lock:
+            if txid in self.txs:
+                return False
+
+            self.txs[txid] = None
+            if len(self.txs) > self.cache_size:
+                self.txs.popitem(last=False)
+
+            return True
+
+    def set_breaches(self, txid, breaches):
+        """Sets the breaches triggered by a cached transaction (see ``txs``)."""
+
+        with self.lock:
+            if txid in self.txs:
+                self.txs[txid] = breaches
+
+    def get_breaches(self, txid):
+        """Gets the breaches triggered by a cached transaction. :obj:`None` if there are none."""
+
+        with self.lock:
+            return self.txs.get(txid)
 
 
 class Watcher:
@@ -188,14 +338,25 @@ class Watcher:
             time.
         blocks_in_cache (:obj:`int`): the number of blocks to keep in cache so recently triggered appointments can be
             covered.
+        locator_index (:obj:`LocatorIndex <teos.locator_index.LocatorIndex>`): an optional on-disk locator index to
+            cover appointments triggered in blocks older than the ones in the cache.
+        breach_workers (:obj:`int`): the number of mempool pre-flight checks (``testmempoolaccept``) run at the same
+            time while validating breaches. Checks are run sequentially if set to 1.
+        mempool_preflight (:obj:`bool`): whether penalty transactions should also be checked against ``bitcoind``'s
+            mempool (``testmempoolaccept``) when validating a breach.
+        max_decrypts_per_locator (:obj:`int`): the maximum number of different blobs decrypted per breached locator
+            while processing a block. The rest are checked in the background. Unlimited if 0.
+        mempool_broadcast (:obj:`bool`): whether penalties should be broadcast as soon as a breach is seen in the
+            mempool.
 
     Attributes:
         appointments (:obj:`dict`): A dictionary containing a summary of the appointments (:obj:`ExtendedAppointment
             <teos.extended_appointment.ExtendedAppointment>` instances) accepted by the tower (``locator`` and
             ``user_id``). It's populated trough ``add_appointment``.
         locator_uuid_map (:obj:`dict`): A ``locator:uuid`` map used to allow the :obj:`Watcher` to deal with several
-            appointments with the same ``locator``.
-        block_queue (:obj:`Queue`): A queue used by the :obj:`Watcher` to receive block hashes from ``bitcoind``. It is
+            appointments with the same ``locator``. The uuids of each locator are kept as the keys of a :obj:`dict`,
+            so they can be looked up in constant time while keeping the order in which they were received.
+        block_queue (:obj:`Queue`): A queue used by the :obj:`Watcher` to receive blocks from ``bitcoind``. It is
             populated by the :obj:`ChainMonitor <teos.chain_monitor.ChainMonitor>`.
         db_manager (:obj:`AppointmentsDBM <teos.appointments_dbm.AppointmentsDBM>`): An instance of the appointment
                 database manager to interact with the database.
@@ -208,14 +369,48 @@ class Watcher:
         max_appointments (:obj:`int`): The maximum amount of appointments accepted by the :obj:`Watcher` at the same
             time.
         last_known_block (:obj:`str`): The last block known by the :obj:`Watcher`.
-        locator_cache (:obj:`LocatorCache`): A cache of locators for the last ``blocks_in_cache`` blocks.
+        locator_cache (:obj:`LocatorCache`): A cache of locators for the last ``blocks_in_cache`` blocks. It is
+            checkpointed to the database so it does not need to be fetched from ``bitcoind`` on restart.
+        locator_index (:obj:`LocatorIndex <teos.locator_index.LocatorIndex>`): An optional deep locator index, checked
+            when a locator is not found in the cache (:obj:`None` if disabled).
+        breach_validator (:obj:`ThreadPoolExecutor`): A pool of workers to run the mempool pre-flight checks of the
+            breaches being validated in parallel (:obj:`None` if ``mempool_preflight`` is not set or ``breach_workers``
+            is 1).
+        mempool_preflight (:obj:`bool`): Whether penalty transactions are checked against ``bitcoind``'s mempool.
+        max_decrypts_per_locator (:obj:`int`): The maximum number of different blobs decrypted per breached locator
+            while processing a block (0 for unlimited).
+        deferred_breaches (:obj:`Queue`): A queue used to notify the background pass that there may be breaches that
+            went over ``max_decrypts_per_locator`` to be checked. The breaches themselves are kept in the database, so
+            they survive restarts.
+        mempool_queue (:obj:`Queue`): A queue used by the :obj:`Watcher` to receive the ids of the transactions that
+            reach ``bitcoind``'s mempool. It is populated by the :obj:`ChainMonitor <teos.chain_monitor.ChainMonitor>`
+            if subscribed to ``rawtx``.
+        mempool_cache (:obj:`MempoolCache`): A cache of the mempool transactions already seen, along with the breaches
+            they triggered.
+        mempool_broadcast (:obj:`bool`): Whether penalties are broadcast as soon as a breach is seen in the mempool.
         rw_lock (:obj:`RWLockWrite <rwlock.RWLockWrite>`): A lock object to manage access to the Watcher on updates.
+        locator_locks (:obj:`list`): A list of ``WATCHER_LOCATOR_LOCKS`` locks used to serialize the appointments sent
+            to the same locator (see :meth:`get_locator_lock`).
 
     Raises:
         :obj:`InvalidKey`: if teos sk cannot be loaded.
     """
 
-    def __init__(self, db_manager, gatekeeper, block_processor, responder, sk, max_appointments, blocks_in_cache):
+    def __init__(
+        self,
+        db_manager,
+        gatekeeper,
+        block_processor,
+        responder,
+        sk,
+        max_appointments,
+        blocks_in_cache,
+        locator_index=None,
+        breach_workers=1,
+        mempool_preflight=False,
+        max_decrypts_per_locator=0,
+        mempool_broadcast=False,
+    ):
         self.logger = get_logger(component=Watcher.__name__)
 
         self.appointments = dict()
@@ -228,8 +423,21 @@ class Watcher:
         self.max_appointments = max_appointments
         self.signing_key = sk
         self.last_known_block = db_manager.load_last_block_hash_watcher()
-        self.locator_cache = LocatorCache(blocks_in_cache)
+        self.locator_cache = LocatorCache(blocks_in_cache, db_manager)
+        self.locator_index = locator_index
+        self.breach_validator = (
+            ThreadPoolExecutor(max_workers=breach_workers, thread_name_prefix="breach_validator")
+            if mempool_preflight and breach_workers > 1
+            else None
+        )
+        self.mempool_preflight = mempool_preflight
+        self.max_decrypts_per_locator = max_decrypts_per_locator
+        self.deferred_breaches = Queue()
+        self.mempool_queue = Queue()
+        self.mempool_cache = MempoolCache(MEMPOOL_CACHE_SIZE)
+        self.mempool_broadcast = mempool_broadcast
         self.rw_lock = rwlock.RWLockWrite()
+        self.locator_locks = [Lock() for _ in range(WATCHER_LOCATOR_LOCKS)]
 
     @property
     def tower_id(self):
@@ -252,6 +460,21 @@ class Watcher:
         """Get the total number of trackers in the responder."""
         return self.responder.n_responder_trackers
 
+    def get_locator_lock(self, locator):
+        """
+        Gets the lock that guards the appointments sent to a given locator. Locks are shared by several locators
+        (striped), so the number of locks is bounded.
+
+        Args:
+            locator (:obj:`str`): the appointment locator (16-byte hex-encoded).
+
+        Returns:
+            :obj:`Lock`: The lock for the given locator.
+        """
+
+        # Locators are derived from transaction ids, so they are already uniformly distributed
+        return self.locator_locks[int(locator[:8], 16) % len(self.locator_locks)]
+
     def awake(self):
         """
         Starts a new thread to monitor the blockchain for channel breaches. The thread will run until the
@@ -359,32 +582,44 @@ class Watcher:
             :obj:`ConnectionRefusedError`: If bitcoind cannot be reached.
         """
 
-        with self.rw_lock.gen_wlock():
-            if len(self.appointments) >= self.max_appointments:
-                message = "Maximum appointments reached, appointment rejected"
-                self.logger.info(message, locator=appointment.locator)
-                raise AppointmentLimitReached(message)
-
-            user_id = self.gatekeeper.authenticate_user(appointment.serialize(), user_signature)
-            has_subscription_expired, expiry = self.gatekeeper.has_subscription_expired(user_id)
-            if has_subscription_expired:
-                raise SubscriptionExpired(f"Your subscription expired at block {expiry}")
-
-            start_block = self.block_processor.get_block(self.last_known_block).get("height")
-            extended_appointment = ExtendedAppointment(
-                appointment.locator,
-                appointment.encrypted_blob,
-                appointment.to_self_delay,
-                user_id,
-                user_signature,
-                start_block,
-            )
+        # The limit is checked without taking the lock (not to wait for the block being processed, if any), so it may be
+        # slightly exceeded by concurrent requests
+        if len(self.appointments) >= self.max_appointments:
+            message = "Maximum appointments reached, appointment rejected"
+            self.logger.info(message, locator=appointment.locator)
+            raise AppointmentLimitReached(message)
+
+        user_id = self.gatekeeper.authenticate_user(appointment.serialize(), user_signature)
+        has_subscription_expired, expiry = self.gatekeeper.has_subscription_expired(user_id)
+        if has_subscription_expired:
+            raise SubscriptionExpired(f"Your subscription expired at block {expiry}")
 
-            # The uuids are generated as the RIPEMD160(locator||user_pubkey).
-            # If an appointment is requested by the user the uuid can be recomputed and queried straightaway (no maps).
-            uuid = hash_160("{}{}".format(extended_appointment.locator, user_id))
+        # The height is read from the cached tip, so no call to bitcoind is needed
+        start_block = self.block_processor.get_tip_height()
+        extended_appointment = ExtendedAppointment(
+            appointment.locator,
+            appointment.encrypted_blob,
+            appointment.to_self_delay,
+            user_id,
+            user_signature,
+            start_block,
+        )
 
-            # If this is a copy of an appointment we've already reacted to, the new appointment is rejected.
+        # The uuids are generated as the RIPEMD160(locator||user_pubkey).
+        # If an appointment is requested by the user the uuid can be recomputed and queried straightaway (no maps).
+        uuid = hash_160("{}{}".format(extended_appointment.locator, user_id))
+
+        # If this is a copy of an appointment we've already reacted to, the new appointment is rejected.
+        if self.responder.has_tracker(uuid):
+            message = "Appointment already in Responder"
+            self.logger.info(message)
+            raise AppointmentAlreadyTriggered(message)
+
+        # Appointments with the same locator (including updates of the same appointment) are added one at a time, so
+        # they are accounted, persisted and added to the maps in the same order
+        with self.get_locator_lock(extended_appointment.locator):
+            # A copy of this appointment may have been handed to the Responder while waiting for the lock, so the check
+            # is done again before charging the user for it
             if self.responder.has_tracker(uuid):
                 message = "Appointment already in Responder"
                 self.logger.info(message)
@@ -393,12 +628,38 @@ class Watcher:
             # Add the appointment to the Gatekeeper
             available_slots = self.gatekeeper.add_update_appointment(user_id, uuid, extended_appointment)
 
-            # Appointments that were triggered in blocks held in the cache
+            # Appointments that were triggered in blocks held in the cache (or, if enabled, in the deep locator index)
             dispute_txid = self.locator_cache.get_txid(extended_appointment.locator)
+            if not dispute_txid and self.locator_index is not None:
+                dispute_txid = self.locator_index.get_txid(extended_appointment.locator)
+
+            # Regular appointments that have not been triggered (or, at least, not recently)
+            if not dispute_txid:
+                # The appointment is persisted before being added to the maps, so do_watch can always load it
+                self.db_manager.store_watcher_appointment(uuid, extended_appointment.to_dict())
+
+                with self.rw_lock.gen_wlock():
+                    # Blocks are added to the cache before do_watch takes the lock, so checking the cache again while
+                    # holding it guarantees that a breach is either found here or by do_watch
+                    dispute_txid = self.locator_cache.get_txid(extended_appointment.locator)
+                    already_watched = uuid in self.appointments
+
+                    if not dispute_txid:
+                        self.appointments[uuid] = extended_appointment.get_summary()
+
+                        # If the uuid is already in the map it means this is an update. Otherwise two users have sent an
+                        # appointment with the same locator, so we need to store both.
+                        self.locator_uuid_map.setdefault(extended_appointment.locator, {})[uuid] = None
+
+                # The appointment has been triggered while being added, so it is handled as the rest of triggered ones
+                if dispute_txid and not already_watched:
+                    self.db_manager.delete_watcher_appointment(uuid)
+
+            broadcast = None
             if dispute_txid:
                 try:
                     penalty_txid, penalty_rawtx = self.check_breach(uuid, extended_appointment, dispute_txid)
-                    receipt = self.responder.handle_breach(
+                    broadcast = self.responder.handle_breach_async(
                         uuid,
                         extended_appointment.locator,
                         dispute_txid,
@@ -408,51 +669,41 @@ class Watcher:
                         self.last_known_block,
                     )
 
-                    # At this point the appointment is accepted but data is only kept if it goes through the Responder.
-                    # Otherwise it is dropped.
-                    if receipt.delivered:
-                        self.db_manager.store_watcher_appointment(uuid, extended_appointment.to_dict())
-                        self.db_manager.create_triggered_appointment_flag(uuid)
-
                 except (EncryptionError, InvalidTransactionFormat):
                     # If data inside the encrypted blob is invalid, the appointment is accepted but the data is dropped.
                     # (same as with data that bounces in the Responder). This reduces the appointment slot count so it
                     # could be used to discourage user misbehaviour.
                     pass
 
-            # Regular appointments that have not been triggered (or, at least, not recently)
-            else:
-                self.appointments[uuid] = extended_appointment.get_summary()
-
-                if extended_appointment.locator in self.locator_uuid_map:
-                    # If the uuid is already in the map it means this is an update.
-                    if uuid not in self.locator_uuid_map[extended_appointment.locator]:
-                        self.locator_uuid_map[extended_appointment.locator].append(uuid)
-                else:
-                    # Otherwise two users have sent an appointment with the same locator, so we need to store both.
-                    self.locator_uuid_map[extended_appointment.locator] = [uuid]
+            # The penalty is pushed without holding the Watcher lock, so other appointments can be accepted in the
+            # meantime. The locator lock is held until the tracker has been created though, so copies of this
+            # appointment are rejected by the check above instead of being charged and broadcast again.
+            receipt = broadcast.result() if broadcast is not None else None
 
-                self.db_manager.store_watcher_appointment(uuid, extended_appointment.to_dict())
+        # At this point the appointment is accepted but data is only kept if it goes through the Responder.
+        # Otherwise it is dropped.
+        if receipt is not None and receipt.delivered:
+            self.db_manager.store_triggered_appointment(uuid, extended_appointment.to_dict())
 
-            try:
-                signature = Cryptographer.sign(
-                    receipts.create_appointment_receipt(user_signature, start_block), self.signing_key
-                )
+        try:
+            signature = Cryptographer.sign(
+                receipts.create_appointment_receipt(user_signature, start_block), self.signing_key
+            )
 
-            except (InvalidParameter, SignatureError):
-                # This should never happen since data is sanitized, just in case to avoid a crash
-                self.logger.error("Data couldn't be signed", appointment=extended_appointment.to_dict())
-                signature = None
+        except (InvalidParameter, SignatureError):
+            # This should never happen since data is sanitized, just in case to avoid a crash
+            self.logger.error("Data couldn't be signed", appointment=extended_appointment.to_dict())
+            signature = None
 
-            self.logger.info("New appointment accepted", locator=extended_appointment.locator)
+        self.logger.info("New appointment accepted", locator=extended_appointment.locator)
 
-            return {
-                "locator": extended_appointment.locator,
-                "start_block": extended_appointment.start_block,
-                "signature": signature,
-                "available_slots": available_slots,
-                "subscription_expiry": self.gatekeeper.get_user_info(user_id).subscription_expiry,
-            }
+        return {
+            "locator": extended_appointment.locator,
+            "start_block": extended_appointment.start_block,
+            "signature": signature,
+            "available_slots": available_slots,
+            "subscription_expiry": self.gatekeeper.get_user_info(user_id).subscription_expiry,
+        }
 
     def do_watch(self):
         """
@@ -470,88 +721,256 @@ class Watcher:
         # Initialise the locator cache with the last ``cache_size`` blocks.
         self.locator_cache.init(self.last_known_block, self.block_processor)
 
+        # Breaches over the per locator decryption limit are validated in the background. The ones deferred before a
+        # restart are checked straightaway
+        deferred_breaches_thread = Thread(target=self.do_deferred_breaches, daemon=True)
+        deferred_breaches_thread.start()
+        self.deferred_breaches.put(self.last_known_block)
+
+        # Mempool transactions are only received if the ChainMonitor is subscribed to them
+        mempool_thread = Thread(target=self.do_watch_mempool, daemon=True)
+        mempool_thread.start()
+
         while True:
-            block_hash = self.block_queue.get()
+            message = self.block_queue.get()
 
             # When the ChainMonitor is stopped, a final ChainMonitor.END_MESSAGE message is sent
-            if block_hash == ChainMonitor.END_MESSAGE:
+            if message == ChainMonitor.END_MESSAGE:
                 break
 
-            block = self.block_processor.get_block(block_hash, blocking=True)
+            # Blocks are normally received already parsed from the ChainMonitor (only hashes are received on bootstrap)
+            block = self.block_processor.resolve_block(message, blocking=True)
+            block_hash = message if isinstance(message, str) else block.hash
+            self.logger.info("New block received", block_hash=block_hash, prev_block_hash=block.prev_block_hash)
+
+            # All the block writes are committed in a single batch alongside the last known block, so a block is either
+            # fully processed or not at all
+            with self.db_manager.block_batch():
+                # If a reorg is detected, the cache is fixed to cover the new chain (the block is added afterwards)
+                if self.last_known_block != block.prev_block_hash:
+                    reorg_depth = self.locator_cache.fix(block.prev_block_hash, self.block_processor)
+                    self.logger.info("Reorg detected", block_hash=block_hash, depth=reorg_depth)
+
+                # The locators for every transaction in the block are precomputed by the Block
+                locator_txid_map = block.locator_txid_map
+                self.locator_cache.update(block_hash, locator_txid_map, block.prev_block_hash)
+                if self.locator_index is not None:
+                    self.locator_index.add_block(block)
+
+                breaches = {}
+                with self.rw_lock.gen_wlock():
+                    if len(self.appointments) > 0 and locator_txid_map:
+                        outdated_appointments = self.gatekeeper.get_outdated_appointments(block.height)
+                        # Make sure we only try to delete what is on the Watcher (some may have been triggered)
+                        outdated_appointments = list(set(outdated_appointments).intersection(self.appointments.keys()))
+
+                        Cleaner.delete_appointments(
+                            outdated_appointments,
+                            self.appointments,
+                            self.locator_uuid_map,
+                            self.db_manager,
+                            outdated=True,
+                        )
+
+                        breaches = self.get_breaches(locator_txid_map)
+
+                if breaches:
+                    # Breaches are validated and penalties are pushed without holding the lock, so appointments can
+                    # still be accepted meanwhile. Appointments that are gone by the time breaches are validated are
+                    # skipped
+                    valid_breaches, invalid_breaches = self.filter_breaches(breaches)
+
+                    with self.rw_lock.gen_wlock():
+                        valid_breaches = {uuid: b for uuid, b in valid_breaches.items() if uuid in self.appointments}
+                        broadcasts = self.broadcast_breaches(valid_breaches, block_hash)
+
+                    breach_receipts = {uuid: broadcast.result() for uuid, broadcast in broadcasts.items()}
+
+                    with self.rw_lock.gen_wlock():
+                        self.handle_breaches(valid_breaches, invalid_breaches, breach_receipts)
+
+                # Register the last processed block for the Watcher
+                self.db_manager.store_last_block_hash_watcher(block_hash)
+            self.last_known_block = block.hash
+
+            # Deferred breaches (if any) are only checked once they have been committed alongside the block
+            if breaches:
+                self.deferred_breaches.put(block_hash)
+
+            self.block_queue.task_done()
+
+        self.deferred_breaches.put(ChainMonitor.END_MESSAGE)
+        self.mempool_queue.put(ChainMonitor.END_MESSAGE)
+        deferred_breaches_thread.join()
+        mempool_thread.join()
+
+        if self.breach_validator is not None:
+            self.breach_validator.shutdown()
+
+    def broadcast_breaches(self, valid_breaches, block_hash):
+        """
+        Hands the valid breaches to the :obj:`Responder <teos.responder.Responder>`, which queues the penalties for
+        broadcast. Must be called holding the write lock.
+
+        Args:
+            valid_breaches (:obj:`dict`): the valid breaches, as returned by :meth:`filter_breaches`.
+            block_hash (:obj:`str`): the hash of the block where the breaches were found.
+
+        Returns:
+            :obj:`dict`: A ``uuid:Future`` map, each future resolving to the
+            :obj:`Receipt <teos.carrier.Receipt>` of the corresponding penalty.
+        """
+
+        broadcasts = {}
+
+        for uuid, breach in valid_breaches.items():
             self.logger.info(
-                "New block received", block_hash=block_hash, prev_block_hash=block.get("previousblockhash")
+                "Notifying responder and deleting appointment",
+                penalty_txid=breach["penalty_txid"],
+                locator=breach["locator"],
+                uuid=uuid,
             )
 
-            # If a reorg is detected, the cache is fixed to cover the last `cache_size` blocks of the new chain
-            if self.last_known_block != block.get("previousblockhash"):
-                self.locator_cache.fix(block_hash, self.block_processor)
+            broadcasts[uuid] = self.responder.handle_breach_async(
+                uuid,
+                breach["locator"],
+                breach["dispute_txid"],
+                breach["penalty_txid"],
+                breach["penalty_rawtx"],
+                self.appointments[uuid].get("user_id"),
+                block_hash,
+            )
 
-            txids = block.get("tx")
-            # Compute the locator for every transaction in the block and add them to the cache
-            locator_txid_map = {compute_locator(txid): txid for txid in txids}
-            self.locator_cache.update(block_hash, locator_txid_map)
+        return broadcasts
 
-            with self.rw_lock.gen_wlock():
-                if len(self.appointments) > 0 and locator_txid_map:
-                    outdated_appointments = self.gatekeeper.get_outdated_appointments(block["height"])
-                    # Make sure we only try to delete what is on the Watcher (some appointments may have been triggered)
-                    outdated_appointments = list(set(outdated_appointments).intersection(self.appointments.keys()))
+    def handle_breaches(self, valid_breaches, invalid_breaches, breach_receipts):
+        """
+        Deletes the appointments that are no longer needed once their breaches have been handled (either delivered,
+        undeliverable or invalid). Must be called holding the write lock.
 
-                    Cleaner.delete_appointments(
-                        outdated_appointments, self.appointments, self.locator_uuid_map, self.db_manager, outdated=True
-                    )
+        Since the lock is released while the penalties are broadcast, appointments that are gone by now are skipped.
 
-                    valid_breaches, invalid_breaches = self.filter_breaches(self.get_breaches(locator_txid_map))
+        Args:
+            valid_breaches (:obj:`dict`): the valid breaches, as returned by :meth:`filter_breaches`.
+            invalid_breaches (:obj:`list`): the uuids of the appointments with invalid breaches.
+            breach_receipts (:obj:`dict`): a ``uuid:Receipt`` map with the outcome of broadcasting the valid breaches.
+        """
 
-                    triggered_flags = []
-                    appointments_to_delete = []
+        triggered_flags = []
+        appointments_to_delete = []
 
-                    for uuid, breach in valid_breaches.items():
-                        self.logger.info(
-                            "Notifying responder and deleting appointment",
-                            penalty_txid=breach["penalty_txid"],
-                            locator=breach["locator"],
-                            uuid=uuid,
-                        )
+        for uuid in valid_breaches:
+            if uuid not in self.appointments:
+                continue
 
-                        receipt = self.responder.handle_breach(
-                            uuid,
-                            breach["locator"],
-                            breach["dispute_txid"],
-                            breach["penalty_txid"],
-                            breach["penalty_rawtx"],
-                            self.appointments[uuid].get("user_id"),
-                            block_hash,
-                        )
+            # FIXME: Only necessary because of the triggered appointment approach. Fix if it changes.
+            if breach_receipts[uuid].delivered:
+                Cleaner.delete_appointment_from_memory(uuid, self.appointments, self.locator_uuid_map)
+                triggered_flags.append(uuid)
+            else:
+                appointments_to_delete.append(uuid)
 
-                        # FIXME: Only necessary because of the triggered appointment approach. Fix if it changes.
+        # Appointments are only flagged as triggered if they are delivered, otherwise they are just deleted.
+        appointments_to_delete.extend(uuid for uuid in invalid_breaches if uuid in self.appointments)
+        appointments_to_delete_gatekeeper = {
+            uuid: self.appointments[uuid].get("user_id") for uuid in appointments_to_delete
+        }
+        self.db_manager.batch_create_triggered_appointment_flag(triggered_flags)
 
-                        if receipt.delivered:
-                            Cleaner.delete_appointment_from_memory(uuid, self.appointments, self.locator_uuid_map)
-                            triggered_flags.append(uuid)
-                        else:
-                            appointments_to_delete.append(uuid)
+        Cleaner.delete_appointments(appointments_to_delete, self.appointments, self.locator_uuid_map, self.db_manager)
+        # Remove invalid appointments from the Gatekeeper
+        self.gatekeeper.delete_appointments(appointments_to_delete_gatekeeper)
 
-                    # Appointments are only flagged as triggered if they are delivered, otherwise they are just deleted.
-                    appointments_to_delete.extend(invalid_breaches)
-                    appointments_to_delete_gatekeeper = {
-                        uuid: self.appointments[uuid].get("user_id") for uuid in appointments_to_delete
-                    }
-                    self.db_manager.batch_create_triggered_appointment_flag(triggered_flags)
+        if not self.appointments:
+            self.logger.info("No more pending appointments")
 
-                    Cleaner.delete_appointments(
-                        appointments_to_delete, self.appointments, self.locator_uuid_map, self.db_manager
-                    )
-                    # Remove invalid appointments from the Gatekeeper
-                    self.gatekeeper.delete_appointments(appointments_to_delete_gatekeeper)
+    def do_deferred_breaches(self):
+        """
+        Validates the breaches that were deferred by :meth:`filter_breaches` because their locator went over the
+        decryption limit, and handles them as if they were found in the last processed block.
 
-                    if not self.appointments:
-                        self.logger.info("No more pending appointments")
+        The deferred breaches are loaded from the database every time a notification is received through
+        ``deferred_breaches``, and deleted in the same batch as the rest of the writes done when handling them. Hence,
+        the ones deferred before a restart are checked once the :obj:`Watcher` starts again.
 
-            # Register the last processed block for the Watcher
-            self.db_manager.store_last_block_hash_watcher(block_hash)
-            self.last_known_block = block.get("hash")
-            self.block_queue.task_done()
+        Validation is performed without holding the write lock, so the processing of new blocks is not delayed.
+        Appointments that are gone by the time the breaches are handled (e.g. they expired) are skipped.
+        """
+
+        while True:
+            message = self.deferred_breaches.get()
+
+            if message == ChainMonitor.END_MESSAGE:
+                break
+
+            deferred = self.db_manager.load_deferred_breaches()
+            if not deferred:
+                self.deferred_breaches.task_done()
+                continue
+
+            groups = [(group["locator"], group["dispute_txid"], group["uuids"]) for group in deferred.values()]
+            valid_breaches, invalid_breaches = self._validate_breach_groups(groups)
+            self.logger.info("Deferred breaches checked", valid=len(valid_breaches), invalid=len(invalid_breaches))
+
+            with self.db_manager.block_batch():
+                with self.rw_lock.gen_wlock():
+                    valid_breaches = {uuid: b for uuid, b in valid_breaches.items() if uuid in self.appointments}
+                    broadcasts = self.broadcast_breaches(valid_breaches, self.last_known_block)
+
+                breach_receipts = {uuid: broadcast.result() for uuid, broadcast in broadcasts.items()}
+
+                with self.rw_lock.gen_wlock():
+                    self.handle_breaches(valid_breaches, invalid_breaches, breach_receipts)
+
+                self.db_manager.batch_delete_deferred_breaches(list(deferred.keys()))
+
+            self.deferred_breaches.task_done()
+
+    def do_watch_mempool(self):
+        """
+        Checks the transactions that reach ``bitcoind``'s mempool (sent by the
+        :obj:`ChainMonitor <teos.chain_monitor.ChainMonitor>` to the ``mempool_queue``) for channel breaches.
+
+        Breaches are validated as soon as they are seen, and the results are kept in the ``mempool_cache`` so they do
+        not need to be checked again once the dispute transaction is mined. If ``mempool_broadcast`` is set, valid
+        penalties are also broadcast right away. Appointments are only handed to the
+        :obj:`Responder <teos.responder.Responder>` once the breach is mined.
+        """
+
+        while True:
+            txid = self.mempool_queue.get()
+
+            if txid == ChainMonitor.END_MESSAGE:
+                break
+
+            # Transactions can be announced more than once (e.g. after a reorg)
+            if not self.mempool_cache.add(txid):
+                continue
+
+            locator = compute_locator(txid)
+            with self.rw_lock.gen_rlock():
+                if locator not in self.locator_uuid_map:
+                    continue
+                groups, _ = self._group_breaches({locator: txid})
+                # Appointments are stored before their summary is updated, so the blob that is validated is never older
+                # than the one these hashes refer to
+                blob_hashes = {uuid: self.get_blob_hash(uuid) for _, _, uuids in groups for uuid in uuids}
+
+            valid_breaches, invalid_breaches = self._validate_breach_groups(groups)
+            penalties = {uuid: (b["penalty_txid"], b["penalty_rawtx"]) for uuid, b in valid_breaches.items()}
+            penalties.update({uuid: None for uuid in invalid_breaches})
+            self.mempool_cache.set_breaches(
+                txid, {(uuid, blob_hashes.get(uuid)): penalty for uuid, penalty in penalties.items()}
+            )
+
+            self.logger.info(
+                "Breach found in mempool", locator=locator, valid=len(valid_breaches), invalid=len(invalid_breaches)
+            )
+
+            if self.mempool_broadcast:
+                # Receipts are not cached, so a failed early broadcast does not affect the Responder
+                for penalty_txid, penalty_rawtx in {penalty for penalty in penalties.values() if penalty}:
+                    self.responder.carrier.send_transaction(penalty_rawtx, penalty_txid, cache_receipt=False)
 
     def get_breaches(self, locator_txid_map):
         """
@@ -582,6 +1001,39 @@ class Watcher:
         """
         Checks if a breach is valid. Valid breaches should decrypt to a valid transaction.
 
+        The transaction is decoded locally. If ``mempool_preflight`` is set, it is also checked against ``bitcoind``'s
+        mempool, and rejections are treated as an invalid transaction.
+
+        Args:
+            uuid (:obj:`str`): the uuid of the appointment that was triggered by the breach.
+            appointment (:obj:`ExtendedAppointment <teos.extended_appointment.ExtendedAppointment>`): the appointment
+                data.
+            dispute_txid (:obj:`str`): the id of the transaction that triggered the breach.
+
+        Returns:
+            :obj:`tuple`: A tuple containing the penalty txid and the raw penalty tx.
+
+        Raises:
+            :obj:`EncryptionError`: if the encrypted blob from the provided appointment cannot be decrypted with the
+                key derived from the breach transaction id.
+            :obj:`InvalidTransactionFormat`: if the decrypted data does not have a valid transaction format (or it is
+                rejected by the mempool pre-flight check).
+        """
+
+        penalty_txid, penalty_rawtx = self.decrypt_penalty(uuid, appointment, dispute_txid)
+
+        if self.mempool_preflight:
+            self.preflight_penalty(uuid, penalty_txid, penalty_rawtx)
+
+        self.logger.info("Breach found for locator", locator=appointment.locator, uuid=uuid, penalty_txid=penalty_txid)
+
+        return penalty_txid, penalty_rawtx
+
+    def decrypt_penalty(self, uuid, appointment, dispute_txid):
+        """
+        Decrypts the penalty transaction of an appointment given the transaction that triggered it, and decodes it
+        locally.
+
         Args:
             uuid (:obj:`str`): the uuid of the appointment that was triggered by the breach.
             appointment (:obj:`ExtendedAppointment <teos.extended_appointment.ExtendedAppointment>`): the appointment
@@ -599,22 +1051,42 @@ class Watcher:
 
         try:
             penalty_rawtx = Cryptographer.decrypt(appointment.encrypted_blob, dispute_txid)
-            penalty_tx = self.block_processor.decode_raw_transaction(penalty_rawtx, blocking=True)
+            penalty_tx = decode_raw_transaction(penalty_rawtx)
 
         except EncryptionError as e:
             self.logger.info("Transaction cannot be decrypted", uuid=uuid)
             raise e
 
-        except InvalidTransactionFormat as e:
+        except DeserializationError as e:
             self.logger.info("The breach contained an invalid transaction", uuid=uuid)
-            raise e
-
-        self.logger.info(
-            "Breach found for locator", locator=appointment.locator, uuid=uuid, penalty_txid=penalty_tx.get("txid")
-        )
+            raise InvalidTransactionFormat("Cannot build transaction from decoded data", error=e.msg)
 
         return penalty_tx.get("txid"), penalty_rawtx
 
+    def preflight_penalty(self, uuid, penalty_txid, penalty_rawtx):
+        """
+        Checks a penalty transaction against ``bitcoind``'s mempool (``testmempoolaccept``). Penalties that are
+        already known by ``bitcoind`` are fine.
+
+        Args:
+            uuid (:obj:`str`): the uuid of the appointment that was triggered by the breach.
+            penalty_txid (:obj:`str`): the id of the penalty transaction.
+            penalty_rawtx (:obj:`str`): the raw penalty transaction.
+
+        Raises:
+            :obj:`InvalidTransactionFormat`: if the penalty is rejected by the mempool.
+        """
+
+        result = self.block_processor.test_mempool_accept(penalty_rawtx, blocking=True)
+
+        if result and not result.get("allowed") and result.get("reject-reason") not in MEMPOOL_ALREADY_KNOWN:
+            self.logger.info(
+                "The breach contained a transaction rejected by the mempool",
+                uuid=uuid,
+                reason=result.get("reject-reason"),
+            )
+            raise InvalidTransactionFormat("Transaction rejected by the mempool", txid=penalty_txid)
+
     def filter_breaches(self, breaches):
         """
         Filters the valid from the invalid channel breaches.
@@ -622,6 +1094,16 @@ class Watcher:
         The :obj:`Watcher` cannot know if an ``encrypted_blob`` contains a valid transaction until a breach is seen.
         Blobs that contain arbitrary data are dropped and not sent to the :obj:`Responder <teos.responder.Responder>`.
 
+        Appointments with the same locator and blob (``blob_hash`` in the summary) are only loaded and decrypted once.
+        If ``max_decrypts_per_locator`` is set, only that many different blobs are decrypted per locator. The rest of
+        them are deferred to be checked in the background (see :meth:`do_deferred_breaches`), so the work that can be
+        forced on the tower while processing a block is bounded. Deferred breaches are stored in the database (joining
+        the block batch of the calling thread, if any), so they are not lost if the tower is stopped before they are
+        checked.
+
+        The appointments are grouped holding the read lock, but they are validated without it, so this must be called
+        without holding the lock.
+
         Args:
             breaches (:obj:`dict`): a dictionary containing channel breaches (``locator:txid``).
 
@@ -634,40 +1116,161 @@ class Watcher:
             ``{locator, dispute_txid, penalty_txid, penalty_rawtx}``
         """
 
-        valid_breaches = {}
-        invalid_breaches = []
+        with self.rw_lock.gen_rlock():
+            groups, deferred = self._group_breaches(breaches)
+
+        if deferred:
+            self.db_manager.store_deferred_breaches(
+                {
+                    uuids[0]: {"locator": locator, "dispute_txid": dispute_txid, "uuids": uuids}
+                    for locator, dispute_txid, uuids in deferred
+                }
+            )
 
-        # A cache of the already decrypted blobs so replicate decryption can be avoided
-        decrypted_blobs = {}
+        return self._validate_breach_groups(groups)
+
+    def _group_breaches(self, breaches):
+        """
+        Groups the appointments triggered by some breaches by locator and blob (``blob_hash`` in the summary). Summaries
+        with no blob hash are never grouped. Only the first ``max_decrypts_per_locator`` groups of every locator are
+        returned for validation, the rest are returned apart. Must be called holding the lock.
+
+        Args:
+            breaches (:obj:`dict`): a dictionary containing channel breaches (``locator:txid``).
+
+        Returns:
+            :obj:`tuple`: Two lists of ``(locator, dispute_txid, uuids)`` tuples. The groups to be validated and the
+            ones that went over the limit.
+        """
 
+        groups = []
+        deferred = []
         for locator, dispute_txid in breaches.items():
-            for uuid in self.locator_uuid_map[locator]:
-                appointment = ExtendedAppointment.from_dict(self.db_manager.load_watcher_appointment(uuid))
+            blob_groups = OrderedDict()
+            # Locators may be gone if the lock was released after getting the breaches
+            for uuid in self.locator_uuid_map.get(locator, {}):
+                blob_groups.setdefault(self.get_blob_hash(uuid) or uuid, []).append(uuid)
+
+            locator_groups = [(locator, dispute_txid, uuids) for uuids in blob_groups.values()]
+
+            if self.max_decrypts_per_locator and len(locator_groups) > self.max_decrypts_per_locator:
+                deferred.extend(locator_groups[self.max_decrypts_per_locator :])  # noqa: E203
+                locator_groups = locator_groups[: self.max_decrypts_per_locator]
+                self.logger.info(
+                    "Too many blobs for locator", locator=locator, over_limit=len(blob_groups) - len(locator_groups)
+                )
+
+            groups.extend(locator_groups)
+
+        return groups, deferred
+
+    def _validate_breach_groups(self, groups):
+        """
+        Validates groups of appointments triggered by the same breach and sharing the same blob. Only one appointment
+        per group is loaded and checked, and the result applies to the whole group. Groups that were already validated
+        when the breach was seen in the mempool are not checked again, as long as their blob has not changed since
+        (i.e. the appointment has not been updated).
+
+        Penalties are decrypted and decoded sequentially, since that is CPU bound. If ``mempool_preflight`` is set, the
+        pre-flight checks are then run by the ``breach_validator`` (if available), so the round trips to ``bitcoind``
+        overlap. The output order follows the input order regardless of the order in which the checks complete.
+
+        Args:
+            groups (:obj:`list`): a list of ``(locator, dispute_txid, uuids)`` tuples.
+
+        Returns:
+            :obj:`tuple`: A dictionary with the valid breaches and a list with the invalid ones, as in
+            :meth:`filter_breaches`.
+        """
+
+        # Penalties (penalty_txid, penalty_rawtx) by group index. None for invalid ones
+        penalties = {}
+        # Groups decrypted here (group index, uuid), pending the pre-flight check
+        preflight = []
+
+        for i, (locator, dispute_txid, uuids) in enumerate(groups):
+            pre_validated = self.mempool_cache.get_breaches(dispute_txid) or {}
+            pre_validated_key = next(
+                (key for key in ((uuid, self.get_blob_hash(uuid)) for uuid in uuids) if key in pre_validated), None
+            )
+            if pre_validated_key is not None:
+                penalties[i] = pre_validated[pre_validated_key]
+                continue
+
+            # Appointments may have been deleted since the groups were built, since they are validated without the lock
+            for uuid in uuids:
+                appointment_data = self.db_manager.load_watcher_appointment(uuid)
+                if appointment_data:
+                    appointment = ExtendedAppointment.from_dict(appointment_data)
+                    try:
+                        penalties[i] = self.decrypt_penalty(uuid, appointment, dispute_txid)
+                        preflight.append((i, uuid))
+                    except (EncryptionError, InvalidTransactionFormat):
+                        penalties[i] = None
+                    break
+
+        if self.mempool_preflight and preflight:
+            breaches = [(uuid, *penalties[i]) for i, uuid in preflight]
+            if self.breach_validator is not None and len(breaches) > 1:
+                results = self.breach_validator.map(self._preflight_breach, breaches)
+            else:
+                results = map(self._preflight_breach, breaches)
+
+            for (i, _), passed in zip(preflight, results):
+                if not passed:
+                    penalties[i] = None
+
+        valid_breaches = {}
+        invalid_breaches = []
+
+        for i, (locator, dispute_txid, uuids) in enumerate(groups):
+            if i not in penalties:
+                continue
 
-                if appointment.encrypted_blob in decrypted_blobs:
-                    penalty_txid, penalty_rawtx = decrypted_blobs[appointment.encrypted_blob]
+            if penalties[i] is None:
+                invalid_breaches.extend(uuids)
+            else:
+                penalty_txid, penalty_rawtx = penalties[i]
+                for uuid in uuids:
                     valid_breaches[uuid] = {
-                        "locator": appointment.locator,
+                        "locator": locator,
                         "dispute_txid": dispute_txid,
                         "penalty_txid": penalty_txid,
                         "penalty_rawtx": penalty_rawtx,
                     }
 
-                else:
-                    try:
-                        penalty_txid, penalty_rawtx = self.check_breach(uuid, appointment, dispute_txid)
-                        valid_breaches[uuid] = {
-                            "locator": appointment.locator,
-                            "dispute_txid": dispute_txid,
-                            "penalty_txid": penalty_txid,
-                            "penalty_rawtx": penalty_rawtx,
-                        }
-                        decrypted_blobs[appointment.encrypted_blob] = (penalty_txid, penalty_rawtx)
+        return valid_breaches, invalid_breaches
 
-                    except (EncryptionError, InvalidTransactionFormat):
-                        invalid_breaches.append(uuid)
+    def _preflight_breach(self, breach):
+        """
+        Wraps :meth:`preflight_penalty` so it can be run by the ``breach_validator``.
 
-        return valid_breaches, invalid_breaches
+        Args:
+            breach (:obj:`tuple`): a ``(uuid, penalty_txid, penalty_rawtx)`` tuple.
+
+        Returns:
+            :obj:`bool`: Whether the penalty passed the check.
+        """
+
+        try:
+            self.preflight_penalty(*breach)
+            return True
+        except InvalidTransactionFormat:
+            return False
+
+    def get_blob_hash(self, uuid):
+        """
+        Gets the hash of the blob of an appointment being watched (``blob_hash`` in the summary).
+
+        Args:
+            uuid (:obj:`str`): the id of the appointment.
+
+        Returns:
+            :obj:`str` or :obj:`None`: The hash of the blob, or :obj:`None` if the appointment is not being watched or
+            its summary has no blob hash.
+        """
+
+        return self.appointments.get(uuid, {}).get("blob_hash")
 
     def get_registered_user_ids(self):
         return self.gatekeeper.user_ids
@@ -229,6 +229,31 @@ def test_unknown_params():
         conf_loader.build_config()
 
 
+def test_build_conf_bool_from_conf_file(conf_file_conf):
+    # Booleans in the config file are read as strings and must be cast
+    default_conf_copy = deepcopy(DEFAULT_CONF)
+    default_conf_copy["FOO_BOOL"] = {"value": False, "type": bool}
+    bool_conf_file_name = f"bool_{conf_file_name}"
+
+    config_parser = ConfigParser()
+    config_parser["foo_section"] = {"FOO_BOOL": "true"}
+    with open(data_dir + bool_conf_file_name, "w") as fout:
+        config_parser.write(fout)
+
+    conf_loader = ConfigLoader(data_dir, bool_conf_file_name, default_conf_copy, {})
+    config = conf_loader.build_config()
+    assert config["FOO_BOOL"] is True
+
+    # Values that are not booleans are rejected
+    config_parser["foo_section"] = {"FOO_BOOL": "foo"}
+    with open(data_dir + bool_conf_file_name, "w") as fout:
+        config_parser.write(fout)
+
+    conf_loader = ConfigLoader(data_dir, bool_conf_file_name, deepcopy(default_conf_copy), {})
+    with pytest.raises(ValueError):
+        conf_loader.build_config()
+
+
 def test_create_config_dict():
     # create_config_dict should create a dictionary with the config fields in ConfigLoader.config_fields as long as
     # the type of the field "value" matches the type in "type". The conf source does not matter here.
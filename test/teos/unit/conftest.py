@@ -1,4 +1,7 @@
+import os
+import json
 import time
+import random
 import pytest
 import threading
 from copy import deepcopy
@@ -27,6 +30,7 @@ from test.teos.unit.mocks import (
     UsersDBM as UserDBMMock,
     Carrier as CarrierMock,
     Responder as ResponderMock,
+    FakeBitcoind,
 )
 
 
@@ -37,12 +41,31 @@ bitcoind_feed_params = {k: v for k, v in config.items() if k.startswith("BTC_FEE
 bitcoind_reachable = Event()
 bitcoind_reachable.set()
 
+# Serialized regtest-format blocks, along with the data bitcoind would report for them (hash, height, prev hash, txids)
+REGTEST_BLOCKS_PATH = os.path.join(os.path.dirname(__file__), "data", "regtest_blocks.json")
+
 
 @pytest.fixture(scope="module")
 def block_processor(run_bitcoind):
     return BlockProcessor(bitcoind_connect_params, bitcoind_reachable)
 
 
+@pytest.fixture(scope="session")
+def regtest_blocks():
+    with open(REGTEST_BLOCKS_PATH) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def fake_bitcoind():
+    fake_bitcoind = FakeBitcoind()
+    fake_bitcoind.start()
+
+    yield fake_bitcoind
+
+    fake_bitcoind.stop()
+
+
 @pytest.fixture(scope="module")
 def block_processor_mock():
     return BlockProcessorMock()
@@ -96,11 +119,23 @@ def generate_dummy_appointment():
     return _generate_dummy_appointment
 
 
+def create_dummy_transaction(prev_txid=None):
+    # Returns a well-formed (but unsigned) raw transaction spending the first output of prev_txid to a random P2WPKH
+    prev_txid = prev_txid or get_random_value_hex(32)
+    script_pubkey = "0014" + get_random_value_hex(20)
+    value = random.randint(1, 10 ** 8).to_bytes(8, "little").hex()
+
+    txin = bytes.fromhex(prev_txid)[::-1].hex() + "00000000" + "00" + "ffffffff"
+    txout = value + "16" + script_pubkey
+
+    return "02000000" + "01" + txin + "01" + txout + "00000000"
+
+
 @pytest.fixture(scope="session")
 def generate_dummy_appointment_w_trigger():
     def _generate_dummy_appointment():
         commitment_txid = get_random_value_hex(32)
-        penalty_tx = get_random_value_hex(150)
+        penalty_tx = create_dummy_transaction(commitment_txid)
 
         appointment_data = {
             "locator": compute_locator(commitment_txid),
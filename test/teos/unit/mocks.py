@@ -1,6 +1,13 @@
-from threading import Event
+import json
+import time
+from threading import Event, Thread
+from contextlib import contextmanager
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 from test.teos.conftest import get_random_value_hex
+from teos.carrier import ReceiptLedger
+from teos.block_processor import Block, ChainTip
 from teos.appointments_dbm import WATCHER_PREFIX, WATCHER_LAST_BLOCK_KEY
 
 
@@ -10,15 +17,35 @@ class BlockProcessor:
     def __init__(self, *args, **kwargs):
         self.bitcoind_reachable = Event()
         self.bitcoind_reachable.set()
+        self.tip = ChainTip()
 
     @staticmethod
     def get_block_count(*args, **kwargs):
         return 0
 
+    def update_tip(self, block, blocking=False):
+        self.tip.update(block)
+
+    def get_tip_height(self, *args, **kwargs):
+        return self.tip.height if self.tip.height is not None else self.get_block_count()
+
     @staticmethod
     def get_block(*args, **kwargs):
         return {"height": 0, "tx": []}
 
+    def get_blocks(self, block_hashes, blocking=False):
+        return [self.get_block(block_hash, blocking) for block_hash in block_hashes]
+
+    def get_block_heights(self, block_hashes, blocking=False):
+        return {block_hash: self.get_block(block_hash, blocking).get("height") for block_hash in block_hashes}
+
+    def get_parsed_block(self, block_hash, blocking=False):
+        block = self.get_block(block_hash, blocking)
+        return Block.from_dict(block) if block is not None else None
+
+    def resolve_block(self, block, blocking=False):
+        return block if isinstance(block, Block) else self.get_parsed_block(block, blocking)
+
     @staticmethod
     def get_best_block_hash(*args, **kwargs):
         return get_random_value_hex(32)
@@ -27,6 +54,10 @@ class BlockProcessor:
     def decode_raw_transaction(*args, **kwargs):
         return {}
 
+    @staticmethod
+    def test_mempool_accept(*args, **kwargs):
+        return {"allowed": True}
+
     def get_distance_to_tip(self, *args, **kwargs):
         pass
 
@@ -35,14 +66,35 @@ class Carrier:
     """ A simple Carrier mock"""
 
     def __init__(self, *args, **kwargs):
-        pass
+        self.issued_receipts = ReceiptLedger(100)
 
     def send_transaction(self, *args, **kwargs):
         pass
 
+    def send_transactions(self, txs, cache_receipt=True):
+        return {txid: self.send_transaction(rawtx, txid) for txid, rawtx in txs.items()}
+
+    def broadcast(self, rawtx, txid, callback=None):
+        receipt = self.send_transaction(rawtx, txid)
+        if callback is not None:
+            callback(receipt)
+
+        future = Future()
+        future.set_result(receipt)
+        return future
+
+    def shutdown(self):
+        pass
+
     def get_transaction(self, *args, **kwargs):
         pass
 
+    def get_transactions(self, txids):
+        return {txid: self.get_transaction(txid) for txid in txids}
+
+    def get_mempool_entries(self, txids):
+        return {}
+
 
 class Gatekeeper:
     """ A simple Gatekeeper mock"""
@@ -84,6 +136,7 @@ class Responder:
 
     def __init__(self, *args, **kwargs):
         self.trackers = {}
+        self.carrier = Carrier()
 
     def has_tracker(self, *args, **kwargs):
         pass
@@ -94,6 +147,11 @@ class Responder:
     def handle_breach(self, *args, **kwargs):
         pass
 
+    def handle_breach_async(self, *args, **kwargs):
+        future = Future()
+        future.set_result(self.handle_breach(*args, **kwargs))
+        return future
+
 
 class AppointmentsDBM:
     """ A mock that stores all the data related to appointments in memory instead of using a database"""
@@ -104,6 +162,10 @@ class AppointmentsDBM:
         self.triggered_appointments = set()
         self.last_known_block_watcher = None
         self.last_known_block_responder = None
+        self.locator_cache_blocks = dict()
+        self.broadcast_intents = dict()
+        self.carrier_receipts = dict()
+        self.deferred_breaches = dict()
         self.data = dict()
 
     def load_appointments_db(self, prefix):
@@ -134,6 +196,9 @@ class AppointmentsDBM:
     def load_responder_trackers(self):
         return self.trackers
 
+    def batch_load_responder_trackers(self, uuids):
+        return {uuid: self.trackers.get(uuid) for uuid in uuids}
+
     def store_watcher_appointment(self, uuid, appointment):
         self.appointments[uuid] = appointment
 
@@ -172,9 +237,27 @@ class AppointmentsDBM:
     def batch_create_triggered_appointment_flag(self, uuids):
         self.triggered_appointments.update(uuids)
 
+    @contextmanager
+    def block_batch(self):
+        yield
+
+    def store_triggered_appointment(self, uuid, appointment):
+        self.store_watcher_appointment(uuid, appointment)
+        self.create_triggered_appointment_flag(uuid)
+
     def load_all_triggered_flags(self):
         return list(self.triggered_appointments)
 
+    def load_locator_cache_blocks(self):
+        return dict(self.locator_cache_blocks)
+
+    def store_locator_cache_blocks(self, blocks):
+        self.locator_cache_blocks.update(blocks)
+
+    def batch_delete_locator_cache_blocks(self, block_hashes):
+        for block_hash in block_hashes:
+            self.locator_cache_blocks.pop(block_hash, None)
+
     def delete_triggered_appointment_flag(self, uuid):
         self.triggered_appointments.remove(uuid)
 
@@ -182,6 +265,35 @@ class AppointmentsDBM:
         for uuid in uuids:
             self.delete_triggered_appointment_flag(uuid)
 
+    def load_broadcast_intents(self):
+        return dict(self.broadcast_intents)
+
+    def store_broadcast_intent(self, uuid, intent):
+        self.broadcast_intents[uuid] = intent
+
+    def delete_broadcast_intent(self, uuid):
+        self.broadcast_intents.pop(uuid, None)
+
+    def load_carrier_receipts(self):
+        return dict(self.carrier_receipts)
+
+    def store_carrier_receipt(self, txid, receipt_data):
+        self.carrier_receipts[txid] = receipt_data
+
+    def batch_delete_carrier_receipts(self, txids):
+        for txid in txids:
+            self.carrier_receipts.pop(txid, None)
+
+    def load_deferred_breaches(self):
+        return dict(self.deferred_breaches)
+
+    def store_deferred_breaches(self, groups):
+        self.deferred_breaches.update(groups)
+
+    def batch_delete_deferred_breaches(self, group_ids):
+        for group_id in group_ids:
+            self.deferred_breaches.pop(group_id, None)
+
 
 class UsersDBM:
     """ A mock that stores all the data related to users in memory instead of using a database"""
@@ -192,11 +304,216 @@ class UsersDBM:
     def store_user(self, user_id, user_data):
         self.users[user_id] = user_data
 
+    def update_user(self, user_id, user_data, appointments=None, deleted_appointments=None):
+        user = self.users.setdefault(user_id, {"appointments": {}})
+        user["available_slots"] = user_data["available_slots"]
+        user["subscription_expiry"] = user_data["subscription_expiry"]
+        user["appointments"].update(appointments or {})
+        for uuid in deleted_appointments or []:
+            user["appointments"].pop(uuid, None)
+
+    def batch_update_users(self, users, deleted_appointments):
+        for user_id, user_data in users.items():
+            self.update_user(user_id, user_data, deleted_appointments=deleted_appointments.get(user_id))
+
     def load_user(self, user_id):
         return self.users[user_id]
 
     def delete_user(self, user_id):
         del self.users[user_id]
 
+    def batch_delete_users(self, user_ids):
+        for user_id in user_ids:
+            self.users.pop(user_id, None)
+
     def load_all_users(self):
         return self.users
+
+
+class LocatorIndex:
+    """ A mock that keeps the indexed locators in memory and records the lookups"""
+
+    def __init__(self, locator_txid_map=None):
+        self.locator_txid_map = dict(locator_txid_map) if locator_txid_map else dict()
+        self.queried = []
+
+    def add_block(self, block):
+        self.locator_txid_map.update(block.locator_txid_map)
+
+    def get_txid(self, locator):
+        self.queried.append(locator)
+        return self.locator_txid_map.get(locator)
+
+
+class FakeBitcoind:
+    """
+    A minimal fake ``bitcoind`` that serves the ``json-rpc`` interface (both single and batch requests) over ``http``
+    using an in-memory chain. It keeps track of the ``http`` requests and the connections it receives so round trips
+    can be checked, and can be told to delay its responses or to drop connections.
+    """
+
+    RPC_INVALID_PARAMETER = -8
+    RPC_INVALID_ADDRESS_OR_KEY = -5
+    RPC_METHOD_NOT_FOUND = -32601
+    RPC_DESERIALIZATION_ERROR = -22
+    RPC_VERIFY_ALREADY_IN_CHAIN = -27
+
+    def __init__(self):
+        self.blocks = {}
+        self.best_chain = []
+        self.mempool = set()
+        self.http_requests = []
+        self.connections = 0
+        self.response_delay = 0
+        self.drop_next_requests = 0
+
+        # Genesis
+        self.mine(1)
+
+        fake_bitcoind = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                fake_bitcoind.connections += 1
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers.get("Content-Length"))))
+
+                if fake_bitcoind.drop_next_requests:
+                    # Close the connection without answering, like a bitcoind dropping an idle keep-alive connection
+                    fake_bitcoind.drop_next_requests -= 1
+                    self.close_connection = True
+                    return
+
+                fake_bitcoind.http_requests.append(request)
+                time.sleep(fake_bitcoind.response_delay)
+
+                if isinstance(request, list):
+                    status, response = 200, [fake_bitcoind.process(r) for r in request]
+                else:
+                    response = fake_bitcoind.process(request)
+                    status = 200 if response.get("error") is None else 500
+
+                body = json.dumps(response).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.connect_params = {
+            "BTC_RPC_USER": "user",
+            "BTC_RPC_PASSWORD": "passwd",
+            "BTC_RPC_CONNECT": "127.0.0.1",
+            "BTC_RPC_PORT": self.server.server_address[1],
+        }
+
+    def start(self):
+        Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    @property
+    def height(self):
+        return len(self.best_chain) - 1
+
+    def mine(self, n, txs=None, prev_block_hash=None):
+        """Mines ``n`` blocks on top of the tip (or ``prev_block_hash``). ``txs`` are included in the first block."""
+
+        prev_block_hash = prev_block_hash or (self.best_chain[-1] if self.best_chain else None)
+        height = self.blocks[prev_block_hash].get("height") + 1 if prev_block_hash else 0
+        # Blocks that are forked out are kept, like bitcoind does
+        del self.best_chain[height:]
+
+        block_hashes = []
+        for i in range(n):
+            block_txs = [get_random_value_hex(32)] + (list(txs) if txs and i == 0 else [])
+            block_hash = get_random_value_hex(32)
+            self.blocks[block_hash] = {
+                "hash": block_hash,
+                "height": height + i,
+                "previousblockhash": prev_block_hash,
+                "tx": block_txs,
+            }
+            self.mempool.difference_update(block_txs)
+            self.best_chain.append(block_hash)
+            block_hashes.append(block_hash)
+            prev_block_hash = block_hash
+
+        return block_hashes
+
+    def get_block(self, block_hash):
+        block = dict(self.blocks.get(block_hash))
+        in_best_chain = block.get("height") <= self.height and self.best_chain[block.get("height")] == block_hash
+        block["confirmations"] = self.height - block.get("height") + 1 if in_best_chain else -1
+        if block.get("previousblockhash") is None:
+            block.pop("previousblockhash")
+
+        return block
+
+    def get_transaction(self, txid):
+        if txid in self.mempool:
+            return {"txid": txid}
+
+        for height, block_hash in enumerate(self.best_chain):
+            if txid in self.blocks[block_hash].get("tx"):
+                return {"txid": txid, "blockhash": block_hash, "confirmations": self.height - height + 1}
+
+        return None
+
+    def process(self, request):
+        method, params = request.get("method"), request.get("params")
+        result, error = None, None
+
+        if method == "getbestblockhash":
+            result = self.best_chain[-1]
+        elif method == "getblockcount":
+            result = self.height
+        elif method == "getblock":
+            if params[0] in self.blocks:
+                result = self.get_block(params[0])
+            else:
+                error = {"code": self.RPC_INVALID_ADDRESS_OR_KEY, "message": "Block not found"}
+        elif method == "getblockheader":
+            if params[0] in self.blocks:
+                result = {k: v for k, v in self.get_block(params[0]).items() if k != "tx"}
+            else:
+                error = {"code": self.RPC_INVALID_ADDRESS_OR_KEY, "message": "Block not found"}
+        elif method == "getblockhash":
+            if 0 <= params[0] <= self.height:
+                result = self.best_chain[params[0]]
+            else:
+                error = {"code": self.RPC_INVALID_PARAMETER, "message": "Block height out of range"}
+        elif method == "getrawtransaction":
+            result = self.get_transaction(params[0])
+            if result is None:
+                error = {"code": self.RPC_INVALID_ADDRESS_OR_KEY, "message": "No such mempool or blockchain tx"}
+        elif method == "getmempoolentry":
+            if params[0] in self.mempool:
+                result = {"vsize": 141}
+            else:
+                error = {"code": self.RPC_INVALID_ADDRESS_OR_KEY, "message": "Transaction not in mempool"}
+        elif method == "sendrawtransaction":
+            # Raw transactions are their own txid (as long as they are hex encoded)
+            try:
+                bytes.fromhex(params[0])
+                if self.get_transaction(params[0]) is not None and params[0] not in self.mempool:
+                    error = {"code": self.RPC_VERIFY_ALREADY_IN_CHAIN, "message": "Transaction already in block chain"}
+                else:
+                    self.mempool.add(params[0])
+                    result = params[0]
+            except ValueError:
+                error = {"code": self.RPC_DESERIALIZATION_ERROR, "message": "TX decode failed"}
+        else:
+            error = {"code": self.RPC_METHOD_NOT_FOUND, "message": "Method not found"}
+
+        return {"result": result, "error": error, "id": request.get("id")}
@@ -2,6 +2,7 @@ import json
 import pytest
 import shutil
 from uuid import uuid4
+from threading import Thread
 
 from teos.appointments_dbm import AppointmentsDBM
 from teos.appointments_dbm import (
@@ -129,6 +130,19 @@ def test_store_load_triggered_appointment(generate_dummy_appointment, db_manager
     assert db_manager.load_watcher_appointments(include_triggered=True) == {uuid: triggered_appointment.to_dict()}
 
 
+def test_store_triggered_appointment(generate_dummy_appointment, db_manager):
+    # Appointments can also be stored and flagged at once
+    triggered_appointment = generate_dummy_appointment()
+    uuid = uuid4().hex
+    assert db_manager.store_triggered_appointment(uuid, triggered_appointment.to_dict()) is True
+
+    assert uuid in db_manager.load_all_triggered_flags()
+    assert db_manager.load_watcher_appointment(uuid) == triggered_appointment.to_dict()
+
+    # Wrong uuids are rejected
+    assert db_manager.store_triggered_appointment(42, triggered_appointment.to_dict()) is False
+
+
 def test_store_responder_trackers_wrong(db_manager, responder_trackers):
     # Trying to store tracker with wrong uuid types should fail
     for _, tracker in responder_trackers.items():
@@ -204,6 +218,20 @@ def test_batch_delete_watcher_appointments(db_manager, watcher_appointments):
     assert not db_watcher_appointments
 
 
+def test_batch_load_responder_trackers(db_manager, responder_trackers):
+    # Trackers can be loaded in a batch. Those that cannot be found are returned as None
+    for uuid, value in responder_trackers.items():
+        db_manager.store_responder_tracker(uuid, {"value": value})
+
+    uuids = list(responder_trackers.keys()) + [uuid4().hex]
+    trackers = db_manager.batch_load_responder_trackers(uuids)
+
+    assert list(trackers.keys()) == uuids
+    assert trackers[uuids[-1]] is None
+    for uuid, value in responder_trackers.items():
+        assert trackers[uuid] == {"value": value}
+
+
 def test_delete_responder_tracker(db_manager, responder_trackers):
     # Tests the deletion of appointments
 
@@ -365,3 +393,181 @@ def test_batch_delete_triggered_appointment_flag(db_manager):
     # Delete the rest and check
     db_manager.batch_delete_triggered_appointment_flag(second_half)
     assert not db_manager.load_all_triggered_flags()
+
+
+def test_store_load_headers(db_manager):
+    assert db_manager.load_headers() == {}
+
+    headers = {get_random_value_hex(32): [i, get_random_value_hex(32)] for i in range(10)}
+    db_manager.store_headers(headers)
+    assert db_manager.load_headers() == headers
+
+
+def test_batch_delete_headers(db_manager):
+    headers = {get_random_value_hex(32): [i, get_random_value_hex(32)] for i in range(10)}
+    db_manager.store_headers(headers)
+
+    to_delete = list(headers.keys())[:5]
+    db_manager.batch_delete_headers(to_delete)
+    assert db_manager.load_headers() == {k: v for k, v in headers.items() if k not in to_delete}
+
+
+def test_store_load_header_index_tip(db_manager):
+    assert db_manager.load_header_index_tip() is None
+
+    block_hash = get_random_value_hex(32)
+    assert db_manager.store_header_index_tip(block_hash) is True
+    assert db_manager.load_header_index_tip() == block_hash
+
+    # Wrong types are not stored
+    assert db_manager.store_header_index_tip(42) is False
+
+
+def test_store_load_locator_cache_blocks(db_manager):
+    assert db_manager.load_locator_cache_blocks() == {}
+
+    blocks = {}
+    for _ in range(10):
+        txids = [get_random_value_hex(32) for _ in range(5)]
+        blocks[get_random_value_hex(32)] = {
+            "prev_block_hash": get_random_value_hex(32),
+            "locator_txid_map": {txid[:32]: txid for txid in txids},
+        }
+
+    db_manager.store_locator_cache_blocks(blocks)
+    assert db_manager.load_locator_cache_blocks() == blocks
+
+    # Blocks can also be deleted in batches
+    to_delete = list(blocks.keys())[:5]
+    db_manager.batch_delete_locator_cache_blocks(to_delete)
+    assert db_manager.load_locator_cache_blocks() == {k: v for k, v in blocks.items() if k not in to_delete}
+
+
+def test_store_load_delete_broadcast_intents(db_manager):
+    assert db_manager.load_broadcast_intents() == {}
+
+    intents = {}
+    for _ in range(5):
+        uuid = uuid4().hex
+        intents[uuid] = {"penalty_txid": get_random_value_hex(32), "penalty_rawtx": get_random_value_hex(100)}
+        db_manager.store_broadcast_intent(uuid, intents[uuid])
+
+    assert db_manager.load_broadcast_intents() == intents
+
+    # Intents do not clash with other data using the same leading byte (e.g. the last known blocks)
+    db_manager.store_last_block_hash_watcher(get_random_value_hex(32))
+    assert db_manager.load_broadcast_intents() == intents
+
+    uuid = list(intents.keys())[0]
+    db_manager.delete_broadcast_intent(uuid)
+    intents.pop(uuid)
+    assert db_manager.load_broadcast_intents() == intents
+
+    # Intents are stored straightaway, but deleted alongside the rest of the block writes within a block batch
+    uuid = list(intents.keys())[0]
+    with db_manager.block_batch():
+        new_uuid = uuid4().hex
+        db_manager.store_broadcast_intent(new_uuid, intents[uuid])
+        db_manager.delete_broadcast_intent(uuid)
+        assert new_uuid in db_manager.load_broadcast_intents() and uuid in db_manager.load_broadcast_intents()
+
+    assert new_uuid in db_manager.load_broadcast_intents() and uuid not in db_manager.load_broadcast_intents()
+
+
+def test_store_load_delete_deferred_breaches(db_manager):
+    assert db_manager.load_deferred_breaches() == {}
+
+    groups = {}
+    for _ in range(5):
+        uuids = [uuid4().hex for _ in range(3)]
+        locator, dispute_txid = get_random_value_hex(16), get_random_value_hex(32)
+        groups[uuids[0]] = {"locator": locator, "dispute_txid": dispute_txid, "uuids": uuids}
+
+    # Deferred breaches are stored alongside the rest of the block writes within a block batch
+    with db_manager.block_batch():
+        db_manager.store_deferred_breaches(groups)
+        assert db_manager.load_deferred_breaches() == {}
+
+    assert db_manager.load_deferred_breaches() == groups
+
+    to_delete = list(groups.keys())[:2]
+    db_manager.batch_delete_deferred_breaches(to_delete)
+    assert db_manager.load_deferred_breaches() == {k: v for k, v in groups.items() if k not in to_delete}
+
+
+def test_store_load_delete_carrier_receipts(db_manager):
+    assert db_manager.load_carrier_receipts() == {}
+
+    receipts = {}
+    for i in range(10):
+        receipts[get_random_value_hex(32)] = {"height": i, "receipt": {"delivered": True, "confirmations": 0}}
+
+    for txid, receipt_data in receipts.items():
+        db_manager.store_carrier_receipt(txid, receipt_data)
+    assert db_manager.load_carrier_receipts() == receipts
+
+    to_delete = list(receipts.keys())[:5]
+    db_manager.batch_delete_carrier_receipts(to_delete)
+    assert db_manager.load_carrier_receipts() == {k: v for k, v in receipts.items() if k not in to_delete}
+
+
+def test_block_batch(db_manager, watcher_appointments, responder_trackers):
+    # Writes done within a block batch are only committed once the context exits, alongside the last known block
+    uuid, appointment = next(iter(watcher_appointments.items()))
+    tracker_uuid, tracker = next(iter(responder_trackers.items()))
+    block_hash = get_random_value_hex(32)
+
+    with db_manager.block_batch():
+        db_manager.store_responder_tracker(tracker_uuid, {"value": tracker})
+        db_manager.batch_create_triggered_appointment_flag([uuid])
+        db_manager.store_last_block_hash_watcher(block_hash)
+
+        # Nested contexts join the outer one
+        with db_manager.block_batch():
+            db_manager.store_watcher_appointment(uuid, appointment.to_dict())
+
+        assert db_manager.load_watcher_appointment(uuid) is None
+        assert db_manager.load_responder_tracker(tracker_uuid) is None
+        assert db_manager.load_last_block_hash_watcher() is None
+
+    assert db_manager.load_watcher_appointment(uuid) == appointment.to_dict()
+    assert db_manager.load_responder_tracker(tracker_uuid) == {"value": tracker}
+    assert uuid in db_manager.load_all_triggered_flags()
+    assert db_manager.load_last_block_hash_watcher() == block_hash
+
+
+def test_block_batch_exception(db_manager, watcher_appointments):
+    # Nothing is written if an exception is raised within the context
+    uuid, appointment = next(iter(watcher_appointments.items()))
+
+    with pytest.raises(ValueError):
+        with db_manager.block_batch():
+            db_manager.store_watcher_appointment(uuid, appointment.to_dict())
+            db_manager.store_last_block_hash_watcher(get_random_value_hex(32))
+            raise ValueError()
+
+    assert db_manager.load_watcher_appointment(uuid) is None
+    assert db_manager.load_last_block_hash_watcher() is None
+
+    # The batch is dropped, so following writes are not affected
+    assert db_manager.store_watcher_appointment(uuid, appointment.to_dict()) is True
+    assert db_manager.load_watcher_appointment(uuid) == appointment.to_dict()
+
+
+def test_block_batch_other_threads(db_manager, watcher_appointments):
+    # Block batches are per thread, so writes from other threads are not deferred
+    uuids = list(watcher_appointments)
+
+    with db_manager.block_batch():
+        db_manager.store_watcher_appointment(uuids[0], watcher_appointments[uuids[0]].to_dict())
+
+        t = Thread(
+            target=db_manager.store_watcher_appointment, args=[uuids[1], watcher_appointments[uuids[1]].to_dict()]
+        )
+        t.start()
+        t.join()
+
+        assert db_manager.load_watcher_appointment(uuids[0]) is None
+        assert db_manager.load_watcher_appointment(uuids[1]) == watcher_appointments[uuids[1]].to_dict()
+
+    assert db_manager.load_watcher_appointment(uuids[0]) == watcher_appointments[uuids[0]].to_dict()
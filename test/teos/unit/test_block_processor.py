@@ -1,8 +1,10 @@
 import pytest
 from threading import Event
 
-from teos.block_processor import BlockProcessor
+from teos.block_processor import Block, BlockProcessor, ChainTip
+from teos.constants import MEDIAN_TIME_SPAN
 from teos.watcher import InvalidTransactionFormat
+from common.tools import compute_locator
 
 from test.teos.conftest import generate_blocks, fork
 from test.teos.unit.conftest import (
@@ -38,6 +40,43 @@ def block_processor_wrong_connection():
     return BlockProcessor(wrong_bitcoind_connect_params, bitcoind_reachable)
 
 
+def test_block_from_dict():
+    block_data = {
+        "hash": get_random_value_hex(32),
+        "height": 42,
+        "previousblockhash": get_random_value_hex(32),
+        "tx": [get_random_value_hex(32) for _ in range(10)],
+    }
+    block = Block.from_dict(block_data)
+
+    assert block.hash == block_data.get("hash")
+    assert block.height == block_data.get("height")
+    assert block.prev_block_hash == block_data.get("previousblockhash")
+    assert block.txids == tuple(block_data.get("tx"))
+
+    # The locators are precomputed for every transaction in the block
+    assert dict(block.locator_txid_map) == {compute_locator(txid): txid for txid in block_data.get("tx")}
+
+
+def test_block_is_immutable():
+    block = Block(get_random_value_hex(32), 0, get_random_value_hex(32), [get_random_value_hex(32)])
+
+    with pytest.raises(AttributeError):
+        block.height = 1
+
+    with pytest.raises(TypeError):
+        block.locator_txid_map[get_random_value_hex(16)] = get_random_value_hex(32)
+
+
+def test_resolve_block(block_processor_mock):
+    # Blocks are returned as they are, while hashes are fetched and parsed
+    block = Block(get_random_value_hex(32), 0, get_random_value_hex(32), [])
+    assert block_processor_mock.resolve_block(block) is block
+
+    parsed_block = block_processor_mock.resolve_block(get_random_value_hex(32))
+    assert isinstance(parsed_block, Block) and parsed_block.height == 0
+
+
 def test_get_best_block_hash(block_processor):
     # As long as bitcoind is running we should always get a block hash
     best_block_hash = block_processor.get_best_block_hash()
@@ -139,6 +178,132 @@ def test_find_last_common_ancestor(block_processor):
     assert len(dropped_txs) == 3
 
 
+def test_chain_tip_update():
+    chain_tip = ChainTip()
+    assert chain_tip.get() == (None, None, None)
+
+    # The median time past is taken from the block if available
+    block = Block(get_random_value_hex(32), 100, get_random_value_hex(32), [], time=1000, median_time=900)
+    chain_tip.update(block)
+    assert chain_tip.get() == (block.hash, 100, 900)
+
+    # Otherwise it is computed once MEDIAN_TIME_SPAN blocks have been seen on top of each other
+    times = [2000, 1500, 1600, 1700, 1400, 1800, 1900, 1300, 2100, 1200, 1100, 2200]
+    for i, block_time in enumerate(times):
+        block = Block(get_random_value_hex(32), 101 + i, chain_tip.hash, [], time=block_time)
+        chain_tip.update(block)
+
+        if i + 2 < MEDIAN_TIME_SPAN:
+            assert chain_tip.median_time is None
+    last_times = ([1000] + times)[-MEDIAN_TIME_SPAN:]
+    assert chain_tip.get() == (block.hash, 101 + len(times) - 1, sorted(last_times)[MEDIAN_TIME_SPAN // 2])
+
+    # The window is restarted if the new block does not build on top of the tip (reorg)
+    chain_tip.update(Block(get_random_value_hex(32), 113, get_random_value_hex(32), [], time=2300))
+    assert chain_tip.height == 113 and chain_tip.median_time is None and len(chain_tip.recent_times) == 1
+
+
+# TESTS WITH A FAKE BITCOIND
+# Batched queries are tested against a fake bitcoind so the number of round trips can be checked.
+
+
+@pytest.fixture
+def fake_block_processor(fake_bitcoind):
+    bitcoind_reachable = Event()
+    bitcoind_reachable.set()
+    return BlockProcessor(fake_bitcoind.connect_params, bitcoind_reachable)
+
+
+def test_get_blocks(fake_bitcoind, fake_block_processor):
+    block_hashes = fake_bitcoind.mine(10)
+    unknown_block_hash = get_random_value_hex(32)
+
+    blocks = fake_block_processor.get_blocks(block_hashes + [unknown_block_hash])
+
+    # Blocks are returned in order, the unknown one as None, and all are fetched in a single request
+    assert [block.get("hash") for block in blocks[:-1]] == block_hashes
+    assert blocks[-1] is None
+    assert len(fake_bitcoind.http_requests) == 1
+
+
+def test_get_block_hashes(fake_bitcoind, fake_block_processor):
+    block_hashes = fake_bitcoind.mine(10)
+
+    assert fake_block_processor.get_block_hashes(list(range(1, 11))) == block_hashes
+    assert fake_block_processor.get_block_hashes([fake_bitcoind.height + 1]) == [None]
+    assert len(fake_bitcoind.http_requests) == 2
+
+
+def test_get_block_heights(fake_bitcoind, fake_block_processor):
+    block_hashes = fake_bitcoind.mine(10)
+    unknown_block_hash = get_random_value_hex(32)
+
+    # Indexed blocks are not queried, and the rest are queried in a single request
+    fake_block_processor.update_tip(fake_block_processor.get_parsed_block(block_hashes[-1]))
+    n_requests = len(fake_bitcoind.http_requests)
+
+    heights = fake_block_processor.get_block_heights(block_hashes + [unknown_block_hash])
+    assert heights == dict(zip(block_hashes, range(1, 11)), **{unknown_block_hash: None})
+    assert len(fake_bitcoind.http_requests) == n_requests + 1
+
+    fake_block_processor.get_block_heights(block_hashes[-1:])
+    assert len(fake_bitcoind.http_requests) == n_requests + 1
+
+
+def test_get_missed_blocks_batched(fake_bitcoind, fake_block_processor):
+    last_known_block_hash = fake_bitcoind.best_chain[-1]
+    missed_blocks = fake_bitcoind.mine(100)
+
+    assert fake_block_processor.get_missed_blocks(last_known_block_hash) == missed_blocks
+    # getbestblockhash, getblock (tip), getblock (last known) and a single batch with all the hashes
+    assert len(fake_bitcoind.http_requests) == 4
+
+    # Nothing is missed if we are already at the tip
+    assert fake_block_processor.get_missed_blocks(missed_blocks[-1]) == []
+
+
+def test_get_missed_blocks_forked_last_known(fake_bitcoind, fake_block_processor):
+    # If the last known block has been forked out, the chain is walked back from the tip as before
+    ancestor = fake_bitcoind.mine(5)[0]
+    last_known_block_hash = fake_bitcoind.best_chain[-1]
+    new_blocks = fake_bitcoind.mine(6, prev_block_hash=ancestor)
+
+    missed_blocks = fake_block_processor.get_missed_blocks(last_known_block_hash)
+    assert missed_blocks[-6:] == new_blocks
+    assert missed_blocks[0] == fake_bitcoind.best_chain[0]
+
+
+def test_find_last_common_ancestor_single_query_per_block(fake_bitcoind, fake_block_processor):
+    ancestor = fake_bitcoind.best_chain[-1]
+    forked_blocks = [fake_bitcoind.mine(1, txs=[get_random_value_hex(32)])[0] for _ in range(3)]
+    fake_bitcoind.mine(4, prev_block_hash=ancestor)
+
+    last_common_ancestor, dropped_txs = fake_block_processor.find_last_common_ancestor(forked_blocks[-1])
+    assert last_common_ancestor == ancestor
+    assert len(dropped_txs) == 6
+
+    # One getblock per forked block plus one for the ancestor
+    assert len(fake_bitcoind.http_requests) == len(forked_blocks) + 1
+
+
+def test_get_blocks_blocking(fake_bitcoind, fake_block_processor):
+    # Batched queries honour the blocking semantics: they wait until bitcoind is reachable
+    block_hashes = fake_bitcoind.mine(3)
+    blocks = []
+
+    run_test_blocking_command_bitcoind_crash(
+        fake_block_processor.bitcoind_reachable,
+        lambda: blocks.extend(fake_block_processor.get_blocks(block_hashes, blocking=True)),
+    )
+
+    assert [block.get("hash") for block in blocks] == block_hashes
+
+
+def test_get_blocks_bitcoind_crash(block_processor_wrong_connection):
+    run_test_command_bitcoind_crash(lambda: block_processor_wrong_connection.get_blocks([get_random_value_hex(32)]))
+    run_test_command_bitcoind_crash(lambda: block_processor_wrong_connection.get_block_hashes([0]))
+
+
 # TESTS WITH BITCOIND UNREACHABLE
 # All BlockProcessor methods should work in a blocking and non-blocking way. The former raises a ConnectionRefusedError,
 # while the latter hangs until the event is set back.
@@ -215,3 +380,77 @@ def test_find_last_common_ancestor_bitcoind_crash(block_processor, block_process
         block_processor.bitcoind_reachable,
         lambda: block_processor.find_last_common_ancestor(best_block_hash, blocking=True),
     )
+
+
+def test_get_tip_height(fake_bitcoind, fake_block_processor):
+    fake_bitcoind.mine(3)
+
+    # bitcoind is only queried if the tip has not been cached yet
+    assert fake_block_processor.get_tip_height() == fake_bitcoind.height
+    assert len(fake_bitcoind.http_requests) == 1
+
+    block_hash = fake_bitcoind.mine(1)[0]
+    fake_block_processor.tip.update(fake_block_processor.get_parsed_block(block_hash))
+    n_requests = len(fake_bitcoind.http_requests)
+
+    assert fake_block_processor.get_tip_height() == fake_bitcoind.height
+    assert len(fake_bitcoind.http_requests) == n_requests
+
+
+def test_update_tip(fake_bitcoind, fake_block_processor):
+    block_hashes = fake_bitcoind.mine(5)
+
+    # The first tip is indexed on its own
+    fake_block_processor.update_tip(fake_block_processor.get_parsed_block(block_hashes[0]))
+    assert fake_block_processor.header_index.tip == block_hashes[0]
+    assert fake_block_processor.tip.hash == block_hashes[0]
+
+    # If some blocks are missed in between, their hashes and headers are fetched (in a request each) so there are no
+    # gaps in the index
+    n_requests = len(fake_bitcoind.http_requests)
+    fake_block_processor.update_tip(fake_block_processor.get_parsed_block(block_hashes[-1]))
+    assert len(fake_bitcoind.http_requests) == n_requests + 1 + 2
+    assert fake_block_processor.header_index.get_best_chain_after(block_hashes[0]) == block_hashes[1:]
+    assert all(request.get("method") != "getblock" for request in fake_bitcoind.http_requests[-1])
+
+
+def test_update_tip_reorg(fake_bitcoind, fake_block_processor):
+    # If the missed blocks fork out of the index under its tip, further blocks are fetched until the index is reached
+    block_hashes = fake_bitcoind.mine(20)
+    for block_hash in block_hashes:
+        fake_block_processor.update_tip(fake_block_processor.get_parsed_block(block_hash))
+
+    fork = fake_bitcoind.mine(10, prev_block_hash=block_hashes[9])
+    n_requests = len(fake_bitcoind.http_requests)
+    fake_block_processor.update_tip(fake_block_processor.get_parsed_block(fork[-1]))
+
+    # The gap down to the index tip does not connect, so 1, 2 and 4 more blocks are fetched
+    assert len(fake_bitcoind.http_requests) == n_requests + 1 + 2 * 4
+    assert fake_block_processor.header_index.tip == fork[-1]
+    assert fake_block_processor.header_index.get_best_chain_after(block_hashes[9]) == fork
+    assert fake_block_processor.is_block_in_best_chain(block_hashes[-1]) is False
+
+
+def test_chain_queries_indexed(fake_bitcoind, fake_block_processor):
+    # Once the chain is indexed, chain queries are answered without querying bitcoind
+    block_hashes = fake_bitcoind.mine(10)
+    for block_hash in block_hashes:
+        fake_block_processor.update_tip(fake_block_processor.get_parsed_block(block_hash))
+
+    ancestor = block_hashes[5]
+    fork = fake_bitcoind.mine(6, prev_block_hash=ancestor)
+    for block_hash in fork:
+        fake_block_processor.update_tip(fake_block_processor.get_parsed_block(block_hash))
+    n_requests = len(fake_bitcoind.http_requests)
+
+    assert fake_block_processor.get_distance_to_tip(block_hashes[0]) == len(fork) + 5
+    assert fake_block_processor.is_block_in_best_chain(ancestor) is True
+    assert fake_block_processor.is_block_in_best_chain(block_hashes[-1]) is False
+    assert fake_block_processor.get_missed_blocks(ancestor) == fork
+    assert fake_block_processor.find_last_common_ancestor(ancestor) == (ancestor, [])
+    assert len(fake_bitcoind.http_requests) == n_requests
+
+    # Only the forked out blocks need to be fetched (in a single request) to get their transactions
+    last_common_ancestor, dropped_txs = fake_block_processor.find_last_common_ancestor(block_hashes[-1])
+    assert last_common_ancestor == ancestor
+    assert len(fake_bitcoind.http_requests) == n_requests + 1
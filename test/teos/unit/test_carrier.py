@@ -1,10 +1,11 @@
 import pytest
 from threading import Event
 
-from teos.carrier import Carrier
+from teos.carrier import Carrier, Receipt, ReceiptLedger
 from teos.utils.rpc_errors import RPC_VERIFY_ALREADY_IN_CHAIN, RPC_DESERIALIZATION_ERROR
 
 from test.teos.conftest import generate_blocks, create_commitment_tx, bitcoin_cli
+from test.teos.unit.mocks import AppointmentsDBM as AppointmentsDBMMock
 from test.teos.unit.conftest import (
     bitcoind_connect_params,
     get_random_value_hex,
@@ -44,7 +45,7 @@ def test_send_double_spending_transaction(carrier):
 
     # Wait for a block to be mined. Issued receipts are reset from the Responder every block, so we should do it too.
     generate_blocks(2)
-    carrier.issued_receipts = {}
+    carrier.issued_receipts.update_height(carrier.issued_receipts.height + 1)
 
     # Try to send it again
     receipt2 = carrier.send_transaction(tx, txid)
@@ -77,6 +78,182 @@ def test_get_non_existing_transaction(carrier):
     assert tx_info is None
 
 
+def test_get_transactions(fake_bitcoind):
+    # Transactions are queried in a single batch, and duplicates only once
+    mempool_tx = get_random_value_hex(32)
+    confirmed_tx = get_random_value_hex(32)
+    unknown_tx = get_random_value_hex(32)
+    fake_bitcoind.mine(3, txs=[confirmed_tx])
+    fake_bitcoind.mempool.add(mempool_tx)
+
+    bitcoind_reachable = Event()
+    bitcoind_reachable.set()
+    carrier = Carrier(fake_bitcoind.connect_params, bitcoind_reachable)
+    txs_info = carrier.get_transactions([mempool_tx, confirmed_tx, unknown_tx, confirmed_tx])
+
+    assert list(txs_info.keys()) == [mempool_tx, confirmed_tx, unknown_tx]
+    assert txs_info[mempool_tx].get("confirmations") is None
+    assert txs_info[confirmed_tx].get("confirmations") == 3
+    assert txs_info[unknown_tx] is None
+    assert len(fake_bitcoind.http_requests) == 1 and len(fake_bitcoind.http_requests[0]) == 3
+
+
+def test_send_transactions(fake_bitcoind):
+    # Transactions are sent in a single batch, and the confirmations of the ones already on chain queried in another
+    new_tx = get_random_value_hex(32)
+    confirmed_tx = get_random_value_hex(32)
+    invalid_tx = "not a transaction"
+    fake_bitcoind.mine(3, txs=[confirmed_tx])
+
+    bitcoind_reachable = Event()
+    bitcoind_reachable.set()
+    carrier = Carrier(fake_bitcoind.connect_params, bitcoind_reachable)
+    receipts = carrier.send_transactions({new_tx: new_tx, confirmed_tx: confirmed_tx, invalid_tx: invalid_tx})
+
+    assert list(receipts.keys()) == [new_tx, confirmed_tx, invalid_tx]
+    assert receipts[new_tx].delivered is True and receipts[new_tx].confirmations == 0
+    assert receipts[confirmed_tx].delivered is True and receipts[confirmed_tx].confirmations == 3
+    assert receipts[confirmed_tx].reason == RPC_VERIFY_ALREADY_IN_CHAIN
+    assert receipts[invalid_tx].delivered is False and receipts[invalid_tx].reason == RPC_DESERIALIZATION_ERROR
+    assert len(fake_bitcoind.http_requests) == 2 and len(fake_bitcoind.http_requests[0]) == 3
+
+    # Receipts are cached, so sending them again does not reach bitcoind
+    assert carrier.send_transactions({new_tx: new_tx})[new_tx].delivered is True
+    assert len(fake_bitcoind.http_requests) == 2
+
+
+def test_get_mempool_entries(fake_bitcoind):
+    # Mempool entries are queried in a single batch. Transactions that are not in the mempool map to None
+    mempool_tx = get_random_value_hex(32)
+    confirmed_tx = get_random_value_hex(32)
+    fake_bitcoind.mine(1, txs=[confirmed_tx])
+    fake_bitcoind.mempool.add(mempool_tx)
+
+    bitcoind_reachable = Event()
+    bitcoind_reachable.set()
+    carrier = Carrier(fake_bitcoind.connect_params, bitcoind_reachable)
+    entries = carrier.get_mempool_entries([mempool_tx, confirmed_tx])
+
+    assert entries[mempool_tx] is not None and entries[confirmed_tx] is None
+    assert len(fake_bitcoind.http_requests) == 1 and len(fake_bitcoind.http_requests[0]) == 2
+
+
+def test_receipt_ledger():
+    ledger = ReceiptLedger(max_receipts=3, blocks=2)
+    txids = [get_random_value_hex(32) for _ in range(4)]
+
+    # Receipts can be looked up by txid, along with the height they were issued at
+    ledger.update_height(10)
+    ledger.add(txids[0], Receipt(delivered=True))
+    ledger.add(txids[1], Receipt(delivered=False, reason=RPC_DESERIALIZATION_ERROR))
+    assert ledger.get(txids[0]).delivered is True
+    assert ledger.get_status(txids[1]) == {
+        "delivered": False,
+        "confirmations": 0,
+        "reason": RPC_DESERIALIZATION_ERROR,
+        "height": 10,
+    }
+    assert ledger.get(get_random_value_hex(32)) is None and ledger.get_status(get_random_value_hex(32)) is None
+
+    # Once full, the least recently used receipt is evicted (txids[1], since txids[0] was just looked up)
+    ledger.update_height(11)
+    ledger.add(txids[2], Receipt(delivered=True))
+    ledger.get(txids[0])
+    ledger.add(txids[3], Receipt(delivered=True))
+    assert len(ledger) == 3 and txids[1] not in ledger
+
+    # Receipts older than the given number of blocks are dropped
+    ledger.update_height(12)
+    assert txids[0] not in ledger
+    assert txids[2] in ledger and txids[3] in ledger
+    ledger.update_height(13)
+    assert len(ledger) == 0
+
+
+def test_receipt_ledger_persistence():
+    dbm = AppointmentsDBMMock()
+    ledger = ReceiptLedger(max_receipts=10, blocks=2, db_manager=dbm)
+    txids = [get_random_value_hex(32) for _ in range(3)]
+
+    ledger.update_height(100)
+    ledger.add(txids[0], Receipt(delivered=True))
+    ledger.update_height(101)
+    ledger.add(txids[1], Receipt(delivered=True, confirmations=2))
+    ledger.add(txids[2], Receipt(delivered=False))
+    ledger.update_height(102)
+
+    # The receipts are loaded back on restart, and pruned receipts are gone from the db too
+    restored_ledger = ReceiptLedger(max_receipts=10, blocks=2, db_manager=dbm)
+    assert restored_ledger.height == 101
+    assert txids[0] not in restored_ledger
+    assert restored_ledger.get_status(txids[1]) == ledger.get_status(txids[1])
+    assert restored_ledger.get(txids[2]).delivered is False
+
+
+def test_broadcast(monkeypatch):
+    # Transactions are pushed by the broadcast workers, and the receipts delivered through futures and callbacks
+    bitcoind_reachable = Event()
+    bitcoind_reachable.set()
+    carrier = Carrier(bitcoind_connect_params, bitcoind_reachable, broadcast_workers=2)
+
+    release = Event()
+    sent = []
+
+    def mock_send_transaction(rawtx, txid):
+        release.wait()
+        sent.append(txid)
+        return Receipt(delivered=True)
+
+    monkeypatch.setattr(carrier, "send_transaction", mock_send_transaction)
+
+    txid = get_random_value_hex(32)
+    callback_receipts = []
+    future = carrier.broadcast(get_random_value_hex(100), txid, callback=callback_receipts.append)
+
+    # The call does not wait for the transaction to be pushed
+    assert not future.done() and txid in carrier.inflight
+
+    release.set()
+    receipt = future.result(timeout=5)
+    assert receipt.delivered is True
+    assert callback_receipts == [receipt]
+    assert sent == [txid]
+
+    carrier.shutdown()
+    assert txid not in carrier.inflight
+
+
+def test_broadcast_same_transaction(monkeypatch):
+    # A transaction queued several times while in flight is only pushed once
+    bitcoind_reachable = Event()
+    bitcoind_reachable.set()
+    carrier = Carrier(bitcoind_connect_params, bitcoind_reachable, broadcast_workers=4)
+
+    release = Event()
+    sent = []
+
+    def mock_send_transaction(rawtx, txid):
+        release.wait()
+        sent.append(txid)
+        return Receipt(delivered=True)
+
+    monkeypatch.setattr(carrier, "send_transaction", mock_send_transaction)
+
+    rawtx = get_random_value_hex(100)
+    txid = get_random_value_hex(32)
+    callback_receipts = []
+    futures = [carrier.broadcast(rawtx, txid, callback=callback_receipts.append) for _ in range(5)]
+
+    release.set()
+    receipts = [future.result(timeout=5) for future in futures]
+    carrier.shutdown()
+
+    assert sent == [txid]
+    assert all(receipt.delivered for receipt in receipts)
+    # Every caller gets its callback run
+    assert len(callback_receipts) == 5
+
+
 # TESTS WITH BITCOIND UNREACHABLE
 
 
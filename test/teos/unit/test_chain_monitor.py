@@ -2,12 +2,20 @@ import zmq
 import time
 import pytest
 from queue import Queue
+from copy import deepcopy
 from threading import Thread, Event, Condition
 
+from teos.block_processor import Block
 from teos.chain_monitor import ChainMonitor, ChainMonitorStatus
+from teos.utils.deserializer import decode_raw_transaction
 
 from test.teos.conftest import generate_blocks, generate_blocks_with_delay
-from test.teos.unit.conftest import get_random_value_hex, bitcoind_feed_params, mock_connection_refused_return
+from test.teos.unit.conftest import (
+    get_random_value_hex,
+    bitcoind_feed_params,
+    mock_connection_refused_return,
+    create_dummy_transaction,
+)
 
 
 def test_init(block_processor_mock):
@@ -25,7 +33,7 @@ def test_init(block_processor_mock):
     assert isinstance(chain_monitor.receiving_queues[1], Queue)
 
 
-def test_notify_subscribers(block_processor_mock):
+def test_notify_subscribers(block_processor_mock, monkeypatch):
     queue1 = Queue()
     queue2 = Queue()
     chain_monitor = ChainMonitor([queue1, queue2], block_processor_mock, bitcoind_feed_params)
@@ -38,6 +46,15 @@ def test_notify_subscribers(block_processor_mock):
     block2 = get_random_value_hex(32)
     block3 = get_random_value_hex(32)
 
+    # Keep track of how many times every block is requested to the BlockProcessor
+    requested_blocks = []
+
+    def get_block(block_hash, blocking):
+        requested_blocks.append(block_hash)
+        return {"hash": block_hash, "height": 0, "tx": []}
+
+    monkeypatch.setattr(block_processor_mock, "get_block", get_block)
+
     # we add two elements to the internal queue before the thread is started
     chain_monitor.queue.put(block1)
     chain_monitor.queue.put(block2)
@@ -50,16 +67,56 @@ def test_notify_subscribers(block_processor_mock):
 
     # the existing elements should be processed soon and in order for all queues
     for q in [queue1, queue2]:
-        assert q.get(timeout=0.1) == block1
-        assert q.get(timeout=0.1) == block2
+        assert q.get(timeout=0.1).hash == block1
+        assert q.get(timeout=0.1).hash == block2
 
     # Subscribers are only notified as long as they are awake
     chain_monitor.queue.put(block3)
 
-    assert queue1.get(timeout=0.1) == block3
-    assert queue2.get(timeout=0.1) == block3
+    queue1_block = queue1.get(timeout=0.1)
+    queue2_block = queue2.get(timeout=0.1)
+    assert isinstance(queue1_block, Block) and queue1_block.hash == block3
+
+    # All the subscribers receive the same object and each block is only fetched once
+    assert queue1_block is queue2_block
+    assert requested_blocks == [block1, block2, block3]
+
+    chain_monitor.terminate()
+
+
+def test_notify_subscribers_block_not_found(block_processor_mock, monkeypatch):
+    # If a block cannot be fetched, it is not notified to the subscribers
+    queue = Queue()
+    chain_monitor = ChainMonitor([queue], block_processor_mock, bitcoind_feed_params)
+    monkeypatch.setattr(block_processor_mock, "get_block", lambda block_hash, blocking: None)
+
+    notifying_thread = Thread(target=chain_monitor.notify_subscribers, daemon=True)
+    notifying_thread.start()
+    chain_monitor.queue.put(get_random_value_hex(32))
+    time.sleep(0.1)
+    assert queue.empty()
+
+    chain_monitor.terminate()
+    assert queue.get(timeout=0.1) == ChainMonitor.END_MESSAGE
+
+
+def test_notify_subscribers_deserialized_block(block_processor_mock, monkeypatch):
+    # Blocks that have already been deserialized (rawblock) are notified without querying bitcoind
+    queue = Queue()
+    chain_monitor = ChainMonitor([queue], block_processor_mock, bitcoind_feed_params)
+    monkeypatch.setattr(block_processor_mock, "get_block", lambda block_hash, blocking: pytest.fail("Unexpected query"))
+
+    block = Block(get_random_value_hex(32), 1, get_random_value_hex(32), [get_random_value_hex(32)])
+    notifying_thread = Thread(target=chain_monitor.notify_subscribers, daemon=True)
+    notifying_thread.start()
+    chain_monitor.queue.put(block)
+
+    assert queue.get(timeout=0.1) is block
+    # The cached tip is updated with the notified block
+    assert block_processor_mock.tip.get() == (block.hash, block.height, None)
 
     chain_monitor.terminate()
+    assert queue.get(timeout=0.1) == ChainMonitor.END_MESSAGE
 
 
 def test_enqueue(block_processor_mock):
@@ -77,6 +134,19 @@ def test_enqueue(block_processor_mock):
     assert chain_monitor.last_tips[-1] == another_block_hash
 
 
+def test_enqueue_block(block_processor_mock):
+    # If a deserialized block is provided, that is what ends up in the queue. last_tips still tracks the hash
+    chain_monitor = ChainMonitor([Queue(), Queue()], block_processor_mock, bitcoind_feed_params)
+    block = Block(get_random_value_hex(32), 1, get_random_value_hex(32), [])
+
+    assert chain_monitor.enqueue(block.hash, block) is True
+    assert chain_monitor.last_tips[-1] == block.hash
+    assert chain_monitor.queue.get() is block
+
+    assert chain_monitor.enqueue(block.hash, block) is False
+    assert chain_monitor.queue.empty()
+
+
 def test_monitor_chain_polling(block_processor_mock, monkeypatch):
     # Monkeypatch the BlockProcessor so the best tip remains unchanged
     fixed_tip = get_random_value_hex(32)
@@ -137,6 +207,85 @@ def test_monitor_chain_zmq(block_processor):
     generate_blocks(1)
 
 
+def test_monitor_chain_zmq_rawblock(block_processor_mock, regtest_blocks):
+    # The zmq interface is mocked using a local publisher that sends the serialized regtest blocks
+    zmq_context = zmq.Context()
+    publisher = zmq_context.socket(zmq.PUB)
+    port = publisher.bind_to_random_port("tcp://127.0.0.1")
+
+    feed_params = deepcopy(bitcoind_feed_params)
+    feed_params.update({"BTC_FEED_CONNECT": "127.0.0.1", "BTC_FEED_PORT": port, "BTC_FEED_RAWBLOCK": True})
+    chain_monitor = ChainMonitor([Queue(), Queue()], block_processor_mock, feed_params)
+    assert chain_monitor.rawblock is True
+
+    zmq_thread = Thread(target=chain_monitor.monitor_chain_zmq, daemon=True)
+    zmq_thread.start()
+    # Give the subscriber some time to connect, otherwise the first messages may be dropped
+    time.sleep(0.5)
+
+    # Hashes are ignored when subscribed to raw blocks, and so are blocks that cannot be deserialized
+    publisher.send_multipart([b"hashblock", bytes.fromhex(get_random_value_hex(32)), b"\x00" * 4])
+    publisher.send_multipart([b"rawblock", b"\x00" * 81, b"\x00" * 4])
+
+    for i, block_data in enumerate(regtest_blocks):
+        publisher.send_multipart([b"rawblock", bytes.fromhex(block_data.get("hex")), i.to_bytes(4, "little")])
+
+    # Every block is queued already deserialized, and only once even if it is received twice
+    publisher.send_multipart([b"rawblock", bytes.fromhex(regtest_blocks[0].get("hex")), b"\x00" * 4])
+
+    for block_data in regtest_blocks:
+        block = chain_monitor.queue.get(timeout=1)
+        assert isinstance(block, Block)
+        assert block.hash == block_data.get("hash")
+        assert block.height == block_data.get("height")
+        assert list(block.txids) == block_data.get("tx")
+
+    time.sleep(0.1)
+    assert chain_monitor.queue.empty()
+
+    chain_monitor.terminate()
+    # The zmq thread needs a message to release from the recv method.
+    publisher.send_multipart([b"rawblock", b"", b""])
+    zmq_thread.join(timeout=1)
+    publisher.close()
+
+
+def test_monitor_chain_zmq_rawtx(block_processor_mock):
+    # Mempool transactions are sent to the mempool queues when subscribed to rawtx
+    zmq_context = zmq.Context()
+    publisher = zmq_context.socket(zmq.PUB)
+    port = publisher.bind_to_random_port("tcp://127.0.0.1")
+
+    feed_params = deepcopy(bitcoind_feed_params)
+    feed_params.update({"BTC_FEED_CONNECT": "127.0.0.1", "BTC_FEED_PORT": port, "BTC_FEED_RAWTX": True})
+    mempool_queue = Queue()
+    chain_monitor = ChainMonitor([Queue()], block_processor_mock, feed_params, [mempool_queue])
+    assert chain_monitor.rawtx is True
+
+    zmq_thread = Thread(target=chain_monitor.monitor_chain_zmq, daemon=True)
+    zmq_thread.start()
+    time.sleep(0.5)
+
+    raw_tx = create_dummy_transaction()
+    txid = decode_raw_transaction(raw_tx).get("txid")
+
+    # Transactions are ignored until the ChainMonitor is active, and so are the ones that cannot be deserialized
+    publisher.send_multipart([b"rawtx", bytes.fromhex(raw_tx), b"\x00" * 4])
+    time.sleep(0.1)
+    chain_monitor.status = ChainMonitorStatus.ACTIVE
+    publisher.send_multipart([b"rawtx", b"\x00" * 10, b"\x00" * 4])
+    publisher.send_multipart([b"rawtx", bytes.fromhex(raw_tx), b"\x00" * 4])
+
+    assert mempool_queue.get(timeout=1) == txid
+    time.sleep(0.1)
+    assert mempool_queue.empty() and chain_monitor.queue.empty()
+
+    chain_monitor.terminate()
+    publisher.send_multipart([b"rawtx", b"", b""])
+    zmq_thread.join(timeout=1)
+    publisher.close()
+
+
 def test_monitor_chain(block_processor):
     # We don't activate it but we start listening; therefore received blocks should accumulate in the internal queue
     chain_monitor = ChainMonitor([Queue(), Queue()], block_processor, bitcoind_feed_params)
@@ -277,11 +426,15 @@ def test_monitor_chain_and_activate(block_processor):
     after_blocks = generate_blocks_with_delay(3, 0.15)
 
     # we now check that all the blocks are in the receiving queues in the correct order
-    all_blocks = pre_blocks + init_blocks + after_blocks
-    for block in all_blocks:
+    # (the pre-blocks were added as hashes, whereas the ones notified by the ChainMonitor are Block objects)
+    for block in pre_blocks:
         assert queue1.get(timeout=0.1) == block
         assert queue2.get(timeout=0.1) == block
 
+    for block in init_blocks + after_blocks:
+        assert queue1.get(timeout=0.1).hash == block
+        assert queue2.get(timeout=0.1).hash == block
+
     chain_monitor.terminate()
     # The zmq thread needs a block generation to release from the recv method.
     generate_blocks(1)
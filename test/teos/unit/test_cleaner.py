@@ -54,7 +54,7 @@ def set_up_appointments(db_manager, total_appointments):
 
         appointment = Appointment(locator, None, None)
         appointments[uuid] = {"locator": appointment.locator}
-        locator_uuid_map[locator] = [uuid]
+        locator_uuid_map[locator] = {uuid: None}
 
         db_manager.store_watcher_appointment(uuid, appointment.to_dict())
 
@@ -63,7 +63,7 @@ def set_up_appointments(db_manager, total_appointments):
             uuid = uuid4().hex
 
             appointments[uuid] = {"locator": appointment.locator}
-            locator_uuid_map[locator].append(uuid)
+            locator_uuid_map[locator][uuid] = None
 
             db_manager.store_watcher_appointment(uuid, appointment.to_dict())
 
@@ -93,7 +93,7 @@ def set_up_trackers(db_manager, total_trackers):
         # Assign both penalty_txid and dispute_txid the same id (it shouldn't matter)
         tracker = TransactionTracker(locator, dispute_txid, penalty_txid, None, None)
         trackers[uuid] = {"locator": tracker.locator, "penalty_txid": tracker.penalty_txid}
-        tx_tracker_map[penalty_txid] = [uuid]
+        tx_tracker_map[penalty_txid] = {uuid}
 
         db_manager.store_responder_tracker(uuid, tracker.to_dict())
 
@@ -102,7 +102,7 @@ def set_up_trackers(db_manager, total_trackers):
             uuid = uuid4().hex
 
             trackers[uuid] = {"locator": tracker.locator, "penalty_txid": tracker.penalty_txid}
-            tx_tracker_map[penalty_txid].append(uuid)
+            tx_tracker_map[penalty_txid].add(uuid)
 
             db_manager.store_responder_tracker(uuid, tracker.to_dict())
 
@@ -0,0 +1,194 @@
+import pytest
+
+from teos.block_processor import Block
+from teos.utils.deserializer import (
+    ByteReader,
+    DeserializationError,
+    deserialize_transaction,
+    deserialize_block,
+    decode_coinbase_height,
+    decode_raw_transaction,
+)
+
+from common.cryptographer import sha256d
+
+# Legacy (non-segwit) transaction and its txid
+legacy_tx = (
+    "0100000001c997a5e56e104102fa209c6a852dd90660a20b2d9c352423edce25857fcd3704000000004847304402204e45e16932b8af514961"
+    "a1d3a1a25fdf3f4f7732e9d624c6c61548ab5fb8cd410220181522ec8eca07de4860a4acdd12909d831cc56cbbac4622082221a8768d1d09"
+    "01ffffffff0200ca9a3b00000000434104ae1a62fe09c5f51b13905f07f06b99a2f7159b2225f374cd378d71302fa28414e7aab37397f554"
+    "a7df5f142c21c1b7303b8a0626f1baded5c72a704f7e6cd84cac00286bee0000000043410411db93e1dcdb8a016b49840f8c53bc1eb68a38"
+    "2e97b1482ecad7b148a6909a5cb2e0eaddfb84ccf9744464f82e160bfa9b8b64f9d4c03f999b8643f656b412a3ac00000000"
+)
+legacy_txid = "f4184fc596403b9d638783cf57adfe4c75c605f6356fbc91338530e9831e9e16"
+
+
+def test_byte_reader():
+    reader = ByteReader(bytes.fromhex("01fd0302fe07060504ff0f0e0d0c0b0a0908"))
+
+    assert reader.read_uint8() == 1
+    assert reader.read_varint() == 0x0203
+    assert reader.read_varint() == 0x04050607
+    assert reader.read_varint() == 0x08090A0B0C0D0E0F
+    assert reader.remaining() == 0
+
+
+def test_byte_reader_out_of_bounds():
+    reader = ByteReader(bytes.fromhex("fd03"))
+
+    # The varint prefix announces two more bytes, but there is only one
+    with pytest.raises(DeserializationError, match="Unexpected end of data"):
+        reader.read_varint()
+
+    with pytest.raises(DeserializationError, match="Unexpected end of data"):
+        ByteReader(b"\x00" * 31).read(32)
+
+
+def test_deserialize_legacy_transaction():
+    reader = ByteReader(bytes.fromhex(legacy_tx))
+    tx = deserialize_transaction(reader)
+
+    assert reader.remaining() == 0
+    assert tx.get("txid") == legacy_txid
+    assert tx.get("version") == 1
+    assert tx.get("locktime") == 0
+    assert len(tx.get("vin")) == 1 and "txinwitness" not in tx.get("vin")[0]
+    assert [txout.get("value") for txout in tx.get("vout")] == [1000000000, 4000000000]
+
+
+def test_deserialize_segwit_transaction(regtest_blocks):
+    # The second block includes a legacy transaction and two segwit ones
+    block_data = regtest_blocks[1]
+    reader = ByteReader(bytes.fromhex(block_data.get("hex")))
+    reader.read(80)
+
+    txs = [deserialize_transaction(reader) for _ in range(reader.read_varint())]
+    assert [tx.get("txid") for tx in txs] == block_data.get("tx")
+
+    segwit_txs = [tx for tx in txs if "txinwitness" in tx.get("vin")[0]]
+    assert len(segwit_txs) == 3  # Including the coinbase (witness reserved value)
+
+    for tx in segwit_txs:
+        assert all(isinstance(txin.get("txinwitness"), list) for txin in tx.get("vin"))
+
+
+def test_deserialize_transaction_wrong_segwit_flag():
+    # Version followed by the segwit marker and a wrong flag
+    with pytest.raises(DeserializationError, match="Wrong segwit flag"):
+        deserialize_transaction(ByteReader(bytes.fromhex("020000000002")))
+
+
+def test_deserialize_transaction_truncated():
+    with pytest.raises(DeserializationError):
+        deserialize_transaction(ByteReader(bytes.fromhex(legacy_tx[:-2])))
+
+
+def test_decode_coinbase_height():
+    assert decode_coinbase_height(bytes.fromhex("00")) == 0
+    assert decode_coinbase_height(bytes.fromhex("51")) == 1
+    assert decode_coinbase_height(bytes.fromhex("60")) == 16
+    assert decode_coinbase_height(bytes.fromhex("012c")) == 44
+    # 300 needs two bytes, and 128 an extra one so it is not read as negative
+    assert decode_coinbase_height(bytes.fromhex("022c01")) == 300
+    assert decode_coinbase_height(bytes.fromhex("028000")) == 128
+    assert decode_coinbase_height(bytes.fromhex("0387d612ffff")) == 1234567
+
+    # Empty, truncated, negative or non-push scripts have no height
+    assert decode_coinbase_height(b"") is None
+    assert decode_coinbase_height(bytes.fromhex("03ffff")) is None
+    assert decode_coinbase_height(bytes.fromhex("0180")) is None
+    assert decode_coinbase_height(bytes.fromhex("4c01ff")) is None
+
+
+def test_deserialize_block(regtest_blocks):
+    for block_data in regtest_blocks:
+        block = deserialize_block(bytes.fromhex(block_data.get("hex")))
+
+        assert isinstance(block, Block)
+        assert block.hash == block_data.get("hash")
+        assert block.height == block_data.get("height")
+        assert block.prev_block_hash == block_data.get("previousblockhash")
+        assert list(block.txids) == block_data.get("tx")
+        assert block.time == int.from_bytes(bytes.fromhex(block_data.get("hex"))[68:72], "little")
+
+
+def test_deserialize_block_chain(regtest_blocks):
+    # The first three blocks build on top of each other
+    for prev_block_data, block_data in zip(regtest_blocks[:2], regtest_blocks[1:3]):
+        block = deserialize_block(bytes.fromhex(block_data.get("hex")))
+        assert block.prev_block_hash == prev_block_data.get("hash")
+
+
+def test_deserialize_block_wrong_merkle_root(regtest_blocks):
+    raw_block = bytearray.fromhex(regtest_blocks[1].get("hex"))
+    # Flip a bit in the locktime of the last transaction
+    raw_block[-1] ^= 0x01
+
+    with pytest.raises(DeserializationError, match="Merkle root mismatch"):
+        deserialize_block(bytes(raw_block))
+
+
+def test_deserialize_block_wrong_size(regtest_blocks):
+    raw_block = bytes.fromhex(regtest_blocks[0].get("hex"))
+
+    with pytest.raises(DeserializationError, match="Unexpected end of data"):
+        deserialize_block(raw_block[:-1])
+
+    with pytest.raises(DeserializationError, match="Unexpected data after the last transaction"):
+        deserialize_block(raw_block + b"\x00")
+
+    # A header with no transactions
+    with pytest.raises(DeserializationError, match="Block has no transactions"):
+        deserialize_block(raw_block[:80] + b"\x00")
+
+
+def test_deserialize_block_hash(regtest_blocks):
+    # The block hash is the double sha256 of the header
+    raw_block = bytes.fromhex(regtest_blocks[2].get("hex"))
+    assert deserialize_block(raw_block).hash == sha256d(raw_block[:80])[::-1].hex()
+
+
+def test_decode_raw_transaction(regtest_blocks):
+    tx = decode_raw_transaction(legacy_tx)
+    assert tx.get("txid") == legacy_txid
+
+    # Segwit transactions are also decoded. Get the raw transactions from a block with some of them
+    block_data = regtest_blocks[1]
+    reader = ByteReader(bytes.fromhex(block_data.get("hex")))
+    reader.read(80)
+
+    raw_txs = []
+    for _ in range(reader.read_varint()):
+        start = reader.offset
+        deserialize_transaction(reader)
+        raw_txs.append(reader.data[start : reader.offset].hex())  # noqa: E203
+
+    assert [decode_raw_transaction(raw_tx).get("txid") for raw_tx in raw_txs] == block_data.get("tx")
+
+
+def test_decode_raw_transaction_invalid():
+    # Wrong encoding
+    for raw_tx in [None, "zz", legacy_tx[:-1]]:
+        with pytest.raises(DeserializationError, match="Wrong transaction encoding"):
+            decode_raw_transaction(raw_tx)
+
+    # Truncated data and trailing data
+    with pytest.raises(DeserializationError, match="Unexpected end of data"):
+        decode_raw_transaction(legacy_tx[:-2])
+    with pytest.raises(DeserializationError, match="Unexpected data after the transaction"):
+        decode_raw_transaction(legacy_tx + "00")
+
+    # A transaction with no outputs
+    no_outputs = legacy_tx[: legacy_tx.index("ffffffff02") + 8] + "00" + "00000000"
+    with pytest.raises(DeserializationError, match="no inputs or no outputs"):
+        decode_raw_transaction(no_outputs)
+
+    # A segwit transaction with no witness data
+    segwit_no_witness = legacy_tx[:8] + "0001" + legacy_tx[8:-8] + "00" + legacy_tx[-8:]
+    with pytest.raises(DeserializationError, match="Superfluous witness record"):
+        decode_raw_transaction(segwit_no_witness)
+
+    # Output values must be in range
+    out_of_range = legacy_tx.replace("00ca9a3b00000000", "ffffffffffffff7f")
+    with pytest.raises(DeserializationError, match="Output value out of range"):
+        decode_raw_transaction(out_of_range)
@@ -2,6 +2,8 @@ import pytest
 
 from teos.extended_appointment import ExtendedAppointment
 
+from common.cryptographer import hash_160
+
 
 @pytest.fixture
 def ext_appointment_data(generate_dummy_appointment):
@@ -37,6 +39,7 @@ def test_get_summary(ext_appointment_data):
     assert ExtendedAppointment.from_dict(ext_appointment_data).get_summary() == {
         "locator": ext_appointment_data["locator"],
         "user_id": ext_appointment_data["user_id"],
+        "blob_hash": hash_160(ext_appointment_data["encrypted_blob"]),
     }
 
 
@@ -2,10 +2,12 @@ import time
 import pytest
 import itertools
 from shutil import rmtree
+from threading import Thread
 from copy import deepcopy
 
 from teos.users_dbm import UsersDBM
 from teos.gatekeeper import Gatekeeper
+from teos.block_processor import Block
 from teos.constants import OUTDATED_USERS_CACHE_SIZE_BLOCKS
 from teos.gatekeeper import AuthenticationFailure, NotEnoughSlots, UserInfo
 
@@ -67,6 +69,12 @@ def gatekeeper_real_bp(gatekeeper, block_processor, monkeypatch):
     return gatekeeper
 
 
+def mock_register_user(gatekeeper, user_id, user_info):
+    # Mocks adding a user to the Gatekeeper (both to the registered users and the outdated users index)
+    gatekeeper.registered_users[user_id] = user_info
+    gatekeeper.outdated_users_index.setdefault(gatekeeper.get_outdated_height(user_info), {})[user_id] = None
+
+
 # USER INFO
 
 
@@ -139,6 +147,42 @@ def test_gatekeeper_init(gatekeeper):
     assert isinstance(gatekeeper.registered_users, dict) and len(gatekeeper.registered_users) == 0
 
 
+def test_get_user_lock(gatekeeper):
+    # The same user always gets the same lock
+    user_id = "02" + get_random_value_hex(32)
+    assert gatekeeper.get_user_lock(user_id) is gatekeeper.get_user_lock(user_id)
+    assert gatekeeper.get_user_lock(user_id) in gatekeeper.user_locks
+
+
+def test_lock_users(gatekeeper):
+    # lock_users holds the locks of all the given users (shared stripes are only acquired once)
+    user_ids = ["02" + get_random_value_hex(32) for _ in range(10)]
+    user_ids.append(user_ids[0])
+
+    with gatekeeper.lock_users(user_ids):
+        assert all(gatekeeper.get_user_lock(user_id).locked() for user_id in user_ids)
+
+    assert not any(lock.locked() for lock in gatekeeper.user_locks)
+
+
+def test_lock_users_deterministic_order(gatekeeper):
+    # Bulk locks are taken in the same order no matter the order of the user ids, so they cannot deadlock
+    user_ids = ["02" + get_random_value_hex(32) for _ in range(10)]
+
+    def lock_many(ids):
+        for _ in range(200):
+            with gatekeeper.lock_users(ids):
+                pass
+
+    threads = [Thread(target=lock_many, args=(ids,), daemon=True) for ids in [user_ids, user_ids[::-1]]]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout=10)
+
+    assert not any(thread.is_alive() for thread in threads)
+
+
 def test_manage_subscription_expiry(gatekeeper, monkeypatch):
     # A thread to manage the subscription expiry is created when the Gatekeeper is created.
     # Subscriptions are expired at expiry but data is deleted once outdated (expiry_delta blocks after)
@@ -157,7 +201,8 @@ def test_manage_subscription_expiry(gatekeeper, monkeypatch):
     expiring_users = {
         get_random_value_hex(32): UserInfo(available_slots=10, subscription_expiry=init_height + 1) for _ in range(10)
     }
-    gatekeeper.registered_users.update(expiring_users)
+    for user_id, user_info in expiring_users.items():
+        mock_register_user(gatekeeper, user_id, user_info)
 
     # Users expire after the current block. Check that they are currently not expired
     for user_id in expiring_users.keys():
@@ -174,7 +219,7 @@ def test_manage_subscription_expiry(gatekeeper, monkeypatch):
     mock_generate_blocks(gatekeeper.expiry_delta - 1, blocks, gatekeeper.block_queue)
     assert expiring_users.keys() == gatekeeper.registered_users.keys()
     mock_generate_blocks(1, blocks, gatekeeper.block_queue)
-    assert len(gatekeeper.registered_users) == 0
+    assert len(gatekeeper.registered_users) == 0 and len(gatekeeper.outdated_users_index) == 0
 
     # Data should also have been deleted from the database
     block_height_deletion = gatekeeper.block_processor.get_block_count()
@@ -216,6 +261,45 @@ def test_add_update_user(gatekeeper, monkeypatch):
         assert user.subscription_expiry == init_height + config.get("SUBSCRIPTION_DURATION")
 
 
+def test_add_update_user_outdated_users_index(gatekeeper, monkeypatch):
+    # Users are indexed by the height their subscription gets outdated at, and moved within the index on renewal
+    # (a height no other test user expires at is used so the index entries can be fully checked)
+    user_id = "02" + get_random_value_hex(32)
+    init_height = 1000
+    monkeypatch.setattr(gatekeeper.block_processor, "get_block_count", lambda: init_height)
+
+    gatekeeper.add_update_user(user_id)
+    outdated_height = init_height + config.get("SUBSCRIPTION_DURATION") + gatekeeper.expiry_delta
+    assert gatekeeper.outdated_users_index[outdated_height] == {user_id: None}
+    assert gatekeeper.get_outdated_user_ids(outdated_height) == [user_id]
+
+    # Renewing the subscription at a later height moves the user, and the old height is removed once empty
+    init_height += 10
+    gatekeeper.add_update_user(user_id)
+    assert outdated_height not in gatekeeper.outdated_users_index
+    assert gatekeeper.outdated_users_index[outdated_height + 10] == {user_id: None}
+    assert gatekeeper.get_outdated_user_ids(outdated_height) == []
+    assert gatekeeper.get_outdated_user_ids(outdated_height + 10) == [user_id]
+
+
+def test_outdated_users_index_on_init(gatekeeper):
+    # The index is built from the users loaded from the database when the Gatekeeper is created
+    for _ in range(5):
+        gatekeeper.add_update_user("02" + get_random_value_hex(32))
+
+    new_gatekeeper = Gatekeeper(
+        gatekeeper.user_db,
+        gatekeeper.block_processor,
+        gatekeeper.subscription_slots,
+        gatekeeper.subscription_duration,
+        gatekeeper.expiry_delta,
+    )
+
+    assert new_gatekeeper.registered_users.keys() == set(flatten(new_gatekeeper.outdated_users_index.values()))
+    for user_id, user_info in new_gatekeeper.registered_users.items():
+        assert user_id in new_gatekeeper.outdated_users_index[new_gatekeeper.get_outdated_height(user_info)]
+
+
 def test_add_update_user_wrong_id(gatekeeper):
     # Passing a wrong pk defaults to the errors in check_user_pk. We can try with one.
     wrong_id = get_random_value_hex(32)
@@ -367,6 +451,56 @@ def test_add_update_appointment(gatekeeper, generate_dummy_appointment, monkeypa
         gatekeeper.add_update_appointment(user_id, appointment_uuid, appointment_x2_size)
 
 
+def test_add_update_appointment_different_users(gatekeeper, generate_dummy_appointment, monkeypatch):
+    # Updates of a user only lock that user, so other users can be updated at the same time
+    user_id = "02" + get_random_value_hex(32)
+    other_user_id = "03" + get_random_value_hex(32)
+    while gatekeeper.get_user_lock(other_user_id) is gatekeeper.get_user_lock(user_id):
+        other_user_id = "03" + get_random_value_hex(32)
+
+    monkeypatch.setitem(gatekeeper.registered_users, user_id, UserInfo(100, 100))
+    monkeypatch.setitem(gatekeeper.registered_users, other_user_id, UserInfo(100, 100))
+    appointment = generate_dummy_appointment()
+
+    with gatekeeper.get_user_lock(user_id):
+        # The other user is not blocked
+        assert gatekeeper.add_update_appointment(other_user_id, get_random_value_hex(16), appointment) == 99
+
+        # The locked user is
+        thread = Thread(
+            target=gatekeeper.add_update_appointment,
+            args=(user_id, get_random_value_hex(16), appointment),
+            daemon=True,
+        )
+        thread.start()
+        time.sleep(0.1)
+        assert gatekeeper.registered_users[user_id].available_slots == 100
+
+    thread.join()
+    assert gatekeeper.registered_users[user_id].available_slots == 99
+
+
+def test_delete_appointments(gatekeeper, monkeypatch):
+    # delete_appointments frees the slots of the given appointments and updates the users in the database
+    user_ids = ["02" + get_random_value_hex(32) for _ in range(5)]
+    appointments = {}
+    for user_id in user_ids:
+        uuids = [get_random_value_hex(16) for _ in range(3)]
+        user_info = UserInfo(7, 100, {uuid: 1 for uuid in uuids})
+        monkeypatch.setitem(gatekeeper.registered_users, user_id, user_info)
+        gatekeeper.user_db.store_user(user_id, user_info.to_dict())
+        appointments.update({uuid: user_id for uuid in uuids[:2]})
+
+    gatekeeper.delete_appointments(appointments)
+
+    for user_id in user_ids:
+        assert gatekeeper.registered_users[user_id].available_slots == 9
+        assert len(gatekeeper.registered_users[user_id].appointments) == 1
+        assert gatekeeper.user_db.load_user(user_id) == gatekeeper.registered_users[user_id].to_dict()
+
+    assert not any(lock.locked() for lock in gatekeeper.user_locks)
+
+
 def test_has_subscription_expired(gatekeeper, monkeypatch):
     init_height = 0
     blocks = dict()
@@ -399,6 +533,19 @@ def test_has_subscription_expired(gatekeeper, monkeypatch):
     assert has_subscription_expired
 
 
+def test_has_subscription_expired_cached_tip(gatekeeper, monkeypatch):
+    # Once the tip is cached, the Gatekeeper does not query bitcoind to check the subscriptions
+    monkeypatch.setattr(gatekeeper.block_processor, "get_block_count", lambda: pytest.fail("Unexpected query"))
+    gatekeeper.block_processor.tip.update(Block(get_random_value_hex(32), 10, get_random_value_hex(32), []))
+
+    user_id = get_random_value_hex(32)
+    monkeypatch.setitem(gatekeeper.registered_users, user_id, UserInfo(available_slots=1, subscription_expiry=11))
+    assert gatekeeper.has_subscription_expired(user_id) == (False, 11)
+
+    gatekeeper.block_processor.tip.update(Block(get_random_value_hex(32), 11, gatekeeper.block_processor.tip.hash, []))
+    assert gatekeeper.has_subscription_expired(user_id) == (True, 11)
+
+
 def test_has_subscription_expired_not_registered(gatekeeper):
     # If the users is unknown by the Gatekeeper, the method will fail
     with pytest.raises(AuthenticationFailure):
@@ -433,8 +580,8 @@ def test_get_outdated_users(gatekeeper, monkeypatch):
     }
 
     # Mock adding users to the Gatekeeper
-    gatekeeper.registered_users.update(outdated_users_next)
-    gatekeeper.registered_users.update(outdated_users_next_next)
+    for user_id, user_info in {**outdated_users_next, **outdated_users_next_next}.items():
+        mock_register_user(gatekeeper, user_id, user_info)
 
     # Check that outdated_users_next are outdated in the next block
     outdated_users = gatekeeper.get_outdated_users(init_height + 1).keys()
@@ -460,7 +607,7 @@ def test_get_outdated_user_ids(gatekeeper, monkeypatch):
             # Add a single appointment to the user
             user_appointments = {get_random_value_hex(16): 1}
             # Mock adding the users to the Gatekeeper
-            monkeypatch.setitem(gatekeeper.registered_users, uuid, UserInfo(100, expiry, user_appointments))
+            mock_register_user(gatekeeper, uuid, UserInfo(100, expiry, user_appointments))
             iter_uuids.append(uuid)
         uuids.append(iter_uuids)
 
@@ -484,14 +631,13 @@ def test_get_outdated_appointments(gatekeeper, monkeypatch):
 
     appointment = {}
     # Let's simulate adding some users with dummy expiry times
-    gatekeeper.registered_users = {}
     for expiry in range(100):
         # Add more than one user expiring at the same time to check it works for multiple users
         for _ in range(2):
             uuid = get_random_value_hex(16)
             user_appointments = {get_random_value_hex(16): 1 for _ in range(10)}
             # Add a single appointment to the user
-            monkeypatch.setitem(gatekeeper.registered_users, uuid, UserInfo(100, expiry, user_appointments))
+            mock_register_user(gatekeeper, uuid, UserInfo(100, expiry, user_appointments))
 
             if expiry in appointment:
                 appointment[expiry].update(user_appointments)
@@ -525,7 +671,7 @@ def test_update_outdated_users_cache(gatekeeper, monkeypatch):
     appointments = {get_random_value_hex(32): 1 for _ in range(10)}
     user_info = UserInfo(available_slots=1, subscription_expiry=init_height + 42, appointments=appointments)
     user_id = get_random_value_hex(32)
-    monkeypatch.setitem(gatekeeper.registered_users, user_id, user_info)
+    mock_register_user(gatekeeper, user_id, user_info)
 
     # Check that the entry is not in the cache
     target_height = init_height + gatekeeper.expiry_delta + 42
@@ -552,7 +698,7 @@ def test_update_outdated_users_cache_remove_data(gatekeeper, monkeypatch):
         appointments = {get_random_value_hex(32): 1 for _ in range(10)}
         user_info = UserInfo(available_slots=1, subscription_expiry=init_height + i, appointments=appointments)
         user_id = get_random_value_hex(32)
-        monkeypatch.setitem(gatekeeper.registered_users, user_id, user_info)
+        mock_register_user(gatekeeper, user_id, user_info)
 
         target_block = init_height + gatekeeper.expiry_delta + i
         gatekeeper.update_outdated_users_cache(target_block)
@@ -584,7 +730,7 @@ def test_manage_subscription_expiry_bitcoind_crash(gatekeeper_real_bp, monkeypat
     # Mock the user registration
     user_id = get_random_value_hex(32)
     user_info = UserInfo(available_slots=10, subscription_expiry=current_height + 1)
-    monkeypatch.setitem(gatekeeper_real_bp.registered_users, user_id, user_info)
+    mock_register_user(gatekeeper_real_bp, user_id, user_info)
 
     # Since the gatekeeper is not currently hooked to any ChainMonitor, it won't be notified.
     block_id = generate_blocks(1)[0]
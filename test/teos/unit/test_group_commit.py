@@ -0,0 +1,107 @@
+import time
+import pytest
+import shutil
+import plyvel
+from threading import Thread
+
+from teos.group_commit import GroupCommitter
+
+from test.teos.unit.conftest import get_random_value_hex
+
+
+class DBProxy:
+    """A proxy of a plyvel.DB that records the batches that are written"""
+
+    def __init__(self, db, fail=False):
+        self.db = db
+        self.fail = fail
+        self.batches = []
+
+    def write_batch(self, **kwargs):
+        if self.fail:
+            raise RuntimeError("Database is closed")
+
+        self.batches.append(kwargs)
+        return self.db.write_batch(**kwargs)
+
+
+@pytest.fixture
+def db(db_name="test_group_commit_db"):
+    db = plyvel.DB(db_name, create_if_missing=True)
+
+    yield db
+
+    db.close()
+    shutil.rmtree(db_name)
+
+
+def test_submit(db):
+    # Submitted writes are committed and the returned future is resolved afterwards
+    committer = GroupCommitter(db)
+    key, value = get_random_value_hex(16).encode(), get_random_value_hex(32).encode()
+
+    future = committer.submit(puts=[(key, value)])
+    assert future.result() is True
+    assert db.get(key) == value
+
+    # Same for deletions
+    committer.write(deletes=[key])
+    assert db.get(key) is None
+
+
+def test_submit_order(db):
+    # Writes are committed in the same order they were submitted
+    committer = GroupCommitter(db, commit_interval=0.05)
+    key = get_random_value_hex(16).encode()
+
+    futures = [committer.submit(puts=[(key, str(i).encode())]) for i in range(10)]
+    futures.append(committer.submit(deletes=[key]))
+    futures.append(committer.submit(puts=[(key, b"last")]))
+
+    assert all(future.result() for future in futures)
+    assert db.get(key) == b"last"
+
+
+def test_group_commit(db):
+    # Writes from concurrent requests are committed together
+    db_proxy = DBProxy(db)
+    committer = GroupCommitter(db_proxy, commit_interval=0.05, sync=True)
+    keys = [get_random_value_hex(16).encode() for _ in range(50)]
+
+    threads = [Thread(target=committer.write, kwargs={"puts": [(key, b"")]}) for key in keys]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(db.get(key) == b"" for key in keys)
+    assert len(db_proxy.batches) < len(keys)
+
+    # Batches are written atomically and using the configured durability
+    assert all(batch == {"transaction": True, "sync": True} for batch in db_proxy.batches)
+
+
+def test_group_commit_error(db):
+    # If a batch cannot be written, all the requests in the batch get the exception
+    committer = GroupCommitter(DBProxy(db, fail=True), commit_interval=0.05)
+    futures = [committer.submit(puts=[(get_random_value_hex(16).encode(), b"")]) for _ in range(5)]
+
+    for future in futures:
+        with pytest.raises(RuntimeError, match="Database is closed"):
+            future.result()
+
+
+def test_stop(db):
+    # Stopping the committer commits all the pending writes and rejects the new ones
+    committer = GroupCommitter(db, commit_interval=0.5)
+    keys = [get_random_value_hex(16).encode() for _ in range(10)]
+    futures = [committer.submit(puts=[(key, b"")]) for key in keys]
+
+    start = time.time()
+    committer.stop()
+    assert time.time() - start < 0.5
+    assert all(future.done() for future in futures) and all(db.get(key) == b"" for key in keys)
+    assert not committer.committer_thread.is_alive()
+
+    with pytest.raises(RuntimeError):
+        committer.submit(puts=[(keys[0], b"")])
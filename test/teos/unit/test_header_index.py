@@ -0,0 +1,175 @@
+import pytest
+import shutil
+
+from teos.header_index import HeaderIndex
+from teos.appointments_dbm import AppointmentsDBM
+
+from test.teos.unit.conftest import get_random_value_hex
+
+
+@pytest.fixture
+def db_manager(db_name="test_header_index_db"):
+    manager = AppointmentsDBM(db_name)
+
+    yield manager
+
+    manager.db.close()
+    shutil.rmtree(db_name)
+
+
+def build_chain(n_blocks, prev_block_hash=None, height=0):
+    # Returns a list of (block_hash, height, prev_block_hash) tuples building on top of each other
+    headers = []
+    for i in range(n_blocks):
+        block_hash = get_random_value_hex(32)
+        headers.append((block_hash, height + i, prev_block_hash))
+        prev_block_hash = block_hash
+
+    return headers
+
+
+def test_init():
+    header_index = HeaderIndex(max_size=10)
+
+    assert len(header_index) == 0
+    assert header_index.tip is None and header_index.tip_height is None
+    assert header_index.max_size == 10
+
+
+def test_connect():
+    header_index = HeaderIndex()
+    chain = build_chain(10)
+
+    # Headers can be connected in bulk or one by one
+    header_index.connect(chain[:5])
+    for header in chain[5:]:
+        header_index.connect([header])
+
+    assert len(header_index) == 10
+    assert header_index.tip == chain[-1][0] and header_index.tip_height == 9
+    assert all(header_index.is_in_best_chain(block_hash) for block_hash, _, _ in chain)
+    assert [header_index.get_height(block_hash) for block_hash, _, _ in chain] == list(range(10))
+
+
+def test_connect_not_connected():
+    # If a header does not build on top of the index, the index is restarted
+    header_index = HeaderIndex()
+    header_index.connect(build_chain(10))
+
+    chain = build_chain(3, prev_block_hash=get_random_value_hex(32), height=20)
+    header_index.connect(chain)
+
+    assert len(header_index) == 3
+    assert header_index.tip == chain[-1][0]
+    assert header_index.get_best_chain_after(chain[0][0]) == [block_hash for block_hash, _, _ in chain[1:]]
+
+
+def test_connect_prunes():
+    # Only the last max_size blocks under the tip are kept
+    header_index = HeaderIndex(max_size=5)
+    chain = build_chain(10)
+
+    for header in chain:
+        header_index.connect([header])
+
+    assert len(header_index) == 5
+    assert all(block_hash not in header_index for block_hash, _, _ in chain[:5])
+    assert all(block_hash in header_index for block_hash, _, _ in chain[5:])
+    assert set(header_index.best_chain.keys()) == set(range(5, 10))
+
+
+def test_connect_prunes_forks():
+    # Forked out headers are pruned by height too
+    header_index = HeaderIndex(max_size=5)
+    chain = build_chain(5)
+    header_index.connect(chain)
+    fork = build_chain(2, prev_block_hash=chain[1][0], height=2)
+    header_index.connect(fork)
+    header_index.connect([chain[-1]])
+
+    for header in build_chain(5, prev_block_hash=chain[-1][0], height=5):
+        header_index.connect([header])
+
+    assert all(block_hash not in header_index for block_hash, _, _ in chain + fork)
+    assert set(header_index.heights.keys()) == set(header_index.best_chain.keys()) == set(range(5, 10))
+
+
+def test_reorg():
+    header_index = HeaderIndex()
+    chain = build_chain(10)
+    header_index.connect(chain)
+
+    # Fork the chain three blocks under the tip with a longer branch
+    ancestor = chain[6]
+    fork = build_chain(5, prev_block_hash=ancestor[0], height=ancestor[1] + 1)
+    for header in fork:
+        header_index.connect([header])
+
+    assert header_index.tip == fork[-1][0]
+    assert all(not header_index.is_in_best_chain(block_hash) for block_hash, _, _ in chain[7:])
+    assert all(header_index.is_in_best_chain(block_hash) for block_hash, _, _ in chain[:7] + fork)
+
+    # The fork point and the forked out blocks can be found from any of the old blocks
+    assert header_index.find_fork_point(chain[-1][0]) == (ancestor[0], [chain[9][0], chain[8][0], chain[7][0]])
+    assert header_index.find_fork_point(ancestor[0]) == (ancestor[0], [])
+
+    # Distances are computed from the new tip, even for forked out blocks
+    assert header_index.get_distance_to_tip(fork[-1][0]) == 0
+    assert header_index.get_distance_to_tip(chain[-1][0]) == 2
+
+    # Reorging back to a shorter chain is also possible
+    header_index.connect([chain[-1]])
+    assert header_index.tip == chain[-1][0] and header_index.tip_height == 9
+    assert all(not header_index.is_in_best_chain(block_hash) for block_hash, _, _ in fork)
+    assert max(header_index.best_chain) == 9
+
+
+def test_unknown_blocks():
+    # Queries about blocks that are not indexed cannot be answered
+    header_index = HeaderIndex()
+    header_index.connect(build_chain(10))
+    unknown_block_hash = get_random_value_hex(32)
+
+    assert header_index.is_in_best_chain(unknown_block_hash) is None
+    assert header_index.get_distance_to_tip(unknown_block_hash) is None
+    assert header_index.find_fork_point(unknown_block_hash) is None
+    assert header_index.get_best_chain_after(unknown_block_hash) is None
+
+
+def test_get_best_chain_after():
+    header_index = HeaderIndex()
+    chain = build_chain(10)
+    header_index.connect(chain)
+
+    assert header_index.get_best_chain_after(chain[4][0]) == [block_hash for block_hash, _, _ in chain[5:]]
+    assert header_index.get_best_chain_after(chain[-1][0]) == []
+
+    # Forked out blocks are not followed
+    fork = build_chain(2, prev_block_hash=chain[-2][0], height=9)
+    header_index.connect(fork)
+    assert header_index.get_best_chain_after(chain[-1][0]) is None
+
+
+def test_persistence(db_manager):
+    header_index = HeaderIndex(max_size=5, db_manager=db_manager)
+    chain = build_chain(8)
+    for header in chain:
+        header_index.connect([header])
+    fork = build_chain(2, prev_block_hash=chain[-3][0], height=6)
+    header_index.connect(fork)
+
+    # The index can be rebuilt from the database, including the pruning and the fork
+    loaded_index = HeaderIndex(max_size=5, db_manager=db_manager)
+    assert loaded_index.headers == header_index.headers
+    assert loaded_index.best_chain == header_index.best_chain
+    assert loaded_index.tip == fork[-1][0]
+    assert len(db_manager.load_headers()) == len(header_index)
+
+
+def test_persistence_no_tip(db_manager):
+    # Headers with no stored tip cannot be trusted, so they are wiped
+    db_manager.store_headers({get_random_value_hex(32): [1, get_random_value_hex(32)]})
+
+    header_index = HeaderIndex(db_manager=db_manager)
+    assert len(header_index) == 0
+    assert db_manager.load_headers() == {}
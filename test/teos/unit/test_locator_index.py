@@ -0,0 +1,151 @@
+import pytest
+import shutil
+
+from teos.block_processor import Block
+from teos.locator_index import LocatorIndex, LocatorFilter, LOCATOR_PREFIX, BLOCK_PREFIX
+from teos.constants import (
+    LOCATOR_INDEX_SEGMENT_SIZE,
+    LOCATOR_INDEX_TXS_PER_BLOCK,
+    LOCATOR_INDEX_FALSE_POSITIVE_RATE,
+)
+
+from common.tools import compute_locator
+
+from test.teos.unit.conftest import get_random_value_hex
+
+WINDOW = 2 * LOCATOR_INDEX_SEGMENT_SIZE
+
+
+@pytest.fixture
+def locator_index(db_name="test_locator_index_db"):
+    index = LocatorIndex(db_name, WINDOW)
+
+    yield index
+
+    index.close()
+    shutil.rmtree(db_name)
+
+
+def build_block(height, prev_block_hash=None, n_txs=3):
+    return Block(get_random_value_hex(32), height, prev_block_hash, [get_random_value_hex(32) for _ in range(n_txs)])
+
+
+def add_blocks(locator_index, n_blocks, start_height=0):
+    blocks = []
+    prev_block_hash = None
+    for height in range(start_height, start_height + n_blocks):
+        block = build_block(height, prev_block_hash)
+        locator_index.add_block(block)
+        blocks.append(block)
+        prev_block_hash = block.hash
+
+    return blocks
+
+
+def test_locator_filter():
+    locator_filter = LocatorFilter(2 ** 16)
+    locators = [bytes.fromhex(compute_locator(get_random_value_hex(32))) for _ in range(100)]
+    for locator in locators:
+        locator_filter.add(locator)
+
+    # No false negatives
+    assert all(locator in locator_filter for locator in locators)
+
+    # False positives are possible but must be rare
+    others = [bytes.fromhex(compute_locator(get_random_value_hex(32))) for _ in range(1000)]
+    assert sum(locator in locator_filter for locator in others) < 10
+
+    with pytest.raises(ValueError):
+        LocatorFilter(1000)
+
+
+def test_locator_filter_get_size():
+    # Filters are sized (as a power of two) so their false positive rate is at most the requested one
+    size = LocatorFilter.get_size(1000, 0.01)
+    assert size & (size - 1) == 0
+    assert LocatorFilter.get_size(1000, 0.001) > size and LocatorFilter.get_size(2000, 0.01) > size
+
+    locator_filter = LocatorFilter(size)
+    for _ in range(1000):
+        locator_filter.add(bytes.fromhex(compute_locator(get_random_value_hex(32))))
+
+    others = [bytes.fromhex(compute_locator(get_random_value_hex(32))) for _ in range(10000)]
+    assert sum(locator in locator_filter for locator in others) < 200
+
+
+def test_filter_size(locator_index):
+    # Every lookup checks all the segments, so bigger windows need bigger filters to keep the same false positive rate
+    assert locator_index.filter_size == LocatorFilter.get_size(
+        LOCATOR_INDEX_SEGMENT_SIZE * LOCATOR_INDEX_TXS_PER_BLOCK,
+        LOCATOR_INDEX_FALSE_POSITIVE_RATE / (WINDOW // LOCATOR_INDEX_SEGMENT_SIZE + 2),
+    )
+
+    add_blocks(locator_index, 1)
+    assert len(locator_index.filters[0].bits) * 8 == locator_index.filter_size
+
+
+def test_init(locator_index):
+    assert locator_index.window == WINDOW
+    assert locator_index.filters == {}
+    assert locator_index.tip_height is None
+
+
+def test_init_wrong_path():
+    with pytest.raises(ValueError):
+        LocatorIndex(None, WINDOW)
+
+
+def test_add_block_get_txid(locator_index):
+    blocks = add_blocks(locator_index, 10)
+
+    assert locator_index.tip_height == 9
+    for block in blocks:
+        for locator, txid in block.locator_txid_map.items():
+            assert locator_index.get_txid(locator) == txid
+
+    assert locator_index.get_txid(compute_locator(get_random_value_hex(32))) is None
+
+
+def test_add_block_prunes(locator_index):
+    # Blocks that fall out of the window are pruned from the db, and so are the prefilters of the segments they were in
+    n_blocks = WINDOW + LOCATOR_INDEX_SEGMENT_SIZE + 10
+    blocks = add_blocks(locator_index, n_blocks)
+
+    for block in blocks[: n_blocks - WINDOW]:
+        assert all(locator_index.get_txid(locator) is None for locator in block.locator_txid_map)
+    for block in blocks[n_blocks - WINDOW :]:  # noqa: E203
+        assert all(locator_index.get_txid(locator) == txid for locator, txid in block.locator_txid_map.items())
+
+    assert len(list(locator_index.db.iterator(prefix=BLOCK_PREFIX))) == WINDOW
+    assert len(list(locator_index.db.iterator(prefix=LOCATOR_PREFIX))) == 3 * WINDOW
+    assert min(locator_index.filters) == (n_blocks - WINDOW) // LOCATOR_INDEX_SEGMENT_SIZE
+
+
+def test_add_block_reorg(locator_index):
+    blocks = add_blocks(locator_index, 10)
+
+    # Adding a block at an already indexed height removes the indexed blocks from that height onwards
+    fork_block = build_block(7, blocks[6].hash)
+    locator_index.add_block(fork_block)
+
+    assert locator_index.tip_height == 7
+    for block in blocks[7:]:
+        assert all(locator_index.get_txid(locator) is None for locator in block.locator_txid_map)
+    for block in blocks[:7] + [fork_block]:
+        assert all(locator_index.get_txid(locator) == txid for locator, txid in block.locator_txid_map.items())
+
+
+def test_reload(db_name="test_locator_index_reload_db"):
+    # The prefilters are not persisted, they are rebuilt from the db when the index is loaded
+    locator_index = LocatorIndex(db_name, WINDOW)
+    blocks = add_blocks(locator_index, 10)
+    locator_index.close()
+
+    loaded_index = LocatorIndex(db_name, WINDOW)
+    assert loaded_index.tip_height == 9
+    assert loaded_index.filters.keys() == locator_index.filters.keys()
+    for block in blocks:
+        assert all(loaded_index.get_txid(locator) == txid for locator, txid in block.locator_txid_map.items())
+
+    loaded_index.close()
+    shutil.rmtree(db_name)
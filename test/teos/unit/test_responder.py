@@ -7,6 +7,7 @@ from copy import deepcopy
 from threading import Thread
 
 from teos.gatekeeper import UserInfo, Gatekeeper as RealGatekeeper
+from teos.carrier import Receipt
 from teos.responder import Responder, TransactionTracker, CONFIRMATIONS_BEFORE_RETRY
 
 from common.constants import LOCATOR_LEN_HEX
@@ -99,8 +100,11 @@ def test_init_responder(responder):
     # shouldn't matter
     assert isinstance(responder.trackers, dict) and len(responder.trackers) == 0
     assert isinstance(responder.tx_tracker_map, dict) and len(responder.tx_tracker_map) == 0
-    assert isinstance(responder.unconfirmed_txs, list) and len(responder.unconfirmed_txs) == 0
-    assert isinstance(responder.missed_confirmations, dict) and len(responder.missed_confirmations) == 0
+    assert isinstance(responder.unconfirmed_txs, set) and len(responder.unconfirmed_txs) == 0
+    assert isinstance(responder.unconfirmed_since, dict) and len(responder.unconfirmed_since) == 0
+    assert isinstance(responder.rebroadcast_index, dict) and len(responder.rebroadcast_index) == 0
+    assert responder.confirmations_before_retry == CONFIRMATIONS_BEFORE_RETRY
+    assert responder.mempool_check_interval == 0 and not responder.mempool_check_stop.is_set()
     assert isinstance(responder.block_queue, Queue) and responder.block_queue.empty()
     assert isinstance(responder.db_manager, AppointmentsDBM)
     assert isinstance(responder.gatekeeper, Gatekeeper)
@@ -165,6 +169,62 @@ def test_handle_breach_bad_response(responder, generate_dummy_tracker, monkeypat
     assert receipt.delivered is False
 
 
+def test_handle_breach_async(responder, generate_dummy_tracker, monkeypatch):
+    tracker = generate_dummy_tracker()
+    uuid = uuid4().hex
+
+    # The intent is stored before handing the penalty to the Carrier, and deleted once the receipt has been handled
+    stored_intents = []
+    monkeypatch.setattr(
+        responder.carrier,
+        "send_transaction",
+        lambda *args: stored_intents.append(dict(responder.db_manager.broadcast_intents)) or mock_receipt_true(),
+    )
+
+    future = responder.handle_breach_async(
+        uuid,
+        tracker.locator,
+        tracker.dispute_txid,
+        tracker.penalty_txid,
+        tracker.penalty_rawtx,
+        tracker.user_id,
+        get_random_value_hex(32),
+    )
+
+    # The receipt is only handled once someone waits for it, and only once
+    future.future.result()
+    assert uuid not in responder.trackers and uuid in responder.db_manager.broadcast_intents
+
+    assert future.result().delivered is True
+    assert uuid in stored_intents[0]
+    assert uuid in responder.trackers
+    assert uuid not in responder.db_manager.broadcast_intents
+
+    monkeypatch.setattr(responder, "add_tracker", lambda *args: pytest.fail("The receipt was handled twice"))
+    assert future.result().delivered is True
+
+
+def test_replay_broadcast_intents(responder, generate_dummy_tracker, monkeypatch):
+    monkeypatch.setattr(responder.carrier, "send_transaction", mock_receipt_true)
+
+    # Intents of breaches that are already tracked are just dropped, the rest are handled again
+    tracked_uuid = uuid4().hex
+    pending_uuid = uuid4().hex
+    for uuid in [tracked_uuid, pending_uuid]:
+        tracker = generate_dummy_tracker()
+        intent = tracker.to_dict()
+        intent["block_hash"] = get_random_value_hex(32)
+        responder.db_manager.store_broadcast_intent(uuid, intent)
+
+    responder.trackers[tracked_uuid] = generate_dummy_tracker().get_summary()
+    responder.replay_broadcast_intents()
+
+    assert pending_uuid in responder.trackers
+    assert pending_uuid in responder.db_manager.triggered_appointments
+    assert tracked_uuid not in responder.db_manager.triggered_appointments
+    assert responder.db_manager.load_broadcast_intents() == {}
+
+
 def test_add_tracker(responder, generate_dummy_tracker):
     # Test adding trackers to the Responder. Notice that adding trackers is guarded by handle_breach, meaning that, for
     # the sake of the test, we can add data assuming it has already been checked.
@@ -250,8 +310,10 @@ def test_add_tracker_already_confirmed(responder, generate_dummy_tracker):
             confirmations,
         )
 
-        # In this case the tracker won't be added to the unconfirmed transactions list
+        # In this case the tracker won't be added to the unconfirmed transactions list. The penalty is located using
+        # the block that included it once the completed trackers are checked
         assert tracker.penalty_txid not in responder.unconfirmed_txs
+        assert tracker.penalty_txid in responder.unlocated_penalties
         assert (
             responder.trackers[uuid].get("penalty_txid") == tracker.penalty_txid
             and responder.trackers[uuid].get("locator") == tracker.locator
@@ -324,8 +386,8 @@ def test_do_watch(responder, user_dbm_mock, generate_dummy_tracker, monkeypatch)
         CONFIRMATIONS_BEFORE_RETRY - 1, blocks, responder.block_queue, prev_block_hash=responder.last_known_block
     )
     # Check that the transactions have been just rebroadcast
-    for _, conf in responder.missed_confirmations.items():
-        assert conf == 0
+    for tx in responder.unconfirmed_txs:
+        assert responder.get_missed_confirmations(tx, responder.last_known_height) == 0
 
     #  Add one more block containing the unconfirmed transactions that were just broadcast
     mock_generate_blocks(1, blocks, responder.block_queue, prev_block_hash=responder.last_known_block, txs=rest_txs)
@@ -334,7 +396,7 @@ def test_do_watch(responder, user_dbm_mock, generate_dummy_tracker, monkeypatch)
 
     # Generating 100 - CONFIRMATIONS_BEFORE_RETRY -2 additional blocks should complete the first 5 trackers
     # This can be simulated mocking Responder.get_completed_trackers
-    monkeypatch.setattr(responder, "get_completed_trackers", lambda: trackers_uuids[:5])
+    monkeypatch.setattr(responder, "get_completed_trackers", lambda height: trackers_uuids[:5])
     # Generate a block to force the update
     mock_generate_blocks(1, blocks, responder.block_queue, prev_block_hash=responder.last_known_block)
 
@@ -358,7 +420,7 @@ def test_do_watch(responder, user_dbm_mock, generate_dummy_tracker, monkeypatch)
     assert set(trackers_uuids[5:]).issubset(db_appointments)
 
     # CONFIRMATIONS_BEFORE_RETRY additional blocks should complete the rest
-    monkeypatch.setattr(responder, "get_completed_trackers", lambda: trackers_uuids[5:])
+    monkeypatch.setattr(responder, "get_completed_trackers", lambda height: trackers_uuids[5:])
     # Generate a block to force the update
     mock_generate_blocks(1, blocks, responder.block_queue, prev_block_hash=responder.last_known_block)
 
@@ -390,46 +452,53 @@ def test_check_confirmations(responder, monkeypatch):
     }
 
     # Mock the structures
-    monkeypatch.setattr(responder, "unconfirmed_txs", unconfirmed_txs)
     monkeypatch.setattr(responder, "tx_tracker_map", tx_tracker_map)
+    for txid in unconfirmed_txs:
+        responder.add_unconfirmed_tx(txid, 100)
 
     # Let's make sure that there are no txs with missed confirmations yet
-    assert len(responder.missed_confirmations) == 0
+    for txid in unconfirmed_txs:
+        assert responder.get_missed_confirmations(txid, 100) == 0
 
     # After checking confirmations the txs in txs_subset should be confirmed (not part of unconfirmed_txs anymore)
     # and the rest should have a missing confirmation
-    responder.check_confirmations(txs)
+    responder.check_confirmations(txs, 101)
 
     for tx in txs_subset:
-        assert tx not in responder.unconfirmed_txs
+        assert tx not in responder.unconfirmed_txs and tx not in responder.unconfirmed_since
+        assert responder.inclusion_heights[tx] == 101
 
+    assert len(responder.unconfirmed_txs) == 10
     for tx in responder.unconfirmed_txs:
-        assert responder.missed_confirmations[tx] == 1
+        assert responder.get_missed_confirmations(tx, 101) == 1
+
+    # Only the unconfirmed transactions are left in the rebroadcast index
+    assert responder.rebroadcast_index == {100 + CONFIRMATIONS_BEFORE_RETRY: responder.unconfirmed_txs}
 
 
-def test_get_txs_to_rebroadcast(responder, monkeypatch):
+def test_get_txs_to_rebroadcast(responder):
     # Transactions are flagged to be rebroadcast once they've missed 6 confirmations.
-    # Let's create a few fake txids and assign at least 6 missing confirmations to each
-    txs_missing_too_many_conf = {get_random_value_hex(32): 6 + i for i in range(10)}
+    # Let's create a few fake txids broadcast at different heights
+    height = 100
+    txs_missing_too_many_conf = [get_random_value_hex(32) for _ in range(10)]
+    for i, txid in enumerate(txs_missing_too_many_conf):
+        responder.add_unconfirmed_tx(txid, height - CONFIRMATIONS_BEFORE_RETRY - i)
 
     # Let's create some other transaction that has missed some confirmations but not that many
-    txs_missing_some_conf = {get_random_value_hex(32): 3 for _ in range(10)}
-
-    # All the txs in the first dict should be flagged as to_rebroadcast
-    monkeypatch.setattr(responder, "missed_confirmations", txs_missing_too_many_conf)
+    txs_missing_some_conf = [get_random_value_hex(32) for _ in range(10)]
+    for txid in txs_missing_some_conf:
+        responder.add_unconfirmed_tx(txid, height - 3)
 
-    txs_to_rebroadcast = responder.get_txs_to_rebroadcast()
-    assert txs_to_rebroadcast == list(txs_missing_too_many_conf.keys())
+    # Only the txs in the first list should be flagged as to_rebroadcast
+    txs_to_rebroadcast = responder.get_txs_to_rebroadcast(height)
+    assert set(txs_to_rebroadcast) == set(txs_missing_too_many_conf)
 
-    # Non of the txs in the second dict should be flagged
-    monkeypatch.setattr(responder, "missed_confirmations", txs_missing_some_conf)
-    txs_to_rebroadcast = responder.get_txs_to_rebroadcast()
-    assert txs_to_rebroadcast == []
+    # None of them are flagged in earlier blocks
+    assert responder.get_txs_to_rebroadcast(height - CONFIRMATIONS_BEFORE_RETRY - 10) == []
 
-    # Let's check that it also works with a mixed dict
-    txs_missing_some_conf.update(txs_missing_too_many_conf)
-    txs_to_rebroadcast = responder.get_txs_to_rebroadcast()
-    assert txs_to_rebroadcast == list(txs_missing_too_many_conf.keys())
+    # And all of them are flagged once enough blocks go by
+    txs_to_rebroadcast = responder.get_txs_to_rebroadcast(height + 3)
+    assert set(txs_to_rebroadcast) == set(txs_missing_too_many_conf + txs_missing_some_conf)
 
 
 def test_get_completed_trackers(responder, generate_dummy_tracker, monkeypatch):
@@ -439,47 +508,123 @@ def test_get_completed_trackers(responder, generate_dummy_tracker, monkeypatch):
     # We'll create 3 type of txs: irrevocably resolved, confirmed but not irrevocably resolved, and unconfirmed
     trackers_ir_resolved = {uuid4().hex: generate_dummy_tracker() for _ in range(10)}
     trackers_confirmed = {uuid4().hex: generate_dummy_tracker() for _ in range(10)}
-    ir_resolved_penalties = [tracker.penalty_txid for _, tracker in trackers_ir_resolved.items()]
+    trackers_unconfirmed = {uuid4().hex: generate_dummy_tracker() for _ in range(10)}
 
-    trackers_unconfirmed = {}
-    unconfirmed_txs = []
-    for commitment_tx in range(10):
-        tracker = generate_dummy_tracker()
-        unconfirmed_txs.append(tracker.penalty_txid)
-        trackers_unconfirmed[uuid4().hex] = tracker
+    for trackers in [trackers_ir_resolved, trackers_confirmed, trackers_unconfirmed]:
+        for uuid, tracker in trackers.items():
+            responder.add_tracker(
+                uuid,
+                tracker.locator,
+                tracker.dispute_txid,
+                tracker.penalty_txid,
+                tracker.penalty_rawtx,
+                tracker.user_id,
+            )
 
-    # Get all the trackers summary to add the to the Responder
-    all_trackers_summary = {}
-    all_trackers_summary.update(trackers_ir_resolved)
-    all_trackers_summary.update(trackers_confirmed)
-    all_trackers_summary.update(trackers_unconfirmed)
-    for uuid, tracker in all_trackers_summary.items():
-        all_trackers_summary[uuid] = tracker.get_summary()
+    # The penalties are included in blocks 100 (irrevocably resolved at 199) and 101 (irrevocably resolved at 200)
+    responder.check_confirmations([tracker.penalty_txid for tracker in trackers_ir_resolved.values()], 100)
+    responder.check_confirmations([tracker.penalty_txid for tracker in trackers_confirmed.values()], 101)
 
-    # Mock the data in the Responder
-    monkeypatch.setattr(responder, "unconfirmed_txs", unconfirmed_txs)
-    monkeypatch.setattr(responder, "trackers", all_trackers_summary)
-    monkeypatch.setattr(
-        responder.carrier,
-        "get_transaction",
-        lambda x: {"confirmations": 100} if x in ir_resolved_penalties else {"confirmations": 99},
-    )
+    # Confirmations are computed from the inclusion height, so bitcoind is not queried
+    monkeypatch.setattr(responder.carrier, "get_transactions", lambda txids: pytest.fail("bitcoind was queried"))
+
+    assert responder.get_completed_trackers(198) == []
 
-    # Let's check
-    completed_trackers = responder.get_completed_trackers()
+    completed_trackers = responder.get_completed_trackers(199)
     ended_trackers_keys = list(trackers_ir_resolved.keys())
     assert set(completed_trackers) == set(ended_trackers_keys)
 
     # Generating 1 additional blocks should also include confirmed
+    completed_trackers = responder.get_completed_trackers(200)
+    ended_trackers_keys.extend(list(trackers_confirmed.keys()))
+    assert set(completed_trackers) == set(ended_trackers_keys)
+
+
+def test_get_completed_trackers_unlocated(responder, generate_dummy_tracker, monkeypatch):
+    # Penalties whose inclusion height is unknown (e.g. loaded from the database or after a reorg) are looked up once
+    trackers_ir_resolved = {uuid4().hex: generate_dummy_tracker() for _ in range(10)}
+    trackers_confirmed = {uuid4().hex: generate_dummy_tracker() for _ in range(10)}
+    trackers_in_mempool = {uuid4().hex: generate_dummy_tracker() for _ in range(10)}
+    ir_resolved_penalties = [tracker.penalty_txid for tracker in trackers_ir_resolved.values()]
+    mempool_penalties = [tracker.penalty_txid for tracker in trackers_in_mempool.values()]
+
+    for trackers in [trackers_ir_resolved, trackers_confirmed, trackers_in_mempool]:
+        for uuid, tracker in trackers.items():
+            responder.add_tracker(
+                uuid,
+                tracker.locator,
+                tracker.dispute_txid,
+                tracker.penalty_txid,
+                tracker.penalty_rawtx,
+                tracker.user_id,
+            )
+
+    # Simulate a bootstrap, where nothing is known about the penalties
+    for txid in list(responder.unconfirmed_txs):
+        responder.remove_unconfirmed_tx(txid)
+    responder.reset_inclusion_heights()
+    assert len(responder.unlocated_penalties) == 30
+
+    queried = []
+    block_heights = {get_random_value_hex(32): 901, get_random_value_hex(32): 902}
+    ir_resolved_block, confirmed_block = block_heights.keys()
+
+    def get_transactions(txids):
+        queried.extend(txids)
+        return {
+            txid: {}
+            if txid in mempool_penalties
+            else {"blockhash": ir_resolved_block, "confirmations": 100}
+            if txid in ir_resolved_penalties
+            else {"blockhash": confirmed_block, "confirmations": 99}
+            for txid in txids
+        }
+
+    monkeypatch.setattr(responder.carrier, "get_transactions", get_transactions)
+    monkeypatch.setattr(
+        responder.block_processor, "get_block_heights", lambda hashes: {h: block_heights.get(h) for h in hashes}
+    )
+
+    completed_trackers = responder.get_completed_trackers(1000)
+    assert set(completed_trackers) == set(trackers_ir_resolved.keys())
+    assert len(queried) == 30
+
+    # The penalties in the mempool are unconfirmed, and the rest are not queried anymore
+    assert set(responder.unconfirmed_txs) == set(mempool_penalties)
+    assert len(responder.unlocated_penalties) == 0
+    completed_trackers = responder.get_completed_trackers(1001)
+    assert set(completed_trackers) == set(trackers_ir_resolved.keys()).union(trackers_confirmed.keys())
+    assert len(queried) == 30
+
+
+def test_get_completed_trackers_bitcoind_ahead(responder, generate_dummy_tracker, monkeypatch):
+    # The inclusion height of penalties already on chain is taken from their block, not from their confirmation count,
+    # since bitcoind may be ahead of the last received block
+    tracker = generate_dummy_tracker()
+    uuid = uuid4().hex
+    block_hash = get_random_value_hex(32)
+    responder.add_tracker(
+        uuid, tracker.locator, tracker.dispute_txid, tracker.penalty_txid, tracker.penalty_rawtx, tracker.user_id, 100
+    )
+
+    # The penalty was included at height 900, and bitcoind is already at 1009 while the last received block is 998
     monkeypatch.setattr(
         responder.carrier,
-        "get_transaction",
-        lambda x: {"confirmations": 101} if x in ir_resolved_penalties else {"confirmations": 100},
+        "get_transactions",
+        lambda txids: {txid: {"blockhash": block_hash, "confirmations": 110} for txid in txids},
     )
+    monkeypatch.setattr(responder.block_processor, "get_block_heights", lambda hashes: {block_hash: 900})
+    monkeypatch.setattr(responder.block_processor, "get_tip_height", lambda: 998)
 
-    completed_trackers = responder.get_completed_trackers()
-    ended_trackers_keys.extend(list(trackers_confirmed.keys()))
-    assert set(completed_trackers) == set(ended_trackers_keys)
+    assert responder.get_completed_trackers(998) == []
+    assert responder.inclusion_heights[tracker.penalty_txid] == 900
+    assert responder.get_completed_trackers(999) == [uuid]
+
+    # Penalties whose block cannot be found are checked again in the next block
+    responder.reset_inclusion_heights()
+    monkeypatch.setattr(responder.block_processor, "get_block_heights", lambda hashes: {block_hash: None})
+    assert responder.get_completed_trackers(999) == []
+    assert tracker.penalty_txid in responder.unlocated_penalties
 
 
 def test_get_outdated_trackers(responder, generate_dummy_tracker, monkeypatch):
@@ -490,7 +635,7 @@ def test_get_outdated_trackers(responder, generate_dummy_tracker, monkeypatch):
     outdated_unconfirmed_trackers = {}
     outdated_unconfirmed_trackers_next = {}
     outdated_confirmed_trackers = {}
-    unconfirmed_txs = []
+    unconfirmed_txs = set()
 
     for i in range(20):
         uuid = uuid4().hex
@@ -499,10 +644,10 @@ def test_get_outdated_trackers(responder, generate_dummy_tracker, monkeypatch):
         # Make 10 of them confirmed and 10 of them unconfirmed expiring next block and 10 unconfirmed expiring in two
         if i % 3:
             outdated_unconfirmed_trackers[uuid] = dummy_tracker
-            unconfirmed_txs.append(dummy_tracker.penalty_txid)
+            unconfirmed_txs.add(dummy_tracker.penalty_txid)
         elif i % 2:
             outdated_unconfirmed_trackers_next[uuid] = dummy_tracker
-            unconfirmed_txs.append(dummy_tracker.penalty_txid)
+            unconfirmed_txs.add(dummy_tracker.penalty_txid)
         else:
             outdated_confirmed_trackers[uuid] = dummy_tracker
 
@@ -568,12 +713,194 @@ def test_rebroadcast(responder, generate_dummy_tracker, monkeypatch):
     monkeypatch.setattr(responder.carrier, "send_transaction", mock_receipt_true)
 
     # Call rebroadcast and and check
-    receipts = responder.rebroadcast(txs_to_rebroadcast)
+    receipts = responder.rebroadcast(txs_to_rebroadcast, 100)
     # All txs should have been delivered and the missed confirmation reset
     for txid, receipt in receipts:
         assert receipt.delivered
         assert txid in txs_to_rebroadcast
-        assert responder.missed_confirmations[txid] == 0
+        assert responder.get_missed_confirmations(txid, 100) == 0
+
+
+def test_rebroadcast_batched(responder, generate_dummy_tracker, monkeypatch):
+    # The trackers are loaded and their penalties sent in batches. Penalties shared by several trackers are only sent
+    # once, but receipts are still reported per tracker
+    trackers = {uuid4().hex: generate_dummy_tracker() for _ in range(10)}
+    trackers[uuid4().hex] = deepcopy(list(trackers.values())[0])
+    rejected_penalty = list(trackers.values())[1].penalty_txid
+
+    for uuid, tracker in trackers.items():
+        responder.add_tracker(
+            uuid, tracker.locator, tracker.dispute_txid, tracker.penalty_txid, tracker.penalty_rawtx, tracker.user_id
+        )
+
+    sent = []
+    monkeypatch.setattr(
+        responder.db_manager, "load_responder_tracker", lambda uuid: pytest.fail("trackers were loaded one by one")
+    )
+    monkeypatch.setattr(
+        responder.carrier,
+        "send_transactions",
+        lambda txs: sent.append(txs) or {txid: Receipt(delivered=txid != rejected_penalty) for txid in txs},
+    )
+
+    txs_to_rebroadcast = list(responder.tx_tracker_map.keys())
+    receipts = responder.rebroadcast(txs_to_rebroadcast, 100)
+
+    assert len(sent) == 1 and set(sent[0].keys()) == set(txs_to_rebroadcast)
+    assert len(receipts) == len(trackers)
+    for txid, receipt in receipts:
+        assert receipt.delivered is (txid != rejected_penalty)
+
+
+def test_handle_reorgs(responder, generate_dummy_tracker, monkeypatch):
+    # After a reorg the trackers are checked (and reset if needed) in a few batches, no matter how many there are
+    trackers = {uuid4().hex: generate_dummy_tracker() for _ in range(40)}
+    for uuid, tracker in trackers.items():
+        responder.add_tracker(
+            uuid, tracker.locator, tracker.dispute_txid, tracker.penalty_txid, tracker.penalty_rawtx, tracker.user_id
+        )
+
+    # A quarter of the trackers have their penalty confirmed, a quarter in the mempool, a quarter banished (half of
+    # them cannot be sent again) and the last quarter lost their dispute
+    tracker_list = list(trackers.values())
+    confirmed, in_mempool, banished, lost = [tracker_list[i::4] for i in range(4)]
+    rejected_penalties = {tracker.penalty_txid for tracker in banished[::2]}
+    known_txs = {tracker.dispute_txid: {"confirmations": 1} for tracker in confirmed + in_mempool + banished}
+    known_txs.update({tracker.penalty_txid: {"confirmations": 1} for tracker in confirmed})
+    known_txs.update({tracker.penalty_txid: {} for tracker in in_mempool})
+
+    # The confirmed and banished penalties were on chain before the reorg
+    for tracker in confirmed + banished:
+        responder.remove_unconfirmed_tx(tracker.penalty_txid)
+
+    queried = []
+    sent = []
+    monkeypatch.setattr(responder, "on_sync", lambda block_hash: True)
+    monkeypatch.setattr(
+        responder.carrier,
+        "get_transactions",
+        lambda txids: queried.append(txids) or {txid: known_txs.get(txid) for txid in txids},
+    )
+    monkeypatch.setattr(
+        responder.carrier,
+        "send_transactions",
+        lambda txs: sent.append(txs) or {txid: Receipt(delivered=txid not in rejected_penalties) for txid in txs},
+    )
+
+    responder.handle_reorgs(get_random_value_hex(32))
+
+    # The disputes and the penalties are queried in one batch each, and the banished penalties sent in another
+    assert len(queried) == 2 and len(sent) == 1
+    assert set(sent[0].keys()) == {tracker.penalty_txid for tracker in banished}
+
+    # The penalties that are back in the mempool are unconfirmed, and so are the ones that have been sent again
+    for tracker in in_mempool + banished:
+        assert (tracker.penalty_txid in responder.unconfirmed_txs) is (tracker.penalty_txid not in rejected_penalties)
+    for tracker in confirmed:
+        assert tracker.penalty_txid not in responder.unconfirmed_txs
+
+    # All the trackers are kept
+    assert len(responder.trackers) == len(trackers)
+
+
+def test_check_mempool(responder, generate_dummy_tracker, monkeypatch):
+    # Penalties that are no longer in the mempool are rebroadcast straightaway, without waiting for them to miss
+    # confirmations_before_retry blocks
+    trackers = {uuid4().hex: generate_dummy_tracker() for _ in range(10)}
+    for uuid, tracker in trackers.items():
+        responder.add_tracker(
+            uuid, tracker.locator, tracker.dispute_txid, tracker.penalty_txid, tracker.penalty_rawtx, tracker.user_id
+        )
+
+    # Half of them are missing from the mempool, and one of them cannot be checked. One of the missing ones has been
+    # mined in a block that has not been processed yet
+    penalty_txids = [tracker.penalty_txid for tracker in trackers.values()]
+    missing = penalty_txids[:5]
+    evicted = missing[:-1]
+    entries = {txid: None if txid in missing else {"vsize": 141} for txid in penalty_txids[:-1]}
+
+    queried = []
+    monkeypatch.setattr(responder.carrier, "get_mempool_entries", lambda txids: queried.append(txids) or entries)
+    mined_tx = {"blockhash": get_random_value_hex(32)}
+    monkeypatch.setattr(
+        responder.carrier,
+        "get_transactions",
+        lambda txids: {txid: mined_tx if txid == missing[-1] else None for txid in txids},
+    )
+
+    # The penalties are pushed without holding the lock
+    lock_available = []
+
+    def mock_send_transactions(txs, cache_receipt=True):
+        wlock = responder.rw_lock.gen_wlock()
+        lock_available.append(wlock.acquire(blocking=False))
+        wlock.release()
+        return {txid: Receipt(delivered=True) for txid in txs}
+
+    monkeypatch.setattr(responder.carrier, "send_transactions", mock_send_transactions)
+    monkeypatch.setattr(responder, "last_known_height", 100)
+    for txid in penalty_txids:
+        responder.add_unconfirmed_tx(txid, 90)
+
+    receipts = responder.check_mempool()
+
+    assert len(queried) == 1 and set(queried[0]) == set(penalty_txids)
+    assert [txid for txid, _ in receipts] == evicted
+    assert lock_available == [True]
+    for txid in penalty_txids:
+        assert responder.get_missed_confirmations(txid, 100) == (0 if txid in evicted else 10)
+
+    # Nothing is queried if there are no unconfirmed penalties
+    for txid in penalty_txids:
+        responder.remove_unconfirmed_tx(txid)
+    assert responder.check_mempool() == [] and len(queried) == 1
+
+
+def test_do_watch_mempool(responder, monkeypatch):
+    # The mempool is checked periodically until the Responder is stopped
+    checks = []
+    monkeypatch.setattr(responder, "mempool_check_interval", 0.01)
+    monkeypatch.setattr(responder, "check_mempool", lambda: checks.append(1))
+
+    mempool_thread = Thread(target=responder.do_watch_mempool, daemon=True)
+    mempool_thread.start()
+    time.sleep(0.2)
+    responder.mempool_check_stop.set()
+    mempool_thread.join(1)
+
+    assert not mempool_thread.is_alive() and len(checks) > 1
+
+
+def test_block_processing_many_trackers(responder):
+    # The per-block work of the Responder should depend on the size of the block, not on the number of trackers.
+    # Let's load 100k unconfirmed penalties broadcast at different heights and check that processing a block is fast
+    n_trackers = 100000
+    height = 1000
+    penalty_txids = [get_random_value_hex(32) for _ in range(n_trackers)]
+
+    for i, txid in enumerate(penalty_txids):
+        responder.tx_tracker_map[txid] = {uuid4().hex}
+        responder.add_unconfirmed_tx(txid, height - i % (2 * CONFIRMATIONS_BEFORE_RETRY))
+
+    # Each block confirms 100 of the penalties and has 2000 unrelated transactions
+    blocks = [
+        penalty_txids[i * 100 : (i + 1) * 100] + [get_random_value_hex(32) for _ in range(2000)]  # noqa: E203
+        for i in range(10)
+    ]
+
+    start = time.time()
+    for block_txs in blocks:
+        height += 1
+        responder.check_confirmations(block_txs, height)
+        responder.get_completed_trackers(height)
+        responder.get_txs_to_rebroadcast(height)
+    elapsed = (time.time() - start) / len(blocks)
+
+    assert len(responder.unconfirmed_txs) == n_trackers - 1000
+    assert len(responder.inclusion_heights) == 1000
+
+    # The bound is generous so the test is not flaky on slow machines
+    assert elapsed < 0.2
 
 
 # TESTS WITH BITCOIND UNREACHABLE
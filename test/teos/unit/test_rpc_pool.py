@@ -0,0 +1,127 @@
+import pytest
+from threading import Thread
+
+from teos.utils.rpc_pool import RPCConnectionPool
+from teos.utils.auth_proxy import JSONRPCException
+
+from test.teos.unit.conftest import wrong_bitcoind_connect_params
+
+
+@pytest.fixture
+def rpc_pool(fake_bitcoind):
+    pool = RPCConnectionPool(fake_bitcoind.connect_params)
+
+    yield pool
+
+    pool.close()
+
+
+def test_init(fake_bitcoind):
+    # Pool size and timeout can be set using the connection params
+    rpc_pool = RPCConnectionPool(dict(fake_bitcoind.connect_params, BTC_RPC_POOL_SIZE=3, BTC_RPC_TIMEOUT=5))
+
+    assert rpc_pool.max_size == 3
+    assert rpc_pool.timeout == 5
+    assert rpc_pool.stats() == {
+        "calls": 0,
+        "created": 0,
+        "reused": 0,
+        "reconnects": 0,
+        "timeouts": 0,
+        "discarded": 0,
+        "in_use": 0,
+        "idle": 0,
+        "max_size": 3,
+    }
+
+
+def test_call(fake_bitcoind, rpc_pool):
+    # Methods can be called directly on the pool, and they reuse the same (keep-alive) connection
+    block_hashes = fake_bitcoind.mine(10)
+
+    assert rpc_pool.getbestblockhash() == block_hashes[-1]
+    for block_hash in block_hashes:
+        assert rpc_pool.getblock(block_hash).get("hash") == block_hash
+    assert rpc_pool.call("getblockcount") == fake_bitcoind.height
+
+    assert fake_bitcoind.connections == 1
+    stats = rpc_pool.stats()
+    assert stats.get("calls") == 12 and stats.get("created") == 1 and stats.get("reused") == 11
+    assert stats.get("in_use") == 0 and stats.get("idle") == 1
+
+
+def test_call_rpc_error(fake_bitcoind, rpc_pool):
+    # json-rpc errors are raised, but the connection is still reused
+    with pytest.raises(JSONRPCException):
+        rpc_pool.getblockhash(fake_bitcoind.height + 1)
+
+    assert rpc_pool.getblockhash(0) == fake_bitcoind.best_chain[0]
+    assert fake_bitcoind.connections == 1
+    assert rpc_pool.stats().get("discarded") == 0
+
+
+def test_batch(fake_bitcoind, rpc_pool):
+    block_hashes = fake_bitcoind.mine(3)
+    requests = [{"method": "getblock", "params": [block_hash], "id": i} for i, block_hash in enumerate(block_hashes)]
+
+    responses = rpc_pool.batch(requests)
+    assert [response.get("result").get("hash") for response in responses] == block_hashes
+    assert len(fake_bitcoind.http_requests) == 1
+
+
+def test_reconnect_on_reset(fake_bitcoind, rpc_pool):
+    # If bitcoind drops a kept-alive connection, the call is retried over a new one
+    rpc_pool.getbestblockhash()
+
+    # The AuthServiceProxy already retries once by itself, and the pool does it once more if that fails too
+    fake_bitcoind.drop_next_requests = 2
+    assert rpc_pool.getbestblockhash() == fake_bitcoind.best_chain[-1]
+    assert fake_bitcoind.connections == 3
+    assert rpc_pool.stats().get("reconnects") == 1
+
+    # Calls are not retried forever though
+    fake_bitcoind.drop_next_requests = 4
+    with pytest.raises(ConnectionError):
+        rpc_pool.getbestblockhash()
+    assert rpc_pool.stats().get("discarded") == 1
+
+
+def test_call_timeout(fake_bitcoind, rpc_pool):
+    # Calls that time out raise, and the connection is discarded since the response may still come through it
+    fake_bitcoind.response_delay = 0.5
+
+    with pytest.raises(JSONRPCException) as e:
+        rpc_pool.call("getbestblockhash", timeout=0.1)
+    assert e.value.error.get("code") == -344
+
+    stats = rpc_pool.stats()
+    assert stats.get("timeouts") == 1 and stats.get("discarded") == 1 and stats.get("idle") == 0
+
+    # The default timeout is used otherwise
+    assert rpc_pool.getbestblockhash() == fake_bitcoind.best_chain[-1]
+
+
+def test_pool_is_bounded(fake_bitcoind):
+    # No more than max_size connections are opened, even if there are more concurrent callers
+    rpc_pool = RPCConnectionPool(dict(fake_bitcoind.connect_params, BTC_RPC_POOL_SIZE=2))
+    fake_bitcoind.response_delay = 0.1
+    results = []
+
+    threads = [Thread(target=lambda: results.append(rpc_pool.getbestblockhash())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == [fake_bitcoind.best_chain[-1]] * 8
+    assert fake_bitcoind.connections == 2
+    assert rpc_pool.stats().get("created") == 2 and rpc_pool.stats().get("idle") == 2
+
+
+def test_connection_refused():
+    # ConnectionRefusedError is raised, so callers can flag bitcoind as unreachable
+    rpc_pool = RPCConnectionPool(wrong_bitcoind_connect_params)
+
+    with pytest.raises(ConnectionRefusedError):
+        rpc_pool.getbestblockhash()
+    assert rpc_pool.stats().get("in_use") == 0
@@ -1,6 +1,7 @@
 import pytest
 
-from teos.tools import in_correct_network, get_default_rpc_port
+from teos.tools import in_correct_network, get_default_rpc_port, bitcoin_cli_batch
+from teos.utils.rpc_pool import RPCConnectionPool
 
 from common.constants import MAINNET_RPC_PORT, TESTNET_RPC_PORT, REGTEST_RPC_PORT
 
@@ -14,6 +15,26 @@ def test_in_correct_network(run_bitcoind):
     assert in_correct_network(bitcoind_connect_params, "regtest") is True
 
 
+def test_bitcoin_cli_batch(fake_bitcoind):
+    # Every call gets its result (or error) back, in order, and they are sent in batches of up to batch_size calls
+    fake_bitcoind.mine(9)
+    heights = [0, 3, 42, 9, 1]
+
+    rpc = RPCConnectionPool(fake_bitcoind.connect_params)
+    results = bitcoin_cli_batch(rpc, "getblockhash", [[h] for h in heights], batch_size=2)
+
+    expected_hashes = [fake_bitcoind.best_chain[h] if h <= fake_bitcoind.height else None for h in heights]
+    assert [block_hash for block_hash, _ in results] == expected_hashes
+    assert [error is None for _, error in results] == [True, True, False, True, True]
+    assert [len(request) for request in fake_bitcoind.http_requests] == [2, 2, 1]
+
+
+def test_bitcoin_cli_batch_empty(fake_bitcoind):
+    # No request is sent if there is nothing to query
+    assert bitcoin_cli_batch(RPCConnectionPool(fake_bitcoind.connect_params), "getblock", []) == []
+    assert fake_bitcoind.http_requests == []
+
+
 def test_get_default_rpc_port():
     # Not much to be tested here.
     assert get_default_rpc_port("mainnet") is MAINNET_RPC_PORT
@@ -1,6 +1,7 @@
+import json
 import pytest
 import shutil
-from teos.users_dbm import UsersDBM
+from teos.users_dbm import UsersDBM, USER_PREFIX, USER_APPOINTMENT_PREFIX
 from teos.gatekeeper import UserInfo
 
 from test.teos.unit.conftest import get_random_value_hex
@@ -53,6 +54,74 @@ def test_load_user(user_db_manager):
     assert user_db_manager.load_user(user_id) == user_info.to_dict()
 
 
+def test_store_user_replaces_appointments(user_db_manager):
+    # Storing a user replaces the whole record, appointments included
+    user_id = "02" + get_random_value_hex(32)
+    user_info = UserInfo(available_slots=42, subscription_expiry=100, appointments={get_random_value_hex(16): 1})
+    user_db_manager.store_user(user_id, user_info.to_dict())
+
+    user_info = UserInfo(available_slots=40, subscription_expiry=100, appointments={get_random_value_hex(16): 2})
+    user_db_manager.store_user(user_id, user_info.to_dict())
+    assert user_db_manager.load_user(user_id) == user_info.to_dict()
+
+
+def test_update_user(user_db_manager):
+    # Updates write the header and only the given appointments
+    user_id = "02" + get_random_value_hex(32)
+    appointments = {get_random_value_hex(16): 1 for _ in range(10)}
+    user_info = UserInfo(available_slots=42, subscription_expiry=100, appointments=dict(appointments))
+    user_db_manager.store_user(user_id, user_info.to_dict())
+
+    # Add an appointment
+    new_uuid = get_random_value_hex(16)
+    user_info.appointments[new_uuid] = 2
+    user_info.available_slots -= 2
+    assert user_db_manager.update_user(user_id, user_info.to_dict(), appointments={new_uuid: 2}) is True
+    assert user_db_manager.load_user(user_id) == user_info.to_dict()
+
+    # Delete some
+    deleted_uuids = list(appointments)[:5]
+    for uuid in deleted_uuids:
+        user_info.available_slots += user_info.appointments.pop(uuid)
+    assert user_db_manager.update_user(user_id, user_info.to_dict(), deleted_appointments=deleted_uuids) is True
+    assert user_db_manager.load_user(user_id) == user_info.to_dict()
+
+    # Or just update the header
+    user_info.subscription_expiry = 200
+    assert user_db_manager.update_user(user_id, user_info.to_dict()) is True
+    assert user_db_manager.load_user(user_id) == user_info.to_dict()
+
+
+def test_update_user_wrong(user_db_manager):
+    # Wrong pks, types or user data are rejected
+    user_info = UserInfo(available_slots=42, subscription_expiry=100)
+    assert user_db_manager.update_user("04" + get_random_value_hex(32), user_info.to_dict()) is False
+    assert user_db_manager.update_user(42, user_info.to_dict()) is False
+    assert user_db_manager.update_user("02" + get_random_value_hex(32), {"available_slots": 42}) is False
+
+
+def test_batch_update_users(user_db_manager):
+    # Multiple users can be updated at once, deleting some of their appointments
+    users = {}
+    for _ in range(5):
+        user_id = "02" + get_random_value_hex(32)
+        users[user_id] = UserInfo(42, 100, appointments={get_random_value_hex(16): 1 for _ in range(5)})
+        user_db_manager.store_user(user_id, users[user_id].to_dict())
+
+    deleted_appointments = {}
+    for user_id, user_info in users.items():
+        deleted_appointments[user_id] = list(user_info.appointments)[:2]
+        for uuid in deleted_appointments[user_id]:
+            user_info.available_slots += user_info.appointments.pop(uuid)
+
+    user_db_manager.batch_update_users(
+        {user_id: user_info.to_dict() for user_id, user_info in users.items()}, deleted_appointments
+    )
+
+    for user_id, user_info in users.items():
+        assert user_db_manager.load_user(user_id) == user_info.to_dict()
+
+
 def test_load_user_wrong(user_db_manager):
     # Tests that wrong data won't load
 
@@ -82,6 +151,30 @@ def test_delete_user(user_db_manager):
     assert not user_db_manager.load_all_users()
 
 
+def test_delete_user_with_appointments(user_db_manager):
+    # The appointments of the user are deleted alongside the header
+    user_id = "02" + get_random_value_hex(32)
+    user_info = UserInfo(42, 100, appointments={get_random_value_hex(16): 1 for _ in range(10)})
+    user_db_manager.store_user(user_id, user_info.to_dict())
+
+    assert user_db_manager.delete_user(user_id) is True
+    assert user_db_manager.load_user(user_id) is None and user_db_manager.load_user_appointments(user_id) == {}
+    assert not list(user_db_manager.db.iterator())
+
+
+def test_batch_delete_users(user_db_manager):
+    # Multiple users can be deleted at once, alongside their appointments
+    user_ids = ["02" + get_random_value_hex(32) for _ in range(5)]
+    for user_id in user_ids:
+        user_info = UserInfo(42, 100, appointments={get_random_value_hex(16): 1 for _ in range(5)})
+        user_db_manager.store_user(user_id, user_info.to_dict())
+
+    user_db_manager.batch_delete_users(user_ids)
+
+    for user_id in user_ids:
+        assert user_db_manager.load_user(user_id) is None and user_db_manager.load_user_appointments(user_id) == {}
+
+
 def test_delete_user_wrong(user_db_manager):
     # Tests that deleting users with wrong data should fail
 
@@ -109,3 +202,41 @@ def test_load_all_users(user_db_manager):
 
     all_users = user_db_manager.load_all_users()
     assert all_users == stored_users
+
+    # Appointments are loaded too
+    for user_id in stored_users:
+        uuid = get_random_value_hex(16)
+        user_db_manager.update_user(user_id, stored_users[user_id], appointments={uuid: 1})
+        stored_users[user_id]["appointments"][uuid] = 1
+
+    assert user_db_manager.load_all_users() == stored_users
+
+
+def test_migrate_users(user_db_manager):
+    # Users stored using the old layout (a single record keyed by user_id) are migrated when the db is loaded
+    old_users = {}
+    for prefix in ["02", "03"]:
+        for _ in range(5):
+            user_id = prefix + get_random_value_hex(32)
+            user_info = UserInfo(42, 100, appointments={get_random_value_hex(16): 1 for _ in range(5)})
+            old_users[user_id] = user_info.to_dict()
+            user_db_manager.db.put(user_id.encode("utf-8"), json.dumps(user_info.to_dict()).encode("utf-8"))
+
+    assert user_db_manager.migrate_users() == len(old_users)
+    assert user_db_manager.load_all_users() == old_users
+
+    # Only the new layout is left, so running the migration again does nothing
+    prefixes = {k.decode("utf-8")[0] for k in user_db_manager.db.iterator(include_value=False)}
+    assert prefixes == {USER_PREFIX, USER_APPOINTMENT_PREFIX}
+    assert user_db_manager.migrate_users() == 0
+
+    # The migration also runs when the db is opened
+    user_id = "02" + get_random_value_hex(32)
+    user_info = UserInfo(42, 100, appointments={get_random_value_hex(16): 1})
+    user_db_manager.db.put(user_id.encode("utf-8"), json.dumps(user_info.to_dict()).encode("utf-8"))
+    user_db_manager.db.close()
+
+    migrated_db_manager = UsersDBM("test_user_db")
+    assert migrated_db_manager.load_user(user_id) == user_info.to_dict()
+    assert migrated_db_manager.load_all_users() == {**old_users, user_id: user_info.to_dict()}
+    migrated_db_manager.db.close()
@@ -6,10 +6,15 @@ from copy import deepcopy
 from threading import Thread
 from coincurve import PrivateKey
 
+from teos.cleaner import Cleaner
+from teos.builder import Builder
 from teos.carrier import Receipt
+from teos.chain_monitor import ChainMonitor
+from teos.extended_appointment import ExtendedAppointment
 from teos.gatekeeper import UserInfo, AuthenticationFailure, NotEnoughSlots, SubscriptionExpired
 from teos.watcher import (
     Watcher,
+    MempoolCache,
     AppointmentLimitReached,
     LocatorCache,
     EncryptionError,
@@ -19,6 +24,7 @@ from teos.watcher import (
     AppointmentStatus,
     AppointmentNotFound,
 )
+from teos.utils.deserializer import decode_raw_transaction
 
 import common.receipts as receipts
 from common.tools import compute_locator
@@ -40,6 +46,7 @@ from test.teos.unit.conftest import (
     raise_invalid_parameter,
 )
 from test.teos.unit.mocks import AppointmentsDBM, Gatekeeper, BlockProcessor, Responder
+from test.teos.unit.mocks import LocatorIndex as LocatorIndexMock
 
 
 APPOINTMENTS = 5
@@ -136,6 +143,61 @@ def test_locator_cache_init(block_processor_mock, monkeypatch):
         assert block_processor_mock.get_block(k, blocking=False)
 
 
+def test_locator_cache_init_checkpointed(block_processor_mock, monkeypatch):
+    # If the cache is backed by a database, it is checkpointed on every change and reloaded on init
+    db_manager = AppointmentsDBM()
+    locator_cache = LocatorCache(config.get("LOCATOR_CACHE_SIZE"), db_manager)
+    blocks = dict()
+    mock_generate_blocks(locator_cache.cache_size + 2, blocks, queue.Queue(), delay=0)
+    block_hashes = list(blocks.keys())
+
+    monkeypatch.setattr(block_processor_mock, "get_block", lambda x, blocking: blocks.get(x))
+    locator_cache.init(block_hashes[-3], block_processor_mock)
+    assert set(db_manager.load_locator_cache_blocks().keys()) == set(block_hashes[:-2])
+
+    # New blocks are checkpointed, and the ones that are pushed out of the cache are deleted
+    for block_hash in block_hashes[-2:]:
+        locator_txid_map = {compute_locator(txid): txid for txid in blocks[block_hash].get("tx")}
+        locator_cache.update(block_hash, locator_txid_map, blocks[block_hash].get("previousblockhash"))
+    assert set(db_manager.load_locator_cache_blocks().keys()) == set(locator_cache.blocks.keys())
+
+    # A new cache can be built from the checkpoint without fetching any block
+    monkeypatch.setattr(block_processor_mock, "get_block", lambda x, blocking: pytest.fail("Unexpected query"))
+    warm_cache = LocatorCache(locator_cache.cache_size, db_manager)
+    warm_cache.init(block_hashes[-1], block_processor_mock)
+    assert warm_cache.blocks == locator_cache.blocks
+    assert warm_cache.cache == locator_cache.cache
+
+
+def test_locator_cache_init_checkpointed_missing_blocks(block_processor_mock, monkeypatch):
+    # Checkpointed blocks that are not in the chain of the last known block are dropped, and the missing ones fetched
+    db_manager = AppointmentsDBM()
+    locator_cache = LocatorCache(config.get("LOCATOR_CACHE_SIZE"), db_manager)
+    blocks = dict()
+    mock_generate_blocks(locator_cache.cache_size, blocks, queue.Queue(), delay=0)
+    block_hashes = list(blocks.keys())
+
+    fetched_blocks = []
+    monkeypatch.setattr(
+        block_processor_mock, "get_block", lambda x, blocking: fetched_blocks.append(x) or blocks.get(x)
+    )
+    locator_cache.init(block_hashes[-1], block_processor_mock)
+
+    # Fork the last block out and mine two blocks on top of the new branch while the tower is offline
+    fork = dict()
+    mock_generate_blocks(2, fork, queue.Queue(), prev_block_hash=block_hashes[-2], delay=0)
+    blocks.update(fork)
+    fork_hashes = list(fork.keys())
+
+    fetched_blocks.clear()
+    warm_cache = LocatorCache(locator_cache.cache_size, db_manager)
+    warm_cache.init(fork_hashes[-1], block_processor_mock)
+
+    assert fetched_blocks == fork_hashes[::-1]
+    assert list(warm_cache.blocks.keys()) == block_hashes[1:-1] + fork_hashes
+    assert set(db_manager.load_locator_cache_blocks().keys()) == set(warm_cache.blocks.keys())
+
+
 def test_cache_get_txid():
     # Not much to test here, this is shadowing dict.get
     locator = get_random_value_hex(16)
@@ -283,24 +345,24 @@ def test_fix_cache(block_processor_mock, monkeypatch):
     current_tip_parent = block_processor_mock.get_block(current_tip, False).get("previousblockhash")
     current_tip_parent_locators = locator_cache.blocks[current_tip_parent]
     fake_tip = block_processor_mock.get_block(current_tip_parent, False).get("previousblockhash")
-    locator_cache.fix(fake_tip, block_processor_mock)
+    assert locator_cache.fix(fake_tip, block_processor_mock) == 2
 
     # The last two blocks are not in the cache nor are there any of its locators
     assert current_tip not in locator_cache.blocks and current_tip_parent not in locator_cache.blocks
     for locator in current_tip_parent_locators + current_tip_locators:
         assert locator not in locator_cache.cache
 
-    # The fake tip is the new tip, and two additional blocks are at the bottom
+    # The fake tip is the new tip. Since the new chain is shorter, the cache is not full until new blocks are added
     assert fake_tip in locator_cache.blocks and list(locator_cache.blocks.keys())[-1] == fake_tip
-    assert len(locator_cache.blocks) == locator_cache.cache_size
+    assert len(locator_cache.blocks) == locator_cache.cache_size - 2
 
     # Test the same for a full cache reorg. We can simulate this by adding more blocks than the cache can fit and
     # trigger a fix. We'll use a new cache to compare with the old
     old_cache_blocks = deepcopy(locator_cache.blocks)
 
-    mock_generate_blocks(locator_cache.cache_size, blocks, queue.Queue())
+    mock_generate_blocks(locator_cache.cache_size, blocks, queue.Queue(), prev_block_hash=get_random_value_hex(32))
     best_block_hash = list(blocks.keys())[-1]
-    locator_cache.fix(best_block_hash, block_processor_mock)
+    assert locator_cache.fix(best_block_hash, block_processor_mock) == locator_cache.cache_size - 2
 
     # None of the data from the old cache is in the new cache
     for block_hash, locators in old_cache_blocks.items():
@@ -317,6 +379,42 @@ def test_fix_cache(block_processor_mock, monkeypatch):
             assert locator in locator_cache.cache
 
 
+def test_fix_cache_incremental(block_processor_mock, monkeypatch):
+    # Only the blocks that are not already in the cache are fetched when fixing it
+    locator_cache = LocatorCache(config.get("LOCATOR_CACHE_SIZE"))
+    blocks = dict()
+    mock_generate_blocks(locator_cache.cache_size, blocks, queue.Queue(), delay=0)
+    block_hashes = list(blocks.keys())
+
+    fetched_blocks = []
+    monkeypatch.setattr(
+        block_processor_mock, "get_block", lambda x, blocking: fetched_blocks.append(x) or blocks.get(x)
+    )
+    locator_cache.init(block_hashes[-1], block_processor_mock)
+    fetched_blocks.clear()
+
+    # Reorg the tip out with a two-block branch forking from its parent
+    reorged_locators = locator_cache.blocks[block_hashes[-1]]
+    fork = dict()
+    mock_generate_blocks(2, fork, queue.Queue(), prev_block_hash=block_hashes[-2], delay=0)
+    blocks.update(fork)
+    fork_hashes = list(fork.keys())
+
+    # Only one block is disconnected, and only the new ones are fetched
+    assert locator_cache.fix(fork_hashes[-1], block_processor_mock) == 1
+    assert fetched_blocks == fork_hashes[::-1]
+    assert list(locator_cache.blocks.keys()) == block_hashes[1:-1] + fork_hashes
+    assert all(locator not in locator_cache.cache for locator in reorged_locators)
+    for block_hash in fork_hashes:
+        for txid in blocks[block_hash].get("tx"):
+            assert locator_cache.get_txid(compute_locator(txid)) == txid
+
+    # Fixing to a block that is already the tip is a no-op
+    fetched_blocks.clear()
+    assert locator_cache.fix(fork_hashes[-1], block_processor_mock) == 0
+    assert fetched_blocks == []
+
+
 # WATCHER
 
 
@@ -582,6 +680,27 @@ def test_add_appointment_in_cache(watcher, generate_dummy_appointment_w_trigger,
         watcher.add_appointment(appointment, Cryptographer.sign(appointment.serialize(), user_sk))
 
 
+def test_add_appointment_in_locator_index(watcher, generate_dummy_appointment_w_trigger, monkeypatch):
+    # If the trigger is not in the cache but it is in the (optional) locator index, the appointment is also triggered
+    appointment, commitment_txid = generate_dummy_appointment_w_trigger()
+    appointment.user_signature = Cryptographer.sign(appointment.encrypted_blob.encode(), user_sk)
+
+    expiry = 100
+    user_info = UserInfo(MAX_APPOINTMENTS, expiry)
+    monkeypatch.setattr(watcher.gatekeeper, "authenticate_user", lambda x, y: user_id)
+    monkeypatch.setattr(watcher.gatekeeper, "has_subscription_expired", lambda x: (False, expiry))
+    monkeypatch.setattr(watcher.gatekeeper, "get_user_info", lambda x: user_info)
+    monkeypatch.setattr(watcher.responder, "handle_breach", mock_receipt_true)
+    monkeypatch.setattr(watcher, "locator_index", LocatorIndexMock({appointment.locator: commitment_txid}))
+
+    response = watcher.add_appointment(appointment, appointment.user_signature)
+
+    # The appointment is accepted and sent straight to the Responder
+    assert response and response.get("locator") == appointment.locator
+    assert not watcher.locator_uuid_map.get(appointment.locator)
+    assert watcher.locator_index.queried == [appointment.locator]
+
+
 def test_add_appointment_in_cache_invalid_blob_or_tx(watcher, generate_dummy_appointment_w_trigger, monkeypatch):
     # Trying to add an appointment with invalid data (blob does not decrypt to a tx or the tx in not invalid) with a
     # trigger in the cache will be accepted, but the data will de dropped.
@@ -619,6 +738,127 @@ def test_add_appointment_in_cache_invalid_blob_or_tx(watcher, generate_dummy_app
         assert watcher.db_manager.load_all_triggered_flags() == []
 
 
+def test_add_appointment_triggered_while_adding(watcher, generate_dummy_appointment_w_trigger, monkeypatch):
+    # If the trigger reaches the cache while the appointment is being added, it is handled as a triggered appointment
+    # instead of being added to the Watcher (where it would be missed)
+    appointment, commitment_txid = generate_dummy_appointment_w_trigger()
+
+    expiry = 100
+    user_info = UserInfo(MAX_APPOINTMENTS, expiry)
+    monkeypatch.setattr(watcher.gatekeeper, "authenticate_user", lambda x, y: user_id)
+    monkeypatch.setattr(watcher.gatekeeper, "has_subscription_expired", lambda x: (False, expiry))
+    monkeypatch.setattr(watcher.gatekeeper, "get_user_info", lambda x: user_info)
+    monkeypatch.setattr(watcher.responder, "handle_breach", mock_receipt_true)
+
+    # Mock the block with the trigger being processed right after the first cache lookup
+    lookups = []
+
+    def get_txid(locator):
+        lookups.append(locator)
+        return commitment_txid if len(lookups) > 1 else None
+
+    monkeypatch.setattr(watcher.locator_cache, "get_txid", get_txid)
+
+    response = watcher.add_appointment(appointment, appointment.user_signature)
+    uuid = hash_160("{}{}".format(appointment.locator, user_id))
+
+    assert response.get("locator") == appointment.locator and len(lookups) == 2
+    assert appointment.locator not in watcher.locator_uuid_map and uuid not in watcher.appointments
+    assert watcher.db_manager.load_all_triggered_flags() == [uuid]
+    assert watcher.db_manager.load_watcher_appointment(uuid) is not None
+
+
+def test_add_appointment_concurrent_copies(watcher, generate_dummy_appointment_w_trigger, monkeypatch):
+    # A copy of an appointment that is being handed to the Responder is rejected, instead of being charged and
+    # broadcast again
+    appointment, commitment_txid = generate_dummy_appointment_w_trigger()
+
+    expiry = 100
+    user_info = UserInfo(MAX_APPOINTMENTS, expiry)
+    monkeypatch.setattr(watcher.gatekeeper, "authenticate_user", lambda x, y: user_id)
+    monkeypatch.setattr(watcher.gatekeeper, "has_subscription_expired", lambda x: (False, expiry))
+    monkeypatch.setattr(watcher.gatekeeper, "get_user_info", lambda x: user_info)
+    monkeypatch.setattr(watcher.locator_cache, "get_txid", lambda x: commitment_txid)
+
+    charged = []
+    monkeypatch.setattr(
+        watcher.gatekeeper, "add_update_appointment", lambda x, uuid, z: charged.append(uuid) or MAX_APPOINTMENTS - 1
+    )
+
+    # Mock a slow broadcast. The tracker is only created once it is done
+    trackers = set()
+
+    class SlowBroadcast:
+        def __init__(self, uuid):
+            self.uuid = uuid
+
+        def result(self):
+            time.sleep(0.2)
+            trackers.add(self.uuid)
+            return Receipt(delivered=True)
+
+    broadcasts = []
+    monkeypatch.setattr(watcher.responder, "has_tracker", lambda uuid: uuid in trackers)
+    monkeypatch.setattr(
+        watcher.responder, "handle_breach_async", lambda uuid, *args: broadcasts.append(uuid) or SlowBroadcast(uuid)
+    )
+
+    rejected = []
+
+    def add_appointment():
+        try:
+            watcher.add_appointment(appointment, appointment.user_signature)
+        except AppointmentAlreadyTriggered:
+            rejected.append(1)
+
+    threads = [Thread(target=add_appointment, daemon=True) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+        time.sleep(0.05)
+    for thread in threads:
+        thread.join()
+
+    uuid = hash_160("{}{}".format(appointment.locator, user_id))
+    assert broadcasts == charged == [uuid] and len(rejected) == 1
+    assert watcher.db_manager.load_all_triggered_flags() == [uuid]
+
+
+def test_add_appointment_concurrent(watcher, generate_dummy_appointment, monkeypatch):
+    # Only the map update needs the Watcher lock, so appointments can be authenticated (and persisted) while a block
+    # is being processed, and added by several threads at the same time
+    expiry = 100
+    user_info = UserInfo(MAX_APPOINTMENTS, expiry)
+    monkeypatch.setattr(watcher.gatekeeper, "has_subscription_expired", lambda x: (False, expiry))
+    monkeypatch.setattr(watcher.responder, "has_tracker", lambda x: False)
+    monkeypatch.setattr(watcher.gatekeeper, "add_update_appointment", lambda x, y, z: MAX_APPOINTMENTS - 1)
+    monkeypatch.setattr(watcher.gatekeeper, "get_user_info", lambda x: user_info)
+
+    authenticated = []
+    monkeypatch.setattr(watcher.gatekeeper, "authenticate_user", lambda x, y: authenticated.append(x) or user_id)
+    appointments = [generate_dummy_appointment() for _ in range(20)]
+
+    # Hold the lock as if a block was being processed
+    wlock = watcher.rw_lock.gen_wlock()
+    wlock.acquire()
+    threads = [Thread(target=watcher.add_appointment, args=(a, a.user_signature), daemon=True) for a in appointments]
+    for thread in threads:
+        thread.start()
+
+    try:
+        time.sleep(0.5)
+        assert len(authenticated) == len(appointments) and len(watcher.appointments) == 0
+    finally:
+        wlock.release()
+
+    for thread in threads:
+        thread.join()
+
+    for appointment in appointments:
+        uuid = hash_160("{}{}".format(appointment.locator, user_id))
+        assert uuid in watcher.locator_uuid_map[appointment.locator]
+        assert watcher.db_manager.load_watcher_appointment(uuid) is not None
+
+
 def test_add_too_many_appointments(watcher, generate_dummy_appointment, monkeypatch):
     # Adding appointment beyond the user limit should fail
 
@@ -789,6 +1029,9 @@ def test_check_breach(watcher, generate_dummy_appointment_w_trigger):
     penalty_txid, penalty_rawtx = watcher.check_breach(uuid, appointment, dispute_txid)
     assert Cryptographer.encrypt(penalty_rawtx, dispute_txid) == appointment.encrypted_blob
 
+    # The transaction is decoded locally, so the txid is computed by the tower
+    assert penalty_txid == decode_raw_transaction(penalty_rawtx).get("txid")
+
 
 def test_check_breach_random_data(watcher, generate_dummy_appointment_w_trigger, monkeypatch):
     # If a breach triggers an appointment with random data as encrypted blob, the check should fail.
@@ -808,13 +1051,31 @@ def test_check_breach_invalid_transaction(watcher, generate_dummy_appointment_w_
     uuid = uuid4().hex
     appointment, dispute_txid = generate_dummy_appointment_w_trigger()
 
-    # Mock the interaction with the BlockProcessor when trying to decode a transaction
-    monkeypatch.setattr(watcher.block_processor, "decode_raw_transaction", raise_invalid_tx_format)
+    # Replace the blob with some data that decrypts fine but is not a transaction
+    appointment.encrypted_blob = Cryptographer.encrypt(get_random_value_hex(150), dispute_txid)
 
     with pytest.raises(InvalidTransactionFormat):
         watcher.check_breach(uuid, appointment, dispute_txid)
 
 
+def test_check_breach_mempool_preflight(watcher, generate_dummy_appointment_w_trigger, monkeypatch):
+    # If the mempool pre-flight is enabled, breaches with penalties rejected by bitcoind are not valid
+    uuid = uuid4().hex
+    appointment, dispute_txid = generate_dummy_appointment_w_trigger()
+    monkeypatch.setattr(watcher, "mempool_preflight", True)
+
+    monkeypatch.setattr(
+        watcher.block_processor, "test_mempool_accept", lambda x, blocking: {"allowed": False, "reject-reason": "dust"}
+    )
+    with pytest.raises(InvalidTransactionFormat):
+        watcher.check_breach(uuid, appointment, dispute_txid)
+
+    # Penalties that bitcoind already knows about are fine
+    for result in [{"allowed": True}, {"allowed": False, "reject-reason": "txn-already-in-mempool"}]:
+        monkeypatch.setattr(watcher.block_processor, "test_mempool_accept", lambda x, blocking: result)
+        assert watcher.check_breach(uuid, appointment, dispute_txid)
+
+
 def test_filter_valid_breaches(watcher, generate_dummy_appointment_w_trigger, monkeypatch):
     # filter_breaches returns computes two collections, one with the valid breaches (breaches that properly decrypt
     # appointments) and one with invalid ones. Test it with a single valid breach.
@@ -868,6 +1129,304 @@ def test_filter_breaches_random_data(watcher, generate_dummy_appointment_w_trigg
     assert len(valid_breaches) == 0 and len(invalid_breaches) == TEST_SET_SIZE // 4
 
 
+def test_filter_breaches_without_lock(watcher, generate_dummy_appointment_w_trigger, monkeypatch):
+    # Breaches are validated without holding the Watcher lock, so appointments can be added in the meantime
+    appointment, dispute_txid = generate_dummy_appointment_w_trigger()
+    uuid = uuid4().hex
+    watcher.appointments[uuid] = appointment.get_summary()
+    watcher.locator_uuid_map[appointment.locator] = {uuid: None}
+    watcher.db_manager.store_watcher_appointment(uuid, appointment.to_dict())
+
+    lock_available = []
+    decrypt_penalty = watcher.decrypt_penalty
+
+    def mock_decrypt_penalty(*args):
+        wlock = watcher.rw_lock.gen_wlock()
+        lock_available.append(wlock.acquire(blocking=False))
+        wlock.release()
+        return decrypt_penalty(*args)
+
+    monkeypatch.setattr(watcher, "decrypt_penalty", mock_decrypt_penalty)
+    valid_breaches, invalid_breaches = watcher.filter_breaches({appointment.locator: dispute_txid})
+
+    assert lock_available == [True]
+    assert list(valid_breaches.keys()) == [uuid] and invalid_breaches == []
+
+
+def test_filter_breaches_preflight_parallel(
+    dbm_mock, gatekeeper_mock, responder_mock, block_processor_mock, generate_dummy_appointment_w_trigger, monkeypatch
+):
+    # The mempool pre-flight checks are run by a pool of workers. The output must not depend on the order in which
+    # they complete
+    watcher = Watcher(
+        dbm_mock,
+        gatekeeper_mock,
+        block_processor_mock,
+        responder_mock,
+        signing_key,
+        MAX_APPOINTMENTS,
+        config.get("LOCATOR_CACHE_SIZE"),
+        breach_workers=4,
+        mempool_preflight=True,
+    )
+
+    potential_breaches = {}
+    rejected = set()
+    for i in range(20):
+        appointment, dispute_txid = generate_dummy_appointment_w_trigger()
+        uuid = uuid4().hex
+        watcher.locator_uuid_map[appointment.locator] = {uuid: None}
+        watcher.db_manager.store_watcher_appointment(uuid, appointment.to_dict())
+        potential_breaches[appointment.locator] = dispute_txid
+
+        # Half of the penalties will be rejected by the mempool
+        if i % 2:
+            rejected.add(Cryptographer.decrypt(appointment.encrypted_blob, dispute_txid))
+
+    # Make the checks overlap and finish in reverse order
+    running = []
+    max_running = []
+
+    def mock_test_mempool_accept(rawtx, blocking):
+        running.append(rawtx)
+        max_running.append(len(running))
+        time.sleep(0.05 if rawtx not in rejected else 0.1)
+        running.remove(rawtx)
+        return {"allowed": rawtx not in rejected, "reject-reason": "dust"}
+
+    monkeypatch.setattr(watcher.block_processor, "test_mempool_accept", mock_test_mempool_accept)
+    valid_breaches, invalid_breaches = watcher.filter_breaches(potential_breaches)
+    watcher.breach_validator.shutdown()
+    assert max(max_running) > 1
+
+    # The result matches the one of the sequential checks, including the ordering
+    monkeypatch.setattr(watcher, "breach_validator", None)
+    assert (valid_breaches, invalid_breaches) == watcher.filter_breaches(potential_breaches)
+    assert len(valid_breaches) == len(invalid_breaches) == 10
+    valid_locators = list(potential_breaches.keys())[::2]
+    assert list(valid_breaches) == [next(iter(watcher.locator_uuid_map[locator])) for locator in valid_locators]
+
+
+def add_triggered_appointments(watcher, appointment, n):
+    # Adds n copies of an appointment (as if they were sent by different users) to the Watcher, returns their uuids
+    uuids = []
+    for _ in range(n):
+        uuid = uuid4().hex
+        watcher.appointments[uuid] = appointment.get_summary()
+        watcher.locator_uuid_map.setdefault(appointment.locator, {})[uuid] = None
+        watcher.db_manager.store_watcher_appointment(uuid, appointment.to_dict())
+        uuids.append(uuid)
+
+    return uuids
+
+
+def test_filter_breaches_same_blob(watcher, generate_dummy_appointment_w_trigger, monkeypatch):
+    # Appointments with the same locator and blob are only loaded and decrypted once
+    appointment, dispute_txid = generate_dummy_appointment_w_trigger()
+    uuids = add_triggered_appointments(watcher, appointment, 10)
+
+    loaded = []
+    load_watcher_appointment = watcher.db_manager.load_watcher_appointment
+    monkeypatch.setattr(
+        watcher.db_manager,
+        "load_watcher_appointment",
+        lambda uuid: loaded.append(uuid) or load_watcher_appointment(uuid),
+    )
+    valid_breaches, invalid_breaches = watcher.filter_breaches({appointment.locator: dispute_txid})
+
+    assert loaded == uuids[:1]
+    assert list(valid_breaches.keys()) == uuids and invalid_breaches == []
+    assert len({breach.get("penalty_txid") for breach in valid_breaches.values()}) == 1
+
+
+def test_filter_breaches_deferred(watcher, generate_dummy_appointment_w_trigger, monkeypatch):
+    # Only max_decrypts_per_locator different blobs are decrypted per locator, the rest are deferred
+    monkeypatch.setattr(watcher, "max_decrypts_per_locator", 2)
+
+    appointment, dispute_txid = generate_dummy_appointment_w_trigger()
+    uuids = add_triggered_appointments(watcher, appointment, 2)
+
+    # Add some garbage under the same locator (different blobs that cannot be decrypted)
+    garbage_uuids = []
+    for _ in range(5):
+        garbage = deepcopy(appointment)
+        garbage.encrypted_blob = get_random_value_hex(100)
+        garbage_uuids.extend(add_triggered_appointments(watcher, garbage, 1))
+
+    valid_breaches, invalid_breaches = watcher.filter_breaches({appointment.locator: dispute_txid})
+    assert list(valid_breaches.keys()) == uuids
+    assert invalid_breaches == garbage_uuids[:1]
+
+    # The rest are stored for the background pass
+    deferred = watcher.db_manager.load_deferred_breaches()
+    assert [group.get("uuids") for group in deferred.values()] == [[uuid] for uuid in garbage_uuids[1:]]
+    assert all(group.get("dispute_txid") == dispute_txid for group in deferred.values())
+
+
+def test_do_deferred_breaches(watcher, generate_dummy_appointment_w_trigger, monkeypatch):
+    # Deferred breaches are handled in the background as any other breach
+    appointment, dispute_txid = generate_dummy_appointment_w_trigger()
+    uuids = add_triggered_appointments(watcher, appointment, 3)
+    garbage = deepcopy(appointment)
+    garbage.encrypted_blob = get_random_value_hex(100)
+    garbage_uuids = add_triggered_appointments(watcher, garbage, 1)
+
+    # One of the appointments is gone by the time the background pass runs, so it is skipped
+    Cleaner.delete_appointments([uuids[0]], watcher.appointments, watcher.locator_uuid_map, watcher.db_manager)
+
+    handled = []
+    monkeypatch.setattr(
+        watcher.responder, "handle_breach", lambda uuid, *args: handled.append(uuid) or Receipt(delivered=True)
+    )
+
+    deferred = [(appointment.locator, dispute_txid, uuids), (garbage.locator, dispute_txid, garbage_uuids)]
+    watcher.db_manager.store_deferred_breaches(
+        {
+            group_uuids[0]: {"locator": locator, "dispute_txid": txid, "uuids": group_uuids}
+            for locator, txid, group_uuids in deferred
+        }
+    )
+    watcher.deferred_breaches.put(get_random_value_hex(32))
+    watcher.deferred_breaches.put(ChainMonitor.END_MESSAGE)
+    watcher.do_deferred_breaches()
+
+    assert handled == uuids[1:]
+    assert watcher.appointments == {}
+    assert set(watcher.db_manager.load_all_triggered_flags()) == set(uuids[1:])
+    assert watcher.db_manager.load_deferred_breaches() == {}
+
+
+def test_do_watch_deferred_breaches_restart(
+    watcher,
+    dbm_mock,
+    gatekeeper_mock,
+    responder_mock,
+    block_processor_mock,
+    generate_dummy_appointment_w_trigger,
+    monkeypatch,
+):
+    # Deferred breaches are committed alongside the block they were found in, so they are checked after a restart even
+    # if the tower is stopped before the background pass runs
+    monkeypatch.setattr(watcher, "max_decrypts_per_locator", 1)
+    appointment, dispute_txid = generate_dummy_appointment_w_trigger()
+    garbage = deepcopy(appointment)
+    garbage.encrypted_blob = get_random_value_hex(100)
+    garbage_uuids = add_triggered_appointments(watcher, garbage, 1)
+    uuids = add_triggered_appointments(watcher, appointment, 2)
+
+    # Mock the tower being stopped before the background pass is run
+    monkeypatch.setattr(watcher, "do_deferred_breaches", lambda: None)
+    monkeypatch.setattr(watcher.gatekeeper, "get_outdated_appointments", lambda x: [])
+
+    block_hash = get_random_value_hex(32)
+    block = {"tx": [dispute_txid], "height": 1, "hash": block_hash}
+    monkeypatch.setattr(watcher.block_processor, "get_block", lambda x, blocking: block)
+    watcher.block_queue.put(block_hash)
+    watcher.block_queue.put(ChainMonitor.END_MESSAGE)
+    watcher.do_watch()
+
+    # The first group (garbage) has been checked with the block, the second one is still pending
+    assert dbm_mock.load_last_block_hash_watcher() == block_hash
+    assert list(dbm_mock.load_deferred_breaches().values()) == [
+        {"locator": appointment.locator, "dispute_txid": dispute_txid, "uuids": uuids}
+    ]
+    assert garbage_uuids[0] not in watcher.appointments and all(uuid in watcher.appointments for uuid in uuids)
+
+    # Restart the Watcher from the same database. The pending group is checked as soon as it starts watching
+    watcher = Watcher(
+        dbm_mock,
+        gatekeeper_mock,
+        block_processor_mock,
+        responder_mock,
+        signing_key,
+        MAX_APPOINTMENTS,
+        config.get("LOCATOR_CACHE_SIZE"),
+    )
+    watcher.appointments, watcher.locator_uuid_map = Builder.build_appointments(dbm_mock.load_watcher_appointments())
+
+    handled = []
+    monkeypatch.setattr(
+        watcher.responder, "handle_breach", lambda uuid, *args: handled.append(uuid) or Receipt(delivered=True)
+    )
+    watcher.block_queue.put(ChainMonitor.END_MESSAGE)
+    watcher.do_watch()
+
+    assert handled == uuids
+    assert watcher.appointments == {}
+    assert set(dbm_mock.load_all_triggered_flags()) == set(uuids)
+    assert dbm_mock.load_deferred_breaches() == {}
+
+
+def test_mempool_cache():
+    mempool_cache = MempoolCache(5)
+    txids = [get_random_value_hex(32) for _ in range(10)]
+
+    # Transactions are only added once
+    assert mempool_cache.add(txids[0]) and not mempool_cache.add(txids[0])
+
+    # Breaches can only be set for cached transactions
+    mempool_cache.set_breaches(txids[0], {uuid4().hex: None})
+    mempool_cache.set_breaches(txids[1], {uuid4().hex: None})
+    assert mempool_cache.get_breaches(txids[0]) and mempool_cache.get_breaches(txids[1]) is None
+
+    # The oldest transactions are dropped when the cache is full
+    for txid in txids[1:]:
+        mempool_cache.add(txid)
+    assert list(mempool_cache.txs.keys()) == txids[5:]
+
+
+def test_do_watch_mempool(watcher, generate_dummy_appointment_w_trigger, monkeypatch):
+    # Breaches seen in the mempool are validated (and optionally broadcast) right away
+    appointment, dispute_txid = generate_dummy_appointment_w_trigger()
+    uuids = add_triggered_appointments(watcher, appointment, 3)
+    monkeypatch.setattr(watcher, "mempool_broadcast", True)
+
+    broadcast = []
+    monkeypatch.setattr(
+        watcher.responder.carrier, "send_transaction", lambda rawtx, txid, cache_receipt: broadcast.append(txid)
+    )
+
+    # Transactions that do not trigger any appointment are only cached, and duplicates are ignored
+    for txid in [get_random_value_hex(32), dispute_txid, dispute_txid, ChainMonitor.END_MESSAGE]:
+        watcher.mempool_queue.put(txid)
+    watcher.do_watch_mempool()
+
+    penalty_txid = decode_raw_transaction(Cryptographer.decrypt(appointment.encrypted_blob, dispute_txid)).get("txid")
+    assert len(watcher.mempool_cache.txs) == 2
+    blob_hash = appointment.get_summary()["blob_hash"]
+    assert watcher.mempool_cache.get_breaches(dispute_txid).keys() == {(uuid, blob_hash) for uuid in uuids}
+    assert broadcast == [penalty_txid]
+
+    # The appointments are kept until the breach is mined. Then, the validation is not repeated
+    assert all(uuid in watcher.appointments for uuid in uuids)
+    monkeypatch.setattr(watcher.db_manager, "load_watcher_appointment", None)
+    valid_breaches, invalid_breaches = watcher.filter_breaches({appointment.locator: dispute_txid})
+    assert list(valid_breaches.keys()) == uuids and invalid_breaches == []
+    assert all(breach.get("penalty_txid") == penalty_txid for breach in valid_breaches.values())
+
+
+def test_do_watch_mempool_updated_appointment(watcher, generate_dummy_appointment_w_trigger):
+    # Mempool results are not reused for appointments updated after the breach was seen
+    appointment, dispute_txid = generate_dummy_appointment_w_trigger()
+    invalid_appointment = ExtendedAppointment.from_dict(
+        dict(appointment.to_dict(), encrypted_blob=get_random_value_hex(100))
+    )
+    uuids = add_triggered_appointments(watcher, invalid_appointment, 1)
+
+    for txid in [dispute_txid, ChainMonitor.END_MESSAGE]:
+        watcher.mempool_queue.put(txid)
+    watcher.do_watch_mempool()
+    blob_hash = invalid_appointment.get_summary()["blob_hash"]
+    assert watcher.mempool_cache.get_breaches(dispute_txid) == {(uuids[0], blob_hash): None}
+
+    # The appointment is updated with a valid blob, so it is validated again once the breach is mined
+    watcher.appointments[uuids[0]] = appointment.get_summary()
+    watcher.db_manager.store_watcher_appointment(uuids[0], appointment.to_dict())
+
+    valid_breaches, invalid_breaches = watcher.filter_breaches({appointment.locator: dispute_txid})
+    assert list(valid_breaches.keys()) == uuids and invalid_breaches == []
+
+
 def test_get_subscription_info(watcher, generate_dummy_appointment, generate_dummy_tracker, monkeypatch):
     # Tests how get_subscription_info should return no data for empty subscriptions, and the info matching the
     # subscriptions otherwise.
@@ -1023,9 +1582,10 @@ def test_check_breach_bitcoind_crash(watcher, block_processor, generate_dummy_ap
     appointment, dispute_txid = generate_dummy_appointment_w_trigger()
 
     # A real BlockProcessor is required to test blocking functionality, since the mock does not implement that stuff
-    # We also need to  mock decoding the transaction given we're using dummy data
+    # Only the mempool pre-flight reaches bitcoind. We need to mock it given we're using dummy data
     watcher.block_processor = block_processor
-    monkeypatch.setattr(block_processor, "decode_raw_transaction", lambda x, blocking: {})
+    watcher.mempool_preflight = True
+    monkeypatch.setattr(block_processor, "test_mempool_accept", lambda x, blocking: {"allowed": True})
 
     run_test_blocking_command_bitcoind_crash(
         watcher.block_processor.bitcoind_reachable, lambda: watcher.check_breach(uuid, appointment, dispute_txid)